@@ -8,17 +8,52 @@ API Endpoints:
 - POST /api/analyze - Full health analysis
 - GET  /api/stats - Dataset statistics
 - POST /api/ai/chat - Multi-provider AI chat (OpenRouter, OpenAI, Perplexity)
+- GET  /api/ai/providers - AI provider breaker state and latency
 """
 
-from flask import Flask, jsonify, Response, request
+from flask import Flask, jsonify, Response, make_response, request
 from flask_cors import CORS
 import json
 import re
-from functools import wraps
+from functools import partial, wraps
+import hmac
 import time
 import os
-import requests
 import logging
+import sys
+
+# Shared engines (rate limiting, provider clients, ...) live in backend/ as flat modules;
+# vercel.json bundles backend/ with this function (functions."api/index.py".includeFiles)
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
+
+# Required by the routes themselves: rate limiting, provider calls and chat request handling
+from ai_providers import DEADLINE_HEADER, Deadline, ProviderChain, ProviderClient, completion_to_sse, parse_hedge_delays
+from chat_service import flight_key
+from chat_setup import LOCAL_GREETING, chat_cache_from_env, knowledge_base_from_env, local_response
+from rate_limiter import BudgetedRateLimiter, response_tokens, usage_cost
+
+# Optional components: a feature whose module cannot be imported is switched off
+try:
+    from ai_insights import DEFAULT_MODEL as DEFAULT_INSIGHTS_MODEL, AIInsights, validate_insight
+except Exception:
+    AIInsights = None
+
+try:
+    from chat_context import ContextTrimmer, parse_budgets
+except Exception:
+    ContextTrimmer = None
+
+try:
+    from chat_intents import ChatIntents
+except Exception:
+    ChatIntents = None
+
+try:
+    from single_flight import SingleFlight
+except Exception:
+    SingleFlight = None
 
 # Create Flask app
 app = Flask(__name__)
@@ -166,40 +201,67 @@ def add_security_headers(response):
     return response
 
 
-# Simple in-memory rate limiting (for demonstration)
-# In production, use Redis or similar
-rate_limit_store = {}
+# In-memory rate limiting: O(1) sliding-window counters with a hard cap on tracked IPs
 RATE_LIMIT = 60  # requests per minute
+AI_RATE_LIMIT = float(os.getenv("AI_RATE_LIMIT", "20"))  # AI budget units per minute
+AI_SECONDS_PER_UNIT = float(os.getenv("AI_SECONDS_PER_UNIT", "5"))
+AI_TOKENS_PER_UNIT = float(os.getenv("AI_TOKENS_PER_UNIT", "1000"))
 RATE_LIMIT_WINDOW = 60  # seconds
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# RATE_LIMIT_BACKEND=sqlite shares counters between workers (RATE_LIMIT_DB file)
+rate_limiter = BudgetedRateLimiter(
+    {"default": RATE_LIMIT, "ai": AI_RATE_LIMIT}, RATE_LIMIT_WINDOW, max_keys=RATE_LIMIT_MAX_KEYS
+)
+
+def client_ip():
+    """Get client IP (handles proxy)"""
+    ip = request.headers.get('X-Forwarded-For', request.remote_addr)
+    if ip:
+        ip = ip.split(',')[0].strip()
+    return ip
+
+def rate_limit(f=None, *, budget="default", cost=1.0, metered=False):
+    """Rate limiting decorator: ``cost`` units of ``budget`` per request.
+
+    ``metered`` routes are post-charged for upstream time / tokens beyond ``cost``.
+    """
+    if f is None:
+        return lambda view: rate_limit(view, budget=budget, cost=cost, metered=metered)
 
-def rate_limit(f):
-    """Rate limiting decorator"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # Get client IP (handles proxy)
-        ip = request.headers.get('X-Forwarded-For', request.remote_addr)
-        if ip:
-            ip = ip.split(',')[0].strip()
-        
-        current_time = time.time()
-        
-        # Clean old entries
-        rate_limit_store[ip] = [t for t in rate_limit_store.get(ip, []) 
-                               if current_time - t < RATE_LIMIT_WINDOW]
-        
-        # Check rate limit
-        if len(rate_limit_store.get(ip, [])) >= RATE_LIMIT:
+        key = client_ip()
+        result = rate_limiter.hit(budget, key, cost)
+        if not result.allowed:
             return jsonify({
                 "error": "Rate limit exceeded. Please try again later.",
-                "retry_after": RATE_LIMIT_WINDOW
+                "retry_after": result.retry_after
             }), 429
-        
-        # Add current request
-        if ip not in rate_limit_store:
-            rate_limit_store[ip] = []
-        rate_limit_store[ip].append(current_time)
-        
-        return f(*args, **kwargs)
+
+        if not metered:
+            return f(*args, **kwargs)
+
+        started = time.monotonic()
+        response = make_response(f(*args, **kwargs))
+        if response.headers.get("X-Cache") == "HIT" or response.headers.get("X-Coalesced"):
+            return response
+        if response.is_streamed:
+            # Don't buffer the stream to count tokens; charge elapsed time when it ends
+            def charge_stream():
+                used = usage_cost(time.monotonic() - started, 0, AI_SECONDS_PER_UNIT, AI_TOKENS_PER_UNIT)
+                rate_limiter.charge(budget, key, used - cost)
+
+            response.call_on_close(charge_stream)
+            return response
+
+        used = usage_cost(
+            time.monotonic() - started,
+            response_tokens(response.get_json(silent=True)),
+            AI_SECONDS_PER_UNIT,
+            AI_TOKENS_PER_UNIT,
+        )
+        rate_limiter.charge(budget, key, used - cost)
+        return response
     return decorated_function
 
 
@@ -281,7 +343,7 @@ def analyze_step():
 
 
 @app.route("/api/analyze", methods=["POST"])
-@rate_limit
+@rate_limit(cost=2)
 def analyze_data():
     """Accepts user health data with input validation"""
     # Ensure analyzer backend is available
@@ -383,7 +445,155 @@ def get_statistics():
         return jsonify({"error": "An error occurred fetching statistics"}), 500
 
 
+# AI providers: one keep-alive connection pool per provider, reused across warm invocations
+AI_POOL_SIZE = int(os.getenv("AI_POOL_SIZE", "10"))
+AI_CONNECT_TIMEOUT = float(os.getenv("AI_CONNECT_TIMEOUT", "3.05"))
+AI_READ_TIMEOUT = float(os.getenv("AI_READ_TIMEOUT", "10"))
+CHAT_TEMPERATURE = 0.7
+# AI_HEDGE=1 races the next provider once one is slower than its hedge delay
+AI_HEDGE = os.getenv("AI_HEDGE", "0") == "1"
+AI_HEDGE_DELAY_MS = float(os.getenv("AI_HEDGE_DELAY_MS", "2000"))
+AI_HEDGE_PERCENTILE = float(os.getenv("AI_HEDGE_PERCENTILE")) if os.getenv("AI_HEDGE_PERCENTILE") else None
+# Fastest provider first (EWMA latency) unless AI_ROUTING=ordered; open breakers are skipped
+AI_ROUTING = os.getenv("AI_ROUTING", "latency")
+AI_BREAKER = {
+    "failure_rate": float(os.getenv("AI_BREAKER_FAILURE_RATE", "0.5")),
+    "min_calls": int(os.getenv("AI_BREAKER_MIN_CALLS", "5")),
+    "open_seconds": float(os.getenv("AI_BREAKER_OPEN_SECONDS", "30")),
+    "slow_call": float(os.getenv("AI_BREAKER_SLOW_MS", "8000")) / 1000,
+}
+# All provider attempts of a chat share AI_REQUEST_TIMEOUT seconds (or the client's shorter
+# X-Request-Timeout), so the local answer goes out before the function's own time limit
+AI_REQUEST_TIMEOUT = float(os.getenv("AI_REQUEST_TIMEOUT", "9"))
+
+def provider_client(name, url, api_key_env, model, headers=None):
+    """Pooled client for one OpenAI-compatible provider with a fixed model"""
+    return ProviderClient(
+        name, url, api_key_env,
+        headers=headers,
+        overrides={"model": model, "temperature": CHAT_TEMPERATURE, "max_tokens": 600},
+        pool_size=AI_POOL_SIZE,
+        connect_timeout=AI_CONNECT_TIMEOUT,
+        read_timeout=AI_READ_TIMEOUT,
+    )
+
+# Fallback order: OpenRouter → OpenAI → Perplexity (then Local AI)
+ai_chain = ProviderChain(
+    [
+        provider_client(
+            "openrouter",
+            "https://api.openrouter.ai/api/v1/chat/completions",
+            "OPENROUTER_API_KEY",
+            "meta-llama/llama-3.1-8b-instruct:free",
+            headers={"HTTP-Referer": "https://pcos-zeta.vercel.app"},
+        ),
+        provider_client("openai", "https://api.openai.com/v1/chat/completions", "OPENAI_API_KEY", "gpt-3.5-turbo"),
+        provider_client("perplexity", "https://api.perplexity.ai/chat/completions", "PERPLEXITY_API_KEY", "pplx-7b-online"),
+    ],
+    hedge=AI_HEDGE,
+    hedge_delay=AI_HEDGE_DELAY_MS / 1000,
+    hedge_delays=parse_hedge_delays(os.getenv("AI_HEDGE_DELAYS", "")),
+    hedge_percentile=AI_HEDGE_PERCENTILE,
+    routing=AI_ROUTING,
+    breaker=AI_BREAKER,
+)
+
+
+# Cache of provider answers to repeated first questions (per warm instance unless CHAT_CACHE_DB is set)
+chat_cache = chat_cache_from_env()
+
+
+# Identical concurrent questions on a warm instance share one upstream call
+chat_flights = None
+if SingleFlight is not None and os.getenv("CHAT_SINGLE_FLIGHT", "1") == "1":
+    chat_flights = SingleFlight(timeout=float(os.getenv("CHAT_SINGLE_FLIGHT_TIMEOUT", "30")))
+
+
+# History is cut to the tightest budget among the provider models (CHAT_CONTEXT_TOKENS,
+# per model via CHAT_CONTEXT_BUDGETS) since any of them may answer; older turns are summarized
+context_trimmer = None
+if ContextTrimmer is not None and os.getenv("CHAT_CONTEXT", "1") == "1":
+    context_trimmer = ContextTrimmer(
+        default_budget=int(os.getenv("CHAT_CONTEXT_TOKENS", "3000")),
+        budgets=parse_budgets(os.getenv("CHAT_CONTEXT_BUDGETS", "")),
+        summarize=os.getenv("CHAT_CONTEXT_SUMMARY", "1") == "1",
+        summary_tokens=int(os.getenv("CHAT_CONTEXT_SUMMARY_TOKENS", "200")),
+    )
+
+
+# Computable questions (cycle length, BMI, symptom risk) are answered by the analyzer in process
+chat_intents = None
+if ChatIntents is not None and analyzer is not None and os.getenv("CHAT_INTENTS", "1") == "1":
+    chat_intents = ChatIntents(analyzer)
+
+
+# Local fallback answers: BM25 search over the bundled PCOS FAQ, shared with the Flask app (chat_setup.py)
+knowledge_base = knowledge_base_from_env()
+
+
+# Chatbot insight endpoints: analyzer results plus advice cached per profile bucket; a
+# provider is asked only for buckets this warm instance has not answered yet
+ai_insights = None
+if AIInsights is not None and os.getenv("AI_INSIGHTS", "1") == "1":
+    ai_insights = AIInsights(
+        analyzer,
+        ai_chain,
+        model=os.getenv("AI_INSIGHTS_MODEL", DEFAULT_INSIGHTS_MODEL),
+        knowledge_base=knowledge_base,
+        flights=chat_flights,
+        maxsize=int(os.getenv("AI_INSIGHTS_CACHE_SIZE", "5000")),
+        ttl=float(os.getenv("AI_INSIGHTS_TTL", "604800")),
+    )
+
+
+def admin_authorized():
+    """True when the X-Admin-Token header matches ADMIN_TOKEN (never while ADMIN_TOKEN is unset)."""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    return bool(admin_token) and hmac.compare_digest(request.headers.get("X-Admin-Token", ""), admin_token)
+
+
+@app.route("/api/ai/providers")
+def ai_provider_status():
+    """Circuit breaker state, latency and win counters per AI provider (X-Admin-Token must match ADMIN_TOKEN)"""
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    status = ai_chain.stats()
+    if chat_cache is not None:
+        status["chat_cache"] = chat_cache.stats()
+    if chat_intents is not None:
+        status["chat_intents"] = chat_intents.stats()
+    if context_trimmer is not None:
+        status["chat_context"] = context_trimmer.stats()
+    if chat_flights is not None:
+        status["chat_single_flight"] = chat_flights.stats()
+    if ai_insights is not None:
+        status["ai_insights"] = ai_insights.stats()
+    return jsonify(status)
+
+
+@app.route("/api/ai/<any(insight, 'analyze-symptoms', lifestyle, 'diet-plan', explain):kind>", methods=["POST"])
+@rate_limit(budget="ai", metered=True)
+def ai_insight(kind):
+    """Chatbot insights: health insight, symptom analysis, lifestyle tips, diet plan or term explanation"""
+    if ai_insights is None:
+        return jsonify({"error": "AI insights are disabled"}), 503
+    if not request.is_json:
+        return jsonify({"error": "Content-Type must be application/json"}), 400
+
+    payload = request.get_json()
+    error = validate_insight(kind, payload)
+    if error:
+        return jsonify({"error": error}), 400
+
+    deadline = Deadline.from_header(request.headers.get(DEADLINE_HEADER), AI_REQUEST_TIMEOUT)
+    body = ai_insights.answer(kind, payload, deadline)
+    response = jsonify(body)
+    response.headers["X-Cache"] = "HIT" if body["source"] in ("cache", "glossary") else "MISS"
+    return response, 200
+
+
 @app.route("/api/ai/chat", methods=["POST"])
+@rate_limit(budget="ai", metered=True)
 def ai_chat():
     """AI chat endpoint - Multi-provider fallback chain: OpenRouter → OpenAI → Perplexity → Local AI"""
     if not request.is_json:
@@ -392,201 +602,103 @@ def ai_chat():
     payload = request.get_json()
     if not isinstance(payload, dict):
         return jsonify({"error": "Invalid request body"}), 400
+    deadline = Deadline.from_header(request.headers.get(DEADLINE_HEADER), AI_REQUEST_TIMEOUT)
 
-    # Try providers in order: OpenRouter → OpenAI → Perplexity → Local AI
-    
-    # 1. Try OpenRouter (primary)
-    openrouter_key = os.getenv("OPENROUTER_API_KEY")
-    if openrouter_key:
-        result = call_openrouter(payload, openrouter_key)
-        if result:
-            return jsonify(result), 200
-    
-    # 2. Try OpenAI (first fallback)
-    openai_key = os.getenv("OPENAI_API_KEY")
-    if openai_key:
-        result = call_openai(payload, openai_key)
-        if result:
-            return jsonify(result), 200
-    
-    # 3. Try Perplexity (second fallback)
-    perplexity_key = os.getenv("PERPLEXITY_API_KEY")
-    if perplexity_key:
-        result = call_perplexity(payload, perplexity_key)
-        if result:
-            return jsonify(result), 200
-    
-    # 4. Fallback to local AI (always available, never fails)
-    return jsonify(generate_local_ai_response(payload)), 200
+    local = chat_intents.answer(payload) if chat_intents is not None else None
+    if local is not None:
+        response = sse_response(completion_to_sse(local)) if payload.get("stream") else jsonify(local)
+        response.headers["X-Local-Intent"] = local["intent"]["name"]
+        return response
 
+    messages = payload.get("messages", [])
+    trim = None
+    if messages and isinstance(messages, list) and context_trimmer is not None:
+        models = [client.overrides.get("model") for client in ai_chain.clients]
+        trim = context_trimmer.trim(messages, context_trimmer.budget_for(*models))
+        messages = trim.messages
+
+    cache_key = None
+    if messages and chat_cache is not None:
+        # Providers always run at CHAT_TEMPERATURE with their fixed model
+        cache_key = chat_cache.key({"messages": messages, "temperature": CHAT_TEMPERATURE})
+    if cache_key:
+        cached = chat_cache.get(cache_key)
+        if cached is not None:
+            response = sse_response(completion_to_sse(cached)) if payload.get("stream") else jsonify(cached)
+            response.headers["X-Cache"] = "HIT"
+            return response
+
+    if messages and payload.get("stream"):
+        return with_context(stream_chat(messages, payload, deadline), trim)
+    if messages:
+        try:
+            if chat_flights is not None:
+                (provider, result), shared = chat_flights.do(
+                    flight_key({"messages": messages}),
+                    partial(ai_chain.complete, {"messages": messages}, deadline),
+                    deadline.remaining(),
+                )
+            else:
+                (provider, result), shared = ai_chain.complete({"messages": messages}, deadline), False
+            if cache_key and not shared:
+                chat_cache.set(cache_key, result)
+            if trim is not None and trim.trimmed:
+                result = {**result, "context": trim.metadata()}
+            response = with_context(jsonify(result), trim)
+            if shared:
+                response.headers["X-Coalesced"] = "true"
+            return response, 200
+        except Exception as e:
+            print(f"AI providers failed: {e}")
+
+    # Fallback to local AI (always available, never fails)
+    return local_answer(jsonify(generate_local_ai_response(payload)), deadline), 200
+
+
+def local_answer(response, deadline):
+    """Mark a local fallback answer given because the request ran out of time"""
+    if deadline.expired:
+        response.headers["X-Deadline-Exceeded"] = "true"
+    return response
 
 
+def with_context(response, trim):
+    """Report the tokens saved by context trimming on a forwarded chat response"""
+    if trim is not None and trim.trimmed:
+        response.headers["X-Context-Tokens-Saved"] = str(trim.original_tokens - trim.sent_tokens)
+    return response
 
-def call_openrouter(payload, api_key):
-    """Call OpenRouter API with fallback on failure"""
-    try:
-        messages = payload.get("messages", [])
-        if not messages:
-            return None
-        
-        response = requests.post(
-            "https://api.openrouter.ai/api/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-                "HTTP-Referer": "https://pcos-zeta.vercel.app"
-            },
-            json={
-                "model": "meta-llama/llama-3.1-8b-instruct:free",
-                "messages": messages,
-                "temperature": 0.7,
-                "max_tokens": 600
-            },
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            return response.json()
-        return None
-    except Exception as e:
-        print(f"OpenRouter failed: {e}")
-        return None
 
+def sse_response(chunks):
+    """Unbuffered text/event-stream response"""
+    return Response(chunks, mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
 
-def call_openai(payload, api_key):
-    """Call OpenAI API with fallback on failure"""
-    try:
-        messages = payload.get("messages", [])
-        if not messages:
-            return None
-        
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "gpt-3.5-turbo",
-                "messages": messages,
-                "temperature": 0.7,
-                "max_tokens": 600
-            },
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            return response.json()
-        return None
-    except Exception as e:
-        print(f"OpenAI failed: {e}")
-        return None
 
+def stream_chat(messages, payload, deadline):
+    """Relay provider SSE chunks as they arrive; stream the local answer if no provider opens in time"""
+    def open_stream():
+        return ai_chain.stream({"messages": messages}, deadline)[1]
 
-def call_perplexity(payload, api_key):
-    """Call Perplexity API with fallback on failure"""
     try:
-        messages = payload.get("messages", [])
-        if not messages:
-            return None
-        
-        response = requests.post(
-            "https://api.perplexity.ai/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "pplx-7b-online",
-                "messages": messages,
-                "temperature": 0.7,
-                "max_tokens": 600
-            },
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            return response.json()
-        return None
+        if chat_flights is not None:
+            chunks, shared = chat_flights.stream(flight_key({"messages": messages}), open_stream, deadline.remaining())
+        else:
+            chunks, shared = open_stream(), False
+        response = sse_response(chunks)
+        if shared:
+            response.headers["X-Coalesced"] = "true"
+        return response
     except Exception as e:
-        print(f"Perplexity failed: {e}")
-        return None
+        print(f"AI provider streams failed: {e}")
+    return local_answer(sse_response(completion_to_sse(generate_local_ai_response(payload))), deadline)
 
 
 def generate_local_ai_response(payload):
-    """Generate a basic AI response using local rules (fallback when APIs unavailable)"""
-    messages = payload.get("messages", [])
-    if not messages:
-        return {"error": "No messages provided"}
-    
-    last_message = messages[-1].get("content", "").lower()
-    
-    # PCOS-related responses
-    pcos_keywords = ["pcos", "polycystic", "ovary", "ovarian"]
-    if any(kw in last_message for kw in pcos_keywords):
-        return {
-            "id": "local-ai-response",
-            "object": "chat.completion",
-            "created": int(time.time()),
-            "model": payload.get("model", "local-ai"),
-            "choices": [{
-                "index": 0,
-                "message": {
-                    "role": "assistant",
-                    "content": "PCOS (Polycystic Ovary Syndrome) is a hormonal condition affecting women of reproductive age. Key characteristics include irregular menstrual cycles, elevated androgen levels, insulin resistance, and polycystic ovaries. Management typically involves lifestyle changes, hormonal contraceptives, or medications like metformin. Common symptoms include irregular periods, acne, hair loss, and weight gain. I recommend consulting a healthcare provider for proper diagnosis and treatment."
-                },
-                "finish_reason": "stop"
-            }],
-            "usage": {
-                "prompt_tokens": len(last_message.split()),
-                "completion_tokens": 75,
-                "total_tokens": len(last_message.split()) + 75
-            }
-        }
-    
-    # Health/medical questions
-    elif any(word in last_message for word in ["health", "symptom", "treatment", "diagnosis", "doctor"]):
-        return {
-            "id": "local-ai-response",
-            "object": "chat.completion",
-            "created": int(time.time()),
-            "model": payload.get("model", "local-ai"),
-            "choices": [{
-                "index": 0,
-                "message": {
-                    "role": "assistant",
-                    "content": "For health-related questions: Please consult with a qualified healthcare provider or medical professional. They can provide personalized advice based on your medical history and current health status. In emergencies, contact your local emergency services."
-                },
-                "finish_reason": "stop"
-            }],
-            "usage": {
-                "prompt_tokens": len(last_message.split()),
-                "completion_tokens": 35,
-                "total_tokens": len(last_message.split()) + 35
-            }
-        }
-    
-    # Generic response
-    else:
-        return {
-            "id": "local-ai-response",
-            "object": "chat.completion",
-            "created": int(time.time()),
-            "model": payload.get("model", "local-ai"),
-            "choices": [{
-                "index": 0,
-                "message": {
-                    "role": "assistant",
-                    "content": "I'm a local AI assistant. I can help with general questions about PCOS and women's health. For specific medical advice, please consult a healthcare provider. What would you like to know?"
-                },
-                "finish_reason": "stop"
-            }],
-            "usage": {
-                "prompt_tokens": len(last_message.split()),
-                "completion_tokens": 30,
-                "total_tokens": len(last_message.split()) + 30
-            }
-        }
+    """Answer from the bundled PCOS knowledge base (fallback when APIs unavailable)"""
+    return local_response(payload, knowledge_base)
 
 
 def generate_report(user_data, analysis, doctors):
@@ -0,0 +1,565 @@
+"""
+AI Insights
+Answers the chatbot's insight, symptom, lifestyle, diet-plan and explain
+requests from PCOSAnalyzer results plus advice cached per coarse profile
+bucket, so an AI provider is only asked for buckets not seen yet
+"""
+
+import logging
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from chat_intents import SYMPTOM_LABELS, find_symptoms
+from knowledge_base import DISCLAIMER
+from lru_cache import LRUCache
+
+
+logger = logging.getLogger("pcos-ai-insights")
+
+KINDS = ("insight", "analyze-symptoms", "lifestyle", "diet-plan", "explain")
+# Field of the response body holding the advice text, per kind
+ADVICE_FIELDS = {
+    "insight": "insight",
+    "analyze-symptoms": "analysis",
+    "lifestyle": "advice",
+    "diet-plan": "plan",
+    "explain": "explanation",
+}
+DEFAULT_MODEL = "meta-llama/llama-3.1-8b-instruct:free"
+# Provider-written advice is kept for a week; built-in advice only briefly, so a
+# provider gets another chance at the bucket once it is back
+DEFAULT_TTL = 7 * 86400
+DEFAULT_LOCAL_TTL = 600
+MAX_TERM_CHARS = 80
+
+ACTIVITY_LEVELS = ("sedentary", "light", "moderate", "active")
+STRESS_LEVELS = ("low", "moderate", "high")
+# Upper BMI bound of each band; anything above the last is "obese"
+BMI_BANDS = ((18.5, "underweight"), (25.0, "normal"), (30.0, "overweight"))
+# Bit order of the symptom mask
+SYMPTOM_KEYS = tuple(SYMPTOM_LABELS)
+
+# Profile fields accepted from clients and their plausible ranges
+NUMERIC_FIELDS = {
+    "age": (10, 80),
+    "cycle_length": (10, 180),
+    "period_length": (1, 30),
+    "sleep": (0, 24),
+    "weight": (20, 300),
+    "height": (100, 250),
+    "bmi": (10, 80),
+}
+# Analyzer inputs assumed when the client leaves them out
+PROFILE_DEFAULTS = {"age": 25, "cycle_length": 28, "period_length": 5}
+
+GOAL_PHRASES = {
+    "weight": r"weight|lose|losing|slim\w*|fat loss",
+    "insulin": r"insulin|blood sugar|glucose|diabet\w*|sugar cravings?",
+    "fertility": r"fertility|pregnan\w*|conceiv\w*|ovulat\w*",
+    "cycle": r"cycles?|periods?|regular\w*",
+    "skin_hair": r"acne|skin|hair",
+    "energy": r"energy|fatigue|tired\w*",
+}
+_GOALS = [(key, re.compile(rf"\b(?:{pattern})\b")) for key, pattern in GOAL_PHRASES.items()]
+
+SYSTEM_PROMPT = (
+    "You are a PCOS health assistant. Write clear, practical and encouraging guidance in plain "
+    "language for a general audience, in at most 180 words. Do not diagnose, do not name "
+    "prescription doses, and do not add a disclaimer (one is added for you)."
+)
+
+SYMPTOM_NOTES = {
+    "irregular_cycles": "Irregular or missed periods usually mean ovulation is not happening every month, "
+    "the most common sign of PCOS.",
+    "hirsutism": "Excess hair on the face, chest or back is driven by higher androgen (male-type hormone) "
+    "levels and is one of the diagnostic signs of PCOS.",
+    "acne": "Persistent adult acne, especially along the jaw, can come from raised androgens.",
+    "weight_gain": "Weight gain around the waist is common with PCOS because insulin resistance makes "
+    "the body store fat more easily.",
+    "hair_loss": "Thinning hair on the top of the head is another effect of raised androgens.",
+    "infertility": "Difficulty conceiving often follows from irregular ovulation and is very treatable "
+    "once the cause is known.",
+    "mood_changes": "Anxiety and low mood are more frequent with PCOS, linked to hormones and to living "
+    "with the symptoms.",
+    "fatigue": "Tiredness can come with insulin resistance, poor sleep or low iron from heavy periods.",
+    "darkening": "Dark, velvety skin patches (acanthosis nigricans) are a visible sign of insulin "
+    "resistance.",
+    "pelvic_pain": "Pelvic pain is not typical of PCOS itself and should be checked by a doctor, as other "
+    "conditions can cause it.",
+}
+
+SYMPTOM_LIFESTYLE = {
+    "irregular_cycles": "Log each period's start date; three months of data shows your doctor the pattern.",
+    "weight_gain": "Combine strength training twice a week with daily walks to improve insulin sensitivity.",
+    "mood_changes": "Plan short daily stress breaks (breathing, a walk outside) and talk to someone you trust.",
+    "fatigue": "Keep regular sleep and wake times, and ask for an iron and thyroid check if tiredness lasts.",
+    "acne": "Use gentle, non-comedogenic skin care and avoid picking; a dermatologist can help early.",
+    "hirsutism": "Hair removal options are safe to use; a doctor can discuss treatments that act on androgens.",
+    "hair_loss": "Handle hair gently, avoid tight styles, and ask about iron and vitamin D levels.",
+    "infertility": "Track ovulation for a few cycles and see a fertility specialist after 6-12 months of trying.",
+    "darkening": "Regular movement after meals helps the insulin resistance behind skin darkening.",
+    "pelvic_pain": "Note when the pain comes and how long it lasts before seeing your doctor.",
+}
+
+SYMPTOM_DIET = {
+    "weight_gain": "Fill half the plate with vegetables and keep portions of rice, bread and pasta modest.",
+    "acne": "Cutting back on sugary drinks and high-glycemic snacks helps some people with acne.",
+    "fatigue": "Include iron-rich foods (lentils, leafy greens, lean meat) and pair them with vitamin C.",
+    "darkening": "Prefer low-glycemic carbohydrates and pair them with protein to blunt sugar spikes.",
+    "irregular_cycles": "Regular meals with protein and fibre keep insulin steady, which supports ovulation.",
+    "mood_changes": "Omega-3 sources (oily fish, walnuts, flax) and regular meals can steady mood.",
+    "hair_loss": "Make sure meals include enough protein, iron and zinc.",
+}
+
+ACTIVITY_ADVICE = {
+    "sedentary": "Start with 10-15 minute walks after meals and build up to 150 minutes of moderate activity "
+    "a week.",
+    "light": "Add one or two sessions a week so you reach 150 minutes of moderate activity, including some "
+    "strength work.",
+    "moderate": "Keep your routine and make sure two sessions a week include strength training.",
+    "active": "Your activity level is great; balance intense training with rest days and enough food.",
+    "unknown": "Aim for 150 minutes of moderate activity a week, with strength training twice a week.",
+}
+
+BMI_ADVICE = {
+    "underweight": "Your BMI is below the healthy range: focus on regular, nourishing meals rather than "
+    "restriction.",
+    "normal": "Your BMI is in the healthy range; PCOS can still involve insulin resistance, so food quality "
+    "matters.",
+    "overweight": "Losing even 5% of body weight often makes cycles more regular and improves other "
+    "symptoms.",
+    "obese": "A gradual 5-10% weight loss can markedly improve cycles, insulin resistance and energy; a "
+    "dietitian can help plan it.",
+    "unknown": "Weight and height help tailor this advice; a healthy waist size matters as much as BMI.",
+}
+
+RISK_ADVICE = {
+    "high": "Your answers show several signs often seen with PCOS. Please book a visit with a gynecologist "
+    "or endocrinologist soon for hormone tests and, if needed, an ultrasound.",
+    "moderate": "Your answers show some signs that are worth discussing with a doctor in the next month or "
+    "two. Keep tracking your cycles and symptoms until then.",
+    "low": "Your answers show few signs of PCOS. Keep an eye on your cycles and mention any changes at your "
+    "next checkup.",
+}
+
+DIET_GUIDELINES = [
+    "Base meals on vegetables, legumes, whole grains, lean protein and healthy fats.",
+    "Choose low-glycemic carbohydrates (oats, lentils, brown rice) over white bread and sugar.",
+    "Eat protein at every meal and spread meals evenly through the day.",
+    "Limit sugary drinks, sweets and ultra-processed snacks.",
+]
+
+GOAL_DIET = {
+    "weight": "Aim for a small calorie deficit (about 300-500 kcal a day) rather than strict dieting.",
+    "insulin": "Pair every carbohydrate with protein or fat and take a short walk after larger meals.",
+    "fertility": "Include folate-rich foods (leafy greens, beans) and ask your doctor about a folic acid "
+    "supplement.",
+    "cycle": "Regular meal times and steady blood sugar support a more regular cycle.",
+    "skin_hair": "Spearmint tea, zinc-rich foods and fewer high-glycemic snacks may help skin and hair.",
+    "energy": "Avoid long gaps between meals and keep caffeine to the morning.",
+}
+
+SAMPLE_DAY = {
+    "breakfast": "Oats with Greek yogurt, berries and a spoon of ground flax",
+    "lunch": "Lentil and vegetable salad with olive oil, feta and a slice of wholegrain bread",
+    "snack": "An apple with a handful of almonds",
+    "dinner": "Grilled fish or tofu with roasted vegetables and a small portion of brown rice",
+}
+
+# Common terms the chatbot explains without asking a provider
+GLOSSARY = {
+    "pcos": "Polycystic ovary syndrome (PCOS) is a common hormonal condition. It can cause irregular "
+    "periods, higher levels of androgens (male-type hormones) and many small follicles on the ovaries.",
+    "androgens": "Androgens are hormones such as testosterone that everyone has. In PCOS they are often "
+    "higher than usual, which can cause acne, excess hair growth and hair thinning.",
+    "hirsutism": "Hirsutism is coarse, dark hair growing in a male-type pattern, for example on the face, "
+    "chest or back. It is usually caused by raised androgens.",
+    "insulin resistance": "Insulin resistance means the body's cells respond less to insulin, so more of it "
+    "is needed to keep blood sugar normal. High insulin can raise androgen levels and makes weight gain "
+    "easier.",
+    "anovulation": "Anovulation means an egg is not released during a cycle. It leads to irregular or "
+    "missed periods and is a common cause of fertility problems in PCOS.",
+    "acanthosis nigricans": "Acanthosis nigricans is dark, velvety skin in folds such as the neck or "
+    "armpits. It is a sign of insulin resistance.",
+    "amh": "Anti-Müllerian hormone (AMH) is made by small follicles in the ovaries. It is often higher in "
+    "PCOS because there are more follicles.",
+    "lh": "Luteinizing hormone (LH) triggers ovulation. In PCOS, LH is often high compared with FSH.",
+    "fsh": "Follicle-stimulating hormone (FSH) helps follicles in the ovaries grow each cycle.",
+    "rotterdam criteria": "The Rotterdam criteria diagnose PCOS when two of three are present: irregular or "
+    "absent ovulation, signs of raised androgens, and polycystic ovaries on ultrasound, once other causes are "
+    "ruled out.",
+    "polycystic ovaries": "Polycystic ovaries have many small follicles (not true cysts) visible on "
+    "ultrasound. They are one of the three Rotterdam criteria for PCOS.",
+    "metformin": "Metformin is a medicine that improves insulin sensitivity. Doctors sometimes prescribe it "
+    "in PCOS to help cycles and metabolism.",
+    "glycemic index": "The glycemic index (GI) ranks foods by how quickly they raise blood sugar. Low-GI "
+    "foods such as oats and lentils are generally recommended with PCOS.",
+    "bmi": "Body mass index (BMI) is weight in kilograms divided by height in metres squared. 18.5-24.9 is "
+    "the healthy adult range.",
+    "testosterone": "Testosterone is the main androgen. A mildly raised level is common in PCOS and can be "
+    "checked with a blood test.",
+    "endometrial hyperplasia": "Endometrial hyperplasia is a thickened womb lining that can develop when "
+    "periods are very infrequent. Having at least a few periods a year helps prevent it.",
+}
+
+
+class ProfileBucket(NamedTuple):
+    """Coarse profile that advice is cached for."""
+
+    risk_level: str
+    symptom_mask: int
+    activity: str
+    bmi_band: str
+
+    def symptoms(self) -> List[str]:
+        return [key for bit, key in enumerate(SYMPTOM_KEYS) if self.symptom_mask & (1 << bit)]
+
+    def describe(self) -> str:
+        labels = [SYMPTOM_LABELS[key] for key in self.symptoms()] or ["none reported"]
+        return (
+            f"estimated PCOS risk: {self.risk_level}; symptoms: {', '.join(labels)}; "
+            f"activity level: {self.activity}; BMI band: {self.bmi_band}"
+        )
+
+
+def profile_from(data: Any) -> Dict[str, Any]:
+    """Form-style profile from a loosely typed client object; unknown or implausible fields are dropped."""
+    if not isinstance(data, dict):
+        return {}
+    profile: Dict[str, Any] = {}
+    for field, (low, high) in NUMERIC_FIELDS.items():
+        try:
+            value = float(data.get(field))
+        except (TypeError, ValueError):
+            continue
+        if low <= value <= high:
+            profile[field] = int(value) if field in ("age", "cycle_length", "period_length") else value
+    profile["symptoms"] = symptoms_from(data.get("symptoms"))[0]
+    for field, levels in (("activity", ACTIVITY_LEVELS), ("stress", STRESS_LEVELS)):
+        value = data.get(field)
+        if isinstance(value, str) and value.strip().lower() in levels:
+            profile[field] = value.strip().lower()
+    if "bmi" not in profile and "weight" in profile and "height" in profile:
+        profile["bmi"] = round(profile["weight"] / (profile["height"] / 100) ** 2, 1)
+    return profile
+
+
+def symptoms_from(value: Any) -> Tuple[List[str], List[str]]:
+    """``(symptom keys, unrecognized items)`` from form keys, labels or free text."""
+    items = [value] if isinstance(value, str) else value if isinstance(value, list) else []
+    found: List[str] = []
+    unknown: List[str] = []
+    for item in items:
+        if not isinstance(item, str) or not item.strip():
+            continue
+        key = item.strip().lower().replace(" ", "_")
+        keys = [key] if key in SYMPTOM_LABELS else find_symptoms(item.lower())
+        if not keys:
+            unknown.append(item.strip()[:MAX_TERM_CHARS])
+        found.extend(k for k in keys if k not in found)
+    return [key for key in SYMPTOM_KEYS if key in found], unknown
+
+
+def goals_from(value: Any) -> List[str]:
+    """Known goal keys mentioned in a goal string or list."""
+    items = [value] if isinstance(value, str) else value if isinstance(value, list) else []
+    text = " ".join(item.lower() for item in items if isinstance(item, str))
+    return [key for key, pattern in _GOALS if pattern.search(text)]
+
+
+def bmi_band(bmi: Optional[float]) -> str:
+    if bmi is None:
+        return "unknown"
+    for bound, band in BMI_BANDS:
+        if bmi < bound:
+            return band
+    return "obese"
+
+
+def profile_bucket(profile: Dict[str, Any], risk_level: str) -> ProfileBucket:
+    mask = 0
+    for bit, key in enumerate(SYMPTOM_KEYS):
+        if key in profile.get("symptoms", []):
+            mask |= 1 << bit
+    return ProfileBucket(
+        risk_level if risk_level in RISK_ADVICE else "moderate",
+        mask,
+        profile.get("activity", "unknown"),
+        bmi_band(profile.get("bmi")),
+    )
+
+
+def validate_insight(kind: str, payload: Any) -> Optional[str]:
+    """Error message for a malformed request body, or None."""
+    if not isinstance(payload, dict):
+        return "Invalid request body"
+    if kind == "insight" and not isinstance(payload.get("userData"), dict):
+        return "userData must be an object"
+    if kind == "analyze-symptoms":
+        symptoms = payload.get("symptoms")
+        if not (isinstance(symptoms, str) and symptoms.strip()) and not (isinstance(symptoms, list) and symptoms):
+            return "symptoms must be a non-empty list or string"
+    if kind == "lifestyle" and not isinstance(payload.get("profile"), dict):
+        return "profile must be an object"
+    if kind == "diet-plan" and not isinstance(payload.get("userProfile", {}), dict):
+        return "userProfile must be an object"
+    if kind == "explain":
+        term = payload.get("term")
+        if not isinstance(term, str) or not term.strip():
+            return "term is required"
+        if len(term) > MAX_TERM_CHARS:
+            return f"term must be at most {MAX_TERM_CHARS} characters"
+    return None
+
+
+class _Request(NamedTuple):
+    """What one request needs besides the advice text."""
+
+    body: Dict[str, Any]
+    key: Optional[Tuple[Any, ...]]  # None: the answer is for this request only and never shared
+    local: Optional[str]
+    prompt: str
+
+
+class AIInsights:
+    """Chatbot insight endpoints on top of ``PCOSAnalyzer``.
+
+    The structured part of every answer (risk score, level, recommendations)
+    is computed from the request by the analyzer. The advice text is cached
+    per kind and ``ProfileBucket`` (risk level, symptom mask, activity, BMI
+    band; plus the goals for diet plans and the term for explanations), so
+    users with similar profiles share it. On a miss ``chain`` is asked once
+    for the bucket and its answer kept for ``ttl`` seconds. Without a
+    provider the built-in advice is used and kept for ``local_ttl`` seconds.
+    Prompts describe only the bucket, never the user's own numbers.
+
+    Glossary terms are answered directly. With ``flights`` (SingleFlight)
+    concurrent misses for one bucket share a provider call.
+    """
+
+    def __init__(
+        self,
+        analyzer,
+        chain=None,
+        model: str = DEFAULT_MODEL,
+        knowledge_base=None,
+        flights=None,
+        maxsize: int = 5000,
+        ttl: float = DEFAULT_TTL,
+        local_ttl: float = DEFAULT_LOCAL_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.analyzer = analyzer
+        self.chain = chain
+        self.model = model
+        self.knowledge_base = knowledge_base
+        self.flights = flights
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self._cache = LRUCache(maxsize, ttl=ttl, clock=clock)
+        self._lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.glossary = 0
+        self.ai_calls = 0
+        self.ai_errors = 0
+        self.local = 0
+
+    def answer(self, kind: str, payload: Dict[str, Any], deadline=None) -> Dict[str, Any]:
+        """Response body for a validated request; ``source`` says where the advice came from."""
+        with self._lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+        if kind == "explain":
+            term = " ".join(payload["term"].lower().split())
+            if term in GLOSSARY:
+                with self._lock:
+                    self.glossary += 1
+                return {"term": term, "explanation": GLOSSARY[term], "source": "glossary", "disclaimer": DISCLAIMER}
+        req = getattr(self, "_" + kind.replace("-", "_"))(payload)
+        text, source = self._advice(req, deadline)
+        return {**req.body, ADVICE_FIELDS[kind]: text, "source": source, "disclaimer": DISCLAIMER}
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        cache = self._cache.stats()
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "cached": cache["size"],
+                "hits": cache["hits"],
+                "misses": cache["misses"],
+                "hit_rate": cache["hit_rate"],
+                "glossary": self.glossary,
+                "ai_calls": self.ai_calls,
+                "ai_errors": self.ai_errors,
+                "local": self.local,
+            }
+
+    def _analyze(self, profile: Dict[str, Any]) -> Dict[str, Any]:
+        data = {**PROFILE_DEFAULTS, **profile}
+        try:
+            return self.analyzer.analyze(data) if self.analyzer is not None else {}
+        except Exception as e:
+            logger.warning(f"Insight analysis failed: {e}")
+            return {}
+
+    def _insight(self, payload: Dict[str, Any]) -> _Request:
+        profile = profile_from(payload["userData"])
+        result = self._analyze(profile)
+        bucket = profile_bucket(profile, result.get("risk_level", "moderate"))
+        body = {
+            "type": payload.get("type") if isinstance(payload.get("type"), str) else "health_analysis",
+            "risk_score": result.get("risk_score"),
+            "risk_level": bucket.risk_level,
+            "summary": result.get("summary"),
+            "cycle_status": result.get("cycle_status"),
+            "period_status": result.get("period_status"),
+            "recommendations": result.get("recommendations", []),
+            "bucket": bucket._asdict(),
+        }
+        local = " ".join(
+            [RISK_ADVICE[bucket.risk_level]]
+            + [SYMPTOM_NOTES[key] for key in bucket.symptoms()[:3]]
+            + [ACTIVITY_ADVICE[bucket.activity], BMI_ADVICE[bucket.bmi_band]]
+        )
+        prompt = (
+            f"Write a short health insight for someone with this profile: {bucket.describe()}. "
+            "Explain what the profile suggests and the most useful next steps."
+        )
+        return _Request(body, ("insight", *bucket), local, prompt)
+
+    def _analyze_symptoms(self, payload: Dict[str, Any]) -> _Request:
+        keys, unknown = symptoms_from(payload["symptoms"])
+        profile = {"symptoms": keys}
+        result = self._analyze(profile)
+        bucket = profile_bucket(profile, result.get("risk_level", "moderate"))
+        body = {
+            "symptoms": [{"key": key, "label": SYMPTOM_LABELS[key], "note": SYMPTOM_NOTES[key]} for key in keys],
+            "unrecognized": unknown,
+            "risk_score": result.get("risk_score"),
+            "risk_level": bucket.risk_level,
+            "recommendations": result.get("recommendations", []),
+            "bucket": bucket._asdict(),
+        }
+        if keys:
+            local = (
+                f"{RISK_ADVICE[bucket.risk_level]} This estimate assumes a 28-day cycle and 5-day periods, "
+                "since only symptoms were given."
+            )
+        else:
+            local = (
+                "None of these matched the symptoms we screen for (for example irregular periods, acne, "
+                "excess hair growth or weight gain). If something is bothering you, a doctor can help."
+            )
+        prompt = (
+            f"Someone reports these symptoms: {', '.join(SYMPTOM_LABELS[k] for k in keys) or 'none we screen for'}. "
+            f"Their estimated PCOS risk is {bucket.risk_level}. Explain how these symptoms can relate to PCOS "
+            "and what to discuss with a doctor."
+        )
+        return _Request(body, ("analyze-symptoms", *bucket), local, prompt)
+
+    def _lifestyle(self, payload: Dict[str, Any]) -> _Request:
+        profile = profile_from(payload["profile"])
+        result = self._analyze(profile)
+        bucket = profile_bucket(profile, result.get("risk_level", "moderate"))
+        tips = [ACTIVITY_ADVICE[bucket.activity], BMI_ADVICE[bucket.bmi_band]]
+        tips += [SYMPTOM_LIFESTYLE[key] for key in bucket.symptoms() if key in SYMPTOM_LIFESTYLE]
+        tips.append("Aim for 7-9 hours of sleep on a regular schedule.")
+        body = {
+            "risk_level": bucket.risk_level,
+            "tips": tips[:6],
+            "recommendations": result.get("recommendations", []),
+            "bucket": bucket._asdict(),
+        }
+        prompt = (
+            f"Give lifestyle recommendations (exercise, sleep, stress) for someone with PCOS concerns and "
+            f"this profile: {bucket.describe()}."
+        )
+        return _Request(body, ("lifestyle", *bucket), " ".join(tips[:6]), prompt)
+
+    def _diet_plan(self, payload: Dict[str, Any]) -> _Request:
+        profile = profile_from(payload.get("userProfile", {}))
+        goals = goals_from(payload.get("goals"))
+        result = self._analyze(profile)
+        bucket = profile_bucket(profile, result.get("risk_level", "moderate"))
+        guidelines = list(DIET_GUIDELINES) + [GOAL_DIET[goal] for goal in goals]
+        guidelines += [SYMPTOM_DIET[key] for key in bucket.symptoms() if key in SYMPTOM_DIET][:3]
+        body = {
+            "goals": goals,
+            "guidelines": guidelines,
+            "sample_day": dict(SAMPLE_DAY),
+            "bucket": bucket._asdict(),
+        }
+        local = f"{BMI_ADVICE[bucket.bmi_band]} " + " ".join(guidelines)
+        prompt = (
+            f"Write a one-day PCOS-friendly meal plan with short reasons for someone with this profile: "
+            f"{bucket.describe()}; goals: {', '.join(goals) or 'general health'}."
+        )
+        return _Request(body, ("diet-plan", *bucket, tuple(goals)), local, prompt)
+
+    def _explain(self, payload: Dict[str, Any]) -> _Request:
+        term = " ".join(payload["term"].lower().split())
+        local = None
+        if self.knowledge_base is not None:
+            hits = self.knowledge_base.search(term, k=1, min_score=1.0)
+            if hits:
+                local = hits[0].entry["answer"]
+        prompt = f'Explain the term "{term}" in simple language, as it relates to PCOS or women\'s health.'
+        # The term is free text from the user, so a provider answer for it is never cached or shared:
+        # only glossary terms (answered before this) get the same explanation for everyone.
+        return _Request({"term": term}, None, local, prompt)
+
+    def _advice(self, req: _Request, deadline) -> Tuple[str, str]:
+        if req.key is None:
+            return self._build(req, deadline)
+        cached = self._cache.get(req.key)
+        if cached is not None:
+            return cached, "cache"
+        if self.flights is None:
+            return self._build(req, deadline)
+        wait = deadline.remaining() if deadline is not None else None
+        (text, source), _ = self.flights.do("insight:" + repr(req.key), lambda: self._build(req, deadline), wait)
+        return text, source
+
+    def _build(self, req: _Request, deadline) -> Tuple[str, str]:
+        text = self._ask(req.prompt, deadline)
+        if text:
+            if req.key is not None:
+                self._cache.set(req.key, text)
+            return text, "ai"
+        with self._lock:
+            self.local += 1
+        if req.local is None:
+            return (
+                "I don't have an explanation for that term yet. Please ask your doctor, or try the chat "
+                "assistant.",
+                "local",
+            )
+        if req.key is not None:
+            self._cache.set(req.key, req.local, ttl=self.local_ttl)
+        return req.local, "local"
+
+    def _ask(self, prompt: str, deadline) -> Optional[str]:
+        if self.chain is None:
+            return None
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}],
+            "temperature": 0.3,
+            "max_tokens": 400,
+        }
+        with self._lock:
+            self.ai_calls += 1
+        try:
+            _, body = self.chain.complete(payload, deadline)
+            text = body["choices"][0]["message"]["content"].strip()
+        except Exception as e:  # ProviderError, or a body without a message
+            logger.info(f"Insight advice from provider unavailable: {e}")
+            text = ""
+        if not text:
+            with self._lock:
+                self.ai_errors += 1
+        return text or None
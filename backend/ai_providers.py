@@ -0,0 +1,921 @@
+"""
+AI Provider Clients
+Long-lived, per-provider HTTP connection pools for the chat proxy, and a
+fallback chain with circuit breakers, latency-ordered routing, hedging and
+a request-level deadline (blocking on ``requests``, or on asyncio with
+``aiohttp`` when installed)
+"""
+
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:  # only the asyncio chat server needs it
+    aiohttp = None
+
+
+DEFAULT_POOL_SIZE = 10
+# Connect is a single round trip (plus TLS); the read timeout covers generation
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 30.0
+# Buffered bodies are read in pieces of this size when a deadline must be checked between reads
+BODY_CHUNK_SIZE = 16 * 1024
+# Upstream sockets one event loop may hold open across all providers
+DEFAULT_ASYNC_CONNECTIONS = 1000
+
+# Hedge after this long without an answer unless a per-provider delay is set
+DEFAULT_HEDGE_DELAY = 2.0
+# Latency samples kept per provider, and needed before percentile delays apply
+LATENCY_SAMPLES = 200
+MIN_LATENCY_SAMPLES = 20
+# Weight of the newest sample in the per-provider success latency EWMA
+EWMA_ALPHA = 0.3
+# Request header in which a client says how many seconds it will wait for an answer
+DEADLINE_HEADER = "X-Request-Timeout"
+
+
+class ProviderError(Exception):
+    """A provider call failed (network error, non-200 status or bad JSON)."""
+
+    def __init__(self, provider: str, message: str, status: Optional[int] = None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.status = status
+
+
+class DeadlineExceeded(ProviderError):
+    """The request's deadline passed before a provider answered."""
+
+
+class Deadline:
+    """Point in time by which a whole request must be answered.
+
+    One deadline is shared by every upstream attempt of a request, so each
+    attempt only gets the time that is left instead of its full timeout.
+    """
+
+    def __init__(self, seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.seconds = seconds
+        self._clock = clock
+        self.expires_at = clock() + seconds
+
+    @classmethod
+    def from_header(cls, value: Optional[str], limit: float) -> "Deadline":
+        """Deadline for a request whose client waits ``value`` seconds (DEADLINE_HEADER), at most ``limit``."""
+        seconds = limit
+        try:
+            requested = float(value) if value else math.nan
+        except ValueError:
+            requested = math.nan
+        if math.isfinite(requested):
+            seconds = min(limit, max(0.0, requested))
+        return cls(seconds)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self._clock())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+
+class ProviderClient:
+    """OpenAI-compatible chat completions endpoint behind a keep-alive session.
+
+    ``overrides`` are body fields forced on every request (model, max_tokens).
+    The session's connection pool (``pool_size`` sockets) is shared by every
+    request thread, so only the first call to a provider pays for TCP and TLS
+    setup. Sessions are created lazily per process: pooled sockets must not
+    be inherited across a fork.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        api_key_env: str,
+        placeholder: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+        overrides: Optional[Dict[str, Any]] = None,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+    ):
+        self.name = name
+        self.url = url
+        self.api_key_env = api_key_env
+        self.placeholder = placeholder
+        self.headers = dict(headers or {})
+        self.overrides = dict(overrides or {})
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self._session: Optional[requests.Session] = None
+        self._session_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def api_key(self) -> Optional[str]:
+        """Configured key, or None when unset or still the .env.example placeholder."""
+        key = os.getenv(self.api_key_env)
+        if not key or key == self.placeholder:
+            return None
+        return key
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None or self._session_pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._session_pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session, self._session_pid = session, os.getpid()
+        return self._session
+
+    def complete(
+        self, payload: Dict[str, Any], api_key: Optional[str] = None, deadline: Optional[Deadline] = None
+    ) -> Dict[str, Any]:
+        """POST a chat completion and return the decoded body; raises ProviderError.
+
+        ``overrides`` (e.g. a fixed model) replace the matching payload fields.
+        With a ``deadline`` the connect and read timeouts are cut to the time
+        left, and DeadlineExceeded is raised without a request once none is.
+        The read timeout applies to each socket read, not the whole body, so
+        the body is read in chunks and given up (DeadlineExceeded) once the
+        deadline passes between two of them: a provider trickling bytes can
+        overrun the deadline by at most one read timeout.
+        """
+        response = self._post(payload, api_key, stream=deadline is not None, deadline=deadline)
+        try:
+            if deadline is None:
+                return response.json()
+            return json.loads(self._read(response, deadline))
+        except ValueError as exc:
+            raise ProviderError(self.name, "invalid JSON body", response.status_code) from exc
+
+    def stream(
+        self, payload: Dict[str, Any], api_key: Optional[str] = None, deadline: Optional[Deadline] = None
+    ) -> requests.Response:
+        """Open a ``stream: true`` completion; the body (SSE) is not read yet.
+
+        Raises ProviderError before any byte is consumed, so callers can still
+        fail over. The caller must close the returned response. A ``deadline``
+        bounds the wait for the first byte, not the length of the stream.
+        """
+        return self._post({**payload, "stream": True}, api_key, stream=True, deadline=deadline)
+
+    async def acomplete(
+        self,
+        session: "aiohttp.ClientSession",
+        payload: Dict[str, Any],
+        api_key: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> Dict[str, Any]:
+        """``complete`` on an aiohttp session: the event loop is free while the provider works."""
+        response = await self._apost(session, payload, api_key, deadline, whole=True)
+        try:
+            return await response.json(content_type=None)
+        except ValueError as exc:
+            raise ProviderError(self.name, "invalid JSON body", response.status) from exc
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            raise ProviderError(self.name, str(exc) or type(exc).__name__) from exc
+        finally:
+            response.release()
+
+    async def astream(
+        self,
+        session: "aiohttp.ClientSession",
+        payload: Dict[str, Any],
+        api_key: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> "aiohttp.ClientResponse":
+        """``stream`` on an aiohttp session; the caller must release the returned response."""
+        return await self._apost(session, {**payload, "stream": True}, api_key, deadline, whole=False)
+
+    def _read(self, response: requests.Response, deadline: Deadline) -> bytes:
+        """The whole body of a ``stream=True`` response, read before ``deadline``."""
+        chunks = []
+        try:
+            for chunk in response.iter_content(chunk_size=BODY_CHUNK_SIZE):
+                chunks.append(chunk)
+                if deadline.expired:
+                    raise DeadlineExceeded(self.name, "deadline exceeded while reading the body")
+        except requests.RequestException as exc:
+            raise ProviderError(self.name, str(exc)) from exc
+        finally:
+            response.close()
+        return b"".join(chunks)
+
+    def _timeout(self, deadline: Optional[Deadline]) -> Tuple[float, float]:
+        """``(connect, read)`` timeout for one attempt: the configured one, cut to the deadline."""
+        if deadline is None:
+            return self.timeout
+        remaining = deadline.remaining()
+        if remaining <= 0.0:
+            raise DeadlineExceeded(self.name, "deadline exceeded")
+        return min(self.timeout[0], remaining), min(self.timeout[1], remaining)
+
+    def _request(self, payload: Dict[str, Any], api_key: Optional[str]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        if self.overrides:
+            payload = {**payload, **self.overrides}
+        api_key = api_key or self.api_key()
+        if not api_key:
+            raise ProviderError(self.name, "no API key configured")
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}",
+            **self.headers,
+        }
+        return payload, headers
+
+    async def _apost(
+        self,
+        session: "aiohttp.ClientSession",
+        payload: Dict[str, Any],
+        api_key: Optional[str],
+        deadline: Optional[Deadline] = None,
+        whole: bool = True,
+    ) -> "aiohttp.ClientResponse":
+        payload, headers = self._request(payload, api_key)
+        connect, read = self._timeout(deadline)
+        # ``total`` also covers reading the body, so it only bounds buffered answers
+        total = deadline.remaining() if deadline is not None and whole else None
+        timeout = aiohttp.ClientTimeout(total=total, sock_connect=connect, sock_read=read)
+        try:
+            response = await session.post(self.url, json=payload, headers=headers, timeout=timeout)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            raise ProviderError(self.name, str(exc) or type(exc).__name__) from exc
+        if response.status != 200:
+            response.release()
+            raise ProviderError(self.name, f"returned {response.status}", response.status)
+        return response
+
+    def _post(
+        self, payload: Dict[str, Any], api_key: Optional[str], stream: bool, deadline: Optional[Deadline] = None
+    ) -> requests.Response:
+        payload, headers = self._request(payload, api_key)
+        timeout = self._timeout(deadline)
+        try:
+            response = self.session.post(
+                self.url, json=payload, headers=headers, timeout=timeout, stream=stream
+            )
+        except requests.RequestException as exc:
+            raise ProviderError(self.name, str(exc)) from exc
+        if response.status_code != 200:
+            response.close()
+            raise ProviderError(self.name, f"returned {response.status_code}", response.status_code)
+        return response
+
+    def close(self) -> None:
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+
+
+def configured(clients: Iterable[ProviderClient]) -> List[ProviderClient]:
+    """Clients that have an API key, in the given order."""
+    return [client for client in clients if client.api_key()]
+
+
+def sse_event(data: Any) -> bytes:
+    """One server-sent event; ``data`` is JSON-encoded unless it is a string."""
+    text = data if isinstance(data, str) else json.dumps(data)
+    return f"data: {text}\n\n".encode()
+
+
+def completion_to_sse(body: Dict[str, Any], words_per_chunk: int = 3) -> Iterator[bytes]:
+    """Replay a finished completion as OpenAI-style ``chat.completion.chunk`` events."""
+    message = (body.get("choices") or [{}])[0].get("message", {})
+    words = message.get("content", "").split(" ")
+    base = {"id": body.get("id", "local"), "object": "chat.completion.chunk", "model": body.get("model")}
+    yield sse_event({**base, "choices": [{"index": 0, "delta": {"role": "assistant"}, "finish_reason": None}]})
+    for start in range(0, len(words), words_per_chunk):
+        text = " ".join(words[start:start + words_per_chunk])
+        if start + words_per_chunk < len(words):
+            text += " "
+        yield sse_event({**base, "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}]})
+    yield sse_event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+    yield sse_event("[DONE]")
+
+
+def parse_hedge_delays(spec: str) -> Dict[str, float]:
+    """Parse ``"openrouter=1500,openai=2500"`` (milliseconds) into seconds per provider."""
+    delays = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, value = part.partition("=")
+        delays[name.strip()] = float(value) / 1000
+    return delays
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker over a provider's recent outcomes.
+
+    The last ``window`` calls are kept; once at least ``min_calls`` are known
+    and the share of failures (errors, plus successes slower than
+    ``slow_call`` seconds) reaches ``failure_rate``, the breaker opens and
+    the provider is skipped for ``open_seconds``. Then up to
+    ``half_open_calls`` probes are let through: a successful probe closes
+    the breaker, a failed one opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_rate: float = 0.5,
+        min_calls: int = 5,
+        window: int = 20,
+        open_seconds: float = 30.0,
+        slow_call: Optional[float] = None,
+        half_open_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.slow_call = slow_call
+        self.half_open_calls = half_open_calls
+        self._clock = clock
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._expire()
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go out now (reserves a probe slot when half-open)."""
+        with self._lock:
+            self._expire()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def release(self) -> None:
+        """Give back a probe slot reserved by ``allow`` for a call that never ran."""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probes:
+                self._probes -= 1
+
+    def record_success(self, latency: float) -> None:
+        if self.slow_call is not None and latency > self.slow_call:
+            self.record_failure()
+            return
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._state = self.CLOSED
+                self._outcomes.clear()
+                self._probes = 0
+            self._outcomes.append(False)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._trip()
+                return
+            self._outcomes.append(True)
+            if len(self._outcomes) >= self.min_calls and self._error_rate() >= self.failure_rate:
+                self._trip()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire()
+            retry_in = self._opened_at + self.open_seconds - self._clock() if self._state == self.OPEN else 0.0
+            return {
+                "state": self._state,
+                "error_rate": round(self._error_rate(), 4),
+                "retry_in": round(max(0.0, retry_in), 2),
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+    def _error_rate(self) -> float:
+        return sum(self._outcomes) / len(self._outcomes) if self._outcomes else 0.0
+
+    def _trip(self) -> None:
+        self._state = self.OPEN
+        self._opened_at = self._clock()
+        self._probes = 0
+        self._outcomes.clear()
+        self.opened += 1
+
+    def _expire(self) -> None:
+        if self._state == self.OPEN and self._clock() >= self._opened_at + self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+
+
+class ProviderChain:
+    """Try providers in turn; skip broken ones and optionally hedge slow ones.
+
+    Each provider has a CircuitBreaker (settings from ``breaker``), so a
+    provider that keeps failing or timing out is skipped instead of costing
+    every request its timeout. With ``routing="latency"`` providers are tried
+    fastest first by EWMA of successful latency (untried providers keep their
+    configured order ahead of measured ones); ``"ordered"`` keeps the
+    configured preference.
+
+    Without hedging a provider is only tried after the previous one failed.
+    With ``hedge=True`` the next provider is also started when the current one
+    has not answered within its hedge delay: a fixed per-provider delay, or
+    the ``hedge_percentile`` of its recent successful latencies once enough
+    samples exist. The first success wins. Losers that have not started are
+    cancelled; in-flight ones cannot be interrupted mid-read, so they finish
+    on a pool thread (bounded by the read timeout) and their answer is
+    discarded.
+
+    ``acomplete`` and ``astream`` do the same on asyncio through one aiohttp
+    session per event loop (at most ``async_connections`` upstream sockets),
+    sharing breakers, latencies and counters with the blocking methods. A
+    waiting call holds a coroutine instead of a thread, and losing hedges
+    are really cancelled.
+
+    Every method takes an optional request ``Deadline``: each attempt's
+    timeouts are cut to the time left, no provider is started or hedged once
+    it has passed, and DeadlineExceeded is raised so the caller can answer
+    locally straight away.
+
+    ``on_attempt(provider, model, status, latency, usage, depth)`` is called
+    after every upstream attempt (status ``ok``, ``error`` or ``cancelled``;
+    ``depth`` is the provider's position in the request's fallback order),
+    e.g. with ``UsageRecorder.record``. It runs on the request path, so it
+    must not do I/O.
+    """
+
+    def __init__(
+        self,
+        clients: Iterable[ProviderClient],
+        hedge: bool = False,
+        hedge_delay: float = DEFAULT_HEDGE_DELAY,
+        hedge_delays: Optional[Dict[str, float]] = None,
+        hedge_percentile: Optional[float] = None,
+        routing: str = "latency",
+        breaker: Optional[Dict[str, Any]] = None,
+        max_workers: int = 16,
+        async_connections: int = DEFAULT_ASYNC_CONNECTIONS,
+        on_attempt: Optional[Callable[..., None]] = None,
+    ):
+        if routing not in ("latency", "ordered"):
+            raise ValueError(f"Unknown routing: {routing}")
+        self.clients = list(clients)
+        self.routing = routing
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.hedge_delays = dict(hedge_delays or {})
+        self.hedge_percentile = hedge_percentile
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._max_workers = max_workers
+        self.async_connections = async_connections
+        self.on_attempt = on_attempt
+        self._async_session: Optional["aiohttp.ClientSession"] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = {
+            c.name: deque(maxlen=LATENCY_SAMPLES) for c in self.clients
+        }
+        self._ewma: Dict[str, Optional[float]] = {c.name: None for c in self.clients}
+        self.breakers = {c.name: CircuitBreaker(**(breaker or {})) for c in self.clients}
+        self._stats: Dict[str, Dict[str, int]] = {
+            c.name: {"calls": 0, "wins": 0, "errors": 0, "hedges": 0, "cancelled": 0, "disconnects": 0}
+            for c in self.clients
+        }
+        self.deadlines_exceeded = 0
+
+    def complete(self, payload: Dict[str, Any], deadline: Optional[Deadline] = None) -> Tuple[str, Dict[str, Any]]:
+        """``(provider name, body)`` of the first successful provider; raises ProviderError."""
+        clients = self.route(configured(self.clients))
+        if not clients:
+            raise ProviderError("chain", "no provider configured")
+        if not self.hedge:
+            return self._sequential(clients, payload, deadline)
+        return self._hedged(clients, payload, deadline)
+
+    def stream(self, payload: Dict[str, Any], deadline: Optional[Deadline] = None) -> Tuple[str, Iterator[bytes]]:
+        """``(provider name, SSE byte chunks)`` from the first provider that opens a stream.
+
+        Failover happens only before the first byte (no hedging: a second
+        stream would double generation cost for no latency win once tokens
+        flow). Chunks are relayed as they arrive and nothing is read ahead,
+        so a slow client slows the upstream read (TCP backpressure) instead
+        of filling worker memory. Closing the iterator, which WSGI servers do
+        when the client disconnects, closes the upstream connection.
+        """
+        errors = []
+        for depth, client in enumerate(self.route(configured(self.clients))):
+            if deadline is not None and deadline.expired:
+                break
+            if not self.breakers[client.name].allow():
+                errors.append(f"{client.name}: circuit open")
+                continue
+            started = self._begin(client)
+            try:
+                response = client.stream(payload, deadline=deadline)
+            except ProviderError as exc:
+                self._fail(client, exc)
+                self._report(client, payload, started, depth, exc)
+                errors.append(str(exc))
+                continue
+            # Time to response headers stands in for latency on streams
+            self._record_latency(client, time.monotonic() - started)
+            self._report(client, payload, started, depth)
+            self._win(client)
+            return client.name, self._relay(client, response)
+        raise self._exhausted(errors, deadline)
+
+    def _relay(self, client: ProviderClient, response: requests.Response) -> Iterator[bytes]:
+        finished = False
+        try:
+            for chunk in response.iter_content(chunk_size=None):
+                if chunk:
+                    yield chunk
+            finished = True
+        except requests.RequestException as exc:
+            finished = True
+            self._fail(client)
+            yield sse_event({"error": f"{client.name} stream interrupted: {exc}"})
+        finally:
+            response.close()
+            if not finished:
+                with self._lock:
+                    self._stats[client.name]["disconnects"] += 1
+
+    def route(self, clients: List[ProviderClient]) -> List[ProviderClient]:
+        """Candidate order for one request (breakers are checked at call time)."""
+        if self.routing == "ordered":
+            return clients
+        with self._lock:
+            ewma = dict(self._ewma)
+        return sorted(clients, key=lambda c: (ewma[c.name] is not None, ewma[c.name] or 0.0))
+
+    def hedge_delay_for(self, client: ProviderClient) -> float:
+        latencies = self._latencies[client.name]
+        if self.hedge_percentile is not None and len(latencies) >= MIN_LATENCY_SAMPLES:
+            ordered = sorted(latencies)
+            index = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))
+            return ordered[index]
+        return self.hedge_delays.get(client.name, self.hedge_delay)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            providers = {}
+            for name, counters in self._stats.items():
+                calls = counters["calls"]
+                ewma = self._ewma[name]
+                providers[name] = {
+                    **counters,
+                    "win_rate": round(counters["wins"] / calls, 4) if calls else 0.0,
+                    "ewma_ms": round(ewma * 1000, 1) if ewma is not None else None,
+                    "breaker": self.breakers[name].snapshot(),
+                }
+        return {
+            "hedging": self.hedge,
+            "routing": self.routing,
+            "deadlines_exceeded": self.deadlines_exceeded,
+            "providers": providers,
+        }
+
+    def _begin(self, client: ProviderClient) -> float:
+        with self._lock:
+            self._stats[client.name]["calls"] += 1
+        return time.monotonic()
+
+    def _fail(self, client: ProviderClient, exc: Optional[ProviderError] = None) -> None:
+        if isinstance(exc, DeadlineExceeded):
+            # Never sent: the provider is not to blame
+            self.breakers[client.name].release()
+            return
+        self.breakers[client.name].record_failure()
+        with self._lock:
+            self._stats[client.name]["errors"] += 1
+
+    def _exhausted(self, errors: List[str], deadline: Optional[Deadline]) -> ProviderError:
+        """The error to raise once no provider answered."""
+        detail = "; ".join(errors or ["no provider configured"])
+        if deadline is not None and deadline.expired:
+            with self._lock:
+                self.deadlines_exceeded += 1
+            return DeadlineExceeded("chain", f"deadline of {deadline.seconds:g} s exceeded: {detail}")
+        return ProviderError("chain", f"all providers failed: {detail}")
+
+    def _report(
+        self,
+        client: ProviderClient,
+        payload: Dict[str, Any],
+        started: float,
+        depth: int,
+        error: Optional[BaseException] = None,
+        body: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        if self.on_attempt is None or isinstance(error, DeadlineExceeded):
+            return
+        body = body if isinstance(body, dict) else {}
+        model = body.get("model") or client.overrides.get("model") or payload.get("model")
+        status = "ok" if error is None else "cancelled" if isinstance(error, asyncio.CancelledError) else "error"
+        try:
+            self.on_attempt(client.name, model, status, time.monotonic() - started, body.get("usage"), depth)
+        except Exception:
+            pass  # accounting must never fail a chat
+
+    def _call(
+        self, client: ProviderClient, payload: Dict[str, Any], deadline: Optional[Deadline] = None, depth: int = 0
+    ) -> Dict[str, Any]:
+        started = self._begin(client)
+        try:
+            body = client.complete(payload, deadline=deadline)
+        except ProviderError as exc:
+            self._fail(client, exc)
+            self._report(client, payload, started, depth, exc)
+            raise
+        self._record_latency(client, time.monotonic() - started)
+        self._report(client, payload, started, depth, body=body)
+        return body
+
+    def _record_latency(self, client: ProviderClient, latency: float) -> None:
+        self.breakers[client.name].record_success(latency)
+        with self._lock:
+            self._latencies[client.name].append(latency)
+            previous = self._ewma[client.name]
+            self._ewma[client.name] = latency if previous is None else (
+                EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * previous
+            )
+
+    def _win(self, client: ProviderClient) -> None:
+        with self._lock:
+            self._stats[client.name]["wins"] += 1
+
+    def _sequential(self, clients: List[ProviderClient], payload: Dict[str, Any], deadline: Optional[Deadline]):
+        errors = []
+        for depth, client in enumerate(clients):
+            if deadline is not None and deadline.expired:
+                break
+            if not self.breakers[client.name].allow():
+                errors.append(f"{client.name}: circuit open")
+                continue
+            try:
+                body = self._call(client, payload, deadline, depth)
+            except ProviderError as exc:
+                errors.append(str(exc))
+                continue
+            self._win(client)
+            return client.name, body
+        raise self._exhausted(errors, deadline)
+
+    def _hedge_wait(self, latest: ProviderClient, remaining: List[ProviderClient], deadline: Optional[Deadline]):
+        """How long to wait for a pending call before hedging (None: until one finishes).
+
+        Once every provider is launched only the deadline is left to wait for.
+        """
+        timeout = self.hedge_delay_for(latest) if remaining else None
+        if deadline is not None:
+            timeout = deadline.remaining() if timeout is None else min(timeout, deadline.remaining())
+        return timeout
+
+    def _hedged(self, clients: List[ProviderClient], payload: Dict[str, Any], deadline: Optional[Deadline]):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self._max_workers, thread_name_prefix="ai-hedge")
+        pending: Dict[Future, ProviderClient] = {}
+        errors = []
+        remaining = list(clients)
+
+        def launch(as_hedge: bool) -> Optional[ProviderClient]:
+            """Start the next provider whose breaker allows a call."""
+            if deadline is not None and deadline.expired:
+                remaining.clear()
+            while remaining:
+                client = remaining.pop(0)
+                if not self.breakers[client.name].allow():
+                    errors.append(f"{client.name}: circuit open")
+                    continue
+                if as_hedge:
+                    with self._lock:
+                        self._stats[client.name]["hedges"] += 1
+                depth = len(clients) - len(remaining) - 1
+                pending[self._executor.submit(self._call, client, payload, deadline, depth)] = client
+                return client
+            return None
+
+        latest = launch(as_hedge=False)
+        while pending:
+            done, _ = wait(pending, timeout=self._hedge_wait(latest, remaining, deadline), return_when=FIRST_COMPLETED)
+            if not done:
+                if deadline is not None and deadline.expired:
+                    self._cancel(pending)
+                    break
+                latest = launch(as_hedge=True) or latest
+                continue
+
+            for future in done:
+                client = pending.pop(future)
+                try:
+                    body = future.result()
+                except ProviderError as exc:
+                    errors.append(str(exc))
+                    continue
+                self._win(client)
+                self._cancel(pending)
+                return client.name, body
+
+            # Every finished call failed: move on without waiting for the hedge delay
+            if not pending:
+                latest = launch(as_hedge=False) or latest
+        raise self._exhausted(errors, deadline)
+
+    def _cancel(self, pending: Dict[Future, ProviderClient]) -> None:
+        with self._lock:
+            for future, client in pending.items():
+                if future.cancel():
+                    self.breakers[client.name].release()
+                self._stats[client.name]["cancelled"] += 1
+
+    # asyncio: same routing, breakers and counters, one aiohttp session per loop
+
+    def async_session(self) -> "aiohttp.ClientSession":
+        """The aiohttp session for the running event loop (created on first use)."""
+        if aiohttp is None:
+            raise RuntimeError("aiohttp is required for the asyncio provider chain")
+        loop = asyncio.get_running_loop()
+        if self._async_session is None or self._async_session.closed or self._async_loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.async_connections, limit_per_host=0, ttl_dns_cache=300)
+            self._async_session = aiohttp.ClientSession(connector=connector)
+            self._async_loop = loop
+        return self._async_session
+
+    async def aclose(self) -> None:
+        if self._async_session is not None:
+            await self._async_session.close()
+            self._async_session = self._async_loop = None
+
+    async def acomplete(
+        self, payload: Dict[str, Any], deadline: Optional[Deadline] = None
+    ) -> Tuple[str, Dict[str, Any]]:
+        """``complete`` for asyncio callers; raises ProviderError."""
+        clients = self.route(configured(self.clients))
+        if not clients:
+            raise ProviderError("chain", "no provider configured")
+        session = self.async_session()
+        errors: List[str] = []
+        if not self.hedge:
+            for depth, client in enumerate(clients):
+                if deadline is not None and deadline.expired:
+                    break
+                if not self.breakers[client.name].allow():
+                    errors.append(f"{client.name}: circuit open")
+                    continue
+                try:
+                    body = await self._acall(session, client, payload, deadline, depth)
+                except ProviderError as exc:
+                    errors.append(str(exc))
+                    continue
+                self._win(client)
+                return client.name, body
+            raise self._exhausted(errors, deadline)
+        return await self._ahedged(session, clients, payload, errors, deadline)
+
+    async def astream(
+        self, payload: Dict[str, Any], deadline: Optional[Deadline] = None
+    ) -> Tuple[str, AsyncIterator[bytes]]:
+        """``stream`` for asyncio callers; ``aclose()`` the iterator if it is not exhausted."""
+        session = self.async_session()
+        errors = []
+        for depth, client in enumerate(self.route(configured(self.clients))):
+            if deadline is not None and deadline.expired:
+                break
+            if not self.breakers[client.name].allow():
+                errors.append(f"{client.name}: circuit open")
+                continue
+            started = self._begin(client)
+            try:
+                response = await client.astream(session, payload, deadline=deadline)
+            except ProviderError as exc:
+                self._fail(client, exc)
+                self._report(client, payload, started, depth, exc)
+                errors.append(str(exc))
+                continue
+            self._record_latency(client, time.monotonic() - started)
+            self._report(client, payload, started, depth)
+            self._win(client)
+            return client.name, self._arelay(client, response)
+        raise self._exhausted(errors, deadline)
+
+    async def _arelay(self, client: ProviderClient, response: "aiohttp.ClientResponse") -> AsyncIterator[bytes]:
+        finished = False
+        try:
+            async for chunk in response.content.iter_any():
+                yield chunk
+            finished = True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            finished = True
+            self._fail(client)
+            yield sse_event({"error": f"{client.name} stream interrupted: {exc or type(exc).__name__}"})
+        finally:
+            if finished:
+                response.release()
+            else:
+                # A half-read body must not go back to the pool
+                response.close()
+                with self._lock:
+                    self._stats[client.name]["disconnects"] += 1
+
+    async def _acall(
+        self,
+        session: "aiohttp.ClientSession",
+        client: ProviderClient,
+        payload: Dict[str, Any],
+        deadline: Optional[Deadline] = None,
+        depth: int = 0,
+    ) -> Dict[str, Any]:
+        started = self._begin(client)
+        try:
+            body = await client.acomplete(session, payload, deadline=deadline)
+        except (ProviderError, asyncio.CancelledError) as exc:
+            if isinstance(exc, ProviderError):
+                self._fail(client, exc)
+            self._report(client, payload, started, depth, exc)
+            raise
+        self._record_latency(client, time.monotonic() - started)
+        self._report(client, payload, started, depth, body=body)
+        return body
+
+    async def _ahedged(
+        self,
+        session: "aiohttp.ClientSession",
+        clients: List[ProviderClient],
+        payload: Dict[str, Any],
+        errors: List[str],
+        deadline: Optional[Deadline] = None,
+    ) -> Tuple[str, Dict[str, Any]]:
+        pending: Dict["asyncio.Task", ProviderClient] = {}
+        remaining = list(clients)
+
+        def launch(as_hedge: bool) -> Optional[ProviderClient]:
+            if deadline is not None and deadline.expired:
+                remaining.clear()
+            while remaining:
+                client = remaining.pop(0)
+                if not self.breakers[client.name].allow():
+                    errors.append(f"{client.name}: circuit open")
+                    continue
+                if as_hedge:
+                    with self._lock:
+                        self._stats[client.name]["hedges"] += 1
+                depth = len(clients) - len(remaining) - 1
+                pending[asyncio.ensure_future(self._acall(session, client, payload, deadline, depth))] = client
+                return client
+            return None
+
+        latest = launch(as_hedge=False)
+        try:
+            while pending:
+                timeout = self._hedge_wait(latest, remaining, deadline)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if deadline is not None and deadline.expired:
+                        break
+                    latest = launch(as_hedge=True) or latest
+                    continue
+                for task in done:
+                    client = pending.pop(task)
+                    try:
+                        body = task.result()
+                    except ProviderError as exc:
+                        errors.append(str(exc))
+                        continue
+                    self._win(client)
+                    return client.name, body
+                if not pending:
+                    latest = launch(as_hedge=False) or latest
+            raise self._exhausted(errors, deadline)
+        finally:
+            # Unlike pool threads, in-flight losers stop here and free their sockets
+            for task, client in pending.items():
+                task.cancel()
+                self.breakers[client.name].release()
+                with self._lock:
+                    self._stats[client.name]["cancelled"] += 1
@@ -0,0 +1,315 @@
+"""
+AI Usage Accounting
+Records every chat provider call (and local fallback) with its model,
+latency, token usage, status and fallback depth, rolls them up in memory by
+hour and provider, and flushes them in batches from a background thread to
+an append-only JSON-lines file or a Supabase table
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+logger = logging.getLogger("pcos-ai-usage")
+
+# USD per 1K tokens for models without an entry in ``prices``
+DEFAULT_PRICE_PER_1K_TOKENS = 0.002
+# Upper bounds (ms) of the latency histogram kept per hour and provider
+LATENCY_BUCKETS_MS = (50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, 8000, 12000, 20000, 30000)
+HOUR = 3600
+
+
+def parse_prices(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parse ``"gpt-3.5-turbo=0.0005/0.0015,pplx-7b-online=0.0002"`` (USD per 1K prompt/completion tokens).
+
+    A single value is used for both prompt and completion tokens.
+    """
+    prices = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        model, _, value = part.rpartition("=")
+        prompt, _, completion = value.partition("/")
+        prices[model.strip()] = (float(prompt), float(completion or prompt))
+    return prices
+
+
+class UsageRecord(NamedTuple):
+    """One provider call or local fallback."""
+
+    ts: float
+    provider: str
+    model: Optional[str]
+    status: str
+    depth: int
+    latency_ms: float
+    prompt_tokens: int
+    completion_tokens: int
+    cost_usd: float
+
+    def row(self) -> Dict[str, Any]:
+        return {**self._asdict(), "ts": datetime.fromtimestamp(self.ts, timezone.utc).isoformat()}
+
+
+class FileSink:
+    """Appends records as JSON lines to ``path``."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(row) + "\n" for row in rows))
+
+
+class SupabaseSink:
+    """Inserts records into a Supabase table, one insert per batch.
+
+    With ``on_conflict`` (a unique column) rows already in the table are
+    skipped instead of failing the batch, so a batch may be written again.
+    """
+
+    def __init__(self, client, table: str = "ai_usage", on_conflict: Optional[str] = None):
+        self.client = client
+        self.table = table
+        self.on_conflict = on_conflict
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        if self.on_conflict:
+            self.client.table(self.table).upsert(rows, on_conflict=self.on_conflict, ignore_duplicates=True).execute()
+        else:
+            self.client.table(self.table).insert(rows).execute()
+
+
+class UsageRecorder:
+    """In-memory usage aggregator with batched, off-request-path persistence.
+
+    ``record`` only appends to a bounded queue and updates the hourly
+    rollups under a lock; nothing is written on the request path. With a
+    ``sink`` a daemon thread writes the queue every ``flush_interval``
+    seconds, or sooner once ``batch_size`` records are waiting. A failed
+    write is retried with the next batch; records beyond ``max_pending`` are
+    dropped oldest first and counted. Rollups older than ``retention_hours``
+    are discarded.
+
+    Cost is ``usage`` tokens times the model's price from ``prices``
+    (``(prompt, completion)`` USD per 1K tokens), or ``default_price``.
+    """
+
+    def __init__(
+        self,
+        prices: Optional[Dict[str, Tuple[float, float]]] = None,
+        default_price: float = DEFAULT_PRICE_PER_1K_TOKENS,
+        sink=None,
+        batch_size: int = 100,
+        flush_interval: float = 5.0,
+        max_pending: int = 10000,
+        retention_hours: int = 48,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.prices = dict(prices or {})
+        self.default_price = default_price
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.retention_hours = retention_hours
+        self._clock = clock
+        self._pending: Deque[UsageRecord] = deque()
+        self._rollups: Dict[Tuple[int, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+        self.recorded = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.flush_errors = 0
+
+    def record(
+        self,
+        provider: str,
+        model: Optional[str],
+        status: str,
+        latency: float,
+        usage: Optional[Dict[str, Any]] = None,
+        depth: int = 0,
+    ) -> UsageRecord:
+        """Account one call; ``latency`` in seconds, ``usage`` as in an OpenAI response body."""
+        prompt, completion = _tokens(usage)
+        prompt_price, completion_price = self.prices.get(model or "", (self.default_price, self.default_price))
+        entry = UsageRecord(
+            ts=self._clock(),
+            provider=provider,
+            model=model,
+            status=status,
+            depth=depth,
+            latency_ms=round(latency * 1000, 1),
+            prompt_tokens=prompt,
+            completion_tokens=completion,
+            cost_usd=round((prompt * prompt_price + completion * completion_price) / 1000, 6),
+        )
+        with self._lock:
+            self.recorded += 1
+            self._roll_up(entry)
+            if self.sink is not None:
+                if len(self._pending) >= self.max_pending:
+                    self._pending.popleft()
+                    self.dropped += 1
+                self._pending.append(entry)
+                full = len(self._pending) >= self.batch_size
+        if self.sink is not None:
+            self._start()
+            if full:
+                self._wake.set()
+        return entry
+
+    def flush(self) -> int:
+        """Write every pending record to the sink now; returns how many were written."""
+        if self.sink is None:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._pending)
+                self._pending.clear()
+            if not batch:
+                return 0
+            try:
+                self.sink.write([entry.row() for entry in batch])
+            except Exception as e:
+                logger.warning(f"AI usage flush failed: {e}")
+                with self._lock:
+                    self.flush_errors += 1
+                    keep = batch[: max(0, self.max_pending - len(self._pending))]
+                    self.dropped += len(batch) - len(keep)
+                    self._pending.extendleft(reversed(keep))
+                return 0
+            with self._lock:
+                self.flushed += len(batch)
+            return len(batch)
+
+    def rollups(self, hours: int = 24, provider: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Per hour and provider totals for the last ``hours`` hours, newest first."""
+        since = (int(self._clock()) // HOUR - hours + 1) * HOUR
+        with self._lock:
+            items = [
+                (key, dict(rollup, models=dict(rollup["models"]), buckets=list(rollup["buckets"])))
+                for key, rollup in self._rollups.items()
+                if key[0] >= since and (provider is None or key[1] == provider)
+            ]
+        items.sort(key=lambda item: (-item[0][0], item[0][1]))
+        return [_rollup_view(hour, name, rollup) for (hour, name), rollup in items]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "recorded": self.recorded,
+                "flushed": self.flushed,
+                "pending": len(self._pending),
+                "dropped": self.dropped,
+                "flush_errors": self.flush_errors,
+                "sink": type(self.sink).__name__ if self.sink is not None else None,
+            }
+
+    def _roll_up(self, entry: UsageRecord) -> None:
+        hour = int(entry.ts) // HOUR * HOUR
+        key = (hour, entry.provider)
+        rollup = self._rollups.get(key)
+        if rollup is None:
+            cutoff = hour - self.retention_hours * HOUR
+            for old in [k for k in self._rollups if k[0] <= cutoff]:
+                del self._rollups[old]
+            rollup = self._rollups[key] = {
+                "calls": 0,
+                "statuses": {},
+                "models": {},
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "cost_usd": 0.0,
+                "latency_ms": 0.0,
+                "depth": 0,
+                "buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+            }
+        rollup["calls"] += 1
+        rollup["statuses"][entry.status] = rollup["statuses"].get(entry.status, 0) + 1
+        model = entry.model or "unknown"
+        rollup["models"][model] = rollup["models"].get(model, 0) + 1
+        rollup["prompt_tokens"] += entry.prompt_tokens
+        rollup["completion_tokens"] += entry.completion_tokens
+        rollup["cost_usd"] += entry.cost_usd
+        rollup["latency_ms"] += entry.latency_ms
+        rollup["depth"] += entry.depth
+        rollup["buckets"][_bucket(entry.latency_ms)] += 1
+
+    def _start(self) -> None:
+        """Start the flush thread (again after a fork: threads do not survive one)."""
+        if self._thread is not None and self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread_pid == os.getpid():
+                return
+            self._thread = threading.Thread(target=self._run, name="ai-usage-flush", daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+def _tokens(usage: Optional[Dict[str, Any]]) -> Tuple[int, int]:
+    if not isinstance(usage, dict):
+        return 0, 0
+    values = []
+    for field in ("prompt_tokens", "completion_tokens"):
+        value = usage.get(field, 0)
+        values.append(value if isinstance(value, int) and value > 0 else 0)
+    return values[0], values[1]
+
+
+def _bucket(latency_ms: float) -> int:
+    for index, bound in enumerate(LATENCY_BUCKETS_MS):
+        if latency_ms <= bound:
+            return index
+    return len(LATENCY_BUCKETS_MS)
+
+
+def _percentile(buckets: Iterable[int], calls: int, q: float) -> Optional[int]:
+    """Upper bound (ms) of the histogram bucket holding the ``q`` quantile; None past the last bound."""
+    target = q * calls
+    seen = 0
+    for index, count in enumerate(buckets):
+        seen += count
+        if seen >= target:
+            return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else None
+    return None
+
+
+def _rollup_view(hour: int, provider: str, rollup: Dict[str, Any]) -> Dict[str, Any]:
+    calls = rollup["calls"]
+    return {
+        "hour": datetime.fromtimestamp(hour, timezone.utc).isoformat(),
+        "provider": provider,
+        "calls": calls,
+        "statuses": rollup["statuses"],
+        "models": rollup["models"],
+        "prompt_tokens": rollup["prompt_tokens"],
+        "completion_tokens": rollup["completion_tokens"],
+        "cost_usd": round(rollup["cost_usd"], 6),
+        "avg_depth": round(rollup["depth"] / calls, 2),
+        "latency_ms": {
+            "avg": round(rollup["latency_ms"] / calls, 1),
+            "p50": _percentile(rollup["buckets"], calls, 0.50),
+            "p95": _percentile(rollup["buckets"], calls, 0.95),
+            "p99": _percentile(rollup["buckets"], calls, 0.99),
+        },
+    }
@@ -0,0 +1,135 @@
+"""
+Analysis Cache
+Content-addressed handling of /api/analyze submissions: a hash of the
+validated payload, scoped to the submitting client, deduplicates the
+pcos_entries insert within a window; the hash alone keys a cache of the
+built analysis, doctors and report
+"""
+
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from lru_cache import LRUCache
+
+
+DEFAULT_TTL = 3600.0
+DEFAULT_DEDUPE_WINDOW = 600.0
+
+
+def payload_key(validated: Dict[str, Any]) -> str:
+    """SHA-256 of the validated payload as canonical JSON.
+
+    The schema has already coerced the values (``"25"`` and ``25`` are both
+    ``25``, weights are floats), so sorting keys is enough for two identical
+    forms to hash alike.
+    """
+    canonical = json.dumps(validated, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def entry_key(key: str, client: Optional[str]) -> str:
+    """Dedupe key for a submission with payload hash ``key`` from ``client``.
+
+    Two people sending the same form must get two rows (and must not learn
+    each other's entry id), so repeats are only recognized from the same
+    client: pass ``"key:<Idempotency-Key>"`` when the request carries one,
+    else ``"ip:<client ip>"``.
+    """
+    return hashlib.sha256(f"{client or ''}\n{key}".encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """Idempotency keys and cached response bodies for repeated submissions.
+
+    ``entry_id(key, save)`` returns the id saved for ``key`` (see
+    ``entry_key``) in the last
+    ``dedupe_window`` seconds, or calls ``save()`` (once, however many
+    identical requests arrive together) and remembers the id it returns; a
+    ``None`` id (nothing was saved) is not remembered. ``result(key, build)``
+    returns the body built for ``key`` in the last ``ttl`` seconds, or
+    builds it. Bodies are shared between requests and must not be mutated.
+
+    With ``flights`` (SingleFlight) concurrent misses for one key share a
+    single ``save`` or ``build`` call, so a double-click inserts once.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 2000,
+        ttl: float = DEFAULT_TTL,
+        dedupe_window: float = DEFAULT_DEDUPE_WINDOW,
+        flights=None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.flights = flights
+        self._results = LRUCache(maxsize, ttl=ttl, clock=clock)
+        self._entries = LRUCache(maxsize, ttl=dedupe_window, clock=clock)
+        self._lock = threading.Lock()
+        self.submissions = 0
+        self.saves = 0
+        self.deduplicated = 0
+
+    def entry_id(self, key: str, save: Callable[[], Optional[str]]) -> Tuple[Optional[str], bool]:
+        """``(entry_id, duplicate)``: the id already saved for ``key``, or the id from ``save()``."""
+        with self._lock:
+            self.submissions += 1
+        entry_id = self._entries.get(key)
+        duplicate = entry_id is not None
+        if not duplicate:
+            (entry_id, duplicate), shared = self._once("entry", key, lambda: self._save(key, save))
+            duplicate = duplicate or (shared and entry_id is not None)
+        if duplicate:
+            with self._lock:
+                self.deduplicated += 1
+        return entry_id, duplicate
+
+    def result(self, key: Hashable, build: Callable[[], Dict[str, Any]]) -> Tuple[Dict[str, Any], bool]:
+        """``(body, hit)``: the body cached for ``key``, or a freshly built (and cached) one."""
+        body = self._results.get(key)
+        if body is not None:
+            return body, True
+
+        def build_and_cache():
+            built = build()
+            self._results.set(key, built)
+            return built
+
+        return self._once("result", json.dumps(key), build_and_cache)
+
+    def clear(self) -> None:
+        self._results.clear()
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        results = self._results.stats()
+        with self._lock:
+            return {
+                "cached": results["size"],
+                "hits": results["hits"],
+                "misses": results["misses"],
+                "hit_rate": results["hit_rate"],
+                "submissions": self.submissions,
+                "saves": self.saves,
+                "deduplicated": self.deduplicated,
+                "dedupe_rate": round(self.deduplicated / self.submissions, 4) if self.submissions else 0.0,
+            }
+
+    def _save(self, key: str, save: Callable[[], Optional[str]]) -> Tuple[Optional[str], bool]:
+        # A flight for this key may have finished between the caller's lookup and this one
+        entry_id = self._entries.get(key)
+        if entry_id is not None:
+            return entry_id, True
+        entry_id = save()
+        with self._lock:
+            self.saves += 1
+        if entry_id is not None:
+            self._entries.set(key, entry_id)
+        return entry_id, False
+
+    def _once(self, kind: str, key: str, call: Callable[[], Any]) -> Tuple[Any, bool]:
+        if self.flights is None:
+            return call(), False
+        return self.flights.do(f"analyze-{kind}:{key}", call)
@@ -395,6 +395,8 @@ class PCOSAnalyzer:
         """Get statistics from PCOS dataset"""
         if self.dataset_cache:
             return self.dataset_cache
+        if self.supabase is None:
+            return self._default_stats()
 
         try:
             # Query dataset
@@ -3,15 +3,19 @@ PCOS Smart Assistant - Backend API
 Analyzes user data, generates health reports, and recommends doctors
 """
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, make_response, send_from_directory
 from marshmallow import Schema, fields, ValidationError
 import os
 from dotenv import load_dotenv
 from datetime import datetime
+import hashlib
+import hmac
 import json
 import re
+import sqlite3
 import time
-from functools import wraps
+import uuid
+from functools import partial, wraps
 
 # Optional external imports guarded to avoid import-time failures in tests
 try:
@@ -25,10 +29,58 @@ except Exception:
     PCOSAnalyzer = None
 
 try:
-    from doctor_recommendations import DoctorRecommender
+    from doctor_recommendations import CITY_COORDINATES, DoctorRecommender
+    from doctor_ranking import SPECIALTY_CATEGORIES, parse_weights
 except Exception:
     DoctorRecommender = None
 
+try:
+    from appointment_slots import MAX_TIME as MAX_SLOT_TIME, SlotIndex, generate_demo_feed, parse_time
+except Exception:
+    SlotIndex = None
+
+try:
+    from ai_providers import DEADLINE_HEADER, Deadline, ProviderError, completion_to_sse, configured
+except Exception:
+    Deadline = None
+
+# Rate limiting and chat request handling are needed by the routes themselves
+import chat_setup
+from chat_service import finish_chat, flight_key, plan_chat, remember_chat, remember_stream, validate_chat
+from chat_setup import AI_REQUEST_TIMEOUT, AI_SECONDS_PER_UNIT, AI_TOKENS_PER_UNIT, LOCAL_GREETING
+from rate_limiter import response_tokens, usage_cost
+
+# Optional components: a feature whose module cannot be imported is switched off
+try:
+    from analysis_cache import AnalysisCache, entry_key, payload_key
+except Exception:
+    AnalysisCache = None
+
+try:
+    from ai_insights import DEFAULT_MODEL as DEFAULT_INSIGHTS_MODEL, AIInsights, validate_insight
+except Exception:
+    AIInsights = None
+
+try:
+    from ai_usage import SupabaseSink
+except Exception:
+    SupabaseSink = None
+
+try:
+    from entry_spool import EntrySpool
+except Exception:
+    EntrySpool = None
+
+try:
+    from single_flight import SingleFlight
+except Exception:
+    SingleFlight = None
+
+try:
+    from write_behind import WriteBehindQueue
+except Exception:
+    WriteBehindQueue = None
+
 import logging
 from flask_cors import CORS
 
@@ -65,33 +117,65 @@ def add_security_headers(response):
     return response
 
 
-# Rate limiting
-rate_limit_store = {}
-RATE_LIMIT = int(os.getenv("RATE_LIMIT", "60"))
-RATE_LIMIT_WINDOW = 60
+# Rate limiting: O(1) sliding-window counters with a hard cap on tracked IPs.
+# Cheap routes share the "default" budget; AI routes draw from a separate "ai"
+# budget and are post-charged for upstream time and tokens (see chat_setup.py).
+rate_limiter = chat_setup.rate_limiter_from_env()
+
+
+def client_ip():
+    ip = request.headers.get("X-Forwarded-For", request.remote_addr)
+    if ip:
+        ip = ip.split(",")[0].strip()
+    return ip
+
+
+def rate_limit(f=None, *, budget="default", cost=1.0, metered=False):
+    """Charge ``cost`` units of ``budget`` per request.
+
+    ``metered`` routes are post-charged for whatever their measured usage
+    (upstream time or ``usage.total_tokens``) exceeds the upfront cost.
+    """
+    if f is None:
+        return lambda view: rate_limit(view, budget=budget, cost=cost, metered=metered)
 
-def rate_limit(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if os.getenv("SKIP_RATE_LIMIT") == "1":
             return f(*args, **kwargs)
 
-        ip = request.headers.get("X-Forwarded-For", request.remote_addr)
-        if ip:
-            ip = ip.split(",")[0].strip()
-
-        current_time = time.time()
-        history = [t for t in rate_limit_store.get(ip, []) if current_time - t < RATE_LIMIT_WINDOW]
-        rate_limit_store[ip] = history
-
-        if len(rate_limit_store.get(ip, [])) >= RATE_LIMIT:
+        key = client_ip()
+        result = rate_limiter.hit(budget, key, cost)
+        if not result.allowed:
             return (
-                jsonify({"error": "Rate limit exceeded. Please try again later.", "retry_after": RATE_LIMIT_WINDOW}),
+                jsonify({"error": "Rate limit exceeded. Please try again later.", "retry_after": result.retry_after}),
                 429,
             )
 
-        rate_limit_store.setdefault(ip, []).append(current_time)
-        return f(*args, **kwargs)
+        if not metered:
+            return f(*args, **kwargs)
+
+        started = time.monotonic()
+        response = make_response(f(*args, **kwargs))
+        if response.headers.get("X-Cache") == "HIT" or response.headers.get("X-Coalesced"):
+            return response
+        if response.is_streamed:
+            # Reading a stream here would buffer it; charge elapsed time once it ends
+            def charge_stream():
+                used = usage_cost(time.monotonic() - started, 0, AI_SECONDS_PER_UNIT, AI_TOKENS_PER_UNIT)
+                rate_limiter.charge(budget, key, used - cost)
+
+            response.call_on_close(charge_stream)
+            return response
+
+        used = usage_cost(
+            time.monotonic() - started,
+            response_tokens(response.get_json(silent=True)),
+            AI_SECONDS_PER_UNIT,
+            AI_TOKENS_PER_UNIT,
+        )
+        rate_limiter.charge(budget, key, used - cost)
+        return response
 
     return decorated_function
 
@@ -130,6 +214,76 @@ else:
         supabase = None
 
 
+# Submissions Supabase cannot take (down, or failing past the writer's retries) go to a local
+# SQLite spool and are replayed once it answers again
+entry_sink = None
+if supabase is not None and SupabaseSink is not None:
+    entry_sink = SupabaseSink(supabase, "pcos_entries", on_conflict="id")
+
+DEFAULT_ENTRY_SPOOL_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "pcos_entries_spool.sqlite3")
+
+
+def entry_spool_from_env(sink):
+    """The entry spool, or None when it is off, unwanted or cannot be opened.
+
+    The spool holds health data, so it is only kept when something replays it
+    (``sink``) or ENTRY_SPOOL_DB asks for it explicitly; without Supabase that
+    is warned about, since the rows then stay on local disk indefinitely.
+    """
+    path = os.getenv("ENTRY_SPOOL_DB")
+    if EntrySpool is None or os.getenv("ENTRY_SPOOL", "1") != "1" or (sink is None and not path):
+        return None
+    path = path or DEFAULT_ENTRY_SPOOL_DB
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        spool = EntrySpool(
+            path,
+            write=sink.write if sink is not None else None,
+            max_bytes=int(os.getenv("ENTRY_SPOOL_MAX_MB", "100")) * 1024 * 1024,
+            replay_interval=float(os.getenv("ENTRY_SPOOL_REPLAY_SECONDS", "30")),
+        )
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"Entry spool unavailable: {e}")
+        return None
+    if sink is None:
+        logger.warning(f"Supabase is not configured: submissions are kept in {path} with nothing to replay them")
+    return spool
+
+
+entry_spool = entry_spool_from_env(entry_sink) if not SKIP_SUPABASE else None
+if entry_spool is not None:
+    entry_spool.start()
+
+
+# Submissions are inserted into pcos_entries in bulk by a background writer (ENTRY_WRITE_BEHIND=0
+# inserts each one on the request path instead)
+entry_writer = None
+if WriteBehindQueue is not None and entry_sink is not None and os.getenv("ENTRY_WRITE_BEHIND", "1") == "1":
+    entry_writer = WriteBehindQueue(
+        entry_sink.write,
+        batch_size=int(os.getenv("ENTRY_BATCH_SIZE", "50")),
+        flush_interval=float(os.getenv("ENTRY_FLUSH_SECONDS", "1")),
+        max_pending=int(os.getenv("ENTRY_MAX_PENDING", "10000")),
+        max_retries=int(os.getenv("ENTRY_MAX_RETRIES", "5")),
+        on_give_up=entry_spool.append if entry_spool is not None else None,
+        name="pcos-entries",
+    )
+
+
+# Identical submissions (double-clicks, refreshes, resubmitted forms) are keyed on a hash of the
+# validated payload: the entry is saved once per ENTRY_DEDUPE_SECONDS per client (Idempotency-Key
+# header, else IP) and the response body is reused for anyone
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+analysis_cache = None
+if AnalysisCache is not None and os.getenv("ANALYSIS_CACHE", "1") == "1":
+    analysis_cache = AnalysisCache(
+        maxsize=int(os.getenv("ANALYSIS_CACHE_SIZE", "2000")),
+        ttl=float(os.getenv("ANALYSIS_CACHE_TTL", "3600")),
+        dedupe_window=float(os.getenv("ENTRY_DEDUPE_SECONDS", "600")),
+        flights=SingleFlight() if SingleFlight is not None else None,
+    )
+
+
 # Initialize analyzers if available
 if PCOSAnalyzer is not None:
     try:
@@ -139,15 +293,43 @@ if PCOSAnalyzer is not None:
 else:
     analyzer = None
 
+def ranking_weights_from_env():
+    """DOCTOR_RANKING_WEIGHTS parsed, or None (the defaults) when unset or invalid.
+
+    e.g. DOCTOR_RANKING_WEIGHTS="rating=0.5,expertise=0.2,specialty=0.2,distance=0.1"
+    """
+    try:
+        return parse_weights(os.getenv("DOCTOR_RANKING_WEIGHTS", ""))
+    except ValueError as e:
+        logger.warning(f"Ignoring DOCTOR_RANKING_WEIGHTS ({e}); using the default ranking weights")
+        return None
+
+
 if DoctorRecommender is not None:
     try:
-        doctor_recommender = DoctorRecommender()
-    except Exception:
+        doctor_recommender = DoctorRecommender(ranking_weights=ranking_weights_from_env())
+    except Exception as e:
+        logger.warning(f"Could not initialize doctor recommendations: {e}")
         doctor_recommender = None
 else:
     doctor_recommender = None
 
 
+# Appointment availability: APPOINTMENT_SLOTS_FILE (JSON feed) or the stand-in demo feed
+slot_index = None
+if SlotIndex is not None and doctor_recommender is not None:
+    try:
+        if os.getenv("APPOINTMENT_SLOTS_FILE"):
+            slot_index = SlotIndex.from_file(doctor_recommender.store, os.getenv("APPOINTMENT_SLOTS_FILE"))
+        elif os.getenv("APPOINTMENT_SLOTS_DEMO") == "1":
+            slot_index = SlotIndex.from_feed(
+                doctor_recommender.store, generate_demo_feed(doctor_recommender.store)
+            )
+    except Exception as e:
+        logger.warning(f"Could not load appointment slots: {e}")
+        slot_index = None
+
+
 @app.route("/health", methods=["GET"])
 def health_check():
     return jsonify({"status": "healthy", "service": "PCOS Smart Assistant API"}), 200
@@ -198,44 +380,49 @@ class AnalyzeSchema(Schema):
 
 
 @app.route("/api/analyze", methods=["POST"])
-@rate_limit
+@rate_limit(cost=2)
 def analyze_data():
+    # ?compact=1 returns doctor ids + reference version instead of embedding static data
+    compact = request.args.get("compact", "").lower() in ("1", "true")
     try:
         data = request.json
         schema = AnalyzeSchema()
         validated = schema.load(data)
 
-        entry_id = save_entry(validated)
         if analyzer is None:
             return jsonify({"error": "Analyzer not available"}), 503
 
-        analysis_result = analyzer.analyze(validated)
-
-        doctors = []
-        if doctor_recommender is not None:
-            try:
-                doctors = doctor_recommender.get_recommendations(
-                    city=validated.get("city", ""),
-                    severity=analysis_result.get("risk_level"),
-                    symptoms=validated.get("symptoms", []),
+        key = payload_key(validated) if analysis_cache is not None else None
+        if analysis_cache is not None:
+            idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+            client = f"key:{idempotency_key}" if idempotency_key else f"ip:{client_ip()}"
+            entry_id, _ = analysis_cache.entry_id(entry_key(key, client), partial(save_entry, validated))
+        else:
+            entry_id = save_entry(validated)
+
+        build = partial(build_analysis, validated, compact)
+        if analysis_cache is not None:
+            body, hit = analysis_cache.result((key, compact), build)
+        else:
+            body, hit = build(), False
+
+        # ?slots=1 attaches each primary doctor's next free appointment (to a copy: bodies are cached)
+        doctors = body["doctors"]
+        if slot_index is not None and request.args.get("slots") == "1" and isinstance(doctors, dict):
+            now = int(time.time())
+            doctors = dict(doctors)
+            if "primary_doctors" in doctors:
+                doctors["primary_doctors"] = slot_index.attach_to(
+                    doctors["primary_doctors"], now, doctors.get("primary_doctor_ids")
                 )
-            except Exception:
-                doctors = []
-
-        report = generate_report(validated, analysis_result, doctors)
-
-        return (
-            jsonify(
-                {
-                    "success": True,
-                    "entry_id": entry_id,
-                    "analysis": analysis_result,
-                    "doctors": doctors,
-                    "report": report,
-                }
-            ),
-            200,
-        )
+            else:
+                doctors["primary_doctor_slots"] = [
+                    slot_index.next_slot(row, now) for row in doctors.get("primary_doctor_ids", [])
+                ]
+
+        response = jsonify({"success": True, "entry_id": entry_id, **body, "doctors": doctors})
+        response.headers["X-Cache"] = "HIT" if hit else "MISS"
+        return response, 200
     except ValidationError as ve:
         logger.error(f"Validation error: {ve.messages}")
         return jsonify({"error": ve.messages}), 400
@@ -244,6 +431,28 @@ def analyze_data():
         return jsonify({"error": str(e)}), 500
 
 
+def build_analysis(validated, compact=False):
+    """Analysis, doctors and report for a validated submission (everything but its entry id)."""
+    analysis_result = analyzer.analyze(validated)
+
+    doctors = []
+    if doctor_recommender is not None:
+        try:
+            get_doctors = (
+                doctor_recommender.get_compact_recommendations if compact else doctor_recommender.get_recommendations
+            )
+            doctors = get_doctors(
+                city=validated.get("city", ""),
+                severity=analysis_result.get("risk_level"),
+                symptoms=validated.get("symptoms", []),
+            )
+        except Exception:
+            doctors = []
+
+    report = generate_report(validated, analysis_result, doctors)
+    return {"analysis": analysis_result, "doctors": doctors, "report": report}
+
+
 @app.route("/api/stats", methods=["GET"])
 def get_statistics():
     try:
@@ -255,183 +464,354 @@ def get_statistics():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/ai/chat", methods=["POST"])
+def admin_authorized():
+    """True when the X-Admin-Token header matches ADMIN_TOKEN (never while ADMIN_TOKEN is unset)."""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    return bool(admin_token) and hmac.compare_digest(request.headers.get("X-Admin-Token", ""), admin_token)
+
+
+@app.route("/api/metrics", methods=["GET"])
+def get_metrics():
+    """In-process cache and engine counters for dashboards (X-Admin-Token must match ADMIN_TOKEN)."""
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    metrics = {"rate_limiter": rate_limiter.stats()}
+    if ai_chain is not None:
+        metrics["ai_providers"] = ai_chain.stats()
+    if chat_cache is not None:
+        metrics["chat_cache"] = chat_cache.stats()
+    if chat_intents is not None:
+        metrics["chat_intents"] = chat_intents.stats()
+    if context_trimmer is not None:
+        metrics["chat_context"] = context_trimmer.stats()
+    if chat_flights is not None:
+        metrics["chat_single_flight"] = chat_flights.stats()
+    if chat_memory is not None:
+        metrics["chat_memory"] = chat_memory.stats()
+    if ai_insights is not None:
+        metrics["ai_insights"] = ai_insights.stats()
+    if usage_recorder is not None:
+        metrics["ai_usage"] = usage_recorder.stats()
+    if entry_writer is not None:
+        metrics["entry_writes"] = entry_writer.stats()
+    if entry_spool is not None:
+        metrics["entry_spool"] = entry_spool.stats()
+    if analysis_cache is not None:
+        metrics["analysis_cache"] = analysis_cache.stats()
+    if doctor_recommender is not None:
+        metrics["recommendation_cache"] = doctor_recommender.cache_stats()
+    return jsonify(metrics), 200
+
+
+@app.route("/api/appointments/earliest", methods=["GET"])
 @rate_limit
+def earliest_appointment():
+    """Earliest free slot, e.g. ?city=Hyderabad&radius_km=50&specialty=pcos_specialist&after=<ISO>"""
+    if slot_index is None:
+        return jsonify({"error": "Appointment availability not configured"}), 503
+
+    args = request.args
+    try:
+        after = parse_time(args["after"]) if args.get("after") else int(time.time())
+        radius_km = float(args["radius_km"]) if args.get("radius_km") else None
+        if "lat" in args and "lon" in args:
+            origin = (float(args["lat"]), float(args["lon"]))
+        else:
+            origin = CITY_COORDINATES.get(sanitize_input(args.get("city", "")).title())
+    except (ValueError, TypeError, OverflowError):
+        return jsonify({"error": "Invalid after, radius_km, lat or lon"}), 400
+    if not 0 <= after <= MAX_SLOT_TIME:
+        return jsonify({"error": "after is out of range"}), 400
+
+    specialty = args.get("specialty", "any")
+    if specialty != "any" and specialty not in SPECIALTY_CATEGORIES:
+        return jsonify({"error": f"specialty must be one of: any, {', '.join(SPECIALTY_CATEGORIES)}"}), 400
+    if radius_km is not None and origin is None:
+        return jsonify({"error": "radius_km needs a known city or lat/lon"}), 400
+
+    earliest = slot_index.earliest(
+        after,
+        origin=origin,
+        radius_km=radius_km,
+        specialty=None if specialty == "any" else specialty,
+    )
+    return jsonify({"success": True, "earliest": earliest}), 200
+
+
+# Static reference data, served separately so clients and CDNs can cache it
+REFERENCE_CACHE_MAX_AGE = int(os.getenv("REFERENCE_CACHE_MAX_AGE", "86400"))
+REFERENCE_SECTIONS = {
+    "helplines": "helplines",
+    "booking-tips": "booking_tips",
+    "questions": "questions_to_ask",
+}
+
+
+def cacheable_json(payload, version, key):
+    """JSON response with a strong ETag and long-lived Cache-Control, 304 on a match."""
+    response = jsonify(payload)
+    response.set_etag(hashlib.sha256(f"{version}:{key}".encode("utf-8")).hexdigest()[:32])
+    response.cache_control.public = True
+    response.cache_control.max_age = REFERENCE_CACHE_MAX_AGE
+    return response.make_conditional(request)
+
+
+@app.route("/api/reference/<section>", methods=["GET"])
+def get_reference(section):
+    if doctor_recommender is None:
+        return jsonify({"error": "Doctor directory not available"}), 503
+
+    version = doctor_recommender.reference_version
+    if section == "version":
+        return jsonify({"version": version}), 200
+
+    reference = doctor_recommender.get_reference_data()
+    if section == "all":
+        payload = reference
+    elif section in REFERENCE_SECTIONS:
+        payload = {REFERENCE_SECTIONS[section]: reference[REFERENCE_SECTIONS[section]]}
+    else:
+        return jsonify({"error": "Unknown reference section"}), 404
+
+    return cacheable_json({**payload, "version": version}, version, section)
+
+
+@app.route("/api/doctors/<city>", methods=["GET"])
+def get_city_doctors(city):
+    if doctor_recommender is None:
+        return jsonify({"error": "Doctor directory not available"}), 503
+
+    version = doctor_recommender.reference_version
+    city_key = sanitize_input(city).title()
+    doctors = doctor_recommender.get_city_doctors(city_key)
+    return cacheable_json(
+        {"city": city_key, "doctors": doctors, "version": version},
+        version,
+        city_key,
+    )
+
+
+# Chat components, built from the same env vars as the async chat server (chat_setup.py)
+usage_recorder = chat_setup.usage_recorder_from_env(supabase)
+ai_chain = chat_setup.provider_chain_from_env(usage_recorder)
+chat_cache = chat_setup.chat_cache_from_env()
+chat_flights = chat_setup.chat_flights_from_env()
+context_trimmer = chat_setup.context_trimmer_from_env()
+chat_memory = chat_setup.chat_memory_from_env()
+chat_intents = chat_setup.chat_intents_from_env(analyzer)
+knowledge_base = chat_setup.knowledge_base_from_env()
+
+
+# Chatbot insight endpoints: analyzer results plus advice cached per profile bucket (risk
+# level, symptoms, activity, BMI band); AI_INSIGHTS_MODEL is asked only for new buckets
+ai_insights = None
+if AIInsights is not None and os.getenv("AI_INSIGHTS", "1") == "1":
+    ai_insights = AIInsights(
+        analyzer,
+        ai_chain,
+        model=os.getenv("AI_INSIGHTS_MODEL", DEFAULT_INSIGHTS_MODEL),
+        knowledge_base=knowledge_base,
+        flights=chat_flights,
+        maxsize=int(os.getenv("AI_INSIGHTS_CACHE_SIZE", "5000")),
+        ttl=float(os.getenv("AI_INSIGHTS_TTL", "604800")),
+    )
+
+
+@app.route("/api/ai/<any(insight, 'analyze-symptoms', lifestyle, 'diet-plan', explain):kind>", methods=["POST"])
+@rate_limit(budget="ai", metered=True)
+def ai_insight(kind):
+    """Chatbot insights (frontend/ai/chatbot.js): health insight, symptom analysis, lifestyle tips,
+    diet plan or a term explanation.
+
+    Bodies: insight {userData, type}, analyze-symptoms {symptoms}, lifestyle {profile},
+    diet-plan {userProfile, goals}, explain {term, context}.
+    """
+    if ai_insights is None:
+        return jsonify({"error": "AI insights are disabled"}), 503
+    if not request.is_json:
+        return jsonify({"error": "Content-Type must be application/json"}), 400
+
+    payload = request.get_json()
+    error = validate_insight(kind, payload)
+    if error:
+        return jsonify({"error": error}), 400
+
+    body = ai_insights.answer(kind, payload, request_deadline())
+    response = jsonify(body)
+    response.headers["X-Cache"] = "HIT" if body["source"] in ("cache", "glossary") else "MISS"
+    return response, 200
+
+
+@app.route("/api/ai/chat", methods=["POST"])
+@rate_limit(budget="ai", metered=True)
 def ai_chat():
     """Proxy AI chat requests to configured AI provider from the server.
 
     Supports: OpenRouter (primary - cheapest), OpenAI, Perplexity. Falls back to local AI if all fail.
-    Expects JSON payload: {model, messages, temperature, max_tokens (optional)}
+    Expects JSON payload: {model, messages, temperature, max_tokens (optional)}; with
+    conversation_id (null to start) messages holds only the new turn.
     """
     if not request.is_json:
         return jsonify({"error": "Content-Type must be application/json"}), 400
 
     payload = request.get_json()
-    if not isinstance(payload, dict):
-        return jsonify({"error": "Invalid request body"}), 400
+    error = validate_chat(payload)
+    if error:
+        return jsonify({"error": error}), 400
+
+    started = time.monotonic()
+    deadline = request_deadline()
+    plan = plan_chat(payload, chat_intents, chat_cache, context_trimmer, chat_memory)
+    if plan.reply is not None:
+        response = sse_response(completion_to_sse(plan.reply)) if payload.get("stream") else jsonify(plan.reply)
+        response.headers.update(plan.headers)
+        return response
+
+    if payload.get("stream") and ai_chain is not None:
+        response = stream_chat(plan, deadline, started)
+        response.headers.update(plan.headers)
+        return response
+
+    # Providers in order: OpenRouter (primary - cheapest), OpenAI, Perplexity
+    if ai_chain is not None:
+        try:
+            if chat_flights is not None:
+                (provider, body), shared = chat_flights.do(
+                    flight_key(plan.payload), partial(ai_chain.complete, plan.payload, deadline), deadline.remaining()
+                )
+            else:
+                (provider, body), shared = ai_chain.complete(plan.payload, deadline), False
+            logger.debug(f"AI chat answered by {provider}")
+            # Only the leader stores the answer; followers share its upstream call
+            response = jsonify(finish_chat(plan, body, None if shared else chat_cache, chat_memory))
+            response.headers.update(plan.headers)
+            if shared:
+                response.headers["X-Coalesced"] = "true"
+            return response, 200
+        except ProviderError as e:
+            logger.warning(f"AI proxy error: {e}")
+        except Exception as e:
+            logger.error(f"AI proxy error: {e}")
+
+    # Fallback to local AI if all external APIs fail
+    logger.info("Using local AI fallback (all external APIs unavailable)")
+    record_fallback(started)
+    response = jsonify(remember_chat(plan, generate_local_ai_response(payload), chat_memory))
+    if plan.conversation is not None:
+        response.headers["X-Conversation-Id"] = plan.conversation.id
+    return local_answer(response, deadline), 200
+
+
+def request_deadline():
+    """Time this chat request may spend on providers: X-Request-Timeout seconds, at most AI_REQUEST_TIMEOUT"""
+    if ai_chain is None:
+        return None
+    return Deadline.from_header(request.headers.get(DEADLINE_HEADER), AI_REQUEST_TIMEOUT)
+
+
+def local_answer(response, deadline):
+    """Mark a local fallback answer given because the request ran out of time"""
+    if deadline is not None and deadline.expired:
+        response.headers["X-Deadline-Exceeded"] = "true"
+    return response
 
-    # Basic validation to avoid misuse
-    if "model" not in payload or "messages" not in payload:
-        return jsonify({"error": "Missing required fields: model, messages"}), 400
 
+def record_fallback(started):
+    """Account a local fallback answer as the last step of the provider chain"""
+    if usage_recorder is not None:
+        depth = len(configured(ai_chain.clients)) if ai_chain is not None else 0
+        usage_recorder.record("local", None, "fallback", time.monotonic() - started, depth=depth)
+
+
+@app.route("/api/admin/ai-usage", methods=["GET"])
+def get_ai_usage():
+    """Hourly AI usage rollups by provider (X-Admin-Token must match ADMIN_TOKEN).
+
+    Query: hours (default 24), provider (optional).
+    """
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    if usage_recorder is None:
+        return jsonify({"error": "AI usage accounting is disabled"}), 503
     try:
-        import requests
-
-        # Try OpenRouter first (primary - cheapest)
-        openrouter_key = os.getenv("OPENROUTER_API_KEY")
-        if openrouter_key and openrouter_key != "sk-or-v1-...":
-            try:
-                OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
-                headers = {
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {openrouter_key}",
-                    "HTTP-Referer": "https://pcos-zeta.vercel.app",
-                    "X-Title": "PCOS AI Assistant",
-                }
-                resp = requests.post(OPENROUTER_API_URL, json=payload, headers=headers, timeout=30)
-                if resp.status_code == 200:
-                    try:
-                        return jsonify(resp.json()), 200
-                    except Exception:
-                        pass
-                else:
-                    logger.warning(f"OpenRouter returned {resp.status_code}, trying fallback...")
-            except Exception as e:
-                logger.warning(f"OpenRouter proxy error: {e}, trying OpenAI...")
-
-        # Try OpenAI as fallback
-        openai_key = os.getenv("OPENAI_API_KEY")
-        if openai_key and openai_key != "sk-proj-...":
-            try:
-                OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
-                headers = {
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {openai_key}",
-                }
-                resp = requests.post(OPENAI_API_URL, json=payload, headers=headers, timeout=30)
-                if resp.status_code == 200:
-                    try:
-                        return jsonify(resp.json()), 200
-                    except Exception:
-                        pass
-            except Exception as e:
-                logger.warning(f"OpenAI proxy error: {e}, trying Perplexity...")
-
-        # Try Perplexity as second fallback
-        perplexity_key = os.getenv("PERPLEXITY_API_KEY")
-        if perplexity_key and perplexity_key != "pplx-...":
-            try:
-                PERPLEXITY_API_URL = "https://api.perplexity.ai/chat/completions"
-                headers = {
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {perplexity_key}",
-                }
-                resp = requests.post(PERPLEXITY_API_URL, json=payload, headers=headers, timeout=30)
-                if resp.status_code == 200:
-                    try:
-                        return jsonify(resp.json()), 200
-                    except Exception:
-                        pass
-            except Exception as e:
-                logger.warning(f"Perplexity proxy error: {e}")
-
-        # Fallback to local AI if all external APIs fail
-        logger.info("Using local AI fallback (all external APIs unavailable)")
-        return jsonify(generate_local_ai_response(payload)), 200
+        hours = int(request.args.get("hours", 24))
+    except ValueError:
+        return jsonify({"error": "hours must be an integer"}), 400
+    hours = min(max(hours, 1), usage_recorder.retention_hours)
+    rollups = usage_recorder.rollups(hours, request.args.get("provider") or None)
+    return jsonify({"hours": hours, "rollups": rollups, "recorder": usage_recorder.stats()}), 200
 
-    except Exception as e:
-        logger.error(f"AI proxy error: {e}")
-        return jsonify(generate_local_ai_response(payload)), 200
+
+def sse_response(chunks):
+    """Unbuffered text/event-stream response (proxies must not buffer it either)."""
+    return Response(
+        chunks,
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def stream_chat(plan, deadline, started):
+    """Relay the provider's SSE stream chunk by chunk; stream the local answer if none opens in time."""
+    payload = plan.payload
+
+    def open_stream():
+        provider, chunks = ai_chain.stream(payload, deadline)
+        logger.debug(f"AI chat streamed by {provider}")
+        return chunks
+
+    try:
+        if chat_flights is not None:
+            chunks, shared = chat_flights.stream(flight_key(payload), open_stream, deadline.remaining())
+        else:
+            chunks, shared = open_stream(), False
+        if plan.conversation is not None:
+            chunks = remember_stream(chunks, plan, chat_memory)
+        response = sse_response(chunks)
+        if shared:
+            response.headers["X-Coalesced"] = "true"
+        return response
+    except ProviderError as e:
+        logger.warning(f"AI stream error: {e}")
+    logger.info("Using local AI fallback (all external APIs unavailable)")
+    record_fallback(started)
+    local = remember_chat(plan, generate_local_ai_response(payload), chat_memory)
+    return local_answer(sse_response(completion_to_sse(local)), deadline)
 
 
 def generate_local_ai_response(payload):
-    """Generate a basic AI response using local rules (fallback when APIs unavailable)"""
-    messages = payload.get("messages", [])
-    if not messages:
-        return {"error": "No messages provided"}
-    
-    last_message = messages[-1].get("content", "").lower()
-    
-    # PCOS-related responses
-    pcos_keywords = ["pcos", "polycystic", "ovary", "ovarian"]
-    if any(kw in last_message for kw in pcos_keywords):
-        return {
-            "id": "local-ai-response",
-            "object": "chat.completion",
-            "created": int(time.time()),
-            "model": payload.get("model", "local-ai"),
-            "choices": [{
-                "index": 0,
-                "message": {
-                    "role": "assistant",
-                    "content": "PCOS (Polycystic Ovary Syndrome) is a hormonal condition affecting women of reproductive age. Key characteristics include irregular menstrual cycles, elevated androgen levels, insulin resistance, and polycystic ovaries. Management typically involves lifestyle changes, hormonal contraceptives, or medications like metformin. Common symptoms include irregular periods, acne, hair loss, and weight gain. I recommend consulting a healthcare provider for proper diagnosis and treatment."
-                },
-                "finish_reason": "stop"
-            }],
-            "usage": {
-                "prompt_tokens": len(last_message.split()),
-                "completion_tokens": 75,
-                "total_tokens": len(last_message.split()) + 75
-            }
-        }
-    
-    # Health/medical questions
-    elif any(word in last_message for word in ["health", "symptom", "treatment", "diagnosis", "doctor"]):
-        return {
-            "id": "local-ai-response",
-            "object": "chat.completion",
-            "created": int(time.time()),
-            "model": payload.get("model", "local-ai"),
-            "choices": [{
-                "index": 0,
-                "message": {
-                    "role": "assistant",
-                    "content": "For health-related questions: Please consult with a qualified healthcare provider or medical professional. They can provide personalized advice based on your medical history and current health status. In emergencies, contact your local emergency services."
-                },
-                "finish_reason": "stop"
-            }],
-            "usage": {
-                "prompt_tokens": len(last_message.split()),
-                "completion_tokens": 35,
-                "total_tokens": len(last_message.split()) + 35
-            }
-        }
-    
-    # Generic response
-    else:
-        return {
-            "id": "local-ai-response",
-            "object": "chat.completion",
-            "created": int(time.time()),
-            "model": payload.get("model", "local-ai"),
-            "choices": [{
-                "index": 0,
-                "message": {
-                    "role": "assistant",
-                    "content": "I'm a local AI assistant. I can help with general questions about PCOS and women's health. For specific medical advice, please consult a healthcare provider. What would you like to know?"
-                },
-                "finish_reason": "stop"
-            }],
-            "usage": {
-                "prompt_tokens": len(last_message.split()),
-                "completion_tokens": 30,
-                "total_tokens": len(last_message.split()) + 30
-            }
-        }
+    """Answer from the bundled PCOS knowledge base (fallback when APIs unavailable)"""
+    return chat_setup.local_response(payload, knowledge_base)
 
 
 def save_entry(data):
+    """Store a submission in pcos_entries and return its id.
+
+    The id is generated here, so with the write-behind queue the row is only
+    queued and the insert happens after the response has gone out. The id is
+    also the idempotency key when a spooled row is replayed.
+    """
+    if entry_sink is None and entry_spool is None:
+        logger.info("Supabase not configured; skipping save")
+        return None
+    entry_id = str(uuid.uuid4())
+    row = {**data, "id": entry_id, "timestamp": datetime.now().isoformat()}
     try:
-        if supabase is None:
-            logger.info("Supabase not configured; skipping save")
-            return None
-        result = (
-            supabase.table("pcos_entries").insert({**data, "timestamp": datetime.now().isoformat()}).execute()
-        )
-        return result.data[0]["id"] if result.data else None
+        if entry_sink is not None and entry_writer is not None:
+            if entry_writer.put(row):
+                return entry_id
+            logger.warning("Entry write queue is full; spooling submission")
+        elif entry_sink is not None:
+            entry_sink.write([row])
+            return entry_id
     except Exception as e:
         logger.error(f"Error saving entry: {e}")
-        return None
+    try:
+        if entry_spool is not None and entry_spool.append([row]):
+            return entry_id
+    except Exception as e:
+        logger.error(f"Error spooling entry: {e}")
+    return None
 
 
 def generate_report(user_data, analysis, doctors):
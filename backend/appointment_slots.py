@@ -0,0 +1,293 @@
+"""
+Appointment Slot Index
+Answers "earliest free slot" queries over per-doctor sorted slot arrays
+"""
+
+import json
+import math
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from doctor_ranking import haversine_km, specialty_category
+from doctor_store import DoctorStore
+
+
+# Slot starts are epoch seconds (< 2**36, i.e. before year 4000); the doctor row
+# is packed above them so one sorted key array covers every doctor
+ROW_SHIFT = 36
+MAX_TIME = (1 << ROW_SHIFT) - 1
+# Doctors are bucketed into cells of this many degrees of latitude and longitude
+# for radius queries; a degree of latitude is about KM_PER_DEGREE km
+GRID_DEGREES = 1.0
+KM_PER_DEGREE = 111.0
+LON_CELLS = int(round(360 / GRID_DEGREES))
+
+
+def parse_time(value: Any) -> int:
+    """ISO-8601 string, datetime or epoch seconds -> epoch seconds (naive = UTC)."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def format_time(epoch: int) -> str:
+    return datetime.fromtimestamp(int(epoch), tz=timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class SlotIndex:
+    """Free appointment slots for every doctor in a DoctorStore.
+
+    Slots live in flat arrays grouped by store row and sorted by start time.
+    ``keys = row << ROW_SHIFT | start`` is globally sorted, so the first slot at
+    or after ``T`` for many doctors is a single vectorized ``searchsorted``:
+    O(log n) per candidate doctor.
+
+    ``earliest`` without a radius or candidate rows searches one time-sorted
+    array of slots: all of them, or those of one specialty category (one
+    array per category is built with the index), so it is O(log n) however
+    many doctors there are. With a radius, doctors are first looked up in a
+    ``GRID_DEGREES`` grid around the origin, and only those in range (and of
+    the wanted category) are searched, one binary search each:
+    O(k log n) for k nearby doctors. Explicit ``rows`` are searched the same way.
+    """
+
+    def __init__(self, store: DoctorStore, slots: Iterable[Tuple[int, int, int]]):
+        """``slots`` are ``(row, start, end)`` tuples with epoch-second times."""
+        self.store = store
+        triples = np.array(sorted(set(slots)), dtype=np.int64).reshape(-1, 3)
+        rows, starts, ends = triples[:, 0], triples[:, 1], triples[:, 2]
+        if len(triples) and (rows.min() < 0 or rows.max() >= len(store)):
+            raise ValueError("Slot refers to a doctor row outside the store")
+        if len(triples) and (starts.max() >= 1 << ROW_SHIFT or starts.min() < 0):
+            raise ValueError("Slot start time out of range")
+
+        self.rows = rows
+        self.starts = starts
+        self.ends = ends
+        self.keys = (rows << ROW_SHIFT) | starts
+        # Slot indices ordered by (start, row), and their starts
+        self.by_time = np.lexsort((rows, starts))
+        self.starts_by_time = starts[self.by_time]
+        # offsets[row]..offsets[row + 1] is the slot range of a doctor
+        self.offsets = np.searchsorted(rows, np.arange(len(store) + 1), side="left")
+
+        # Specialty category of every doctor, and the time-ordered slots of each category
+        codes = store.columns["specialty"]
+        names = np.array([specialty_category(codes.value(c)) for c in range(codes.cardinality)], dtype=object)
+        self.category = names[codes.codes] if len(store) else np.array([], dtype=object)
+        slot_category = self.category[rows[self.by_time]] if len(triples) else np.array([], dtype=object)
+        self._by_category: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for name in set(names.tolist()):
+            order = self.by_time[slot_category == name]
+            self._by_category[name] = (order, starts[order])
+
+        # Doctors with coordinates, by grid cell
+        lat, lon = np.asarray(store.lat, dtype=np.float64), np.asarray(store.lon, dtype=np.float64)
+        located = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+        cell_lat, cell_lon = _cell(lat[located], lon[located])
+        self._cells: Dict[Tuple[int, int], np.ndarray] = {}
+        for cell in set(zip(cell_lat.tolist(), cell_lon.tolist())):
+            self._cells[cell] = located[(cell_lat == cell[0]) & (cell_lon == cell[1])]
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @classmethod
+    def from_feed(cls, store: DoctorStore, feed: Dict[str, Any]) -> "SlotIndex":
+        """Build from ``{"slots": [{"doctor": name | "doctor_id": row, "start", "end"}]}``.
+
+        Doctors are matched by exact name (ids are store rows and change with the
+        directory); unknown doctors are skipped.
+        """
+        names = store.columns["name"]
+        row_by_name = {names[row]: row for row in range(len(store))}
+        slots = []
+        for slot in feed.get("slots", []):
+            row = slot.get("doctor_id")
+            if row is None:
+                row = row_by_name.get(slot.get("doctor"))
+            if row is None:
+                continue
+            start = parse_time(slot["start"])
+            end = parse_time(slot["end"]) if slot.get("end") else start + 30 * 60
+            slots.append((int(row), start, end))
+        return cls(store, slots)
+
+    @classmethod
+    def from_file(cls, store: DoctorStore, path: str) -> "SlotIndex":
+        with open(path, encoding="utf-8") as handle:
+            return cls.from_feed(store, json.load(handle))
+
+    def first_slot_after(self, rows: np.ndarray, after: int) -> np.ndarray:
+        """Index into ``starts``/``ends`` of each row's first slot at or after ``after``; -1 if none.
+
+        ``after`` before the epoch means any slot; past ``MAX_TIME`` there are none.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        after = int(after)
+        if after > MAX_TIME:
+            return np.full(len(rows), -1, dtype=np.int64)
+        idx = np.searchsorted(self.keys, (rows << ROW_SHIFT) | max(after, 0), side="left")
+        inside = (idx >= self.offsets[rows]) & (idx < self.offsets[rows + 1])
+        return np.where(inside, idx, -1)
+
+    def next_slot(self, row: int, after: int) -> Optional[Dict[str, str]]:
+        idx = int(self.first_slot_after(np.array([row]), after)[0])
+        return self._slot(idx) if idx >= 0 else None
+
+    def earliest(
+        self,
+        after: int,
+        origin: Optional[Tuple[float, float]] = None,
+        radius_km: Optional[float] = None,
+        specialty: Optional[str] = None,
+        rows: Optional[np.ndarray] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Earliest free slot among doctors matching the filters.
+
+        ``specialty`` is a doctor_ranking.specialty_category name; ``radius_km``
+        needs an ``origin`` and excludes doctors without coordinates.
+        """
+        after = max(int(after), 0)
+        near = origin is not None and radius_km is not None
+        if rows is None and not near:
+            idx = self._first_in_time(after, specialty)
+        else:
+            if rows is not None:
+                candidates = np.unique(np.asarray(rows, dtype=np.int64))
+            else:
+                candidates = self.near(origin, radius_km)
+            if specialty:
+                candidates = candidates[self.category[candidates] == specialty]
+            if near and rows is not None:
+                lat, lon = self.store.lat[candidates], self.store.lon[candidates]
+                candidates = candidates[haversine_km(lat, lon, origin) <= radius_km]
+            idx = self._first_among(after, candidates)
+        if idx < 0:
+            return None
+
+        row = int(self.rows[idx])
+        result = {
+            "doctor_id": row,
+            "doctor": self.store.materialize(row),
+            "city": self.store.city_of(row),
+            "slot": self._slot(idx),
+        }
+        if origin is not None:
+            distance = haversine_km(self.store.lat[[row]], self.store.lon[[row]], origin)[0]
+            result["distance_km"] = round(float(distance), 1)
+        return result
+
+    def near(self, origin: Tuple[float, float], radius_km: float) -> np.ndarray:
+        """Store rows within ``radius_km`` of ``origin`` (doctors without coordinates never are).
+
+        Only doctors in grid cells overlapping the radius's bounding box are
+        measured.
+        """
+        lat, lon = float(origin[0]), float(origin[1])
+        dlat = radius_km / KM_PER_DEGREE
+        cos = math.cos(math.radians(lat))
+        lat_range = _cell_index(np.array([lat - dlat, lat + dlat]), 90)
+        if lat - dlat <= -90 or lat + dlat >= 90 or radius_km >= KM_PER_DEGREE * 180 * cos:
+            lon_wanted = None  # the box spans every longitude
+        else:
+            dlon = radius_km / (KM_PER_DEGREE * cos)
+            first, last = _cell_index(np.array([lon - dlon, lon + dlon]), 180)
+            lon_wanted = {c % LON_CELLS for c in range(int(first), int(last) + 1)}
+
+        cells = [
+            members for (cell_lat, cell_lon), members in self._cells.items()
+            if lat_range[0] <= cell_lat <= lat_range[1] and (lon_wanted is None or cell_lon in lon_wanted)
+        ]
+        if not cells:
+            return np.array([], dtype=np.int64)
+        candidates = np.concatenate(cells)
+        distance = haversine_km(self.store.lat[candidates], self.store.lon[candidates], (lat, lon))
+        return np.sort(candidates[distance <= radius_km])
+
+    def attach_to(
+        self, doctors: List[Dict[str, Any]], after: int, rows: Optional[Iterable[int]] = None
+    ) -> List[Dict[str, Any]]:
+        """Copies of materialized doctor dicts with a ``next_available_slot`` key.
+
+        Doctors are identified by store row: ``rows`` (one per doctor) or each
+        doctor's ``id``; a doctor with neither gets no slot. Names are not
+        unique, so they are never used.
+        """
+        rows = list(rows) if rows is not None else [doctor.get("id") for doctor in doctors]
+        attached = []
+        for doctor, row in zip(doctors, rows):
+            slot = self.next_slot(int(row), after) if row is not None else None
+            attached.append({**doctor, "next_available_slot": slot})
+        return attached
+
+    def _first_in_time(self, after: int, specialty: Optional[str]) -> int:
+        """Index of the earliest slot at or after ``after`` (of a ``specialty`` doctor); -1 if none."""
+        if specialty:
+            if specialty not in self._by_category:
+                return -1
+            order, starts = self._by_category[specialty]
+        else:
+            order, starts = self.by_time, self.starts_by_time
+        pos = int(np.searchsorted(starts, after, side="left"))
+        return int(order[pos]) if pos < len(order) else -1
+
+    def _first_among(self, after: int, rows: np.ndarray) -> int:
+        """Index of the earliest slot at or after ``after`` of any of ``rows``; -1 if none."""
+        if not len(rows) or after > MAX_TIME:
+            return -1
+        idx = self.first_slot_after(rows, after)
+        idx = idx[idx >= 0]
+        if not len(idx):
+            return -1
+        # Ties on start go to the lowest row, as in the time-ordered arrays
+        return int(idx[np.lexsort((self.rows[idx], self.starts[idx]))[0]])
+
+    def _slot(self, idx: int) -> Dict[str, str]:
+        return {"start": format_time(self.starts[idx]), "end": format_time(self.ends[idx])}
+
+
+def _cell_index(degrees: np.ndarray, offset: float) -> np.ndarray:
+    return np.floor((np.asarray(degrees, dtype=np.float64) + offset) / GRID_DEGREES).astype(np.int64)
+
+
+def _cell(lat: np.ndarray, lon: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Grid cell ``(lat index, lon index)`` of each point; longitudes wrap at 180 degrees."""
+    return _cell_index(lat, 90), _cell_index(lon, 180) % LON_CELLS
+
+
+def generate_demo_feed(
+    store: DoctorStore,
+    start: Optional[datetime] = None,
+    days: int = 14,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """Stand-in feed: weekday 30-minute slots, 9:00-17:00 UTC, with some already booked."""
+    rng = random.Random(seed)
+    start = (start or datetime.now(timezone.utc)).replace(hour=0, minute=0, second=0, microsecond=0)
+    names = store.columns["name"]
+    slots = []
+    for row in range(len(store)):
+        for day in range(days):
+            date = start + timedelta(days=day)
+            if date.weekday() >= 5:
+                continue
+            for half_hour in range(16):
+                if rng.random() < 0.7:
+                    continue
+                begin = date + timedelta(hours=9, minutes=30 * half_hour)
+                slots.append(
+                    {
+                        "doctor": names[row],
+                        "start": begin.isoformat(),
+                        "end": (begin + timedelta(minutes=30)).isoformat(),
+                    }
+                )
+    return {"generated_at": datetime.now(timezone.utc).isoformat(), "slots": slots}
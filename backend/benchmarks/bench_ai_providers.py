@@ -0,0 +1,107 @@
+"""
+Benchmark: one-shot requests.post vs. pooled ProviderClient
+
+Runs a local fake chat provider whose new connections cost ``--handshake-ms``
+(standing in for TCP + TLS setup to a remote API) and whose answers take
+``--service-ms``. Reports per-call latency for both clients, sequentially and
+from ``--threads`` concurrent callers.
+
+Usage:
+    python backend/benchmarks/bench_ai_providers.py [--calls 200] [--threads 8] [--handshake-ms 60]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_providers import ProviderClient  # noqa: E402
+
+
+def start_fake_provider(handshake_s, service_s):
+    body = json.dumps({"choices": [{"message": {"role": "assistant", "content": "ok"}}]}).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            super().setup()
+            time.sleep(handshake_s)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(service_s)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+
+
+def timed(call):
+    started = time.perf_counter()
+    call()
+    return (time.perf_counter() - started) * 1000
+
+
+def run(call, calls, threads):
+    if threads == 1:
+        return [timed(call) for _ in range(calls)]
+    with ThreadPoolExecutor(threads) as pool:
+        return list(pool.map(lambda _: timed(call), range(calls)))
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"  {label:<22} p50 {statistics.median(samples):7.1f} ms   p95 {p95:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--handshake-ms", type=float, default=60.0)
+    parser.add_argument("--service-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    server, url = start_fake_provider(args.handshake_ms / 1000, args.service_ms / 1000)
+    payload = {"model": "m", "messages": [{"role": "user", "content": "hi"}]}
+    headers = {"Authorization": "Bearer test"}
+
+    def one_shot():
+        requests.post(url, json=payload, headers=headers, timeout=30).json()
+
+    client = ProviderClient("fake", url, "UNUSED", pool_size=args.threads)
+
+    def pooled():
+        client.complete(payload, "test")
+
+    print(f"handshake {args.handshake_ms:.0f} ms, service {args.service_ms:.0f} ms, {args.calls} calls")
+    for threads in (1, args.threads):
+        print(f"{threads} thread(s):")
+        report("requests.post", run(one_shot, args.calls, threads))
+        report("pooled ProviderClient", run(pooled, args.calls, threads))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Benchmark: concurrent chat requests against a slow provider, Flask vs asyncio
+
+Starts a fake OpenAI-compatible provider that answers after ``--delay``
+seconds, then sends ``--concurrency`` chat requests at once to:
+
+- the Flask app behind a fixed pool of ``--workers`` threads (like a sync
+  gunicorn deployment), and
+- the aiohttp chat server (chat_server.py) in one thread.
+
+Both use the same provider chain, intents, cache and fallback code. While
+the chats are in flight, ``/health`` on the Flask server is probed to show
+whether other endpoints are starved.
+
+Usage:
+    python backend/benchmarks/bench_chat_concurrency.py [--concurrency 500] [--delay 1.0] [--workers 16]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SKIP_SUPABASE", "1")
+os.environ["SKIP_RATE_LIMIT"] = "1"
+os.environ["BENCH_PROVIDER_KEY"] = "bench"
+
+from aiohttp import ClientSession, TCPConnector, web  # noqa: E402
+from werkzeug.serving import BaseWSGIServer  # noqa: E402
+
+import app as flask_app  # noqa: E402
+from ai_providers import ProviderChain, ProviderClient  # noqa: E402
+from chat_server import create_app  # noqa: E402
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug server that handles connections on a fixed thread pool"""
+
+    request_queue_size = 4096
+
+    def __init__(self, host, port, app, workers):
+        super().__init__(host, port, app)
+        self.pool = ThreadPoolExecutor(workers)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+async def start_provider(delay):
+    async def completions(request):
+        await request.read()
+        await asyncio.sleep(delay)
+        return web.json_response({
+            "id": "bench",
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}}],
+            "usage": {"total_tokens": 10},
+        })
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", completions)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0, backlog=4096)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1/chat/completions"
+
+
+async def load(session, chat_url, health_url, concurrency):
+    latencies = []
+
+    async def one(i):
+        started = time.perf_counter()
+        payload = {"model": "m", "messages": [{"role": "user", "content": f"question {i} about pcos"}]}
+        async with session.post(chat_url, json=payload) as response:
+            await response.read()
+            assert response.status == 200, response.status
+        latencies.append(time.perf_counter() - started)
+
+    async def probe():
+        await asyncio.sleep(0.1)
+        started = time.perf_counter()
+        async with session.get(health_url) as response:
+            await response.read()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    probe_task = asyncio.ensure_future(probe())
+    await asyncio.gather(*(one(i) for i in range(concurrency)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return wall, latencies, await probe_task
+
+
+def report(label, wall, latencies, probe):
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+    print(
+        f"  {label:<22} wall {wall:6.2f} s   p50 {statistics.median(latencies):6.2f} s   "
+        f"p99 {p99:6.2f} s   /health during load {probe * 1000:7.1f} ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--delay", type=float, default=1.0, help="provider latency in seconds")
+    parser.add_argument("--workers", type=int, default=16, help="Flask worker threads")
+    args = parser.parse_args()
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    provider, provider_url = await start_provider(args.delay)
+    flask_app.ai_chain = ProviderChain(
+        [ProviderClient("bench", provider_url, "BENCH_PROVIDER_KEY", pool_size=args.workers)]
+    )
+    flask_app.chat_cache = None
+
+    wsgi = PooledWSGIServer("127.0.0.1", 0, flask_app.app, args.workers)
+    threading.Thread(target=wsgi.serve_forever, daemon=True).start()
+    flask_url = f"http://127.0.0.1:{wsgi.server_port}"
+
+    chat = create_app(
+        ProviderChain([ProviderClient("bench", provider_url, "BENCH_PROVIDER_KEY")]),
+        flask_app.generate_local_ai_response,
+        intents=flask_app.chat_intents,
+        trimmer=flask_app.context_trimmer,
+    )
+    runner = web.AppRunner(chat, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0, backlog=4096)
+    await site.start()
+    async_url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+    print(f"{args.concurrency} concurrent chats, provider latency {args.delay:.2f} s")
+    async with ClientSession(connector=TCPConnector(limit=0)) as session:
+        report(
+            f"flask, {args.workers} threads",
+            *await load(session, f"{flask_url}/api/ai/chat", f"{flask_url}/health", args.concurrency),
+        )
+        report(
+            "asyncio chat server",
+            *await load(session, f"{async_url}/api/ai/chat", f"{flask_url}/health", args.concurrency),
+        )
+
+    wsgi.shutdown()
+    await runner.cleanup()
+    await provider.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+"""
+Latency benchmark: weighted top-k doctor ranking over a large candidate set
+
+Usage:
+    python backend/benchmarks/bench_doctor_ranking.py [--candidates 5000] [--repeat 2000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from bench_doctor_store import CITIES, synthetic_doctor  # noqa: E402
+from doctor_ranking import DoctorRanker  # noqa: E402
+from doctor_recommendations import CITY_COORDINATES  # noqa: E402
+from doctor_store import DoctorStore  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--candidates", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+
+    def record(i):
+        city = CITIES[i % len(CITIES)]
+        lat, lon = CITY_COORDINATES[city]
+        doctor = synthetic_doctor(i)
+        doctor["lat"] = lat + rng.normal(0, 0.3)
+        doctor["lon"] = lon + rng.normal(0, 0.3)
+        return city, doctor
+
+    store = DoctorStore.from_records(record(i) for i in range(args.candidates * len(CITIES)))
+    ranker = DoctorRanker(store)
+    rows = np.arange(args.candidates)
+    mask = ranker.symptom_mask(["irregular_cycles", "weight_gain", "infertility"])
+    origin = CITY_COORDINATES["Hyderabad"]
+
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        ranker.top_k(rows, 3, "high", mask, origin)
+        timings.append(time.perf_counter() - started)
+
+    timings = np.array(timings) * 1e6
+    print(f"candidates: {args.candidates:,}")
+    print(f"top-3 latency: p50 {np.percentile(timings, 50):.0f} us, p99 {np.percentile(timings, 99):.0f} us")
+
+    started = time.perf_counter()
+    for _ in range(args.repeat // 10):
+        scores = ranker.score(rows, "high", mask, origin)
+        np.argsort(-scores, kind="stable")[:3]
+    full_sort = (time.perf_counter() - started) / (args.repeat // 10) * 1e6
+    print(f"score + full sort: {full_sort:.0f} us")
+
+
+if __name__ == "__main__":
+    main()
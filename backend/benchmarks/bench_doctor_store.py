@@ -0,0 +1,89 @@
+"""
+Memory benchmark: list-of-dicts doctor directory vs. columnar DoctorStore
+
+Usage:
+    python backend/benchmarks/bench_doctor_store.py [--count 1000000]
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from doctor_store import DoctorStore  # noqa: E402
+
+CITIES = ["Hyderabad", "Vijayawada", "Bangalore", "Chennai", "Delhi", "Mumbai", "Pune"]
+SPECIALTIES = [
+    "Gynecologist",
+    "Endocrinologist",
+    "Gynecologist & PCOS Specialist",
+    "Gynecologist & Fertility Specialist",
+]
+HOSPITALS = ["Apollo Hospital", "Care Hospitals", "Fortis Hospital", "Max Hospital", "Manipal Hospital"]
+EXPERTISE = ["PCOS", "Infertility", "Thyroid", "Diabetes", "IVF", "Hormonal Disorders", "Women's Health"]
+
+
+def synthetic_doctor(i):
+    """Deterministic doctor record shaped like DoctorRecommender.doctors_db entries."""
+    return {
+        "name": f"Dr. Synthetic {i}",
+        "specialty": SPECIALTIES[i % len(SPECIALTIES)],
+        "hospital": HOSPITALS[i % len(HOSPITALS)],
+        "phone": f"+91 {40 + i % 60} {i % 10000:04d} {i // 10000:04d}",
+        "address": f"Block {i % 500}, {CITIES[i % len(CITIES)]}",
+        "experience": f"{5 + i % 20}+ years",
+        "rating": round(3.5 + (i % 15) / 10, 1),
+        "expertise": ["PCOS", EXPERTISE[1 + i % 6], EXPERTISE[1 + (i // 7) % 6]],
+    }
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    obj = build()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, current, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=1_000_000)
+    args = parser.parse_args()
+    n = args.count
+
+    def build_dicts():
+        db = {city: [] for city in CITIES}
+        for i in range(n):
+            db[CITIES[i % len(CITIES)]].append(synthetic_doctor(i))
+        return db
+
+    def build_store():
+        return DoctorStore.from_records(
+            (CITIES[i % len(CITIES)], synthetic_doctor(i)) for i in range(n)
+        )
+
+    db, dict_bytes, dict_secs = measure(build_dicts)
+    del db
+    store, store_bytes, store_secs = measure(build_store)
+
+    print(f"doctors:            {n:,}")
+    print(f"dict directory:     {dict_bytes / 2**20:9.1f} MiB  ({dict_bytes / n:6.1f} B/doctor, built in {dict_secs:.1f}s)")
+    print(f"DoctorStore:        {store_bytes / 2**20:9.1f} MiB  ({store_bytes / n:6.1f} B/doctor, built in {store_secs:.1f}s)")
+    print(f"reduction:          {dict_bytes / max(store_bytes, 1):9.1f}x")
+
+    started = time.perf_counter()
+    rows = store.rows_for_city("Chennai")[:3]
+    store.materialize_many(rows)
+    print(f"materialize 3 rows: {(time.perf_counter() - started) * 1e6:9.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark: local knowledge base start-up and query latency
+
+Times building the BM25 index from the bundled FAQ against loading a file
+written by ``KnowledgeBase.save``, then the per-query latency of ``search``
+for a mix of chat questions.
+
+Usage:
+    python backend/benchmarks/bench_knowledge_base.py [--queries 10000] [--k 3]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from knowledge_base import KnowledgeBase  # noqa: E402
+
+
+QUESTIONS = [
+    "what is pcos",
+    "can I eat rice with pcos",
+    "metformin side effects",
+    "how do I get pregnant with pcos and irregular periods",
+    "why is my hair thinning",
+    "is keto good for insulin resistance",
+    "which blood tests do I need",
+    "I feel anxious and tired all the time",
+]
+
+
+def best_of(call, repeat=5):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = call()
+        times.append((time.perf_counter() - started) * 1000)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=10000)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    build_ms, kb = best_of(KnowledgeBase.from_file)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index.json")
+        kb.save(path)
+        load_ms, _ = best_of(lambda: KnowledgeBase.from_file(path))
+
+    print(f"{len(kb)} entries, {kb.stats()['terms']} terms")
+    print(f"  build index at start-up   {build_ms:7.1f} ms")
+    print(f"  load pre-built index      {load_ms:7.1f} ms")
+
+    samples = []
+    for i in range(args.queries):
+        started = time.perf_counter()
+        kb.search(QUESTIONS[i % len(QUESTIONS)], k=args.k)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    print(f"search (k={args.k}): p50 {statistics.median(samples):.3f} ms   p99 {p99:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark: per-IP timestamp lists vs. SlidingWindowLimiter
+
+Pushes a million distinct client IPs through both limiters (scanner-style
+traffic) and times a single hot key at a high limit.
+
+Usage:
+    python backend/benchmarks/bench_rate_limiter.py [--ips 1000000] [--max-keys 100000]
+"""
+
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import SlidingWindowLimiter, SQLiteRateLimiter  # noqa: E402
+
+
+class TimestampListLimiter:
+    """The previous implementation: every request timestamp kept per IP."""
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.store = {}
+
+    def hit(self, ip):
+        now = time.time()
+        history = [t for t in self.store.get(ip, []) if now - t < self.window]
+        self.store[ip] = history
+        if len(history) >= self.limit:
+            return False
+        history.append(now)
+        return True
+
+
+def ip(i):
+    return f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}"
+
+
+def run(limiter, n):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    for i in range(n):
+        limiter.hit(ip(i))
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, current
+
+
+def hot_key(limiter, n):
+    started = time.perf_counter()
+    for _ in range(n):
+        limiter.hit("203.0.113.7")
+    return (time.perf_counter() - started) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ips", type=int, default=1_000_000)
+    parser.add_argument("--max-keys", type=int, default=100_000)
+    args = parser.parse_args()
+
+    old_secs, old_bytes = run(TimestampListLimiter(60, 60), args.ips)
+    new_secs, new_bytes = run(SlidingWindowLimiter(60, 60, max_keys=args.max_keys), args.ips)
+
+    print(f"distinct IPs: {args.ips:,}")
+    print(f"timestamp lists:      {old_secs:6.2f}s  {old_bytes / 2**20:8.1f} MiB retained")
+    print(f"sliding window (cap {args.max_keys:,}): {new_secs:6.2f}s  {new_bytes / 2**20:8.1f} MiB retained")
+
+    print("hot key, limit 10,000, 10,000 requests:")
+    print(f"  timestamp lists: {hot_key(TimestampListLimiter(10_000, 60), 10_000):8.2f} us/check")
+    print(f"  sliding window:  {hot_key(SlidingWindowLimiter(10_000, 60), 10_000):8.2f} us/check")
+    with tempfile.TemporaryDirectory() as tmp:
+        shared = SQLiteRateLimiter(10_000, 60, path=os.path.join(tmp, "rl.db"))
+        print(f"  sqlite (shared): {hot_key(shared, 10_000):8.2f} us/check")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Chat Response Cache
+Reuses provider answers for repeated questions ("what is PCOS", ...)
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Callable, Dict, Optional
+
+from lru_cache import LRUCache
+
+
+DEFAULT_TTL = 24 * 3600
+# Blended USD price per 1K tokens used to estimate what a hit saved
+DEFAULT_PRICE_PER_1K_TOKENS = 0.002
+
+_SPACE = re.compile(r"\s+")
+_TRAILING = re.compile(r"[\s?!.,;:]+$")
+
+
+def normalize_text(text: str) -> str:
+    """Case-, width- and whitespace-insensitive form; trailing punctuation dropped."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return _TRAILING.sub("", _SPACE.sub(" ", text).strip())
+
+
+class ChatCache:
+    """LRU + TTL cache of chat completions keyed on the normalized conversation.
+
+    Only requests that are deterministic enough are cached: temperature at
+    most ``max_temperature``, plain-text messages, a single choice, no tools,
+    and at most ``max_turns`` non-system messages. The default limit, 0.3, is
+    below the frontend's 0.7: a warmer request asks for varied wording, which a
+    cached answer would take away, so it is only cached when ``max_temperature``
+    is raised (more hits, less variety). The key covers the model,
+    temperature, system prompt and every remaining turn, so a follow-up such
+    as "tell me more" never matches a different conversation.
+
+    With ``path`` entries are also written to a SQLite file, so answers
+    survive restarts and are shared between workers; memory stays the first
+    level.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1000,
+        ttl: float = DEFAULT_TTL,
+        max_temperature: float = 0.3,
+        max_turns: int = 1,
+        price_per_1k_tokens: float = DEFAULT_PRICE_PER_1K_TOKENS,
+        path: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_temperature = max_temperature
+        self.max_turns = max_turns
+        self.price_per_1k_tokens = price_per_1k_tokens
+        self.path = path
+        self._clock = clock
+        self._memory = LRUCache(maxsize, ttl=ttl, clock=clock)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.tokens_saved = 0
+        if path:
+            self._db().execute(
+                """
+                CREATE TABLE IF NOT EXISTS chat_cache (
+                    key TEXT PRIMARY KEY,
+                    body TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+
+    def key(self, payload: Dict[str, Any]) -> Optional[str]:
+        """Cache key for a chat payload, or None when it should not be cached."""
+        if payload.get("tools") or payload.get("functions") or payload.get("n", 1) != 1:
+            return None
+        try:
+            temperature = float(payload.get("temperature", 1.0))
+        except (TypeError, ValueError):
+            return None
+        if temperature > self.max_temperature:
+            return None
+
+        messages = payload.get("messages")
+        if not isinstance(messages, list) or not messages:
+            return None
+        turns = []
+        for message in messages:
+            content = message.get("content") if isinstance(message, dict) else None
+            if not isinstance(content, str):
+                return None
+            turns.append((message.get("role", "user"), normalize_text(content)))
+        if sum(role != "system" for role, _ in turns) > self.max_turns:
+            return None
+
+        material = json.dumps([payload.get("model"), temperature, turns], separators=(",", ":"))
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        body = self._memory.get(key)
+        if body is None and self.path:
+            row = self._db().execute(
+                "SELECT body, expires_at FROM chat_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row and row[1] > self._clock():
+                body = json.loads(row[0])
+                self._memory.set(key, body, ttl=row[1] - self._clock())
+        with self._lock:
+            if body is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.tokens_saved += _total_tokens(body)
+        return body
+
+    def set(self, key: str, body: Dict[str, Any]) -> None:
+        self._memory.set(key, body)
+        with self._lock:
+            self.stores += 1
+            prune = self.path and self.stores % 100 == 0
+        if self.path:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO chat_cache (key, body, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(body), self._clock() + self.ttl),
+            )
+            if prune:
+                db.execute("DELETE FROM chat_cache WHERE expires_at <= ?", (self._clock(),))
+                db.execute(
+                    """
+                    DELETE FROM chat_cache WHERE key IN (
+                        SELECT key FROM chat_cache ORDER BY expires_at
+                        LIMIT max(0, (SELECT count(*) FROM chat_cache) - ?)
+                    )
+                    """,
+                    (self.maxsize,),
+                )
+
+    def clear(self) -> None:
+        self._memory.clear()
+        if self.path:
+            self._db().execute("DELETE FROM chat_cache")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._memory),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "tokens_saved": self.tokens_saved,
+                "dollars_saved": round(self.tokens_saved / 1000 * self.price_per_1k_tokens, 4),
+                "persistent": bool(self.path),
+            }
+
+    def _db(self) -> sqlite3.Connection:
+        """One connection per thread and process (connections must not cross a fork)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+
+def _total_tokens(body: Dict[str, Any]) -> int:
+    usage = body.get("usage") if isinstance(body, dict) else None
+    tokens = usage.get("total_tokens", 0) if isinstance(usage, dict) else 0
+    return tokens if isinstance(tokens, int) else 0
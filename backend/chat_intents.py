@@ -0,0 +1,271 @@
+"""
+Chat Intents
+Answers computable chat questions (cycle length, BMI, symptom risk) with the
+analysis engine in process instead of forwarding them to an AI provider
+"""
+
+import re
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from knowledge_base import DISCLAIMER
+
+
+class Intent(NamedTuple):
+    name: str
+    slots: Dict[str, Any]
+
+
+# Form symptom keys (see frontend/form.html) and the phrases that mean them
+SYMPTOM_PHRASES = {
+    "irregular_cycles": r"irregular (?:periods?|cycles?|menstruation)|missed periods?|missing periods?|no periods?|late periods?",
+    "hirsutism": r"hirsutism|facial hair|excess(?:ive)? hair|unwanted hair|(?:body|chin) hair|hair growth",
+    "acne": r"acne|pimples?|breakouts?",
+    "weight_gain": r"weight gain|gaining weight|gained weight|putting on weight",
+    "hair_loss": r"hair loss|hair thinning|thinning hair|losing (?:my )?hair|hair falling out|balding",
+    "infertility": r"infertility|infertile|trouble conceiving|difficulty conceiving|(?:can'?t|cannot) get pregnant",
+    "mood_changes": r"mood swings?|mood changes?|depression|depressed|anxiety|irritability",
+    "fatigue": r"fatigue|tiredness|always tired|exhaustion",
+    "darkening": r"dark (?:skin )?patches|darkening|acanthosis",
+    "pelvic_pain": r"pelvic pain",
+}
+
+SYMPTOM_LABELS = {
+    "irregular_cycles": "irregular periods",
+    "hirsutism": "excess hair growth",
+    "acne": "acne",
+    "weight_gain": "weight gain",
+    "hair_loss": "hair loss",
+    "infertility": "difficulty conceiving",
+    "mood_changes": "mood changes",
+    "fatigue": "fatigue",
+    "darkening": "dark skin patches",
+    "pelvic_pain": "pelvic pain",
+}
+
+_SYMPTOMS = [(key, re.compile(rf"\b(?:{pattern})\b")) for key, pattern in SYMPTOM_PHRASES.items()]
+_NEGATED = re.compile(r"\b(?:no|not|without|never|don'?t|do not)\b(?:\s+(?!but\b|and\b)\w+){0,2}\s*$")
+
+_CYCLE = [
+    re.compile(r"(\d{1,3})\s*-?\s*days?[\s-]+(?:long\s+)?(?:menstrual\s+)?cycles?\b"),
+    re.compile(r"\bcycles?\b[^.?!\d]{0,30}?(\d{1,3})\s*-?\s*days?\b"),
+    re.compile(r"\bperiods?\s+(?:\w+\s+){0,2}every\s+(\d{1,3})\s*days?\b"),
+]
+_PERIOD = [
+    re.compile(r"(\d{1,2})\s*-?\s*days?[\s-]+(?:long\s+)?periods?\b"),
+    re.compile(r"\bperiods?\b[^.?!\d]{0,20}?\b(?:lasts?|lasting|for|of)\s+(\d{1,2})\s*days?\b"),
+    re.compile(r"\bbleed(?:ing|s)?\s+(?:for\s+)?(\d{1,2})\s*days?\b"),
+]
+_AGE = re.compile(r"\b(?:i'?m|i am|aged?)\s+(\d{2})\b|\b(\d{2})\s*(?:years?|yrs?|y/?o)\b")
+_WEIGHT = re.compile(r"(\d{2,3}(?:\.\d+)?)\s*(kgs?|kilo(?:gram)?s?|lbs?|pounds?)\b")
+_HEIGHT_CM = re.compile(r"(\d{3}(?:\.\d+)?)\s*(?:cm|centimet(?:er|re)s?)\b")
+_HEIGHT_M = re.compile(r"\b([12](?:\.\d+)?)\s*(?:m|meters?|metres?)\b")
+_HEIGHT_FT = re.compile(r"\b([4-7])\s*(?:'|ft|feet|foot)\s*(?:(\d{1,2})\s*(?:\"|''|in|inch(?:es)?)?)?")
+
+_BMI_CUE = re.compile(r"\bbmi\b|body mass")
+_RISK_CUE = re.compile(r"\b(?:risk|chances?|likel(?:y|ihood)|probability|odds)\b")
+_CYCLE_CUE = re.compile(
+    r"\b(?:normal|abnormal|regular|irregular|ok(?:ay)?|fine|healthy|typical|usual|long|short|concern\w*|worr\w*)\b"
+)
+
+
+def _number(pattern_list, text) -> Optional[int]:
+    for pattern in pattern_list:
+        match = pattern.search(text)
+        if match:
+            return int(next(group for group in match.groups() if group))
+    return None
+
+
+def find_symptoms(text: str) -> List[str]:
+    found = []
+    for key, pattern in _SYMPTOMS:
+        for match in pattern.finditer(text):
+            if not _NEGATED.search(text[max(0, match.start() - 25):match.start()]):
+                found.append(key)
+                break
+    return found
+
+
+def _weight_kg(text: str) -> Optional[float]:
+    match = _WEIGHT.search(text)
+    if not match:
+        return None
+    value = float(match.group(1))
+    return value * 0.4536 if match.group(2).startswith(("lb", "pound")) else value
+
+
+def _height_cm(text: str) -> Optional[float]:
+    match = _HEIGHT_CM.search(text)
+    if match:
+        return float(match.group(1))
+    match = _HEIGHT_M.search(text)
+    if match:
+        return float(match.group(1)) * 100
+    match = _HEIGHT_FT.search(text)
+    if match:
+        return (int(match.group(1)) * 12 + int(match.group(2) or 0)) * 2.54
+    return None
+
+
+def extract_intent(text: str) -> Optional[Intent]:
+    """Recognize a computable question and its slots, or None to forward it."""
+    text = text.lower().replace("’", "'").replace("”", '"')
+
+    if _BMI_CUE.search(text):
+        weight, height = _weight_kg(text), _height_cm(text)
+        if weight and height and 20 <= weight <= 300 and 100 <= height <= 230:
+            return Intent("bmi", {"weight": round(weight, 1), "height": round(height, 1)})
+        return None
+
+    cycle_length = _number(_CYCLE, text)
+    period_length = _number(_PERIOD, text)
+    if cycle_length is not None and not 10 <= cycle_length <= 180:
+        return None
+    if period_length is not None and not 1 <= period_length <= 20:
+        return None
+
+    if _RISK_CUE.search(text):
+        symptoms = find_symptoms(text)
+        if not symptoms and cycle_length is None:
+            return None
+        slots: Dict[str, Any] = {"symptoms": symptoms}
+        age = _AGE.search(text)
+        if age:
+            slots["age"] = int(age.group(1) or age.group(2))
+        if cycle_length is not None:
+            slots["cycle_length"] = cycle_length
+        if period_length is not None:
+            slots["period_length"] = period_length
+        return Intent("risk", slots)
+
+    if (cycle_length is not None or period_length is not None) and _CYCLE_CUE.search(text):
+        slots = {}
+        if cycle_length is not None:
+            slots["cycle_length"] = cycle_length
+        if period_length is not None:
+            slots["period_length"] = period_length
+        return Intent("cycle", slots)
+    return None
+
+
+class ChatIntents:
+    """Short-circuits recognized chat questions to ``PCOSAnalyzer``.
+
+    Only the last user message is looked at. ``answer`` returns an
+    OpenAI-style chat completion (with an extra ``intent`` field) or None when
+    the question should go to a provider as before.
+    """
+
+    def __init__(self, analyzer):
+        self.analyzer = analyzer
+        self._lock = threading.Lock()
+        self.answered: Dict[str, int] = {}
+        self.forwarded = 0
+
+    def answer(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        messages = payload.get("messages")
+        text = ""
+        if isinstance(messages, list) and messages and isinstance(messages[-1], dict):
+            if messages[-1].get("role", "user") == "user" and isinstance(messages[-1].get("content"), str):
+                text = messages[-1]["content"]
+        intent = extract_intent(text) if text else None
+        content = getattr(self, f"_{intent.name}")(intent.slots) if intent else None
+        with self._lock:
+            if content is None:
+                self.forwarded += 1
+                return None
+            self.answered[intent.name] = self.answered.get(intent.name, 0) + 1
+
+        prompt_tokens = len(text.split())
+        completion_tokens = len(content.split())
+        return {
+            "id": f"local-intent-{intent.name}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "local-ai"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+            "intent": {"name": intent.name, "slots": intent.slots},
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            answered = sum(self.answered.values())
+            total = answered + self.forwarded
+            return {
+                "answered": dict(self.answered),
+                "forwarded": self.forwarded,
+                "answer_rate": round(answered / total, 4) if total else 0.0,
+            }
+
+    def _cycle(self, slots: Dict[str, Any]) -> str:
+        insights = self.analyzer.analyze_step(2, slots)
+        lines = [f"{finding}." for finding in insights.get("findings", [])]
+        lines += insights.get("tips", [])
+        lines.append(
+            "A typical adult cycle is 21-35 days from the first day of one period to the first day of "
+            "the next, with bleeding for 2-7 days. If yours is regularly outside that range, it is worth "
+            "discussing with a doctor."
+        )
+        return " ".join(lines) + "\n\n" + DISCLAIMER
+
+    def _bmi(self, slots: Dict[str, Any]) -> Optional[str]:
+        insights = self.analyzer.analyze_step(1, slots)
+        findings = [f for f in insights.get("findings", []) if f.startswith("BMI")]
+        if not findings:
+            return None
+        lines = [findings[0].replace("BMI:", f"BMI for {slots['weight']:g} kg and {slots['height']:g} cm:", 1) + "."]
+        lines += insights.get("tips", [])
+        lines.append(
+            "Adult categories: under 18.5 underweight, 18.5-24.9 normal, 25-29.9 overweight, 30 or more "
+            "obese (lower cut-offs are often used for Asian populations). BMI does not show where fat is "
+            "stored, so waist size is a useful extra measure."
+        )
+        return " ".join(lines) + "\n\n" + DISCLAIMER
+
+    def _risk(self, slots: Dict[str, Any]) -> str:
+        assumed = []
+        data = dict(slots)
+        for key, default, label in (
+            ("cycle_length", 28, "a 28-day cycle"),
+            ("period_length", 5, "5-day periods"),
+            ("age", 25, "age 25"),
+        ):
+            if key not in data:
+                data[key] = default
+                assumed.append(label)
+        result = self.analyzer.analyze(data)
+
+        reported = [SYMPTOM_LABELS[s] for s in slots["symptoms"]]
+        if "cycle_length" in slots:
+            reported.append(f"a {slots['cycle_length']}-day cycle")
+        level = result.get("risk_level", "moderate")
+        score = result.get("risk_score")
+        headline = f"With {_join(reported)}, your estimated PCOS risk is {level}"
+        headline += f" ({score}/100)." if score is not None else "."
+        lines = [headline]
+        if assumed:
+            lines.append(f"This assumes {_join(assumed)}, since you did not mention them.")
+        recommendations = result.get("recommendations", [])[:3]
+        text = " ".join(lines)
+        if recommendations:
+            text += "\n\nRecommendations:\n" + "\n".join(f"- {rec}" for rec in recommendations)
+        text += (
+            "\n\nThis uses the same scoring as the assessment form and is a screening estimate, not a "
+            "diagnosis. The full assessment gives a more complete picture.\n\n" + DISCLAIMER
+        )
+        return text
+
+
+def _join(items: List[str]) -> str:
+    return items[0] if len(items) == 1 else ", ".join(items[:-1]) + " and " + items[-1]
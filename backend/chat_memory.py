@@ -0,0 +1,209 @@
+"""
+Chat Conversation Memory
+Keeps the recent turns of each chat conversation on the server, so clients
+send a conversation id and the new message instead of the whole history
+"""
+
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional
+
+from lru_cache import LRUCache
+
+
+DEFAULT_TTL = 3600
+DEFAULT_MAX_TURNS = 20
+# Roughly 4K tokens of history per conversation
+DEFAULT_MAX_CHARS = 16000
+
+_CONVERSATION_ID = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+
+class Conversation(NamedTuple):
+    """A conversation as resumed for one request."""
+
+    id: str
+    history: List[Dict[str, Any]]
+    resumed: bool
+
+
+class ConversationStore:
+    """Ring buffer of recent turns per conversation, with LRU and TTL eviction.
+
+    Each conversation keeps at most ``max_turns`` messages and ``max_chars``
+    characters of them (oldest dropped first), and expires ``ttl`` seconds
+    after its last turn. At most ``max_conversations`` are held; the least
+    recently used goes first. Memory is therefore bounded by
+    ``max_conversations * max_chars``.
+
+    Ids are issued by the store: an unknown, expired or malformed id gets a
+    fresh conversation rather than one named by the client, so nobody can
+    write into a conversation whose id they made up.
+
+    With ``path`` conversations are also written to a SQLite file, so they
+    survive restarts and are shared between workers. The file is then the
+    source of truth: every resume and append reads it (an append reads and
+    writes inside one ``BEGIN IMMEDIATE`` transaction), so a turn stored by
+    another worker is neither missed nor overwritten. Memory only mirrors
+    what this worker last read.
+    """
+
+    def __init__(
+        self,
+        max_turns: int = DEFAULT_MAX_TURNS,
+        max_chars: int = DEFAULT_MAX_CHARS,
+        max_conversations: int = 10000,
+        ttl: float = DEFAULT_TTL,
+        path: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.max_turns = max_turns
+        self.max_chars = max_chars
+        self.max_conversations = max_conversations
+        self.ttl = ttl
+        self.path = path
+        self._clock = clock
+        self._memory = LRUCache(max_conversations, ttl=ttl, clock=clock)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.started = 0
+        self.resumed = 0
+        self.unknown = 0
+        self.appended = 0
+        self.dropped = 0
+        if path:
+            self._db().execute(
+                """
+                CREATE TABLE IF NOT EXISTS chat_memory (
+                    id TEXT PRIMARY KEY,
+                    turns TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+
+    def resume(self, conversation_id: Any) -> Conversation:
+        """The stored conversation ``conversation_id``, or a new empty one under a fresh id."""
+        turns = self._load(conversation_id) if self._valid(conversation_id) else None
+        with self._lock:
+            if turns is not None:
+                self.resumed += 1
+                return Conversation(conversation_id, list(turns), True)
+            if conversation_id:
+                self.unknown += 1
+            self.started += 1
+        return Conversation(secrets.token_urlsafe(18), [], False)
+
+    def append(self, conversation_id: str, messages: List[Dict[str, Any]]) -> int:
+        """Add turns to a conversation (creating it if needed); returns how many it now keeps."""
+        if not self.path:
+            with self._lock:
+                return len(self._extend(conversation_id, self._memory.get(conversation_id), messages))
+        db = self._db()
+        # Read-modify-write under the database's write lock: concurrent appends from other workers wait
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            turns = self._load(conversation_id)
+            with self._lock:
+                snapshot = self._extend(conversation_id, turns, messages)
+                prune = self.appended % 100 < len(messages)
+            self._save(conversation_id, snapshot, prune)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return len(snapshot)
+
+    def clear(self) -> None:
+        self._memory.clear()
+        if self.path:
+            self._db().execute("DELETE FROM chat_memory")
+
+    def stats(self) -> Dict[str, Any]:
+        memory = self._memory.stats()
+        with self._lock:
+            return {
+                "conversations": len(self._memory),
+                "max_conversations": self.max_conversations,
+                "max_turns": self.max_turns,
+                "started": self.started,
+                "resumed": self.resumed,
+                "unknown": self.unknown,
+                "turns_appended": self.appended,
+                "turns_dropped": self.dropped,
+                "evictions": memory["evictions"],
+                "persistent": bool(self.path),
+            }
+
+    def _extend(
+        self, conversation_id: str, turns: Optional[Deque[Dict[str, Any]]], messages: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Add ``messages`` to ``turns`` within the caps and remember the result; the caller holds ``_lock``."""
+        if turns is None:
+            turns = deque(maxlen=self.max_turns)
+        before = len(turns) + len(messages)
+        turns.extend(messages)
+        chars = sum(_chars(turn) for turn in turns)
+        while len(turns) > 1 and chars > self.max_chars:
+            chars -= _chars(turns.popleft())
+        self.appended += len(messages)
+        self.dropped += before - len(turns)
+        # Re-setting restarts the TTL: conversations expire after their last turn
+        self._memory.set(conversation_id, turns)
+        return list(turns)
+
+    def _valid(self, conversation_id: Any) -> bool:
+        return isinstance(conversation_id, str) and bool(_CONVERSATION_ID.match(conversation_id))
+
+    def _load(self, conversation_id: str) -> Optional[Deque[Dict[str, Any]]]:
+        if not self.path:
+            return self._memory.get(conversation_id)
+        row = self._db().execute(
+            "SELECT turns, expires_at FROM chat_memory WHERE id = ?", (conversation_id,)
+        ).fetchone()
+        if not row or row[1] <= self._clock():
+            self._memory.pop(conversation_id)
+            return None
+        turns = deque(json.loads(row[0]), maxlen=self.max_turns)
+        self._memory.set(conversation_id, turns, ttl=row[1] - self._clock())
+        return turns
+
+    def _save(self, conversation_id: str, turns: List[Dict[str, Any]], prune: bool) -> None:
+        db = self._db()
+        db.execute(
+            "INSERT OR REPLACE INTO chat_memory (id, turns, expires_at) VALUES (?, ?, ?)",
+            (conversation_id, json.dumps(turns), self._clock() + self.ttl),
+        )
+        if prune:
+            db.execute("DELETE FROM chat_memory WHERE expires_at <= ?", (self._clock(),))
+            db.execute(
+                """
+                DELETE FROM chat_memory WHERE id IN (
+                    SELECT id FROM chat_memory ORDER BY expires_at
+                    LIMIT max(0, (SELECT count(*) FROM chat_memory) - ?)
+                )
+                """,
+                (self.max_conversations,),
+            )
+
+    def _db(self) -> sqlite3.Connection:
+        """One connection per thread and process (connections must not cross a fork)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+
+def _chars(message: Dict[str, Any]) -> int:
+    content = message.get("content") if isinstance(message, dict) else None
+    if isinstance(content, str):
+        return len(content)
+    return len(json.dumps(content))
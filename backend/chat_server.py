@@ -0,0 +1,253 @@
+"""
+Async Chat Server
+Serves POST /api/ai/chat on asyncio (aiohttp), so a request waiting on a slow
+provider holds a coroutine instead of a Flask worker thread. Validation,
+conversation memory, intent answers, the answer cache, history trimming,
+rate limiting and the local fallback are the Flask app's own (see chat_service.py); only the
+transport differs. The components are built from the same env vars by chat_setup.py, so this
+process does not import the Flask app (or start its entry writer and spool replayer).
+
+Run next to the Flask app and route /api/ai/chat to it at the proxy:
+    python backend/chat_server.py            # CHAT_SERVER_PORT, default 5001
+"""
+
+import asyncio
+import logging
+import os
+import time
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from aiohttp import web
+
+from ai_providers import DEADLINE_HEADER, Deadline, ProviderChain, ProviderError, completion_to_sse, configured
+import chat_setup
+from chat_service import StreamedReply, finish_chat, flight_key, plan_chat, remember_chat, validate_chat
+from rate_limiter import response_tokens, usage_cost
+
+try:
+    from analysis_engine import PCOSAnalyzer
+except Exception:
+    PCOSAnalyzer = None
+
+
+logger = logging.getLogger("pcos-chat-server")
+
+SSE_HEADERS = {"Content-Type": "text/event-stream", "Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def create_app(
+    chain: Optional[ProviderChain],
+    fallback: Callable[[Dict[str, Any]], Dict[str, Any]],
+    intents=None,
+    cache=None,
+    trimmer=None,
+    flights=None,
+    limiter=None,
+    memory=None,
+    usage=None,
+    budget: str = "ai",
+    seconds_per_unit: float = 5.0,
+    tokens_per_unit: float = 1000.0,
+    request_timeout: float = 25.0,
+) -> web.Application:
+    """aiohttp application answering /api/ai/chat like the Flask view.
+
+    ``fallback`` builds the local answer when no provider succeeds. With
+    ``flights`` (SingleFlight) identical concurrent requests share one
+    upstream call or stream. ``memory`` (ConversationStore) serves requests
+    that carry a ``conversation_id``. ``usage`` (UsageRecorder) accounts
+    local fallback answers; pass the same recorder as the chain's
+    ``on_attempt`` to account provider attempts. With a
+    ``limiter`` (BudgetedRateLimiter) each request is charged one unit of
+    ``budget`` upfront and buffered answers are post-charged for their
+    measured usage, as the Flask ``rate_limit(metered=True)`` decorator does.
+    Provider attempts share a deadline of ``request_timeout`` seconds (or
+    the client's shorter X-Request-Timeout) before the fallback answers.
+
+    The limiter, cache and memory may be SQLite-backed (RATE_LIMIT_BACKEND,
+    CHAT_CACHE_DB, CHAT_MEMORY_DB), so calls into them and ``fallback`` run on
+    the loop's default executor rather than on the event loop.
+    """
+
+    async def chat(request: web.Request) -> web.StreamResponse:
+        deadline = Deadline.from_header(request.headers.get(DEADLINE_HEADER), request_timeout)
+        if request.content_type != "application/json":
+            return web.json_response({"error": "Content-Type must be application/json"}, status=400)
+        try:
+            payload = await request.json()
+        except ValueError:
+            payload = None
+        error = validate_chat(payload)
+        if error:
+            return web.json_response({"error": error}, status=400)
+
+        client = None
+        if limiter is not None and os.getenv("SKIP_RATE_LIMIT") != "1":
+            client = client_ip(request)
+            result = await blocking(limiter.hit, budget, client, 1.0)
+            if not result.allowed:
+                return web.json_response(
+                    {"error": "Rate limit exceeded. Please try again later.", "retry_after": result.retry_after},
+                    status=429,
+                )
+
+        plan = await blocking(plan_chat, payload, intents, cache, trimmer, memory)
+        if plan.reply is not None:
+            if payload.get("stream"):
+                return await replay(request, plan.reply, plan.headers)
+            return web.json_response(plan.reply, headers=plan.headers)
+
+        started = time.monotonic()
+        key = flight_key(plan.payload) if flights is not None else None
+        if payload.get("stream") and chain is not None:
+            try:
+                chunks, shared = await coalesced_stream(key, plan.payload, deadline)
+            except ProviderError as e:
+                logger.warning(f"AI stream error: {e}")
+                record_fallback(started)
+                local = await blocking(answer_locally, plan)
+                return await replay(request, local, {**plan.headers, **expired(deadline)})
+            headers = {**SSE_HEADERS, **plan.headers}
+            if shared:
+                headers["X-Coalesced"] = "true"
+            response = web.StreamResponse(headers=headers)
+            reply = StreamedReply()
+            try:
+                await response.prepare(request)
+                async for chunk in chunks:
+                    reply.feed(chunk)
+                    await response.write(chunk)
+                await response.write_eof()
+                if reply.done:
+                    await blocking(remember_chat, plan, reply.body(), memory)
+            finally:
+                # Also runs when the client disconnects: closes the upstream connection
+                await chunks.aclose()
+                if not shared:
+                    await charge(client, time.monotonic() - started, 0)
+            return response
+
+        if chain is not None:
+            try:
+                (provider, body), shared = await coalesced_call(key, plan.payload, deadline)
+                if shared:
+                    # Followers share the leader's upstream call and its cost
+                    answer = await blocking(finish_chat, plan, body, memory=memory)
+                    return web.json_response(answer, headers={**plan.headers, "X-Coalesced": "true"})
+                await charge(client, time.monotonic() - started, response_tokens(body))
+                answer = await blocking(finish_chat, plan, body, cache, memory)
+                return web.json_response(answer, headers=plan.headers)
+            except ProviderError as e:
+                logger.warning(f"AI proxy error: {e}")
+
+        logger.info("Using local AI fallback (all external APIs unavailable)")
+        record_fallback(started)
+        headers = expired(deadline)
+        if plan.conversation is not None:
+            headers["X-Conversation-Id"] = plan.conversation.id
+        return web.json_response(await blocking(answer_locally, plan), headers=headers)
+
+    async def blocking(call: Callable, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(None, partial(call, *args, **kwargs))
+
+    def answer_locally(plan) -> Dict[str, Any]:
+        return remember_chat(plan, fallback(plan.payload), memory)
+
+    def record_fallback(started: float) -> None:
+        if usage is not None:
+            depth = len(configured(chain.clients)) if chain is not None else 0
+            usage.record("local", None, "fallback", time.monotonic() - started, depth=depth)
+
+    async def charge(client: Optional[str], seconds: float, tokens: int) -> None:
+        if client is not None:
+            cost = usage_cost(seconds, tokens, seconds_per_unit, tokens_per_unit) - 1.0
+            await blocking(limiter.charge, budget, client, cost)
+
+    async def coalesced_call(key: Optional[str], payload: Dict[str, Any], deadline: Deadline):
+        if flights is None:
+            return await chain.acomplete(payload, deadline), False
+        return await flights.ado(key, partial(chain.acomplete, payload, deadline), deadline.remaining())
+
+    async def coalesced_stream(key: Optional[str], payload: Dict[str, Any], deadline: Deadline):
+        async def open_stream():
+            return (await chain.astream(payload, deadline))[1]
+
+        if flights is None:
+            return await open_stream(), False
+        return await flights.astream(key, open_stream, deadline.remaining())
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({"status": "healthy", "service": "PCOS chat server"})
+
+    async def close_chain(app: web.Application) -> None:
+        if chain is not None:
+            await chain.aclose()
+
+    app = web.Application()
+    app.router.add_post("/api/ai/chat", chat)
+    app.router.add_get("/health", health)
+    app.on_cleanup.append(close_chain)
+    return app
+
+
+async def replay(request: web.Request, body: Dict[str, Any], headers: Dict[str, str]) -> web.StreamResponse:
+    """Stream a finished completion as SSE events."""
+    response = web.StreamResponse(headers={**SSE_HEADERS, **headers})
+    await response.prepare(request)
+    for event in completion_to_sse(body):
+        await response.write(event)
+    await response.write_eof()
+    return response
+
+
+def expired(deadline: Deadline) -> Dict[str, str]:
+    """Headers marking a local answer given because the request ran out of time."""
+    return {"X-Deadline-Exceeded": "true"} if deadline.expired else {}
+
+
+def client_ip(request: web.Request) -> Optional[str]:
+    ip = request.headers.get("X-Forwarded-For", request.remote)
+    if ip:
+        ip = ip.split(",")[0].strip()
+    return ip
+
+
+def supabase_from_env():
+    """Supabase client for AI_USAGE_SINK=supabase, or None"""
+    if os.getenv("SKIP_SUPABASE") == "1" or os.getenv("AI_USAGE_SINK") != "supabase":
+        return None
+    try:
+        from supabase._sync.client import create_client
+
+        return create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"))
+    except Exception as e:
+        logger.warning(f"Could not initialize Supabase client: {e}")
+        return None
+
+
+def from_env() -> web.Application:
+    """Chat server with the chain, caches and limiter configured as the Flask app's (chat_setup.py)."""
+    usage = chat_setup.usage_recorder_from_env(supabase_from_env())
+    knowledge_base = chat_setup.knowledge_base_from_env()
+    return create_app(
+        chat_setup.provider_chain_from_env(usage),
+        partial(chat_setup.local_response, knowledge_base=knowledge_base),
+        intents=chat_setup.chat_intents_from_env(PCOSAnalyzer(None) if PCOSAnalyzer is not None else None),
+        cache=chat_setup.chat_cache_from_env(),
+        trimmer=chat_setup.context_trimmer_from_env(),
+        flights=chat_setup.chat_flights_from_env(),
+        limiter=chat_setup.rate_limiter_from_env(),
+        memory=chat_setup.chat_memory_from_env(),
+        usage=usage,
+        seconds_per_unit=chat_setup.AI_SECONDS_PER_UNIT,
+        tokens_per_unit=chat_setup.AI_TOKENS_PER_UNIT,
+        request_timeout=chat_setup.AI_REQUEST_TIMEOUT,
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    port = int(os.getenv("CHAT_SERVER_PORT", 5001))
+    logger.info(f"Starting PCOS chat server on port {port}")
+    web.run_app(from_env(), host="0.0.0.0", port=port)
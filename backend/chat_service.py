@@ -0,0 +1,198 @@
+"""
+Chat Request Handling
+Validation and the local short-cuts of /api/ai/chat (conversation memory,
+intent answers, cached answers, history trimming), shared by the Flask view
+and the asyncio chat server so both behave the same
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from chat_cache import normalize_text
+
+
+class ConversationTurn(NamedTuple):
+    """The messages a request adds to a stored conversation."""
+
+    id: str
+    messages: List[Any]
+    resumed: bool
+
+
+class ChatPlan(NamedTuple):
+    """What to do with one chat request.
+
+    ``reply`` is set when the request was answered locally (intent or cache
+    hit) and no provider should be called; otherwise ``payload`` is the body
+    to forward. ``headers`` go on the response either way.
+    """
+
+    payload: Dict[str, Any]
+    reply: Optional[Dict[str, Any]]
+    headers: Dict[str, str]
+    cache_key: Optional[str] = None
+    trim: Any = None
+    conversation: Optional[ConversationTurn] = None
+
+
+def validate_chat(payload: Any) -> Optional[str]:
+    """Error message for a malformed chat body, or None."""
+    if not isinstance(payload, dict):
+        return "Invalid request body"
+    # Basic validation to avoid misuse
+    if "model" not in payload or "messages" not in payload:
+        return "Missing required fields: model, messages"
+    return None
+
+
+def flight_key(payload: Dict[str, Any]) -> Optional[str]:
+    """Single-flight key: requests with equal keys would get the same upstream answer.
+
+    Every field counts except ``stream`` (streamed and buffered requests fly
+    separately anyway); message text is compared case-, width- and
+    whitespace-insensitively, as for the answer cache.
+    """
+    messages = payload.get("messages")
+    if not isinstance(messages, list) or not messages:
+        return None
+    turns = []
+    for message in messages:
+        if not isinstance(message, dict):
+            return None
+        content = message.get("content")
+        turns.append([message.get("role", "user"), normalize_text(content) if isinstance(content, str) else content])
+    options = {k: v for k, v in payload.items() if k not in ("messages", "stream")}
+    try:
+        material = json.dumps([options, turns], sort_keys=True, separators=(",", ":"))
+    except (TypeError, ValueError):
+        return None
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def recall_chat(payload: Dict[str, Any], memory) -> Tuple[Dict[str, Any], ConversationTurn]:
+    """Put the stored history of the payload's ``conversation_id`` before its new messages.
+
+    System messages sent with the request stay first; only the other new
+    messages are stored. ``conversation_id`` is not forwarded.
+    """
+    conversation = memory.resume(payload.get("conversation_id"))
+    messages = payload["messages"] if isinstance(payload["messages"], list) else []
+    system = [m for m in messages if isinstance(m, dict) and m.get("role") == "system"]
+    new = [m for m in messages if not (isinstance(m, dict) and m.get("role") == "system")]
+    forwarded = {k: v for k, v in payload.items() if k != "conversation_id"}
+    forwarded["messages"] = system + conversation.history + new
+    return forwarded, ConversationTurn(conversation.id, new, conversation.resumed)
+
+
+def plan_chat(payload: Dict[str, Any], intents=None, cache=None, trimmer=None, memory=None) -> ChatPlan:
+    """Answer from ``intents`` or ``cache`` if possible, else trim the history to forward.
+
+    A payload with a ``conversation_id`` key (null to start one) is expanded
+    from ``memory`` first. Intents see the conversation as sent; the cache
+    key covers the trimmed history, since that is what a provider would
+    answer.
+    """
+    conversation = None
+    if memory is not None and "conversation_id" in payload:
+        payload, conversation = recall_chat(payload, memory)
+    base = {"X-Conversation-Id": conversation.id} if conversation is not None else {}
+
+    local = intents.answer(payload) if intents is not None else None
+    if local is not None:
+        plan = ChatPlan(payload, local, {**base, "X-Local-Intent": local["intent"]["name"]}, conversation=conversation)
+        return plan._replace(reply=remember_chat(plan, local, memory))
+
+    trim = None
+    if trimmer is not None and isinstance(payload["messages"], list):
+        trim = trimmer.trim(payload["messages"], trimmer.budget_for(payload.get("model")))
+        payload = {**payload, "messages": trim.messages}
+
+    cache_key = cache.key(payload) if cache is not None else None
+    if cache_key:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            plan = ChatPlan(payload, cached, {**base, "X-Cache": "HIT"}, cache_key, conversation=conversation)
+            return plan._replace(reply=remember_chat(plan, cached, memory))
+
+    headers = dict(base)
+    if trim is not None and trim.trimmed:
+        headers["X-Context-Tokens-Saved"] = str(trim.original_tokens - trim.sent_tokens)
+    return ChatPlan(payload, None, headers, cache_key, trim, conversation)
+
+
+def finish_chat(plan: ChatPlan, body: Dict[str, Any], cache=None, memory=None) -> Dict[str, Any]:
+    """Cache a provider answer, attach what trimming saved and store the conversation turn."""
+    if plan.cache_key and cache is not None:
+        cache.set(plan.cache_key, body)
+    if plan.trim is not None and plan.trim.trimmed:
+        body = {**body, "context": plan.trim.metadata()}
+    return remember_chat(plan, body, memory)
+
+
+def remember_chat(plan: ChatPlan, body: Dict[str, Any], memory) -> Dict[str, Any]:
+    """Store the request's new messages and the answer in its conversation.
+
+    Returns ``body`` with a ``conversation`` field (id, turns kept, whether
+    earlier history was found) for requests that use conversation memory.
+    """
+    if plan.conversation is None or memory is None:
+        return body
+    turns = list(plan.conversation.messages)
+    choices = body.get("choices") if isinstance(body, dict) else None
+    message = choices[0].get("message") if choices and isinstance(choices[0], dict) else None
+    if isinstance(message, dict) and isinstance(message.get("content"), str):
+        turns.append({"role": "assistant", "content": message["content"]})
+    kept = memory.append(plan.conversation.id, turns)
+    return {**body, "conversation": {"id": plan.conversation.id, "turns": kept, "resumed": plan.conversation.resumed}}
+
+
+class StreamedReply:
+    """Assistant text of a ``chat.completion.chunk`` stream, collected as chunks are relayed."""
+
+    def __init__(self):
+        self.done = False
+        self._pending = b""
+        self._parts: List[str] = []
+
+    def feed(self, chunk: bytes) -> None:
+        lines = (self._pending + chunk).split(b"\n")
+        self._pending = lines.pop()
+        for line in lines:
+            if not line.startswith(b"data:"):
+                continue
+            data = line[5:].strip()
+            if data == b"[DONE]":
+                self.done = True
+                continue
+            try:
+                event = json.loads(data)
+            except ValueError:
+                continue
+            choices = event.get("choices") if isinstance(event, dict) else None
+            delta = choices[0].get("delta") if choices and isinstance(choices[0], dict) else None
+            content = delta.get("content") if isinstance(delta, dict) else None
+            if isinstance(content, str):
+                self._parts.append(content)
+
+    def body(self) -> Dict[str, Any]:
+        return {"choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(self._parts)}}]}
+
+
+def remember_stream(chunks: Iterable[bytes], plan: ChatPlan, memory) -> Iterator[bytes]:
+    """Relay ``chunks``; store the conversation turn once the stream completes.
+
+    A stream cut short (client gone, upstream error) is not stored. Closing
+    this iterator closes ``chunks``.
+    """
+    reply = StreamedReply()
+    try:
+        for chunk in chunks:
+            reply.feed(chunk)
+            yield chunk
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+    if reply.done:
+        remember_chat(plan, reply.body(), memory)
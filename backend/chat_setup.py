@@ -0,0 +1,280 @@
+"""
+Chat Setup
+Builds the chat components (provider chain, rate limiter, usage recorder,
+answer cache, conversation memory, history trimming, intents and the local
+knowledge-base fallback) from environment variables. The Flask app and the
+async chat server (chat_server.py) both build theirs here, so the chat
+server does not have to import the Flask app and start its background
+writers.
+"""
+
+import logging
+import os
+import time
+from typing import Any, Dict
+
+from dotenv import load_dotenv
+
+from chat_cache import ChatCache
+from rate_limiter import BudgetedRateLimiter
+
+# Optional components: a feature whose module cannot be imported is switched off
+try:
+    from ai_providers import ProviderChain, ProviderClient, parse_hedge_delays
+except Exception:
+    ProviderClient = None
+
+try:
+    from ai_usage import FileSink, SupabaseSink, UsageRecorder, parse_prices
+except Exception:
+    UsageRecorder = None
+
+try:
+    from chat_context import ContextTrimmer, parse_budgets
+except Exception:
+    ContextTrimmer = None
+
+try:
+    from chat_intents import ChatIntents
+except Exception:
+    ChatIntents = None
+
+try:
+    from chat_memory import ConversationStore
+except Exception:
+    ConversationStore = None
+
+try:
+    from knowledge_base import DEFAULT_PATH as DEFAULT_KNOWLEDGE_BASE, KnowledgeBase, format_answer
+except Exception:
+    KnowledgeBase = None
+
+try:
+    from single_flight import SingleFlight
+except Exception:
+    SingleFlight = None
+
+
+logger = logging.getLogger("pcos-backend")
+
+load_dotenv()
+
+
+# Rate limiting: O(1) sliding-window counters with a hard cap on tracked IPs.
+# Cheap routes share the "default" budget; AI routes draw from a separate "ai"
+# budget and are post-charged for upstream time and tokens.
+RATE_LIMIT = int(os.getenv("RATE_LIMIT", "60"))
+AI_RATE_LIMIT = float(os.getenv("AI_RATE_LIMIT", "20"))
+AI_SECONDS_PER_UNIT = float(os.getenv("AI_SECONDS_PER_UNIT", "5"))
+AI_TOKENS_PER_UNIT = float(os.getenv("AI_TOKENS_PER_UNIT", "1000"))
+RATE_LIMIT_WINDOW = 60
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# AI providers: one keep-alive connection pool per provider, shared by all requests
+AI_POOL_SIZE = int(os.getenv("AI_POOL_SIZE", "10"))
+AI_CONNECT_TIMEOUT = float(os.getenv("AI_CONNECT_TIMEOUT", "3.05"))
+AI_READ_TIMEOUT = float(os.getenv("AI_READ_TIMEOUT", "30"))
+AI_PROVIDER_SPECS = [
+    {
+        "name": "openrouter",
+        "url": "https://openrouter.ai/api/v1/chat/completions",
+        "api_key_env": "OPENROUTER_API_KEY",
+        "placeholder": "sk-or-v1-...",
+        "headers": {"HTTP-Referer": "https://pcos-zeta.vercel.app", "X-Title": "PCOS AI Assistant"},
+    },
+    {
+        "name": "openai",
+        "url": "https://api.openai.com/v1/chat/completions",
+        "api_key_env": "OPENAI_API_KEY",
+        "placeholder": "sk-proj-...",
+    },
+    {
+        "name": "perplexity",
+        "url": "https://api.perplexity.ai/chat/completions",
+        "api_key_env": "PERPLEXITY_API_KEY",
+        "placeholder": "pplx-...",
+    },
+]
+# AI_HEDGE=1 starts the next provider when one is slower than its hedge delay
+# (AI_HEDGE_DELAY_MS, per provider via AI_HEDGE_DELAYS, or AI_HEDGE_PERCENTILE
+# of its recent latencies) instead of waiting out the read timeout
+AI_HEDGE = os.getenv("AI_HEDGE", "0") == "1"
+AI_HEDGE_DELAY_MS = float(os.getenv("AI_HEDGE_DELAY_MS", "2000"))
+AI_HEDGE_PERCENTILE = float(os.getenv("AI_HEDGE_PERCENTILE")) if os.getenv("AI_HEDGE_PERCENTILE") else None
+# Providers are tried fastest first (EWMA latency) unless AI_ROUTING=ordered, and
+# skipped while their circuit breaker is open
+AI_ROUTING = os.getenv("AI_ROUTING", "latency")
+AI_BREAKER = {
+    "failure_rate": float(os.getenv("AI_BREAKER_FAILURE_RATE", "0.5")),
+    "min_calls": int(os.getenv("AI_BREAKER_MIN_CALLS", "5")),
+    "open_seconds": float(os.getenv("AI_BREAKER_OPEN_SECONDS", "30")),
+    "slow_call": float(os.getenv("AI_BREAKER_SLOW_MS", "8000")) / 1000,
+}
+# Each chat request gets AI_REQUEST_TIMEOUT seconds (less if the client's X-Request-Timeout
+# says so) across all provider attempts, then the local fallback answers
+AI_REQUEST_TIMEOUT = float(os.getenv("AI_REQUEST_TIMEOUT", "25"))
+
+# Local fallback answers: BM25 search over the bundled PCOS FAQ (KNOWLEDGE_BASE_PATH may
+# point to a file written by KnowledgeBase.save, which loads without re-indexing)
+KNOWLEDGE_BASE_RESULTS = int(os.getenv("KNOWLEDGE_BASE_RESULTS", "3"))
+KNOWLEDGE_BASE_MIN_SCORE = float(os.getenv("KNOWLEDGE_BASE_MIN_SCORE", "1.0"))
+LOCAL_GREETING = (
+    "I'm a local AI assistant. I can help with general questions about PCOS and women's health. "
+    "For specific medical advice, please consult a healthcare provider. What would you like to know?"
+)
+
+
+def rate_limiter_from_env():
+    """RATE_LIMIT_BACKEND=sqlite shares counters between workers (RATE_LIMIT_DB file)"""
+    return BudgetedRateLimiter(
+        {"default": RATE_LIMIT, "ai": AI_RATE_LIMIT}, RATE_LIMIT_WINDOW, max_keys=RATE_LIMIT_MAX_KEYS
+    )
+
+
+def usage_recorder_from_env(supabase=None):
+    """Every provider attempt and local fallback is accounted (model, latency, tokens, cost,
+    fallback depth) in memory and, with AI_USAGE_SINK=file|supabase, written in batches
+    by a background thread; ``supabase`` is the client for the supabase sink
+    """
+    if UsageRecorder is None or os.getenv("AI_USAGE", "1") != "1":
+        return None
+    sink_name = os.getenv("AI_USAGE_SINK", "none")
+    sink = None
+    if sink_name == "file":
+        sink = FileSink(os.getenv("AI_USAGE_FILE", "ai_usage.jsonl"))
+    elif sink_name == "supabase" and supabase is not None:
+        sink = SupabaseSink(supabase, os.getenv("AI_USAGE_TABLE", "ai_usage"))
+    return UsageRecorder(
+        prices=parse_prices(os.getenv("AI_USAGE_PRICES", "")),
+        default_price=float(os.getenv("CHAT_CACHE_PRICE_PER_1K_TOKENS", "0.002")),
+        sink=sink,
+        batch_size=int(os.getenv("AI_USAGE_BATCH_SIZE", "100")),
+        flush_interval=float(os.getenv("AI_USAGE_FLUSH_SECONDS", "5")),
+    )
+
+
+def provider_chain_from_env(usage_recorder=None):
+    """Provider chain over AI_PROVIDER_SPECS; attempts are recorded by ``usage_recorder``"""
+    if ProviderClient is None:
+        return None
+    return ProviderChain(
+        [
+            ProviderClient(
+                **spec,
+                pool_size=AI_POOL_SIZE,
+                connect_timeout=AI_CONNECT_TIMEOUT,
+                read_timeout=AI_READ_TIMEOUT,
+            )
+            for spec in AI_PROVIDER_SPECS
+        ],
+        hedge=AI_HEDGE,
+        hedge_delay=AI_HEDGE_DELAY_MS / 1000,
+        hedge_delays=parse_hedge_delays(os.getenv("AI_HEDGE_DELAYS", "")),
+        hedge_percentile=AI_HEDGE_PERCENTILE,
+        routing=AI_ROUTING,
+        breaker=AI_BREAKER,
+        async_connections=int(os.getenv("AI_ASYNC_CONNECTIONS", "1000")),
+        on_attempt=usage_recorder.record if usage_recorder is not None else None,
+    )
+
+
+def chat_cache_from_env():
+    """Repeated questions are answered from a cache of provider responses"""
+    if os.getenv("CHAT_CACHE", "1") != "1":
+        return None
+    return ChatCache(
+        maxsize=int(os.getenv("CHAT_CACHE_SIZE", "1000")),
+        ttl=float(os.getenv("CHAT_CACHE_TTL", "86400")),
+        max_temperature=float(os.getenv("CHAT_CACHE_MAX_TEMPERATURE", "0.3")),
+        max_turns=int(os.getenv("CHAT_CACHE_TURNS", "1")),
+        price_per_1k_tokens=float(os.getenv("CHAT_CACHE_PRICE_PER_1K_TOKENS", "0.002")),
+        path=os.getenv("CHAT_CACHE_DB") or None,
+    )
+
+
+def chat_flights_from_env():
+    """Identical concurrent questions (e.g. from a shared link) wait on one upstream call"""
+    if SingleFlight is None or os.getenv("CHAT_SINGLE_FLIGHT", "1") != "1":
+        return None
+    return SingleFlight(timeout=float(os.getenv("CHAT_SINGLE_FLIGHT_TIMEOUT", "30")))
+
+
+def context_trimmer_from_env():
+    """Long conversations are cut to CHAT_CONTEXT_TOKENS (or the model's entry in
+    CHAT_CONTEXT_BUDGETS) before they are forwarded; older turns become a summary
+    """
+    if ContextTrimmer is None or os.getenv("CHAT_CONTEXT", "1") != "1":
+        return None
+    return ContextTrimmer(
+        default_budget=int(os.getenv("CHAT_CONTEXT_TOKENS", "3000")),
+        budgets=parse_budgets(os.getenv("CHAT_CONTEXT_BUDGETS", "")),
+        summarize=os.getenv("CHAT_CONTEXT_SUMMARY", "1") == "1",
+        summary_tokens=int(os.getenv("CHAT_CONTEXT_SUMMARY_TOKENS", "200")),
+    )
+
+
+def chat_memory_from_env():
+    """Requests with a conversation_id send only the new message; the last CHAT_MEMORY_TURNS
+    turns of each conversation are kept here (and in CHAT_MEMORY_DB if set)
+    """
+    if ConversationStore is None or os.getenv("CHAT_MEMORY", "1") != "1":
+        return None
+    return ConversationStore(
+        max_turns=int(os.getenv("CHAT_MEMORY_TURNS", "20")),
+        max_chars=int(os.getenv("CHAT_MEMORY_CHARS", "16000")),
+        max_conversations=int(os.getenv("CHAT_MEMORY_CONVERSATIONS", "10000")),
+        ttl=float(os.getenv("CHAT_MEMORY_TTL", "3600")),
+        path=os.getenv("CHAT_MEMORY_DB") or None,
+    )
+
+
+def chat_intents_from_env(analyzer):
+    """Computable questions (cycle length, BMI, symptom risk) are answered by the analyzer in process"""
+    if ChatIntents is None or analyzer is None or os.getenv("CHAT_INTENTS", "1") != "1":
+        return None
+    return ChatIntents(analyzer)
+
+
+def knowledge_base_from_env():
+    """The bundled PCOS FAQ index, or the one at KNOWLEDGE_BASE_PATH; None if it cannot be loaded"""
+    if KnowledgeBase is None:
+        return None
+    try:
+        return KnowledgeBase.from_file(os.getenv("KNOWLEDGE_BASE_PATH") or DEFAULT_KNOWLEDGE_BASE)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Knowledge base unavailable: {e}")
+        return None
+
+
+def local_response(payload: Dict[str, Any], knowledge_base=None) -> Dict[str, Any]:
+    """Answer from the bundled PCOS knowledge base (fallback when APIs unavailable)"""
+    messages = payload.get("messages", [])
+    if not messages:
+        return {"error": "No messages provided"}
+
+    last_message = messages[-1].get("content", "")
+    if not isinstance(last_message, str):
+        last_message = ""
+
+    hits = []
+    if knowledge_base is not None:
+        hits = knowledge_base.search(last_message, k=KNOWLEDGE_BASE_RESULTS, min_score=KNOWLEDGE_BASE_MIN_SCORE)
+    content = format_answer(hits) if hits else LOCAL_GREETING
+    prompt_tokens = len(last_message.split())
+    completion_tokens = len(content.split())
+    return {
+        "id": "local-ai-response",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": payload.get("model", "local-ai"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
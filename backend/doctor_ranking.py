@@ -0,0 +1,171 @@
+"""
+Doctor Ranking Engine
+Scores candidate doctors on rating, expertise match, specialty fit and distance
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from doctor_store import DoctorStore
+
+
+# Relative importance of each factor; normalized to sum to 1
+DEFAULT_WEIGHTS = {
+    "rating": 0.4,
+    "expertise": 0.25,
+    "specialty": 0.2,
+    "distance": 0.15,
+}
+
+# Expertise tags that are relevant to each form symptom
+SYMPTOM_EXPERTISE = {
+    "irregular_cycles": ["PCOS", "Menstrual Disorders", "Hormonal Disorders", "Hormonal Imbalance"],
+    "hirsutism": ["PCOS", "Hormonal Disorders", "Hormonal Imbalance", "Hormones", "Endocrine Disorders"],
+    "acne": ["Hormonal Disorders", "Hormonal Imbalance", "Hormones"],
+    "weight_gain": ["Insulin Resistance", "Metabolic Disorders", "Metabolism", "Diabetes"],
+    "hair_loss": ["Thyroid", "Thyroid Disorders", "Hormonal Health"],
+    "infertility": ["Infertility", "Fertility", "IVF", "Reproductive Health", "Reproductive Medicine"],
+    "mood_changes": ["Hormonal Health", "Women's Health"],
+}
+
+# How well each kind of specialist fits a risk level (0-1)
+SPECIALTY_FIT = {
+    "high": {"pcos_specialist": 1.0, "endocrinologist": 0.9, "fertility": 0.85, "gynecologist": 0.5},
+    "moderate": {"pcos_specialist": 1.0, "gynecologist": 0.9, "endocrinologist": 0.8, "fertility": 0.8},
+    "low": {"gynecologist": 1.0, "pcos_specialist": 0.9, "endocrinologist": 0.7, "fertility": 0.7},
+}
+
+SPECIALTY_CATEGORIES = ("pcos_specialist", "endocrinologist", "fertility", "gynecologist")
+
+# Distance score halves roughly every DISTANCE_SCALE_KM * ln(2) km
+DISTANCE_SCALE_KM = 100.0
+EARTH_RADIUS_KM = 6371.0
+
+# Matching more than this many relevant tags counts as a full expertise match
+EXPERTISE_SATURATION = 3
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """Parse ``"rating=0.5,distance=0.2"`` into a weights dict (unknown factors and bad values raise)."""
+    weights = dict(DEFAULT_WEIGHTS)
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, value = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_WEIGHTS:
+            raise ValueError(f"Unknown ranking factor: {name}")
+        weights[name] = float(value)
+        if weights[name] < 0:
+            raise ValueError(f"Ranking weight for {name} must not be negative")
+    if sum(weights.values()) <= 0:
+        raise ValueError("Ranking weights must sum to a positive value")
+    return weights
+
+
+def specialty_category(specialty: str) -> str:
+    """Bucket a free-text specialty into a SPECIALTY_FIT category."""
+    if "PCOS" in specialty:
+        return "pcos_specialist"
+    if "Fertility" in specialty:
+        return "fertility"
+    if "Endocrinologist" in specialty:
+        return "endocrinologist"
+    return "gynecologist"
+
+
+def haversine_km(lat: np.ndarray, lon: np.ndarray, origin: Tuple[float, float]) -> np.ndarray:
+    """Great-circle distance from ``origin`` to each point, in km."""
+    lat1, lon1 = np.radians(origin[0]), np.radians(origin[1])
+    lat2, lon2 = np.radians(lat), np.radians(lon)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class DoctorRanker:
+    """Vectorized weighted scoring over DoctorStore rows.
+
+    Per-row factors that do not depend on the request (normalized rating,
+    specialty fit per risk level) are precomputed once per store.
+    """
+
+    def __init__(
+        self,
+        store: DoctorStore,
+        weights: Optional[Dict[str, float]] = None,
+        distance_scale_km: float = DISTANCE_SCALE_KM,
+    ):
+        weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        unknown = set(weights) - set(DEFAULT_WEIGHTS)
+        if unknown:
+            raise ValueError(f"Unknown ranking factors: {sorted(unknown)}")
+        total = sum(weights.values())
+        if total <= 0:
+            raise ValueError("Ranking weights must sum to a positive value")
+
+        self.store = store
+        self.weights = {name: value / total for name, value in weights.items()}
+        self.distance_scale_km = distance_scale_km
+
+        self._rating_score = np.clip(store.rating / np.float32(5.0), 0, 1)
+        specialties = store.columns["specialty"]
+        categories = [specialty_category(specialties.value(c)) for c in range(specialties.cardinality)]
+        self._fit_by_code = {
+            risk: np.array([fit[category] for category in categories], dtype=np.float32)
+            for risk, fit in SPECIALTY_FIT.items()
+        }
+
+    def symptom_mask(self, symptoms: Iterable[str]) -> int:
+        """Expertise bitset relevant to a list of symptoms."""
+        tags = [tag for symptom in symptoms for tag in SYMPTOM_EXPERTISE.get(symptom, [])]
+        return self.store.expertise_mask(tags)
+
+    def score(
+        self,
+        rows: np.ndarray,
+        risk_level: str,
+        expertise_mask: int = 0,
+        origin: Optional[Tuple[float, float]] = None,
+    ) -> np.ndarray:
+        """Weighted score in [0, 1] for each candidate row."""
+        rows = np.asarray(rows, dtype=np.int64)
+        w = self.weights
+        scores = w["rating"] * self._rating_score[rows]
+
+        fit = self._fit_by_code.get(risk_level, self._fit_by_code["moderate"])
+        scores = scores + w["specialty"] * fit[self.store.columns["specialty"].codes[rows]]
+
+        if expertise_mask:
+            matched = np.bitwise_count(self.store.expertise_bits[rows] & np.uint64(expertise_mask))
+            wanted = min(bin(int(expertise_mask)).count("1"), EXPERTISE_SATURATION)
+            scores = scores + w["expertise"] * np.minimum(matched / np.float32(wanted), 1)
+
+        if origin is not None:
+            distance = haversine_km(self.store.lat[rows], self.store.lon[rows], origin)
+            closeness = np.nan_to_num(np.exp(-distance / self.distance_scale_km), nan=0.0)
+            scores = scores + w["distance"] * closeness
+        else:
+            # Unknown user location: distance is neutral
+            scores = scores + w["distance"]
+
+        return scores.astype(np.float32, copy=False)
+
+    def top_k(
+        self,
+        rows: np.ndarray,
+        k: int,
+        risk_level: str,
+        expertise_mask: int = 0,
+        origin: Optional[Tuple[float, float]] = None,
+    ) -> List[int]:
+        """Best ``k`` rows, highest score first; ties keep candidate order."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if k <= 0 or len(rows) == 0:
+            return []
+
+        scores = self.score(rows, risk_level, expertise_mask, origin)
+        if len(rows) > k:
+            picked = np.argpartition(-scores, k - 1)[:k]
+        else:
+            picked = np.arange(len(rows))
+        picked = picked[np.lexsort((picked, -scores[picked]))]
+        return [int(row) for row in rows[picked]]
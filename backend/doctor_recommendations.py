@@ -3,11 +3,69 @@ Doctor Recommendation System
 Recommends gynecologists, endocrinologists, and specialists based on location and condition
 """
 
-from typing import List, Dict, Any
+import hashlib
+import json
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from doctor_ranking import DoctorRanker
+from doctor_store import DoctorStore
+from lru_cache import LRUCache
+
+
+# City centres used for distance ranking when a doctor has no coordinates
+CITY_COORDINATES = {
+    "Hyderabad": (17.385, 78.4867),
+    "Vijayawada": (16.5062, 80.648),
+    "Bangalore": (12.9716, 77.5946),
+    "Chennai": (13.0827, 80.2707),
+    "Delhi": (28.6139, 77.209),
+    "Mumbai": (19.076, 72.8777),
+    "Pune": (18.5204, 73.8567),
+}
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError("cached recommendations are read-only; copy the part you change")
+
+
+class FrozenDict(dict):
+    """A dict that refuses changes. Still a dict, so it serializes and compares like one."""
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+
+class FrozenList(list):
+    """A list that refuses changes. Still a list, so it serializes and compares like one."""
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+
+    def __reduce__(self):
+        return FrozenList, (list(self),)
+
+
+def freeze(value: Any) -> Any:
+    """Read-only copy of a JSON-like payload (dicts, lists and tuples at any depth)."""
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return FrozenList(freeze(item) for item in value)
+    return value
 
 
 class DoctorRecommender:
-    def __init__(self):
+    def __init__(
+        self,
+        store: Optional[DoctorStore] = None,
+        cache_size: int = 256,
+        ranking_weights: Optional[Dict[str, float]] = None,
+    ):
         # Doctor database - In production, this would be in a proper database
         self.doctors_db = {
             "Hyderabad": [
@@ -183,38 +241,88 @@ class DoctorRecommender:
             "Apollo Hospitals Hotline": "1066",
         }
 
+        # Fully built payloads keyed by (resolved city, needs_specialist, urgency, expertise)
+        self.recommendation_cache = LRUCache(maxsize=cache_size)
+        self.ranking_weights = ranking_weights
+
+        # Serve lookups from the columnar store; dicts are only built for returned rows
+        if store is None:
+            store = DoctorStore.from_directory(self.doctors_db, city_coordinates=CITY_COORDINATES)
+        self.load_store(store)
+
+    def load_store(self, store: DoctorStore) -> None:
+        """Swap in a (new) directory and invalidate memoized recommendations"""
+        specialties = store.columns["specialty"]
+        specialist_by_code = np.array(
+            [
+                "Specialist" in specialties.value(code) or "Endocrinologist" in specialties.value(code)
+                for code in range(specialties.cardinality)
+            ],
+            dtype=bool,
+        )
+
+        # Version of the directory + static reference data, used for ETags and compact responses
+        reference_json = json.dumps(self.get_reference_data(), sort_keys=True)
+        reference_version = hashlib.sha256(
+            (store.fingerprint() + reference_json).encode("utf-8")
+        ).hexdigest()[:16]
+
+        self.store, self._specialist_by_code = store, specialist_by_code
+        self.ranker = DoctorRanker(store, weights=self.ranking_weights)
+        self.reference_version = reference_version
+        self.recommendation_cache.clear()
+
     def get_recommendations(
         self, city: str = "", severity: str = "moderate", symptoms: List[str] = None
     ) -> Dict[str, Any]:
         """
-        Get doctor recommendations based on location and condition severity
+        Get doctor recommendations based on location and condition severity.
+        Payloads are memoized and shared between callers, so they are read-only
+        (see freeze); build a shallow copy of the part you want to change.
         """
-        if symptoms is None:
-            symptoms = []
-
-        # Normalize city name
-        city = city.strip().title()
+        return self._cached("full", city, severity, symptoms, self._build_recommendations)
 
-        # Get doctors for the city
-        doctors = self.doctors_db.get(city, [])
+    def get_compact_recommendations(
+        self, city: str = "", severity: str = "moderate", symptoms: List[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Same selection as get_recommendations, but only per-user data is returned.
+        Doctors are referenced by id; lists are served by get_city_doctors and the
+        static parts by get_reference_data, both versioned by reference_version.
+        """
+        return self._cached("compact", city, severity, symptoms, self._build_compact)
 
-        # If no doctors in city, provide nearby alternatives
-        nearby_cities = self._get_nearby_cities(city)
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of the recommendation cache"""
+        return {**self.recommendation_cache.stats(), "version": self.reference_version}
 
-        # Filter by severity
-        recommended_doctors = self._filter_by_severity(doctors, severity, symptoms)
+    def _cached(self, mode, city, severity, symptoms, build) -> Dict[str, Any]:
+        """Look up or build a payload; output depends only on the key below"""
+        symptoms = symptoms or []
+        city = city.strip().title()
+        needs_specialist = self._needs_specialist(severity, symptoms)
+        urgency = self._urgency(severity)
+        expertise_mask = self.ranker.symptom_mask(symptoms)
+        key = (mode, self.reference_version, city, needs_specialist, urgency, expertise_mask)
 
-        # Add nearby options if needed
-        if len(recommended_doctors) < 2 and nearby_cities:
-            for nearby_city in nearby_cities[:2]:
-                nearby_doctors = self.doctors_db.get(nearby_city, [])
-                recommended_doctors.extend(
-                    self._filter_by_severity(nearby_doctors[:1], severity, symptoms)
-                )
+        payload = self.recommendation_cache.get(key)
+        if payload is None:
+            rows, primary_rows, nearby_cities = self._select_rows(
+                city, needs_specialist, urgency, expertise_mask
+            )
+            # Frozen once per miss: hits return the cached object itself, with no copying
+            payload = freeze(build(city, severity, rows, primary_rows, nearby_cities))
+            self.recommendation_cache.set(key, payload)
+        return payload
 
+    def _build_recommendations(
+        self, city: str, severity: str, rows: np.ndarray, primary_rows: List[int], nearby_cities: List[str]
+    ) -> Dict[str, Any]:
         return {
-            "primary_doctors": recommended_doctors[:3],
-            "all_doctors_in_city": doctors,
+            "primary_doctors": self.store.materialize_many(primary_rows),
+            # Store rows of the primary doctors (names are not unique), as in the compact payload
+            "primary_doctor_ids": primary_rows,
+            "all_doctors_in_city": self.store.materialize_many(rows),
             "nearby_cities": nearby_cities,
             "helplines": self.helplines,
             "urgent_care_message": self._get_urgent_message(severity),
@@ -222,29 +330,79 @@ class DoctorRecommender:
             "questions_to_ask": self._get_questions_to_ask(),
         }
 
-    def _filter_by_severity(
-        self, doctors: List[Dict], severity: str, symptoms: List[str]
-    ) -> List[Dict]:
-        """Filter doctors based on severity and symptoms"""
-        result = []
+    def _build_compact(
+        self, city: str, severity: str, rows: np.ndarray, primary_rows: List[int], nearby_cities: List[str]
+    ) -> Dict[str, Any]:
+        doctor_cities = []
+        for row in primary_rows:
+            row_city = self.store.city_of(row)
+            if row_city not in doctor_cities:
+                doctor_cities.append(row_city)
+
+        return {
+            "city": city,
+            "primary_doctor_ids": primary_rows,
+            "doctor_cities": doctor_cities,
+            "nearby_cities": nearby_cities,
+            "urgent_care_message": self._get_urgent_message(severity),
+            "reference_version": self.reference_version,
+        }
+
+    def get_city_doctors(self, city: str) -> List[Dict]:
+        """All doctors in a city, including their ids"""
+        rows = self.store.rows_for_city(city.strip().title())
+        return self.store.materialize_many(rows, doctor_id=True)
+
+    def get_reference_data(self) -> Dict[str, Any]:
+        """Static data that is identical for every user"""
+        return {
+            "helplines": self.helplines,
+            "booking_tips": self._get_booking_tips(),
+            "questions_to_ask": self._get_questions_to_ask(),
+        }
+
+    def _select_rows(
+        self, city: str, needs_specialist: bool, urgency: str, expertise_mask: int
+    ) -> Tuple[np.ndarray, List[int], List[str]]:
+        """Pick the top ranked store rows for an already normalized city"""
+        # Get doctors for the city
+        rows = self.store.rows_for_city(city)
+
+        # If no doctors in city, provide nearby alternatives
+        nearby_cities = self._get_nearby_cities(city)
+
+        # Filter by severity
+        candidates = self._filter_by_need(rows, needs_specialist)
+
+        # Add nearby options if needed; the distance factor favours local doctors
+        if len(candidates) < 2 and nearby_cities:
+            nearby = [
+                self._filter_by_need(self.store.rows_for_city(nearby_city), needs_specialist)
+                for nearby_city in nearby_cities[:2]
+            ]
+            candidates = np.concatenate([candidates, *nearby])
 
-        # For high severity or fertility issues, prioritize specialists
-        needs_specialist = severity == "high" or "infertility" in symptoms
+        primary_rows = self.ranker.top_k(
+            candidates, 3, urgency, expertise_mask, origin=CITY_COORDINATES.get(city)
+        )
+        return rows, primary_rows, nearby_cities
 
-        for doctor in doctors:
-            if needs_specialist:
-                if (
-                    "Specialist" in doctor["specialty"]
-                    or "Endocrinologist" in doctor["specialty"]
-                ):
-                    result.append(doctor)
-            else:
-                result.append(doctor)
+    @staticmethod
+    def _needs_specialist(severity: str, symptoms: List[str]) -> bool:
+        """High severity or fertility issues prioritize specialists"""
+        return severity == "high" or "infertility" in symptoms
 
-        # Sort by rating
-        result.sort(key=lambda x: x.get("rating", 0), reverse=True)
+    @staticmethod
+    def _urgency(severity: str) -> str:
+        """Bucket matching the branches of _get_urgent_message"""
+        return severity if severity in ("high", "moderate") else "low"
 
-        return result
+    def _filter_by_need(self, rows: np.ndarray, needs_specialist: bool) -> np.ndarray:
+        """Filter store rows to specialists if needed"""
+        if needs_specialist:
+            codes = self.store.columns["specialty"].codes[rows]
+            rows = rows[self._specialist_by_code[codes]]
+        return rows
 
     def _get_nearby_cities(self, city: str) -> List[str]:
         """Get nearby cities with doctors"""
@@ -296,7 +454,7 @@ class DoctorRecommender:
 
     def get_all_cities(self) -> List[str]:
         """Get list of all cities with doctors"""
-        return list(self.doctors_db.keys())
+        return list(self.store.city_names)
 
     def get_helplines(self) -> Dict[str, str]:
         """Return standardized helpline keys for tests and UI usage"""
@@ -310,13 +468,9 @@ class DoctorRecommender:
     def search_doctor_by_name(self, name: str) -> List[Dict]:
         """Search for doctor by name"""
         results = []
-        name_lower = name.lower()
-
-        for city, doctors in self.doctors_db.items():
-            for doctor in doctors:
-                if name_lower in doctor["name"].lower():
-                    doctor_copy = doctor.copy()
-                    doctor_copy["city"] = city
-                    results.append(doctor_copy)
+        for row in self.store.find_by_name(name):
+            doctor = self.store.materialize(row)
+            doctor["city"] = self.store.city_of(row)
+            results.append(doctor)
 
         return results
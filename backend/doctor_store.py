@@ -0,0 +1,260 @@
+"""
+Compact Doctor Store
+Holds the doctor directory as columns (struct-of-arrays) instead of one dict per doctor
+"""
+
+import hashlib
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+# Columns that are stored as dictionary-encoded strings, in output order
+STRING_FIELDS = ("name", "specialty", "hospital", "phone", "address", "experience")
+
+# Expertise tags are packed into one uint64 bitset per doctor
+MAX_EXPERTISE_TAGS = 64
+
+
+class StringColumn:
+    """Dictionary-encoded string column.
+
+    Each distinct value is stored once as UTF-8 inside a single bytes blob;
+    rows only keep a uint32 code pointing into that dictionary.
+    """
+
+    def __init__(self, codes: np.ndarray, blob: bytes, offsets: np.ndarray):
+        self.codes = codes
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, values: Iterable[str]) -> "StringColumn":
+        """Encode an iterable of strings, interning repeated values."""
+        index: Dict[str, int] = {}
+        codes: List[int] = []
+        for value in values:
+            code = index.get(value)
+            if code is None:
+                code = len(index)
+                index[value] = code
+            codes.append(code)
+
+        encoded = [value.encode("utf-8") for value in index]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+        if encoded:
+            np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(np.asarray(codes, dtype=np.uint32), b"".join(encoded), offsets)
+
+    @property
+    def cardinality(self) -> int:
+        return len(self.offsets) - 1
+
+    def value(self, code: int) -> str:
+        """Decode a dictionary entry."""
+        start, end = int(self.offsets[code]), int(self.offsets[code + 1])
+        return self.blob[start:end].decode("utf-8")
+
+    def __getitem__(self, row: int) -> str:
+        return self.value(int(self.codes[row]))
+
+    def take(self, order: np.ndarray) -> "StringColumn":
+        """Return the column with rows reordered (dictionary is shared)."""
+        return StringColumn(self.codes[order], self.blob, self.offsets)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + len(self.blob) + self.offsets.nbytes
+
+
+class DoctorStore:
+    """Columnar, read-only doctor directory.
+
+    Rows are sorted by city so every city maps to a contiguous ``[start, stop)``
+    range. Doctor dicts are only materialized for the rows a response needs.
+    """
+
+    def __init__(
+        self,
+        columns: Dict[str, StringColumn],
+        rating: np.ndarray,
+        expertise_bits: np.ndarray,
+        expertise_vocab: List[str],
+        city_names: List[str],
+        city_offsets: np.ndarray,
+        lat: Optional[np.ndarray] = None,
+        lon: Optional[np.ndarray] = None,
+    ):
+        self.columns = columns
+        self.rating = rating
+        self.expertise_bits = expertise_bits
+        self.expertise_vocab = expertise_vocab
+        self.city_names = city_names
+        self.city_offsets = city_offsets
+        # Coordinates in degrees, NaN when unknown
+        self.lat = lat if lat is not None else np.full(len(rating), np.nan, dtype=np.float32)
+        self.lon = lon if lon is not None else np.full(len(rating), np.nan, dtype=np.float32)
+        self._expertise_index = {tag: i for i, tag in enumerate(expertise_vocab)}
+
+    @classmethod
+    def from_directory(
+        cls,
+        doctors_db: Dict[str, List[Dict[str, Any]]],
+        city_coordinates: Optional[Dict[str, Tuple[float, float]]] = None,
+    ) -> "DoctorStore":
+        """Build a store from the ``{city: [doctor, ...]}`` mapping used by DoctorRecommender."""
+        return cls.from_records(
+            ((city, doctor) for city, doctors in doctors_db.items() for doctor in doctors),
+            city_coordinates=city_coordinates,
+        )
+
+    @classmethod
+    def from_records(
+        cls,
+        records: Iterable[Tuple[str, Dict[str, Any]]],
+        city_coordinates: Optional[Dict[str, Tuple[float, float]]] = None,
+    ) -> "DoctorStore":
+        """Build a store from ``(city, doctor)`` pairs without keeping the dicts around.
+
+        Doctors without their own ``lat``/``lon`` fall back to ``city_coordinates``.
+        """
+        city_coordinates = city_coordinates or {}
+        raw: Dict[str, List[str]] = {field: [] for field in STRING_FIELDS}
+        cities: List[str] = []
+        ratings: List[float] = []
+        lats: List[float] = []
+        lons: List[float] = []
+        bits: List[int] = []
+        vocab: Dict[str, int] = {}
+
+        for city, doctor in records:
+            cities.append(city)
+            for field in STRING_FIELDS:
+                raw[field].append(str(doctor.get(field, "")))
+            ratings.append(float(doctor.get("rating", 0) or 0))
+            fallback = city_coordinates.get(city, (np.nan, np.nan))
+            lats.append(float(doctor.get("lat", fallback[0])))
+            lons.append(float(doctor.get("lon", fallback[1])))
+
+            mask = 0
+            for tag in doctor.get("expertise", []):
+                bit = vocab.get(tag)
+                if bit is None:
+                    bit = len(vocab)
+                    if bit >= MAX_EXPERTISE_TAGS:
+                        raise ValueError(
+                            f"DoctorStore supports at most {MAX_EXPERTISE_TAGS} expertise tags"
+                        )
+                    vocab[tag] = bit
+                mask |= 1 << bit
+            bits.append(mask)
+
+        city_names = sorted(set(cities))
+        city_codes = np.asarray(
+            [bisect_left(city_names, c) for c in cities], dtype=np.uint32
+        )
+        order = np.argsort(city_codes, kind="stable")
+        counts = np.bincount(city_codes, minlength=len(city_names))
+        city_offsets = np.zeros(len(city_names) + 1, dtype=np.int64)
+        np.cumsum(counts, out=city_offsets[1:])
+
+        columns = {field: StringColumn.build(raw[field]).take(order) for field in STRING_FIELDS}
+        return cls(
+            columns=columns,
+            rating=np.asarray(ratings, dtype=np.float32)[order],
+            expertise_bits=np.asarray(bits, dtype=np.uint64)[order],
+            expertise_vocab=list(vocab),
+            city_names=city_names,
+            city_offsets=city_offsets,
+            lat=np.asarray(lats, dtype=np.float32)[order],
+            lon=np.asarray(lons, dtype=np.float32)[order],
+        )
+
+    def __len__(self) -> int:
+        return len(self.rating)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the column buffers."""
+        total = self.rating.nbytes + self.expertise_bits.nbytes + self.city_offsets.nbytes
+        total += self.lat.nbytes + self.lon.nbytes
+        total += sum(column.nbytes for column in self.columns.values())
+        return total
+
+    def fingerprint(self) -> str:
+        """Content hash of every column, used as the directory version."""
+        digest = hashlib.sha256()
+        for field in STRING_FIELDS:
+            column = self.columns[field]
+            digest.update(column.codes.tobytes())
+            digest.update(column.offsets.tobytes())
+            digest.update(column.blob)
+        digest.update(self.rating.tobytes())
+        digest.update(self.expertise_bits.tobytes())
+        digest.update("\x00".join(self.expertise_vocab).encode("utf-8"))
+        digest.update("\x00".join(self.city_names).encode("utf-8"))
+        digest.update(self.city_offsets.tobytes())
+        digest.update(self.lat.tobytes())
+        digest.update(self.lon.tobytes())
+        return digest.hexdigest()
+
+    def city_range(self, city: str) -> Tuple[int, int]:
+        """Return the ``[start, stop)`` row range for a city (empty if unknown)."""
+        i = bisect_left(self.city_names, city)
+        if i < len(self.city_names) and self.city_names[i] == city:
+            return int(self.city_offsets[i]), int(self.city_offsets[i + 1])
+        return 0, 0
+
+    def rows_for_city(self, city: str) -> np.ndarray:
+        """Row ids for all doctors in a city, in directory order."""
+        start, stop = self.city_range(city)
+        return np.arange(start, stop)
+
+    def city_of(self, row: int) -> str:
+        """Return the city a row belongs to."""
+        i = int(np.searchsorted(self.city_offsets, row, side="right")) - 1
+        return self.city_names[i]
+
+    def expertise_mask(self, tags: Iterable[str]) -> int:
+        """Bitset for a set of expertise tags (unknown tags are ignored)."""
+        mask = 0
+        for tag in tags:
+            bit = self._expertise_index.get(tag)
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def expertise(self, row: int) -> List[str]:
+        bits = int(self.expertise_bits[row])
+        return [tag for i, tag in enumerate(self.expertise_vocab) if bits >> i & 1]
+
+    def specialty(self, row: int) -> str:
+        return self.columns["specialty"][row]
+
+    def materialize(self, row: int, doctor_id: bool = False) -> Dict[str, Any]:
+        """Build the public doctor dict for a single row."""
+        doctor: Dict[str, Any] = {}
+        if doctor_id:
+            doctor["id"] = int(row)
+        for field in STRING_FIELDS:
+            doctor[field] = self.columns[field][row]
+        doctor["rating"] = round(float(self.rating[row]), 2)
+        doctor["expertise"] = self.expertise(row)
+        return doctor
+
+    def materialize_many(self, rows: Iterable[int], doctor_id: bool = False) -> List[Dict[str, Any]]:
+        return [self.materialize(int(row), doctor_id=doctor_id) for row in rows]
+
+    def find_by_name(self, name: str) -> List[int]:
+        """Case-insensitive substring search over the name column."""
+        needle = name.lower()
+        column = self.columns["name"]
+        matches = {
+            code for code in range(column.cardinality) if needle in column.value(code).lower()
+        }
+        if not matches:
+            return []
+        hit = np.isin(column.codes, np.fromiter(matches, dtype=np.uint32))
+        return [int(row) for row in np.flatnonzero(hit)]
+
@@ -0,0 +1,208 @@
+"""
+Entry Spool
+Durable local store for submissions Supabase could not take (not configured,
+down, or failing past the write-behind retries), replayed to Supabase in bulk
+by a background thread once it is reachable
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+logger = logging.getLogger("pcos-entry-spool")
+
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+
+
+class EntrySpool:
+    """Append-only SQLite (WAL) spool of rows keyed by their ``id``.
+
+    ``append`` is a local insert, so submissions are accepted at disk speed
+    whatever the state of Supabase. The id doubles as the idempotency key:
+    a row spooled twice is kept once, and ``write(rows)`` must ignore rows
+    whose id the table already has (an upsert with ``ignore_duplicates``).
+    A replay that wrote rows but died before deleting them therefore sends
+    them again harmlessly, and each entry lands exactly once.
+
+    A daemon thread (``start``) replays ``batch_size`` rows at a time every
+    ``replay_interval`` seconds, backing off up to ``max_interval`` while
+    writes fail. Row data is capped at ``max_bytes``: past it ``append``
+    refuses rows, and from ``alert_ratio`` of it an error is logged and
+    ``stats()["alert"]`` is set.
+
+    With ``synchronous=NORMAL`` a commit is durable against a process crash
+    and WAL pages are fsynced in batches at checkpoints, not per row.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        write: Optional[Callable[[List[Dict[str, Any]]], Any]] = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        alert_ratio: float = 0.8,
+        batch_size: int = 200,
+        replay_interval: float = 30.0,
+        max_interval: float = 600.0,
+        name: str = "entry-spool",
+    ):
+        self.path = path
+        self.write = write
+        self.max_bytes = max_bytes
+        self.alert_ratio = alert_ratio
+        self.batch_size = batch_size
+        self.replay_interval = replay_interval
+        self.max_interval = max_interval
+        self.name = name
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+        self._failures = 0
+        self.appended = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.replayed = 0
+        self.replay_errors = 0
+        self.last_error: Optional[str] = None
+        self.alert = False
+        db = self._db()
+        # Rows are health data: only the server's own user may read the file (and its -wal/-shm,
+        # which SQLite creates with the same mode)
+        os.chmod(path, 0o600)
+        db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entry_spool (
+                id TEXT PRIMARY KEY,
+                row TEXT NOT NULL,
+                spooled_at REAL NOT NULL
+            )
+            """
+        )
+        self.rows, self.bytes = db.execute(
+            "SELECT count(*), COALESCE(sum(length(row)), 0) FROM entry_spool"
+        ).fetchone()
+        self._check_alert()
+
+    def append(self, rows: List[Dict[str, Any]]) -> int:
+        """Spool rows that carry an ``id``; returns how many are now held (duplicates included)."""
+        held = 0
+        db = self._db()
+        for row in rows:
+            data = json.dumps(row, default=str)
+            with self._lock:
+                if self.bytes + len(data) > self.max_bytes:
+                    self.rejected += 1
+                    logger.error(f"{self.name}: spool full ({self.bytes} bytes), entry {row.get('id')} not saved")
+                    continue
+                added = db.execute(
+                    "INSERT OR IGNORE INTO entry_spool (id, row, spooled_at) VALUES (?, ?, ?)",
+                    (str(row["id"]), data, time.time()),
+                ).rowcount
+                if added:
+                    self.rows += 1
+                    self.bytes += len(data)
+                    self.appended += 1
+                else:
+                    self.duplicates += 1
+                self._check_alert()
+            held += 1
+        return held
+
+    def replay(self) -> int:
+        """Write spooled rows to ``write`` in batches until none are left; returns rows replayed.
+
+        A failed write is counted and raised; the rows stay spooled.
+        """
+        if self.write is None:
+            return 0
+        replayed = 0
+        db = self._db()
+        with self._replay_lock:
+            while True:
+                batch = db.execute(
+                    "SELECT id, row FROM entry_spool ORDER BY spooled_at LIMIT ?", (self.batch_size,)
+                ).fetchall()
+                if not batch:
+                    break
+                try:
+                    self.write([json.loads(data) for _, data in batch])
+                except Exception as e:
+                    with self._lock:
+                        self.replay_errors += 1
+                        self.last_error = str(e)
+                    logger.warning(f"{self.name}: replay of {len(batch)} entries failed: {e}")
+                    raise
+                ids = [entry_id for entry_id, _ in batch]
+                with self._lock:
+                    db.execute(f"DELETE FROM entry_spool WHERE id IN ({','.join('?' * len(ids))})", ids)
+                    self.rows -= len(batch)
+                    self.bytes -= sum(len(data) for _, data in batch)
+                    self.replayed += len(batch)
+                    self.last_error = None
+                    self._check_alert()
+                replayed += len(batch)
+        if replayed:
+            logger.info(f"{self.name}: replayed {replayed} entries")
+            db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return replayed
+
+    def start(self) -> None:
+        """Start the replayer thread (again after a fork: threads do not survive one)."""
+        if self.write is None or (self._thread is not None and self._thread_pid == os.getpid()):
+            return
+        with self._lock:
+            if self._thread is not None and self._thread_pid == os.getpid():
+                return
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rows": self.rows,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "usage": round(self.bytes / self.max_bytes, 4) if self.max_bytes else 0.0,
+                "alert": self.alert,
+                "appended": self.appended,
+                "duplicates": self.duplicates,
+                "rejected": self.rejected,
+                "replayed": self.replayed,
+                "replay_errors": self.replay_errors,
+                "last_error": self.last_error,
+                "replaying": self.write is not None,
+            }
+
+    def _check_alert(self) -> None:
+        """Log once each time usage crosses ``alert_ratio`` of ``max_bytes`` (call with the lock held)."""
+        alert = self.bytes >= self.alert_ratio * self.max_bytes
+        if alert and not self.alert:
+            logger.error(f"{self.name}: spool at {self.bytes} of {self.max_bytes} bytes; is Supabase reachable?")
+        self.alert = alert
+
+    def _run(self) -> None:
+        while True:
+            interval = min(self.max_interval, self.replay_interval * 2 ** min(self._failures, 16))
+            time.sleep(interval)
+            try:
+                self.replay()
+                self._failures = 0
+            except Exception:
+                self._failures += 1
+
+    def _db(self) -> sqlite3.Connection:
+        """One connection per thread and process (connections must not cross a fork)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
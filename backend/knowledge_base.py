@@ -0,0 +1,215 @@
+"""
+Local Knowledge Base
+BM25 retrieval over the bundled PCOS FAQ, used when no AI provider answers
+"""
+
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "pcos_faq.json")
+
+# Okapi BM25 parameters
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+
+# A match in the question counts twice as much as one in the tags or answer
+FIELD_WEIGHTS = {"question": 2.0, "body": 1.0}
+# Bonus for the share of a question's terms the query covers. Terms that occur
+# in nearly every entry ("pcos") carry almost no BM25 weight, so without it
+# "what is pcos" would rank all short questions about PCOS alike.
+COVERAGE_WEIGHT = 2.0
+
+DISCLAIMER = (
+    "This is general information, not a diagnosis. Please consult a healthcare "
+    "provider for advice about your own situation."
+)
+
+STOPWORDS = frozenset(
+    """
+    a about above after again all am an and any are as at be because been before
+    being below between both but by can could did do does doing down during each
+    few for from further had has have having he her here hers herself him himself
+    his how i if in into is it its itself just me more most my myself no nor not
+    now of off on once only or other our ours ourselves out over own same she
+    should so some such than that the their theirs them themselves then there
+    these they this those through to too under until up very was we were what
+    when where which while who whom why will with would you your yours yourself
+    yourselves get got im ive dont tell know please explain anything something
+    really much many also lot lots thing things thank thanks hi hello hey
+    """.split()
+)
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def stem(word: str) -> str:
+    """Light suffix stripping so "periods"/"period" and "depressed"/"depression" match."""
+    if len(word) <= 3:
+        return word
+    if word.endswith("ies") and len(word) > 4:
+        word = word[:-3] + "y"
+    elif word.endswith("sses"):
+        word = word[:-2]
+    elif word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        word = word[:-1]
+    if word.endswith("ing") and len(word) > 5:
+        word = word[:-3]
+    elif word.endswith("ed") and not word.endswith("eed") and len(word) > 4:
+        word = word[:-2]
+    elif word.endswith("ion") and len(word) > 6:
+        word = word[:-3]
+    elif word.endswith("ment") and len(word) > 7:
+        word = word[:-4]
+    if word.endswith("e") and len(word) > 4:
+        word = word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word stems with stopwords and single letters removed."""
+    return [
+        stem(word)
+        for word in _TOKEN.findall(text.lower())
+        if len(word) > 1 and word not in STOPWORDS
+    ]
+
+
+class SearchHit(NamedTuple):
+    entry: Dict[str, Any]
+    score: float
+
+
+class _Field:
+    """Inverted index of one text field: term -> [(doc, term frequency), ...]."""
+
+    def __init__(self, postings: Dict[str, List[List[int]]], lengths: List[int], k1: float, b: float):
+        self.postings = postings
+        self.lengths = lengths
+        avgdl = sum(lengths) / len(lengths) if lengths else 0.0
+        # Per-document part of the BM25 denominator, computed once
+        self.norms = [k1 * (1 - b + b * length / avgdl) if avgdl else k1 for length in lengths]
+        count = len(lengths)
+        self.idf = {
+            term: math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in postings.items()
+        }
+
+    @classmethod
+    def build(cls, documents: Iterable[List[str]], k1: float, b: float) -> "_Field":
+        postings: Dict[str, List[List[int]]] = {}
+        lengths = []
+        for doc, tokens in enumerate(documents):
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append([doc, tf])
+        return cls(postings, lengths, k1, b)
+
+
+class KnowledgeBase:
+    """Okapi BM25 search over question/answer entries.
+
+    Each entry is a dict with at least ``question`` and ``answer`` (plus
+    optional ``id``, ``category`` and ``tags``). Two fields are indexed: the
+    question, and the tags plus answer; their scores are summed with
+    FIELD_WEIGHTS. Scoring only walks the postings of the query terms, so a
+    search over a few hundred entries takes well under a millisecond.
+
+    ``save`` writes the entries together with the built index, and
+    ``from_file`` loads such a file without re-tokenizing anything.
+    """
+
+    def __init__(
+        self,
+        entries: List[Dict[str, Any]],
+        k1: float = DEFAULT_K1,
+        b: float = DEFAULT_B,
+        fields: Optional[Dict[str, _Field]] = None,
+    ):
+        self.entries = entries
+        self.k1 = k1
+        self.b = b
+        if fields is None:
+            fields = {
+                "question": _Field.build((tokenize(e["question"]) for e in entries), k1, b),
+                "body": _Field.build(
+                    (tokenize(" ".join(e.get("tags", [])) + " " + e["answer"]) for e in entries), k1, b
+                ),
+            }
+        self._fields = fields
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_PATH) -> "KnowledgeBase":
+        """Load a FAQ file; use its pre-built index when it has one."""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        entries = data["entries"]
+        index = data.get("index")
+        if not index:
+            return cls(entries)
+        k1, b = index["k1"], index["b"]
+        fields = {
+            name: _Field(field["postings"], field["lengths"], k1, b)
+            for name, field in index["fields"].items()
+        }
+        return cls(entries, k1=k1, b=b, fields=fields)
+
+    def save(self, path: str) -> None:
+        """Write the entries and the built index, for loading with ``from_file``."""
+        index = {
+            "k1": self.k1,
+            "b": self.b,
+            "fields": {
+                name: {"postings": field.postings, "lengths": field.lengths}
+                for name, field in self._fields.items()
+            },
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "entries": self.entries, "index": index}, f, separators=(",", ":"))
+
+    def search(self, query: str, k: int = 3, min_score: float = 0.0) -> List[SearchHit]:
+        """Best ``k`` entries for ``query`` scoring above ``min_score``, best first."""
+        terms = set(tokenize(query))
+        scores: Dict[int, float] = {}
+        for name, weight in FIELD_WEIGHTS.items():
+            field = self._fields[name]
+            norms = field.norms
+            for term in terms:
+                postings = field.postings.get(term)
+                if not postings:
+                    continue
+                idf = weight * field.idf[term] * (self.k1 + 1)
+                for doc, tf in postings:
+                    scores[doc] = scores.get(doc, 0.0) + idf * tf / (tf + norms[doc])
+
+        question = self._fields["question"]
+        for term in terms:
+            for doc, tf in question.postings.get(term, ()):
+                scores[doc] += COVERAGE_WEIGHT * tf / question.lengths[doc]
+
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [SearchHit(self.entries[doc], round(score, 4)) for doc, score in best if score > min_score]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self.entries),
+            "terms": len(self._fields["body"].postings),
+        }
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def format_answer(hits: List[SearchHit]) -> str:
+    """Chat reply for search results: the best answer, related questions, then DISCLAIMER."""
+    parts = [hits[0].entry["answer"]]
+    related = [hit.entry["question"] for hit in hits[1:]]
+    if related:
+        parts.append("Related questions:\n" + "\n".join(f"- {question}" for question in related))
+    parts.append(DISCLAIMER)
+    return "\n\n".join(parts)
@@ -0,0 +1,359 @@
+"""
+Rate Limiter
+Constant-time sliding-window-counter rate limiting with a bounded key table.
+Counters live in process memory or, to share limits between workers on one
+host, in a local SQLite file.
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    remaining: float
+    retry_after: int
+
+
+class SlidingWindowLimiter:
+    """Sliding window counter (previous + current fixed window, weighted).
+
+    Each key keeps three numbers instead of a timestamp per request, so a
+    check is O(1) regardless of the limit. At most ``max_keys`` keys are
+    tracked: the least recently seen key is evicted first, and keys idle for
+    two full windows (whose counters are zero anyway) are dropped lazily.
+    """
+
+    def __init__(
+        self,
+        limit: float,
+        window: float = 60.0,
+        max_keys: int = 100_000,
+        clock: Callable[[], float] = time.time,
+    ):
+        if limit <= 0 or window <= 0 or max_keys < 1:
+            raise ValueError("limit, window and max_keys must be positive")
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._clock = clock
+        # key -> [window index, previous window count, current window count]
+        self._counters: "OrderedDict[Hashable, list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.denied = 0
+        self.evictions = 0
+
+    def hit(self, key: Hashable, cost: float = 1.0) -> RateLimitResult:
+        """Charge ``cost`` to ``key`` if it fits within the limit."""
+        now = self._clock()
+        current = int(now // self.window)
+        elapsed = (now % self.window) / self.window
+        counters = self._counters
+
+        with self._lock:
+            counter = counters.get(key)
+            if counter is None:
+                # Only new keys grow the table, so only they pay for eviction
+                self._drop_idle(current)
+                counter = counters[key] = [current, 0.0, 0.0]
+                if len(counters) > self.max_keys:
+                    counters.popitem(last=False)
+                    self.evictions += 1
+            else:
+                counters.move_to_end(key)
+                if counter[0] != current:
+                    self._roll(counter, current)
+
+            estimate = counter[1] * (1 - elapsed) + counter[2]
+            if estimate + cost > self.limit:
+                self.denied += 1
+                retry_after = max(1, math.ceil(self.window * (1 - elapsed)))
+                return RateLimitResult(False, max(0.0, self.limit - estimate), retry_after)
+
+            counter[2] += cost
+            self.allowed += 1
+            return RateLimitResult(True, self.limit - estimate - cost, 0)
+
+    def charge(self, key: Hashable, cost: float) -> None:
+        """Add ``cost`` to ``key`` without checking the limit (post-paid usage).
+
+        The overdraft is paid back before the key is allowed again.
+        """
+        current = int(self._clock() // self.window)
+        counters = self._counters
+        with self._lock:
+            counter = counters.get(key)
+            if counter is None:
+                self._drop_idle(current)
+                counter = counters[key] = [current, 0.0, 0.0]
+                if len(counters) > self.max_keys:
+                    counters.popitem(last=False)
+                    self.evictions += 1
+            else:
+                counters.move_to_end(key)
+                if counter[0] != current:
+                    self._roll(counter, current)
+            counter[2] += cost
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "tracked_keys": len(self._counters),
+            "max_keys": self.max_keys,
+            "allowed": self.allowed,
+            "denied": self.denied,
+            "evictions": self.evictions,
+        }
+
+    @staticmethod
+    def _roll(counter: list, current: int) -> None:
+        """Advance a counter to the current window."""
+        counter[1] = counter[2] if counter[0] == current - 1 else 0.0
+        counter[2] = 0.0
+        counter[0] = current
+
+    def _drop_idle(self, current: int, budget: int = 2) -> None:
+        """Pop up to ``budget`` least-recent keys that no longer count (amortized O(1))."""
+        counters = self._counters
+        for _ in range(budget):
+            if not counters:
+                return
+            key = next(iter(counters))
+            if counters[key][0] >= current - 1:
+                return
+            del counters[key]
+            self.evictions += 1
+
+
+class SQLiteRateLimiter:
+    """Sliding window counter shared by every process that opens the same file.
+
+    Each check is one ``BEGIN IMMEDIATE`` transaction (read, roll, update), so
+    concurrent workers never double-spend a budget. The database runs in WAL
+    mode with ``synchronous=OFF``: counters are disposable, only atomicity
+    matters. Idle and over-cap keys are pruned every ``prune_every`` checks.
+    """
+
+    def __init__(
+        self,
+        limit: float,
+        window: float = 60.0,
+        path: str = "rate_limits.sqlite3",
+        max_keys: int = 100_000,
+        clock: Callable[[], float] = time.time,
+        prune_every: int = 1000,
+        busy_timeout: float = 5.0,
+    ):
+        if limit <= 0 or window <= 0 or max_keys < 1:
+            raise ValueError("limit, window and max_keys must be positive")
+        self.limit = limit
+        self.window = window
+        self.path = path
+        self.max_keys = max_keys
+        self.prune_every = prune_every
+        self.busy_timeout = busy_timeout
+        self._clock = clock
+        self._local = threading.local()
+        self.allowed = 0
+        self.denied = 0
+        self._hits_since_prune = 0
+
+        with self._connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS rate_limits (
+                    key TEXT PRIMARY KEY,
+                    window INTEGER NOT NULL,
+                    prev REAL NOT NULL,
+                    curr REAL NOT NULL,
+                    seen REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS rate_limits_seen ON rate_limits (seen)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread and process (connections must not cross a fork)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def hit(self, key: Hashable, cost: float = 1.0) -> RateLimitResult:
+        """Charge ``cost`` to ``key`` if it fits within the limit."""
+        now = self._clock()
+        elapsed = (now % self.window) / self.window
+        estimate, allowed = self._update(str(key), cost, now, enforce=True)
+        if not allowed:
+            self.denied += 1
+            retry_after = max(1, math.ceil(self.window * (1 - elapsed)))
+            return RateLimitResult(False, max(0.0, self.limit - estimate), retry_after)
+        self.allowed += 1
+        return RateLimitResult(True, self.limit - estimate - cost, 0)
+
+    def charge(self, key: Hashable, cost: float) -> None:
+        """Add ``cost`` to ``key`` without checking the limit (post-paid usage)."""
+        self._update(str(key), cost, self._clock(), enforce=False)
+
+    def _update(self, key: str, cost: float, now: float, enforce: bool):
+        """Roll, check and store one key atomically; returns (estimate, charged)."""
+        current = int(now // self.window)
+        elapsed = (now % self.window) / self.window
+        conn = self._connection()
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT window, prev, curr FROM rate_limits WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[0] < current - 1:
+                prev, curr = 0.0, 0.0
+            elif row[0] == current - 1:
+                prev, curr = row[2], 0.0
+            else:
+                prev, curr = row[1], row[2]
+
+            estimate = prev * (1 - elapsed) + curr
+            charged = not enforce or estimate + cost <= self.limit
+            if charged:
+                curr += cost
+            conn.execute(
+                """
+                INSERT INTO rate_limits (key, window, prev, curr, seen) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    window = excluded.window, prev = excluded.prev,
+                    curr = excluded.curr, seen = excluded.seen
+                """,
+                (key, current, prev, curr, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        self._hits_since_prune += 1
+        if self._hits_since_prune >= self.prune_every:
+            self._hits_since_prune = 0
+            self.prune()
+        return estimate, charged
+
+    def prune(self) -> int:
+        """Drop keys idle for two windows, then the least recently seen over the cap."""
+        conn = self._connection()
+        idle_before = (int(self._clock() // self.window) - 1) * self.window
+        removed = conn.execute("DELETE FROM rate_limits WHERE seen < ?", (idle_before,)).rowcount
+        removed += conn.execute(
+            """
+            DELETE FROM rate_limits WHERE key IN (
+                SELECT key FROM rate_limits ORDER BY seen
+                LIMIT max(0, (SELECT count(*) FROM rate_limits) - ?)
+            )
+            """,
+            (self.max_keys,),
+        ).rowcount
+        return removed
+
+    def reset(self) -> None:
+        self._connection().execute("DELETE FROM rate_limits")
+
+    def stats(self) -> Dict[str, Any]:
+        tracked = self._connection().execute("SELECT count(*) FROM rate_limits").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "tracked_keys": tracked,
+            "max_keys": self.max_keys,
+            "allowed": self.allowed,
+            "denied": self.denied,
+        }
+
+
+def create_rate_limiter(
+    limit: float,
+    window: float = 60.0,
+    max_keys: int = 100_000,
+    backend: Optional[str] = None,
+    path: Optional[str] = None,
+):
+    """Limiter for ``RATE_LIMIT_BACKEND`` (``memory`` default, or ``sqlite``).
+
+    ``sqlite`` shares counters across worker processes on one host through
+    ``RATE_LIMIT_DB`` so N workers enforce one limit instead of N.
+    """
+    backend = (backend or os.getenv("RATE_LIMIT_BACKEND", "memory")).lower()
+    if backend == "sqlite":
+        path = path or os.getenv("RATE_LIMIT_DB", os.path.join("/tmp", "pcos-rate-limits.sqlite3"))
+        return SQLiteRateLimiter(limit, window, path=path, max_keys=max_keys)
+    if backend != "memory":
+        raise ValueError(f"Unknown rate limit backend: {backend}")
+    return SlidingWindowLimiter(limit, window, max_keys=max_keys)
+
+
+class BudgetedRateLimiter:
+    """Separate budgets (e.g. cheap page calls vs. expensive AI calls) per client.
+
+    Each budget has its own limit; endpoints pick a budget and a per-request
+    cost. Keys are namespaced by budget so the sqlite backend can share one
+    table between budgets.
+    """
+
+    def __init__(
+        self,
+        budgets: Dict[str, float],
+        window: float = 60.0,
+        max_keys: int = 100_000,
+        backend: Optional[str] = None,
+        path: Optional[str] = None,
+    ):
+        if not budgets:
+            raise ValueError("At least one budget is required")
+        self.limiters = {
+            name: create_rate_limiter(limit, window, max_keys=max_keys, backend=backend, path=path)
+            for name, limit in budgets.items()
+        }
+
+    def hit(self, budget: str, key: Hashable, cost: float = 1.0) -> RateLimitResult:
+        return self.limiters[budget].hit(f"{budget}:{key}", cost)
+
+    def charge(self, budget: str, key: Hashable, cost: float) -> None:
+        if cost > 0:
+            self.limiters[budget].charge(f"{budget}:{key}", cost)
+
+    def reset(self) -> None:
+        for limiter in self.limiters.values():
+            limiter.reset()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            name: {"limit": limiter.limit, **limiter.stats()}
+            for name, limiter in self.limiters.items()
+        }
+
+
+def usage_cost(
+    seconds: float,
+    tokens: int = 0,
+    seconds_per_unit: float = 5.0,
+    tokens_per_unit: float = 1000.0,
+) -> float:
+    """Budget units consumed by an upstream call: the larger of time and token usage."""
+    return max(seconds / seconds_per_unit, tokens / tokens_per_unit)
+
+
+def response_tokens(body: Any) -> int:
+    """``usage.total_tokens`` of an OpenAI-style completion body, 0 if absent."""
+    usage = body.get("usage") if isinstance(body, dict) else None
+    tokens = usage.get("total_tokens", 0) if isinstance(usage, dict) else 0
+    return tokens if isinstance(tokens, (int, float)) else 0
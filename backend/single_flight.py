@@ -0,0 +1,388 @@
+"""
+Single-Flight Request Coalescing
+Identical concurrent upstream calls share one in-flight call: the first
+caller for a key makes it, the others wait for its result (or join its
+stream)
+"""
+
+import asyncio
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+DEFAULT_TIMEOUT = 30.0
+
+
+class _Call:
+    def __init__(self, started: float):
+        self.started = started
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _AsyncCall:
+    def __init__(self, started: float, task: "asyncio.Task"):
+        self.started = started
+        self.task = task
+
+
+class _Stream:
+    """Chunks of one upstream stream, replayed to every subscriber.
+
+    Whichever subscriber needs a chunk that has not arrived reads it from
+    upstream (the others wait), so the fastest reader sets the pace and a
+    subscriber that goes away hands reading over to the rest.
+    """
+
+    def __init__(self, started: float, on_finish: Callable[["_Stream"], None]):
+        self.started = started
+        self.opened = threading.Event()
+        self.error: Optional[BaseException] = None
+        self.upstream: Optional[Iterator[bytes]] = None
+        self.chunks: List[bytes] = []
+        self.finished = False
+        self.abandoned = False
+        self.subscribers = 0
+        self._pumping = False
+        self._cond = threading.Condition()
+        self._on_finish = on_finish
+
+    def subscribe(self) -> Optional["_Subscription"]:
+        """A new reader, or None when every earlier one left and upstream was closed."""
+        with self._cond:
+            if self.abandoned:
+                return None
+            self.subscribers += 1
+        return _Subscription(self)
+
+    def chunk(self, index: int) -> Optional[bytes]:
+        """Chunk ``index``, reading upstream if nobody else is; None at the end."""
+        with self._cond:
+            while True:
+                if index < len(self.chunks):
+                    return self.chunks[index]
+                if self.finished:
+                    return None
+                if not self._pumping:
+                    self._pumping = True
+                    break
+                self._cond.wait()
+        try:
+            chunk = next(self.upstream, None)
+        except Exception:
+            chunk = None
+        with self._cond:
+            self._pumping = False
+            if chunk is None:
+                self.finished = True
+            else:
+                self.chunks.append(chunk)
+            self._cond.notify_all()
+        if chunk is None:
+            self._on_finish(self)
+        return chunk
+
+    def leave(self) -> None:
+        with self._cond:
+            self.subscribers -= 1
+            abandoned = self.subscribers == 0 and not self.finished
+            if abandoned:
+                self.finished = self.abandoned = True
+        if abandoned:
+            # Nobody is listening any more: stop the upstream generation
+            close = getattr(self.upstream, "close", None)
+            if close is not None:
+                close()
+            self._on_finish(self)
+
+
+class _Subscription:
+    """Iterator over a shared stream; ``close()`` (called by WSGI servers) unsubscribes."""
+
+    def __init__(self, stream: _Stream):
+        self._stream = stream
+        self._index = 0
+        self._closed = False
+
+    def __iter__(self) -> "_Subscription":
+        return self
+
+    def __next__(self) -> bytes:
+        if self._closed:
+            raise StopIteration
+        chunk = self._stream.chunk(self._index)
+        if chunk is None:
+            self.close()
+            raise StopIteration
+        self._index += 1
+        return chunk
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._stream.leave()
+
+
+class _AsyncStream:
+    """Asyncio counterpart of _Stream: a pump task reads upstream for all subscribers."""
+
+    def __init__(self, started: float, on_finish: Callable[["_AsyncStream"], None]):
+        self.started = started
+        self.opening: Optional[asyncio.Future] = None
+        self.upstream: Optional[AsyncIterator[bytes]] = None
+        self.chunks: List[bytes] = []
+        self.finished = False
+        self.abandoned = False
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._pump: Optional[asyncio.Task] = None
+        self._on_finish = on_finish
+
+    def open(self, open_stream: Callable[[], Awaitable[AsyncIterator[bytes]]]) -> None:
+        """Open upstream as a task of its own and start pumping once it is open.
+
+        Neither depends on the leader, so followers are served even when the
+        leader's client goes away while the stream opens.
+        """
+        self.opening = asyncio.ensure_future(open_stream())
+        self.opening.add_done_callback(self._opened)
+
+    def _opened(self, opening: asyncio.Future) -> None:
+        if opening.cancelled() or opening.exception() is not None:
+            self.finished = True
+            self._on_finish(self)
+            return
+        self.upstream = opening.result()
+        self._pump = asyncio.ensure_future(self._run())
+
+    def subscribe(self) -> Optional["_AsyncSubscription"]:
+        if self.abandoned:
+            return None
+        self.subscribers += 1
+        return _AsyncSubscription(self)
+
+    async def wait(self) -> None:
+        changed = self._changed
+        await changed.wait()
+
+    async def _run(self) -> None:
+        try:
+            async for chunk in self.upstream:
+                self.chunks.append(chunk)
+                self._wake()
+        except Exception:
+            pass
+        finally:
+            self.finished = True
+            self._wake()
+            self._on_finish(self)
+
+    def _wake(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def leave(self) -> None:
+        self.subscribers -= 1
+        if self.subscribers == 0 and not self.finished and self._pump is not None:
+            # Cancelling the pump closes the upstream response
+            self.abandoned = True
+            self._pump.cancel()
+
+
+class _AsyncSubscription:
+    def __init__(self, stream: _AsyncStream):
+        self._stream = stream
+        self._index = 0
+        self._closed = False
+
+    def __aiter__(self) -> "_AsyncSubscription":
+        return self
+
+    async def __anext__(self) -> bytes:
+        while not self._closed:
+            if self._index < len(self._stream.chunks):
+                self._index += 1
+                return self._stream.chunks[self._index - 1]
+            if self._stream.finished:
+                break
+            await self._stream.wait()
+        await self.aclose()
+        raise StopAsyncIteration
+
+    async def aclose(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._stream.leave()
+
+
+class SingleFlight:
+    """Coalesces identical concurrent upstream calls by key.
+
+    The first caller for a key (the leader) makes the call; callers arriving
+    while it is in flight (followers) get the same result, or the same
+    exception. Followers wait at most ``timeout`` seconds (or the ``wait``
+    they pass, e.g. what is left of their request deadline, if shorter)
+    before making their own call, and a flight older than ``timeout`` is not
+    joined any more.
+    Results are not kept once the call ends; that is the cache's job.
+
+    Streams are shared the same way: a follower replays the chunks received
+    so far and then gets live ones, and the upstream is closed once every
+    subscriber has gone. Blocking methods (``do``, ``stream``) and asyncio
+    methods (``ado``, ``astream``) keep separate flights. A ``None`` key is
+    never coalesced.
+    """
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, clock: Callable[[], float] = time.monotonic):
+        self.timeout = timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._flights: Dict[Tuple[str, str], Any] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.timeouts = 0
+
+    def do(self, key: Optional[str], call: Callable[[], Any], wait: Optional[float] = None) -> Tuple[Any, bool]:
+        """``(result, shared)``: run ``call`` or wait for the identical call in flight."""
+        if key is None:
+            return call(), False
+        flight, leader = self._join(("call", key), lambda: _Call(self._clock()))
+        if not leader:
+            if flight.done.wait(self._patience(wait)):
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result, True
+            self._timed_out()
+            return call(), False
+        try:
+            flight.result = call()
+            return flight.result, False
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            self._forget(("call", key), flight)
+            flight.done.set()
+
+    def stream(
+        self, key: Optional[str], open_stream: Callable[[], Iterator[bytes]], wait: Optional[float] = None
+    ) -> Tuple[Iterator[bytes], bool]:
+        """``(chunks, shared)``: open a stream or subscribe to the identical one in flight.
+
+        Blocks until the upstream stream is open; a failure to open is raised
+        to the leader and every follower. Close the returned iterator when
+        done with it.
+        """
+        if key is None:
+            return open_stream(), False
+        flight_key = ("stream", key)
+        flight, leader = self._join(
+            flight_key, lambda: _Stream(self._clock(), lambda done: self._forget(flight_key, done))
+        )
+        if leader:
+            try:
+                flight.upstream = open_stream()
+            except BaseException as exc:
+                flight.error = exc
+                self._forget(flight_key, flight)
+                raise
+            finally:
+                flight.opened.set()
+        elif not flight.opened.wait(self._patience(wait)):
+            self._timed_out()
+            return open_stream(), False
+        elif flight.error is not None:
+            raise flight.error
+        subscription = flight.subscribe()
+        if subscription is None:
+            return open_stream(), False
+        return subscription, not leader
+
+    async def ado(
+        self, key: Optional[str], call: Callable[[], Awaitable[Any]], wait: Optional[float] = None
+    ) -> Tuple[Any, bool]:
+        """Asyncio ``do``. The call runs as its own task, so a leader that goes away does not cancel it."""
+        if key is None:
+            return await call(), False
+        flight_key = ("acall", key)
+        flight, leader = self._join(flight_key, lambda: self._task(flight_key, call))
+        if leader:
+            return await asyncio.shield(flight.task), False
+        try:
+            return await asyncio.wait_for(asyncio.shield(flight.task), self._patience(wait)), True
+        except asyncio.TimeoutError:
+            self._timed_out()
+            return await call(), False
+
+    async def astream(
+        self,
+        key: Optional[str],
+        open_stream: Callable[[], Awaitable[AsyncIterator[bytes]]],
+        wait: Optional[float] = None,
+    ) -> Tuple[AsyncIterator[bytes], bool]:
+        """Asyncio ``stream``; ``aclose()`` the returned iterator when done with it."""
+        if key is None:
+            return await open_stream(), False
+        flight_key = ("astream", key)
+        flight, leader = self._join(
+            flight_key, lambda: _AsyncStream(self._clock(), lambda done: self._forget(flight_key, done))
+        )
+        if leader:
+            flight.open(open_stream)
+            await asyncio.shield(flight.opening)
+        else:
+            try:
+                await asyncio.wait_for(asyncio.shield(flight.opening), self._patience(wait))
+            except asyncio.TimeoutError:
+                self._timed_out()
+                return await open_stream(), False
+        subscription = flight.subscribe()
+        if subscription is None:
+            return await open_stream(), False
+        return subscription, not leader
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = self.leaders + self.followers
+            return {
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "timeouts": self.timeouts,
+                "in_flight": len(self._flights),
+                "coalesce_rate": round(self.followers / calls, 4) if calls else 0.0,
+            }
+
+    def _patience(self, wait: Optional[float]) -> float:
+        return self.timeout if wait is None else min(self.timeout, wait)
+
+    def _join(self, flight_key: Tuple[str, str], create: Callable[[], Any]) -> Tuple[Any, bool]:
+        with self._lock:
+            flight = self._flights.get(flight_key)
+            if flight is not None and self._clock() - flight.started < self.timeout:
+                self.followers += 1
+                return flight, False
+            flight = self._flights[flight_key] = create()
+            self.leaders += 1
+            return flight, True
+
+    def _task(self, flight_key: Tuple[str, str], call: Callable[[], Awaitable[Any]]) -> _AsyncCall:
+        flight = _AsyncCall(self._clock(), asyncio.ensure_future(call()))
+
+        def done(task: asyncio.Task) -> None:
+            self._forget(flight_key, flight)
+            if not task.cancelled():
+                task.exception()  # retrieved, so an unawaited failure is not logged
+
+        flight.task.add_done_callback(done)
+        return flight
+
+    def _forget(self, flight_key: Tuple[str, str], flight: Any) -> None:
+        with self._lock:
+            if self._flights.get(flight_key) is flight:
+                del self._flights[flight_key]
+
+    def _timed_out(self) -> None:
+        with self._lock:
+            self.timeouts += 1
@@ -0,0 +1,16 @@
+create table if not exists public.ai_usage (
+  id bigint generated always as identity primary key,
+  ts timestamptz not null,
+  provider text not null,
+  model text,
+  status text not null,
+  depth integer not null default 0,
+  latency_ms double precision not null,
+  prompt_tokens integer not null default 0,
+  completion_tokens integer not null default 0,
+  cost_usd numeric(12, 6) not null default 0
+);
+
+create index if not exists ai_usage_ts_provider_idx on public.ai_usage (ts, provider);
+
+alter table public.ai_usage enable row level security;
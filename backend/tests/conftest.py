@@ -2,14 +2,36 @@
 pytest configuration and fixtures for backend tests
 """
 
+import json
 import pytest
 import sys
 import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 # Add the backend directory to the path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 
+@pytest.fixture(autouse=True)
+def clear_chat_caches():
+    """Chat answers, conversations, insight advice and analyses stored by one test must not leak into the next"""
+    yield
+    for name in ("app", "api.index"):
+        for store in ("chat_cache", "chat_memory", "ai_insights", "analysis_cache"):
+            cache = getattr(sys.modules.get(name), store, None)
+            if cache is not None:
+                cache.clear()
+
+
+@pytest.fixture
+def admin_headers(monkeypatch):
+    """Headers authorizing admin-only endpoints such as /api/metrics"""
+    monkeypatch.setenv("ADMIN_TOKEN", "admin-secret")
+    return {"X-Admin-Token": "admin-secret"}
+
+
 @pytest.fixture
 def sample_user_data():
     """Sample user data for testing"""
@@ -74,3 +96,110 @@ def mock_supabase_client():
     client.table.return_value.insert.return_value.execute.return_value = mock_response
 
     return client
+
+
+class FakeProvider:
+    """Local OpenAI-compatible chat server with adjustable latency and status"""
+
+    def __init__(self):
+        self.status = 200
+        self.delay = 0.0
+        self.reply = "Hello from the fake provider"
+        self.requests = []
+        self.connections = 0
+        # Streaming (``"stream": true``) answers: one SSE event per token
+        self.stream_tokens = ["Hello", " from", " the", " stream"]
+        self.chunk_delay = 0.0
+        self.stream_disconnects = 0
+        # Buffered answers are written in 16-byte pieces this far apart (a provider trickling bytes)
+        self.body_chunk_delay = 0.0
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                provider.connections += 1
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request_body = json.loads(self.rfile.read(length) or b"{}")
+                provider.requests.append(request_body)
+                time.sleep(provider.delay)
+                if request_body.get("stream") and provider.status == 200:
+                    self.stream()
+                    return
+                body = json.dumps(
+                    {
+                        "id": "fake",
+                        "object": "chat.completion",
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": provider.reply}}],
+                        "usage": {"total_tokens": 12},
+                    }
+                ).encode()
+                self.send_response(provider.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if not provider.body_chunk_delay:
+                    self.wfile.write(body)
+                    return
+                try:
+                    for start in range(0, len(body), 16):
+                        self.wfile.write(body[start:start + 16])
+                        self.wfile.flush()
+                        time.sleep(provider.body_chunk_delay)
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+
+            def stream(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                events = [
+                    {"choices": [{"index": 0, "delta": {"content": token}}]} for token in provider.stream_tokens
+                ]
+                try:
+                    for event in events + ["[DONE]"]:
+                        data = event if isinstance(event, str) else json.dumps(event)
+                        chunk = f"data: {data}\n\n".encode()
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                        self.wfile.flush()
+                        time.sleep(provider.chunk_delay)
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    provider.stream_disconnects += 1
+                    self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1/chat/completions"
+        self._thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_provider():
+    """A running FakeProvider, shut down after the test"""
+    provider = FakeProvider()
+    yield provider
+    provider.close()
+
+
+@pytest.fixture
+def second_provider():
+    """Another FakeProvider (answering "second") for fallback and hedging tests"""
+    provider = FakeProvider()
+    provider.reply = "second"
+    yield provider
+    provider.close()
@@ -0,0 +1,185 @@
+"""
+PCOS Smart Assistant - AI Insight Endpoint Tests
+Tests for the chatbot insight endpoints and their per-profile-bucket advice cache
+"""
+
+import importlib
+import json
+import pytest
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+os.environ.setdefault("SKIP_SUPABASE", "1")
+
+from ai_insights import AIInsights, profile_bucket, profile_from, symptoms_from, validate_insight
+from ai_providers import ProviderChain, ProviderClient
+from analysis_engine import PCOSAnalyzer
+from rate_limiter import BudgetedRateLimiter
+
+
+@pytest.fixture
+def chain(fake_provider, monkeypatch):
+    monkeypatch.setenv("FAKE_PROVIDER_KEY", "secret")
+    return ProviderChain([ProviderClient("fake", fake_provider.url, "FAKE_PROVIDER_KEY")])
+
+
+def user_data(**extra):
+    return {"age": 27, "cycle_length": 45, "period_length": 6, "symptoms": ["acne", "weight_gain"],
+            "activity": "sedentary", "weight": 80, "height": 165, **extra}
+
+
+class TestProfileBucket:
+    """Tests for reducing a profile to its cache bucket"""
+
+    def test_profile_is_normalized(self):
+        """Test that numbers are coerced, implausible values dropped and BMI derived"""
+        profile = profile_from({"age": "31", "cycle_length": 400, "weight": 70, "height": 175,
+                                "activity": "Light", "symptoms": ["Acne", "facial hair"]})
+        assert profile["age"] == 31 and "cycle_length" not in profile
+        assert profile["bmi"] == 22.9
+        assert profile["activity"] == "light"
+        assert profile["symptoms"] == ["hirsutism", "acne"]
+
+    def test_free_text_symptoms(self):
+        """Test that symptoms are recognized from phrases and unknown ones reported"""
+        keys, unknown = symptoms_from(["missed periods", "always tired", "headache"])
+        assert keys == ["irregular_cycles", "fatigue"]
+        assert unknown == ["headache"]
+
+    def test_similar_profiles_share_a_bucket(self):
+        """Test that age, exact weight and cycle length do not split buckets"""
+        first = profile_bucket(profile_from(user_data()), "high")
+        second = profile_bucket(profile_from(user_data(age=33, weight=78, cycle_length=50)), "high")
+        assert first == second
+        assert first.bmi_band == "overweight" and first.symptoms() == ["acne", "weight_gain"]
+        assert profile_bucket(profile_from(user_data(activity="active")), "high") != first
+
+    def test_validation(self):
+        """Test that each kind checks its own body"""
+        assert validate_insight("insight", {"userData": {}}) is None
+        assert validate_insight("insight", {"userData": []}) == "userData must be an object"
+        assert validate_insight("analyze-symptoms", {"symptoms": []})
+        assert validate_insight("explain", {"term": " "}) == "term is required"
+        assert validate_insight("diet-plan", {"goals": ["lose weight"]}) is None
+
+
+class TestAIInsights:
+    """Tests for answering from the advice cache before asking a provider"""
+
+    def test_provider_is_asked_once_per_bucket(self, chain, fake_provider):
+        """Test that a second user in the same bucket is served from the cache"""
+        insights = AIInsights(PCOSAnalyzer(None), chain)
+        first = insights.answer("insight", {"userData": user_data()})
+        second = insights.answer("insight", {"userData": user_data(age=30, weight=81)})
+        assert (first["source"], second["source"]) == ("ai", "cache")
+        assert first["insight"] == second["insight"] == fake_provider.reply
+        assert len(fake_provider.requests) == 1
+        assert "80" not in fake_provider.requests[0]["messages"][1]["content"]
+        assert "age 30" in second["summary"]
+
+    def test_each_kind_has_its_own_advice(self, chain, fake_provider):
+        """Test that kinds and diet goals are cached separately"""
+        insights = AIInsights(PCOSAnalyzer(None), chain)
+        profile = user_data()
+        insights.answer("lifestyle", {"profile": profile})
+        insights.answer("diet-plan", {"userProfile": profile, "goals": ["lose weight"]})
+        insights.answer("diet-plan", {"userProfile": profile, "goals": ["get pregnant"]})
+        insights.answer("diet-plan", {"userProfile": profile, "goals": "weight loss"})
+        assert len(fake_provider.requests) == 3
+        assert insights.stats()["hits"] == 1
+
+    def test_local_advice_without_a_provider(self):
+        """Test that built-in advice answers when no provider is configured"""
+        now = [0.0]
+        insights = AIInsights(PCOSAnalyzer(None), local_ttl=60, clock=lambda: now[0])
+        body = insights.answer("lifestyle", {"profile": user_data()})
+        assert body["source"] == "local"
+        assert body["advice"].startswith("Start with 10-15 minute walks")
+        assert insights.answer("lifestyle", {"profile": user_data()})["source"] == "cache"
+        now[0] += 61
+        assert insights.answer("lifestyle", {"profile": user_data()})["source"] == "local"
+
+    def test_failing_provider_falls_back(self, chain, fake_provider):
+        """Test that a provider error gives the built-in advice and is counted"""
+        fake_provider.status = 503
+        insights = AIInsights(PCOSAnalyzer(None), chain)
+        body = insights.answer("analyze-symptoms", {"symptoms": ["acne", "irregular periods"]})
+        assert body["source"] == "local"
+        assert [s["key"] for s in body["symptoms"]] == ["irregular_cycles", "acne"]
+        assert insights.stats()["ai_errors"] == 1
+
+    def test_glossary_terms_skip_the_provider(self, chain, fake_provider):
+        """Test that common terms are explained without a provider call"""
+        insights = AIInsights(PCOSAnalyzer(None), chain)
+        body = insights.answer("explain", {"term": "Insulin  Resistance"})
+        assert body["source"] == "glossary" and "insulin" in body["explanation"]
+        assert insights.answer("explain", {"term": "thyroid panel"})["source"] == "ai"
+        assert len(fake_provider.requests) == 1
+
+    def test_free_text_terms_are_never_cached(self, chain, fake_provider):
+        """Test that a term outside the glossary is asked every time and not shared through the cache"""
+        insights = AIInsights(PCOSAnalyzer(None), chain)
+        assert insights.answer("explain", {"term": "thyroid panel"})["source"] == "ai"
+        assert insights.answer("explain", {"term": "Thyroid  Panel"})["source"] == "ai"
+        assert len(fake_provider.requests) == 2
+        assert insights.stats()["cached"] == 0
+
+
+class TestEndpoints:
+    """Tests for /api/ai/<kind> on the Flask app and the Vercel function"""
+
+    @pytest.fixture(params=["app", "api.index"])
+    def module(self, request, chain, monkeypatch):
+        module = importlib.import_module(request.param)
+        insights = AIInsights(module.analyzer, chain, knowledge_base=module.knowledge_base)
+        monkeypatch.setattr(module, "ai_insights", insights)
+        monkeypatch.setattr(module, "rate_limiter", BudgetedRateLimiter({"default": 60, "ai": 100}))
+        monkeypatch.setenv("SKIP_RATE_LIMIT", "1")
+        return module
+
+    def post(self, module, kind, payload):
+        return module.app.test_client().post(
+            f"/api/ai/{kind}", data=json.dumps(payload), content_type="application/json"
+        )
+
+    @pytest.mark.parametrize("kind,payload,field", [
+        ("insight", {"userData": user_data(), "type": "health_analysis"}, "insight"),
+        ("analyze-symptoms", {"symptoms": ["acne", "hair loss"]}, "analysis"),
+        ("lifestyle", {"profile": user_data()}, "advice"),
+        ("diet-plan", {"userProfile": user_data(), "goals": ["balance blood sugar"]}, "plan"),
+        ("explain", {"term": "AMH", "context": {}}, "explanation"),
+    ])
+    def test_chatbot_calls_are_answered(self, module, kind, payload, field):
+        """Test that every endpoint the chatbot calls answers with its advice field"""
+        response = self.post(module, kind, payload)
+        assert response.status_code == 200
+        assert response.get_json()[field]
+        assert response.headers["X-Cache"] in ("HIT", "MISS")
+
+    def test_repeat_is_a_cache_hit(self, module, fake_provider):
+        """Test that the same bucket is answered from the cache the second time"""
+        first = self.post(module, "insight", {"userData": user_data()})
+        second = self.post(module, "insight", {"userData": user_data(age=40)})
+        assert (first.headers["X-Cache"], second.headers["X-Cache"]) == ("MISS", "HIT")
+        assert len(fake_provider.requests) == 1
+
+    def test_endpoints_draw_on_the_ai_budget(self, module, monkeypatch):
+        """Test that insight requests use up the AI budget and leave the default budget alone"""
+        monkeypatch.delenv("SKIP_RATE_LIMIT", raising=False)
+        monkeypatch.setattr(module, "rate_limiter", BudgetedRateLimiter({"default": 5, "ai": 1}))
+        assert self.post(module, "explain", {"term": "AMH"}).status_code == 200
+        assert self.post(module, "explain", {"term": "AMH"}).status_code == 429
+        assert module.rate_limiter.stats()["default"]["allowed"] == 0
+
+    def test_bad_bodies_are_rejected(self, module):
+        """Test that invalid bodies get 400 and unknown kinds 404"""
+        assert self.post(module, "lifestyle", {"profile": "active"}).status_code == 400
+        assert self.post(module, "explain", {"term": "x" * 200}).status_code == 400
+        assert self.post(module, "horoscope", {}).status_code in (404, 405)
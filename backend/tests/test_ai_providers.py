@@ -0,0 +1,377 @@
+"""
+PCOS Smart Assistant - AI Provider Client Tests
+Tests for pooled provider clients and the chat proxy that uses them
+"""
+
+import json
+import pytest
+import sys
+import os
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SKIP_SUPABASE", "1")
+
+from ai_providers import (
+    CircuitBreaker,
+    ProviderChain,
+    ProviderClient,
+    ProviderError,
+    configured,
+    parse_hedge_delays,
+)
+
+
+def make_client(provider, name="fake", **kwargs):
+    return ProviderClient(name, provider.url, "FAKE_PROVIDER_KEY", placeholder="fake-...", **kwargs)
+
+
+@pytest.fixture
+def provider_key(monkeypatch):
+    monkeypatch.setenv("FAKE_PROVIDER_KEY", "secret")
+
+
+class TestProviderClient:
+    """Tests for ProviderClient"""
+
+    def test_complete(self, fake_provider):
+        """Test that a completion body is returned and the key is sent"""
+        client = make_client(fake_provider)
+        result = client.complete({"model": "m", "messages": [{"role": "user", "content": "hi"}]}, "secret")
+        assert result["choices"][0]["message"]["content"] == fake_provider.reply
+        assert fake_provider.requests[0]["model"] == "m"
+
+    def test_connections_are_reused(self, fake_provider):
+        """Test that sequential calls share one keep-alive connection"""
+        client = make_client(fake_provider)
+        for _ in range(5):
+            client.complete({"messages": []}, "secret")
+        assert fake_provider.connections == 1
+
+    def test_error_status_raises(self, fake_provider):
+        """Test that non-200 answers raise ProviderError with the status"""
+        fake_provider.status = 503
+        with pytest.raises(ProviderError) as excinfo:
+            make_client(fake_provider).complete({"messages": []}, "secret")
+        assert excinfo.value.status == 503
+        assert excinfo.value.provider == "fake"
+
+    def test_read_timeout_raises(self, fake_provider):
+        """Test that a slow provider trips the read timeout"""
+        fake_provider.delay = 0.5
+        client = make_client(fake_provider, read_timeout=0.1)
+        with pytest.raises(ProviderError):
+            client.complete({"messages": []}, "secret")
+
+    def test_api_key_from_environment(self, fake_provider, monkeypatch):
+        """Test that unset and placeholder keys count as unconfigured"""
+        client = make_client(fake_provider)
+        monkeypatch.delenv("FAKE_PROVIDER_KEY", raising=False)
+        assert client.api_key() is None
+        with pytest.raises(ProviderError):
+            client.complete({"messages": []})
+
+        monkeypatch.setenv("FAKE_PROVIDER_KEY", "fake-...")
+        assert configured([client]) == []
+        monkeypatch.setenv("FAKE_PROVIDER_KEY", "real")
+        assert configured([client]) == [client]
+
+
+def reply_of(body):
+    return body["choices"][0]["message"]["content"]
+
+
+class TestProviderChain:
+    """Tests for sequential and hedged provider chains"""
+
+    def test_sequential_fallback(self, fake_provider, second_provider, provider_key):
+        """Test that the next provider is tried only after a failure"""
+        fake_provider.status = 500
+        chain = ProviderChain([make_client(fake_provider, "a"), make_client(second_provider, "b")])
+        name, body = chain.complete({"messages": []})
+        assert (name, reply_of(body)) == ("b", "second")
+        stats = chain.stats()["providers"]
+        assert stats["a"]["errors"] == 1
+        assert stats["b"]["wins"] == 1
+
+    def test_all_failed(self, fake_provider, provider_key):
+        """Test that ProviderError is raised when nobody answers"""
+        fake_provider.status = 500
+        with pytest.raises(ProviderError):
+            ProviderChain([make_client(fake_provider)]).complete({"messages": []})
+
+    def test_unconfigured_providers_are_skipped(self, fake_provider, monkeypatch):
+        """Test that a chain without keys refuses immediately"""
+        monkeypatch.delenv("FAKE_PROVIDER_KEY", raising=False)
+        with pytest.raises(ProviderError):
+            ProviderChain([make_client(fake_provider)]).complete({"messages": []})
+        assert fake_provider.requests == []
+
+    def test_hedge_beats_slow_primary(self, fake_provider, second_provider, provider_key):
+        """Test that a hung primary costs the hedge delay, not its timeout"""
+        fake_provider.delay = 1.0
+        chain = ProviderChain(
+            [make_client(fake_provider, "slow"), make_client(second_provider, "fast")],
+            hedge=True,
+            hedge_delay=0.05,
+        )
+        started = time.monotonic()
+        name, body = chain.complete({"messages": []})
+        assert name == "fast"
+        assert time.monotonic() - started < 0.8
+        stats = chain.stats()["providers"]
+        assert stats["fast"]["hedges"] == 1
+        assert stats["fast"]["wins"] == 1
+        assert stats["slow"]["cancelled"] == 1
+
+    def test_hedge_waits_for_fast_primary(self, fake_provider, second_provider, provider_key):
+        """Test that no hedge is sent when the primary answers in time"""
+        chain = ProviderChain(
+            [make_client(fake_provider, "a"), make_client(second_provider, "b")],
+            hedge=True,
+            hedge_delay=1.0,
+        )
+        assert chain.complete({"messages": []})[0] == "a"
+        assert second_provider.requests == []
+
+    def test_hedge_failure_moves_on_immediately(self, fake_provider, second_provider, provider_key):
+        """Test that an error skips the remaining hedge delay"""
+        fake_provider.status = 502
+        chain = ProviderChain(
+            [make_client(fake_provider, "a"), make_client(second_provider, "b")],
+            hedge=True,
+            hedge_delay=5.0,
+        )
+        started = time.monotonic()
+        assert chain.complete({"messages": []})[0] == "b"
+        assert time.monotonic() - started < 1.0
+
+    def test_percentile_hedge_delay(self, fake_provider):
+        """Test that enough latency samples replace the fixed delay"""
+        client = make_client(fake_provider)
+        chain = ProviderChain([client], hedge=True, hedge_delay=2.0, hedge_percentile=90)
+        assert chain.hedge_delay_for(client) == 2.0
+        chain._latencies["fake"].extend(i / 100 for i in range(1, 101))
+        assert chain.hedge_delay_for(client) == pytest.approx(0.91)
+
+    def test_parse_hedge_delays(self):
+        """Test per-provider hedge delays in milliseconds"""
+        assert parse_hedge_delays("openrouter=1500, openai=250") == {"openrouter": 1.5, "openai": 0.25}
+
+    def test_overrides(self, fake_provider, provider_key):
+        """Test that overrides replace payload fields"""
+        client = make_client(fake_provider, overrides={"model": "fixed"})
+        client.complete({"model": "user", "messages": []})
+        assert fake_provider.requests[0]["model"] == "fixed"
+
+
+class FakeClock:
+    """Manually advanced monotonic clock"""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker:
+    """Tests for CircuitBreaker state transitions"""
+
+    def test_opens_on_error_rate(self):
+        """Test that enough failures open the breaker"""
+        breaker = CircuitBreaker(failure_rate=0.5, min_calls=4, clock=FakeClock())
+        breaker.record_success(0.1)
+        breaker.record_failure()
+        breaker.record_success(0.1)
+        assert breaker.state == CircuitBreaker.CLOSED
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+
+    def test_slow_successes_count_as_failures(self):
+        """Test that latency above slow_call trips the breaker"""
+        breaker = CircuitBreaker(min_calls=2, slow_call=1.0, clock=FakeClock())
+        breaker.record_success(5.0)
+        breaker.record_success(5.0)
+        assert breaker.state == CircuitBreaker.OPEN
+
+    def test_half_open_probe_closes(self):
+        """Test that one successful probe after the cool-down closes the breaker"""
+        clock = FakeClock()
+        breaker = CircuitBreaker(min_calls=1, open_seconds=30, clock=clock)
+        breaker.record_failure()
+        clock.now += 31
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record_success(0.1)
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_half_open_probe_failure_reopens(self):
+        """Test that a failed probe opens the breaker for another cool-down"""
+        clock = FakeClock()
+        breaker = CircuitBreaker(min_calls=1, open_seconds=30, clock=clock)
+        breaker.record_failure()
+        clock.now += 31
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.snapshot()["state"] == CircuitBreaker.OPEN
+        assert breaker.snapshot()["opened"] == 2
+
+    def test_release_returns_probe(self):
+        """Test that a probe that never ran can be handed back"""
+        clock = FakeClock()
+        breaker = CircuitBreaker(min_calls=1, open_seconds=1, clock=clock)
+        breaker.record_failure()
+        clock.now += 2
+        assert breaker.allow()
+        breaker.release()
+        assert breaker.allow()
+
+
+class TestRouting:
+    """Tests for breaker-aware, latency-ordered provider routing"""
+
+    def test_open_breaker_is_skipped(self, fake_provider, second_provider, provider_key):
+        """Test that a failing provider stops receiving traffic"""
+        fake_provider.status = 500
+        chain = ProviderChain(
+            [make_client(fake_provider, "a"), make_client(second_provider, "b")],
+            routing="ordered",
+            breaker={"min_calls": 2},
+        )
+        for _ in range(5):
+            assert chain.complete({"messages": []})[0] == "b"
+        assert len(fake_provider.requests) == 2
+        assert chain.stats()["providers"]["a"]["breaker"]["state"] == "open"
+
+    def test_fastest_provider_first(self, fake_provider, second_provider, provider_key):
+        """Test that EWMA latency reorders providers"""
+        chain = ProviderChain([make_client(fake_provider, "slow"), make_client(second_provider, "fast")])
+        chain._ewma.update({"slow": 2.0, "fast": 0.2})
+        assert chain.complete({"messages": []})[0] == "fast"
+        assert [c.name for c in chain.route(chain.clients)] == ["fast", "slow"]
+
+    def test_untried_providers_go_first(self, fake_provider, second_provider):
+        """Test that providers without samples keep their place ahead of measured ones"""
+        chain = ProviderChain([make_client(fake_provider, "a"), make_client(second_provider, "b")])
+        chain._ewma["a"] = 0.5
+        assert [c.name for c in chain.route(chain.clients)] == ["b", "a"]
+
+    def test_ewma_updates_on_success(self, fake_provider, provider_key):
+        """Test that successful calls feed the latency average"""
+        chain = ProviderChain([make_client(fake_provider)])
+        chain.complete({"messages": []})
+        assert chain.stats()["providers"]["fake"]["ewma_ms"] is not None
+
+    def test_unknown_routing(self):
+        """Test that routing modes are validated"""
+        with pytest.raises(ValueError):
+            ProviderChain([], routing="random")
+
+
+class TestChatProxy:
+    """Tests for /api/ai/chat on top of provider clients"""
+
+    def test_falls_through_to_next_provider(self, fake_provider, monkeypatch):
+        """Test that a failing provider is skipped for the next one"""
+        import app as app_module
+
+        broken = ProviderClient("broken", "http://127.0.0.1:9/", "BROKEN_KEY", connect_timeout=0.2)
+        working = make_client(fake_provider)
+        monkeypatch.setattr(app_module, "ai_chain", ProviderChain([broken, working]))
+        monkeypatch.setenv("BROKEN_KEY", "x")
+        monkeypatch.setenv("FAKE_PROVIDER_KEY", "y")
+        monkeypatch.setenv("SKIP_RATE_LIMIT", "1")
+
+        response = app_module.app.test_client().post(
+            "/api/ai/chat",
+            data=json.dumps({"model": "m", "messages": [{"role": "user", "content": "hi"}]}),
+            content_type="application/json",
+        )
+        assert response.status_code == 200
+        assert json.loads(response.data)["id"] == "fake"
+
+
+def sse_contents(raw):
+    """Concatenated delta contents of an SSE body"""
+    contents = []
+    for line in raw.decode().splitlines():
+        if line.startswith("data: ") and line != "data: [DONE]":
+            delta = json.loads(line[6:])["choices"][0].get("delta", {})
+            contents.append(delta.get("content", ""))
+    return "".join(contents)
+
+
+class TestStreaming:
+    """Tests for SSE passthrough and the streaming local fallback"""
+
+    def test_chain_relays_chunks(self, fake_provider, provider_key):
+        """Test that provider events are relayed unchanged"""
+        name, chunks = ProviderChain([make_client(fake_provider)]).stream({"messages": []})
+        assert name == "fake"
+        assert sse_contents(b"".join(chunks)) == "Hello from the stream"
+        assert fake_provider.requests[0]["stream"] is True
+
+    def test_fails_over_before_first_byte(self, fake_provider, second_provider, provider_key):
+        """Test that a provider refusing the stream is skipped"""
+        fake_provider.status = 503
+        chain = ProviderChain([make_client(fake_provider, "a"), make_client(second_provider, "b")], routing="ordered")
+        assert chain.stream({"messages": []})[0] == "b"
+
+    def test_first_chunk_arrives_before_generation_ends(self, fake_provider, provider_key, monkeypatch):
+        """Test that time to first token is not the full generation time"""
+        import app as app_module
+
+        fake_provider.chunk_delay = 0.2
+        monkeypatch.setattr(app_module, "ai_chain", ProviderChain([make_client(fake_provider)]))
+        monkeypatch.setenv("SKIP_RATE_LIMIT", "1")
+        started = time.monotonic()
+        response = app_module.app.test_client().post(
+            "/api/ai/chat",
+            data=json.dumps({"model": "m", "stream": True, "messages": [{"role": "user", "content": "hi"}]}),
+            content_type="application/json",
+            buffered=False,
+        )
+        chunks = iter(response.response)
+        first = next(chunks)
+        first_at = time.monotonic() - started
+        rest = b"".join(chunks)
+
+        assert response.mimetype == "text/event-stream"
+        assert first_at < 0.15
+        assert time.monotonic() - started >= 0.6
+        assert sse_contents(first + rest) == "Hello from the stream"
+
+    def test_client_disconnect_closes_upstream(self, fake_provider, provider_key):
+        """Test that closing the relay stops the upstream stream"""
+        fake_provider.chunk_delay = 0.05
+        fake_provider.stream_tokens = ["token"] * 50
+        chain = ProviderChain([make_client(fake_provider)])
+        _, chunks = chain.stream({"messages": []})
+        next(chunks)
+        chunks.close()
+
+        deadline = time.monotonic() + 2
+        while not fake_provider.stream_disconnects and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert fake_provider.stream_disconnects == 1
+        assert chain.stats()["providers"]["fake"]["disconnects"] == 1
+
+    def test_local_fallback_streams(self, monkeypatch):
+        """Test that the local answer is streamed when no provider is configured"""
+        import app as app_module
+
+        monkeypatch.setattr(app_module, "ai_chain", ProviderChain([]))
+        monkeypatch.setenv("SKIP_RATE_LIMIT", "1")
+        response = app_module.app.test_client().post(
+            "/api/ai/chat",
+            data=json.dumps({"model": "m", "stream": True, "messages": [{"role": "user", "content": "what is pcos"}]}),
+            content_type="application/json",
+        )
+        assert response.mimetype == "text/event-stream"
+        assert response.data.endswith(b"data: [DONE]\n\n")
+        assert "Polycystic Ovary Syndrome" in sse_contents(response.data)
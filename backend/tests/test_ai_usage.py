@@ -0,0 +1,203 @@
+"""
+PCOS Smart Assistant - AI Usage Accounting Tests
+Tests for per-provider usage records, hourly rollups and batched persistence
+"""
+
+import json
+import pytest
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SKIP_SUPABASE", "1")
+
+from ai_providers import ProviderChain, ProviderClient
+from ai_usage import FileSink, UsageRecorder, parse_prices
+
+
+def ask(text):
+    return {"model": "m", "messages": [{"role": "user", "content": text}]}
+
+
+class FailingSink:
+    """Sink that fails until ``broken`` is cleared"""
+
+    def __init__(self):
+        self.broken = True
+        self.rows = []
+
+    def write(self, rows):
+        if self.broken:
+            raise OSError("sink down")
+        self.rows.extend(rows)
+
+
+class TestUsageRecorder:
+    """Tests for the in-memory aggregator"""
+
+    def test_parse_prices(self):
+        """Test that prices parse per model, a single value covering both token kinds"""
+        assert parse_prices("a=0.5/1.5, b=0.2") == {"a": (0.5, 1.5), "b": (0.2, 0.2)}
+        assert parse_prices("") == {}
+
+    def test_cost_from_usage(self):
+        """Test that cost is tokens times the model's price, with the default for unknown models"""
+        recorder = UsageRecorder(prices={"cheap": (1.0, 2.0)}, default_price=10.0)
+        usage = {"prompt_tokens": 1000, "completion_tokens": 500}
+        assert recorder.record("p", "cheap", "ok", 0.1, usage).cost_usd == 2.0
+        assert recorder.record("p", "other", "ok", 0.1, {"prompt_tokens": 100}).cost_usd == 1.0
+        assert recorder.record("p", "other", "error", 0.1, None).cost_usd == 0.0
+
+    def test_hourly_rollups(self):
+        """Test that records roll up by hour and provider, newest hour first"""
+        now = [7200.0]
+        recorder = UsageRecorder(clock=lambda: now[0])
+        recorder.record("openai", "gpt", "ok", 0.08, {"prompt_tokens": 10, "completion_tokens": 5})
+        recorder.record("openai", "gpt", "error", 0.9, depth=1)
+        recorder.record("local", None, "fallback", 1.2, depth=2)
+        now[0] += 3600
+        recorder.record("openai", "gpt", "ok", 0.2)
+
+        rollups = recorder.rollups()
+        assert [(r["hour"][11:13], r["provider"]) for r in rollups] == [
+            ("03", "openai"), ("02", "local"), ("02", "openai"),
+        ]
+        openai = rollups[2]
+        assert openai["calls"] == 2
+        assert openai["statuses"] == {"ok": 1, "error": 1}
+        assert openai["prompt_tokens"] == 10 and openai["completion_tokens"] == 5
+        assert openai["avg_depth"] == 0.5
+        assert openai["latency_ms"]["p50"] == 100 and openai["latency_ms"]["p99"] == 1000
+        assert [r["provider"] for r in recorder.rollups(hours=1)] == ["openai"]
+        assert [r["hour"][11:13] for r in recorder.rollups(provider="local")] == ["02"]
+
+    def test_old_hours_are_discarded(self):
+        """Test that rollups older than ``retention_hours`` are dropped"""
+        now = [0.0]
+        recorder = UsageRecorder(retention_hours=2, clock=lambda: now[0])
+        recorder.record("p", "m", "ok", 0.1)
+        now[0] += 3 * 3600
+        recorder.record("p", "m", "ok", 0.1)
+        assert len(recorder.rollups(hours=24)) == 1
+
+    def test_no_sink_queues_nothing(self):
+        """Test that without a sink records are only aggregated"""
+        recorder = UsageRecorder()
+        recorder.record("p", "m", "ok", 0.1)
+        assert recorder.flush() == 0
+        assert recorder.stats()["pending"] == 0 and recorder.stats()["recorded"] == 1
+
+
+class TestFlush:
+    """Tests for batched writes to a sink"""
+
+    def test_file_sink(self, tmp_path):
+        """Test that flushed records are appended as JSON lines"""
+        path = tmp_path / "usage.jsonl"
+        recorder = UsageRecorder(sink=FileSink(str(path)), flush_interval=3600)
+        recorder.record("openai", "gpt", "ok", 0.25, {"prompt_tokens": 3, "completion_tokens": 4}, depth=1)
+        recorder.record("local", None, "fallback", 0.5, depth=2)
+        assert recorder.flush() == 2
+        rows = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [(r["provider"], r["status"], r["depth"]) for r in rows] == [
+            ("openai", "ok", 1), ("local", "fallback", 2),
+        ]
+        assert rows[0]["latency_ms"] == 250.0 and rows[0]["ts"].endswith("+00:00")
+        assert recorder.stats()["flushed"] == 2
+
+    def test_failed_write_is_retried(self):
+        """Test that a batch the sink rejected is written with the next flush"""
+        sink = FailingSink()
+        recorder = UsageRecorder(sink=sink, flush_interval=3600)
+        recorder.record("p", "m", "ok", 0.1)
+        assert recorder.flush() == 0
+        sink.broken = False
+        recorder.record("p", "m", "ok", 0.1)
+        assert recorder.flush() == 2
+        assert recorder.stats()["flush_errors"] == 1
+
+    def test_pending_is_bounded(self):
+        """Test that records beyond ``max_pending`` are dropped oldest first and counted"""
+        recorder = UsageRecorder(sink=FailingSink(), flush_interval=3600, max_pending=3)
+        for latency in range(5):
+            recorder.record("p", "m", "ok", latency)
+        stats = recorder.stats()
+        assert stats["pending"] == 3 and stats["dropped"] == 2
+
+
+class TestChainHook:
+    """Tests for ProviderChain reporting attempts to on_attempt"""
+
+    def test_attempts_are_reported_with_depth(self, fake_provider, second_provider, monkeypatch):
+        """Test that a failed attempt and the one answering after it are both accounted"""
+        monkeypatch.setenv("FAKE_PROVIDER_KEY", "secret")
+        fake_provider.status = 500
+        recorder = UsageRecorder()
+        chain = ProviderChain([
+            ProviderClient("first", fake_provider.url, "FAKE_PROVIDER_KEY"),
+            ProviderClient("second", second_provider.url, "FAKE_PROVIDER_KEY"),
+        ], routing="ordered", on_attempt=recorder.record)
+        chain.complete(ask("hi"))
+        rollups = {r["provider"]: r for r in recorder.rollups()}
+        assert rollups["first"]["statuses"] == {"error": 1} and rollups["first"]["avg_depth"] == 0
+        assert rollups["second"]["statuses"] == {"ok": 1} and rollups["second"]["avg_depth"] == 1
+        assert rollups["second"]["models"] == {"m": 1}
+
+    def test_failing_hook_does_not_fail_the_chat(self, fake_provider, monkeypatch):
+        """Test that an exception in on_attempt is swallowed"""
+        monkeypatch.setenv("FAKE_PROVIDER_KEY", "secret")
+
+        def broken(*args):
+            raise RuntimeError("boom")
+
+        chain = ProviderChain([ProviderClient("fake", fake_provider.url, "FAKE_PROVIDER_KEY")], on_attempt=broken)
+        assert chain.complete(ask("hi"))[0] == "fake"
+
+
+class TestAdminEndpoint:
+    """Tests for /api/admin/ai-usage"""
+
+    @pytest.fixture
+    def app_module(self, fake_provider, monkeypatch):
+        import app as app_module
+
+        monkeypatch.setenv("FAKE_PROVIDER_KEY", "secret")
+        monkeypatch.setenv("SKIP_RATE_LIMIT", "1")
+        monkeypatch.setenv("ADMIN_TOKEN", "admin-secret")
+        recorder = UsageRecorder()
+        client = ProviderClient("fake", fake_provider.url, "FAKE_PROVIDER_KEY")
+        monkeypatch.setattr(app_module, "usage_recorder", recorder)
+        monkeypatch.setattr(app_module, "ai_chain", ProviderChain([client], on_attempt=recorder.record))
+        monkeypatch.setattr(app_module, "chat_intents", None)
+        monkeypatch.setattr(app_module, "chat_cache", None)
+        return app_module
+
+    def chat(self, app_module):
+        return app_module.app.test_client().post(
+            "/api/ai/chat", data=json.dumps(ask("What is PCOS?")), content_type="application/json"
+        )
+
+    def test_requires_admin_token(self, app_module, monkeypatch):
+        """Test that a missing or wrong token, or no configured token, is refused"""
+        client = app_module.app.test_client()
+        assert client.get("/api/admin/ai-usage").status_code == 403
+        assert client.get("/api/admin/ai-usage", headers={"X-Admin-Token": "nope"}).status_code == 403
+        monkeypatch.delenv("ADMIN_TOKEN")
+        assert client.get("/api/admin/ai-usage", headers={"X-Admin-Token": ""}).status_code == 403
+
+    def test_provider_calls_and_fallbacks_are_rolled_up(self, app_module, fake_provider):
+        """Test that a provider answer and a local fallback both appear in the rollups"""
+        self.chat(app_module)
+        fake_provider.status = 503
+        self.chat(app_module)
+        response = app_module.app.test_client().get(
+            "/api/admin/ai-usage?hours=2", headers={"X-Admin-Token": "admin-secret"}
+        )
+        assert response.status_code == 200
+        body = response.get_json()
+        rollups = {r["provider"]: r for r in body["rollups"]}
+        assert rollups["fake"]["statuses"] == {"ok": 1, "error": 1}
+        assert rollups["local"]["statuses"] == {"fallback": 1} and rollups["local"]["avg_depth"] == 1
+        assert body["recorder"]["recorded"] == 3
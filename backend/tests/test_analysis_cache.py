@@ -0,0 +1,194 @@
+"""
+PCOS Smart Assistant - Analysis Cache Tests
+Tests for deduplicating repeated /api/analyze submissions and reusing their results
+"""
+
+import json
+import pytest
+import sys
+import os
+import threading
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SKIP_SUPABASE", "1")
+
+from analysis_cache import AnalysisCache, entry_key, payload_key
+from single_flight import SingleFlight
+
+
+FORM = {"age": 25, "cycle_length": 40, "period_length": 5, "symptoms": ["acne"], "city": "Mumbai"}
+
+
+class TestPayloadKey:
+    """Tests for hashing validated payloads"""
+
+    def test_key_order_does_not_matter(self):
+        """Test that the same fields in another order hash alike"""
+        assert payload_key({"age": 25, "weight": 60.0}) == payload_key({"weight": 60.0, "age": 25})
+
+    def test_any_change_gives_a_new_key(self):
+        """Test that a changed value or symptom list gives a different hash"""
+        assert payload_key(FORM) != payload_key({**FORM, "age": 26})
+        assert payload_key(FORM) != payload_key({**FORM, "symptoms": ["acne", "hair_loss"]})
+
+    def test_entry_key_is_scoped_by_client(self):
+        """Test that the same payload from two clients gives two dedupe keys"""
+        key = payload_key(FORM)
+        assert entry_key(key, "ip:10.0.0.1") == entry_key(key, "ip:10.0.0.1")
+        assert entry_key(key, "ip:10.0.0.1") != entry_key(key, "ip:10.0.0.2")
+        assert entry_key(key, "key:abc") != entry_key(key, "ip:10.0.0.1")
+
+
+class TestAnalysisCache:
+    """Tests for idempotent saves and cached results"""
+
+    def test_entry_is_saved_once_per_window(self):
+        """Test that a repeat within the window reuses the id and a later one saves again"""
+        now = [0.0]
+        saved = []
+        cache = AnalysisCache(dedupe_window=60, clock=lambda: now[0])
+
+        def save():
+            saved.append(f"id-{len(saved)}")
+            return saved[-1]
+
+        assert cache.entry_id("k", save) == ("id-0", False)
+        assert cache.entry_id("k", save) == ("id-0", True)
+        now[0] += 61
+        assert cache.entry_id("k", save) == ("id-1", False)
+        stats = cache.stats()
+        assert (stats["submissions"], stats["saves"], stats["deduplicated"]) == (3, 2, 1)
+
+    def test_unsaved_entries_are_not_remembered(self):
+        """Test that a save returning None is tried again on the next submission"""
+        cache = AnalysisCache()
+        ids = iter([None, "id-1"])
+        assert cache.entry_id("k", lambda: next(ids)) == (None, False)
+        assert cache.entry_id("k", lambda: next(ids)) == ("id-1", False)
+
+    def test_concurrent_submissions_save_once(self):
+        """Test that identical submissions arriving together share one save"""
+        cache = AnalysisCache(flights=SingleFlight())
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def save():
+            calls.append(1)
+            started.set()
+            release.wait(2.0)
+            return "id-0"
+
+        results = []
+        first = threading.Thread(target=lambda: results.append(cache.entry_id("k", save)))
+        first.start()
+        assert started.wait(2.0)
+        second = threading.Thread(target=lambda: results.append(cache.entry_id("k", save)))
+        second.start()
+        release.set()
+        first.join(2.0)
+        second.join(2.0)
+        assert len(calls) == 1
+        assert sorted(results) == [("id-0", False), ("id-0", True)]
+
+    def test_results_are_cached_with_a_ttl(self):
+        """Test that a body is built once per key until it expires"""
+        now = [0.0]
+        builds = []
+        cache = AnalysisCache(ttl=60, clock=lambda: now[0])
+        build = lambda: builds.append(1) or {"report": {}}
+        assert cache.result(("k", False), build)[1] is False
+        assert cache.result(("k", False), build)[1] is True
+        assert cache.result(("k", True), build)[1] is False
+        now[0] += 61
+        assert cache.result(("k", False), build)[1] is False
+        assert len(builds) == 3
+        assert cache.stats()["hit_rate"] == 0.25
+
+
+class TestAnalyzeEndpoint:
+    """Tests for /api/analyze answering repeats from the cache"""
+
+    @pytest.fixture
+    def app_module(self, monkeypatch):
+        import app as app_module
+
+        if app_module.analyzer is None:
+            pytest.skip("Analyzer not available")
+        monkeypatch.setenv("SKIP_RATE_LIMIT", "1")
+        saved = []
+
+        def save_entry(data):
+            saved.append(data)
+            return f"id-{len(saved)}"
+
+        monkeypatch.setattr(app_module, "save_entry", save_entry)
+        monkeypatch.setattr(app_module, "analysis_cache", AnalysisCache(flights=SingleFlight()))
+        return app_module, saved
+
+    def post(self, module, payload, query="", headers=None):
+        return module.app.test_client().post(
+            f"/api/analyze{query}", data=json.dumps(payload), content_type="application/json", headers=headers
+        )
+
+    def test_resubmission_is_deduplicated(self, app_module):
+        """Test that an identical form is saved once and answered from the cache"""
+        module, saved = app_module
+        first = self.post(module, FORM)
+        second = self.post(module, dict(reversed(list(FORM.items()))))
+        assert (first.headers["X-Cache"], second.headers["X-Cache"]) == ("MISS", "HIT")
+        assert first.get_json() == second.get_json()
+        assert first.get_json()["entry_id"] == "id-1"
+        assert len(saved) == 1
+
+    def test_clients_are_saved_apart(self, app_module):
+        """Test that two clients posting the same form get their own rows but share the cached body"""
+        module, saved = app_module
+        first = self.post(module, FORM, headers={"X-Forwarded-For": "10.0.0.1"})
+        second = self.post(module, FORM, headers={"X-Forwarded-For": "10.0.0.2"})
+        assert len(saved) == 2
+        assert (first.get_json()["entry_id"], second.get_json()["entry_id"]) == ("id-1", "id-2")
+        assert second.headers["X-Cache"] == "HIT"
+
+    def test_idempotency_key_scopes_the_dedupe(self, app_module):
+        """Test that a retried request with the same Idempotency-Key is saved once, from any address"""
+        module, saved = app_module
+        first = self.post(module, FORM, headers={"Idempotency-Key": "k1", "X-Forwarded-For": "10.0.0.1"})
+        retry = self.post(module, FORM, headers={"Idempotency-Key": "k1", "X-Forwarded-For": "10.0.0.9"})
+        other = self.post(module, FORM, headers={"Idempotency-Key": "k2", "X-Forwarded-For": "10.0.0.1"})
+        assert [r.get_json()["entry_id"] for r in (first, retry, other)] == ["id-1", "id-1", "id-2"]
+        assert len(saved) == 2
+
+    def test_nothing_is_saved_without_the_analyzer(self, app_module, monkeypatch):
+        """Test that a 503 for a missing analyzer neither saves nor remembers an entry"""
+        module, saved = app_module
+        monkeypatch.setattr(module, "analyzer", None)
+        assert self.post(module, FORM).status_code == 503
+        assert saved == [] and module.analysis_cache.stats()["submissions"] == 0
+
+    def test_changed_form_is_analyzed_again(self, app_module):
+        """Test that a different payload is saved and analyzed on its own"""
+        module, saved = app_module
+        self.post(module, FORM)
+        response = self.post(module, {**FORM, "cycle_length": 30})
+        assert response.headers["X-Cache"] == "MISS"
+        assert response.get_json()["entry_id"] == "id-2"
+
+    def test_compact_responses_are_cached_separately(self, app_module):
+        """Test that ?compact=1 does not get the full body cached for the same form"""
+        module, saved = app_module
+        full = self.post(module, FORM).get_json()
+        compact = self.post(module, FORM, "?compact=1")
+        assert compact.headers["X-Cache"] == "MISS"
+        assert compact.get_json()["entry_id"] == full["entry_id"]
+        assert len(saved) == 1
+
+    def test_metrics(self, app_module, admin_headers):
+        """Test that result hit rate and dedupe rate are reported in /api/metrics"""
+        module, _ = app_module
+        self.post(module, FORM)
+        self.post(module, FORM)
+        metrics = module.app.test_client().get("/api/metrics", headers=admin_headers).get_json()["analysis_cache"]
+        assert metrics["hit_rate"] == 0.5
+        assert metrics["dedupe_rate"] == 0.5
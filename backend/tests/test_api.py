@@ -248,6 +248,86 @@ class TestAnalyzeEndpoint:
         assert "summary" in data["report"]
 
 
+class TestCompactAnalyze:
+    """Tests for the ?compact=1 analyze response and reference endpoints"""
+
+    @patch("app.analyzer.analyze")
+    @patch("app.save_entry")
+    def test_compact_analyze_omits_static_data(self, mock_save, mock_analyze, client):
+        """Test that compact mode returns doctor ids and a reference version"""
+        mock_save.return_value = "test-id"
+        mock_analyze.return_value = {"risk_level": "moderate", "recommendations": []}
+
+        response = client.post(
+            "/api/analyze?compact=1",
+            data=json.dumps(
+                {"age": 25, "cycle_length": 28, "period_length": 5, "symptoms": [], "city": "Pune"}
+            ),
+            content_type="application/json",
+        )
+
+        doctors = json.loads(response.data)["doctors"]
+        assert response.status_code == 200
+        assert "all_doctors_in_city" not in doctors
+        assert "helplines" not in doctors
+        assert doctors["doctor_cities"] == ["Pune"]
+        assert len(doctors["primary_doctor_ids"]) == 2
+        assert doctors["reference_version"]
+
+    def test_city_doctors_endpoint(self, client):
+        """Test that city doctor lists carry ids and cache headers"""
+        response = client.get("/api/doctors/pune")
+        data = json.loads(response.data)
+        assert response.status_code == 200
+        assert data["city"] == "Pune"
+        assert all("id" in doctor for doctor in data["doctors"])
+        assert response.headers.get("ETag")
+        assert "max-age" in response.headers.get("Cache-Control", "")
+
+    def test_city_doctors_not_modified(self, client):
+        """Test that a matching If-None-Match returns 304"""
+        etag = client.get("/api/doctors/Pune").headers["ETag"]
+        response = client.get("/api/doctors/Pune", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+    def test_reference_sections(self, client):
+        """Test the reference data endpoints"""
+        version = json.loads(client.get("/api/reference/version").data)["version"]
+        data = json.loads(client.get("/api/reference/all").data)
+        assert data["version"] == version
+        assert set(data) == {"helplines", "booking_tips", "questions_to_ask", "version"}
+        assert "booking_tips" in json.loads(client.get("/api/reference/booking-tips").data)
+
+    def test_unknown_reference_section(self, client):
+        """Test that unknown sections return 404"""
+        assert client.get("/api/reference/unknown").status_code == 404
+
+
+class TestMetricsEndpoint:
+    """Tests for the /api/metrics endpoint"""
+
+    def test_metrics_require_admin_token(self, client, monkeypatch):
+        """Test that metrics are refused without the admin token, or while none is configured"""
+        monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+        assert client.get("/api/metrics", headers={"X-Admin-Token": ""}).status_code == 403
+        monkeypatch.setenv("ADMIN_TOKEN", "admin-secret")
+        assert client.get("/api/metrics").status_code == 403
+        assert client.get("/api/metrics", headers={"X-Admin-Token": "nope"}).status_code == 403
+
+    def test_metrics_include_recommendation_cache(self, client, admin_headers):
+        """Test that recommendation cache counters are exposed"""
+        data = json.loads(client.get("/api/metrics", headers=admin_headers).data)
+        cache = data["recommendation_cache"]
+        assert {"hits", "misses", "hit_rate", "size", "version"} <= set(cache)
+
+    def test_metrics_include_provider_wins(self, client, admin_headers):
+        """Test that per-provider win counters are exposed"""
+        data = json.loads(client.get("/api/metrics", headers=admin_headers).data)
+        providers = data["ai_providers"]["providers"]
+        assert {"openrouter", "openai", "perplexity"} == set(providers)
+        assert {"calls", "wins", "hedges", "win_rate"} <= set(providers["openai"])
+
+
 class TestStatsEndpoint:
     """Tests for the /api/stats endpoint"""
 
@@ -0,0 +1,245 @@
+"""
+PCOS Smart Assistant - Appointment Slot Tests
+Tests for the earliest-slot availability index
+"""
+
+import json
+import pytest
+import sys
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SKIP_SUPABASE", "1")
+
+from appointment_slots import MAX_TIME, SlotIndex, format_time, generate_demo_feed, parse_time
+from doctor_ranking import haversine_km
+from doctor_recommendations import CITY_COORDINATES, DoctorRecommender
+
+
+@pytest.fixture
+def store():
+    """Store built from the bundled directory"""
+    return DoctorRecommender().store
+
+
+def at(day, hour):
+    """Epoch seconds for 2026-03-<day> <hour>:00 UTC"""
+    return parse_time(datetime(2026, 3, day, hour, tzinfo=timezone.utc))
+
+
+@pytest.fixture
+def feed():
+    """Small hand-written feed"""
+    return {
+        "slots": [
+            {"doctor": "Dr. Sunita Rao", "start": "2026-03-02T10:00:00Z", "end": "2026-03-02T10:30:00Z"},
+            {"doctor": "Dr. Sunita Rao", "start": "2026-03-03T09:00:00Z", "end": "2026-03-03T09:30:00Z"},
+            {"doctor": "Dr. Priya Reddy", "start": "2026-03-02T09:00:00Z", "end": "2026-03-02T09:30:00Z"},
+            {"doctor": "Dr. Meera Sharma", "start": "2026-03-02T08:00:00Z", "end": "2026-03-02T08:30:00Z"},
+            {"doctor": "Dr. Nobody", "start": "2026-03-02T08:00:00Z"},
+        ]
+    }
+
+
+@pytest.fixture
+def index(store, feed):
+    return SlotIndex.from_feed(store, feed)
+
+
+class TestSlotIndex:
+    """Tests for SlotIndex queries"""
+
+    def test_unknown_doctors_are_skipped(self, index):
+        """Test that slots for doctors not in the store are ignored"""
+        assert len(index) == 4
+
+    def test_next_slot_for_doctor(self, store, index):
+        """Test per-doctor earliest slot after a time"""
+        row = store.find_by_name("Sunita Rao")[0]
+        assert index.next_slot(row, at(2, 0))["start"] == "2026-03-02T10:00:00Z"
+        assert index.next_slot(row, at(2, 11))["start"] == "2026-03-03T09:00:00Z"
+        assert index.next_slot(row, at(4, 0)) is None
+
+    def test_doctor_without_slots(self, store, index):
+        """Test that doctors with no slots return None"""
+        row = store.find_by_name("Rajeev Kumar")[0]
+        assert index.next_slot(row, 0) is None
+
+    def test_time_before_the_epoch(self, store, index):
+        """Test that a negative time finds each doctor's own first slot, not a neighbour's"""
+        for row in range(len(store)):
+            idx = int(index.first_slot_after(np.array([row]), -1)[0])
+            assert idx == -1 or index.rows[idx] == row
+        row = store.find_by_name("Sunita Rao")[0]
+        assert index.next_slot(row, -1)["start"] == "2026-03-02T10:00:00Z"
+        assert index.next_slot(store.find_by_name("Rajeev Kumar")[0], -1) is None
+
+    def test_time_past_the_range(self, store, index):
+        """Test that times too large for the packed key find no slot instead of another row's"""
+        rows = np.arange(len(store))
+        assert (index.first_slot_after(rows, MAX_TIME + 1) == -1).all()
+        assert (index.first_slot_after(rows, 1 << 40) == -1).all()
+        assert index.earliest(1 << 40) is None
+
+    def test_vectorized_lookup(self, store, index):
+        """Test that many doctors are resolved in one call"""
+        rows = np.arange(len(store))
+        idx = index.first_slot_after(rows, at(2, 0))
+        assert (idx >= 0).sum() == 3
+
+    def test_earliest_overall(self, index):
+        """Test the global earliest slot"""
+        result = index.earliest(at(2, 0))
+        assert result["doctor"]["name"] == "Dr. Meera Sharma"
+        assert result["city"] == "Bangalore"
+
+    def test_earliest_within_radius(self, index):
+        """Test that the radius filter excludes far doctors"""
+        result = index.earliest(at(2, 0), origin=CITY_COORDINATES["Hyderabad"], radius_km=50)
+        assert result["doctor"]["name"] == "Dr. Priya Reddy"
+        assert result["distance_km"] < 50
+
+    def test_earliest_pcos_specialist(self, index):
+        """Test the specialty filter"""
+        result = index.earliest(
+            at(2, 0), origin=CITY_COORDINATES["Hyderabad"], radius_km=50, specialty="pcos_specialist"
+        )
+        assert result["doctor"]["name"] == "Dr. Sunita Rao"
+        assert result["slot"] == {"start": "2026-03-02T10:00:00Z", "end": "2026-03-02T10:30:00Z"}
+
+    def test_earliest_among_rows(self, store, index):
+        """Test that an explicit candidate list restricts the search"""
+        rows = [store.find_by_name("Sunita Rao")[0], store.find_by_name("Priya Reddy")[0]]
+        assert index.earliest(at(2, 0), rows=rows)["doctor"]["name"] == "Dr. Priya Reddy"
+
+    def test_earliest_scans_past_other_doctors(self, store):
+        """Test that a match far behind other doctors' slots is still found"""
+        other, wanted = store.find_by_name("Meera Sharma")[0], store.find_by_name("Sunita Rao")[0]
+        slots = [(other, at(2, 0) + 60 * i, at(2, 0) + 60 * i + 30) for i in range(1000)]
+        index = SlotIndex(store, slots + [(wanted, at(5, 0), at(5, 1))])
+        assert index.earliest(at(2, 0), specialty="pcos_specialist", rows=[wanted])["doctor_id"] == wanted
+        assert index.earliest(at(2, 0))["doctor_id"] == other
+
+    def test_earliest_none(self, index):
+        """Test that no matching slot returns None"""
+        assert index.earliest(at(5, 0)) is None
+
+    def test_attach_to_doctors(self, store, index):
+        """Test attaching next slots to materialized doctors by store row"""
+        rows = [store.find_by_name("Sunita Rao")[0], store.find_by_name("Rajeev Kumar")[0]]
+        doctors = [{"name": "Dr. Sunita Rao"}, {"name": "Dr. Rajeev Kumar"}]
+        attached = index.attach_to(doctors, at(2, 0), rows)
+        assert attached[0]["next_available_slot"]["start"] == "2026-03-02T10:00:00Z"
+        assert attached[1]["next_available_slot"] is None
+        assert "next_available_slot" not in doctors[0]
+
+    def test_attach_to_namesakes(self, store):
+        """Test that two doctors with the same name get their own slots, not one shared by name"""
+        first, second = store.find_by_name("Sunita Rao")[0], store.find_by_name("Priya Reddy")[0]
+        index = SlotIndex(store, [(first, at(2, 9), at(2, 10)), (second, at(3, 9), at(3, 10))])
+        doctors = [{"id": first, "name": "Dr. Same"}, {"id": second, "name": "Dr. Same"}]
+        starts = [d["next_available_slot"]["start"] for d in index.attach_to(doctors, at(1, 0))]
+        assert starts == ["2026-03-02T09:00:00Z", "2026-03-03T09:00:00Z"]
+        assert index.attach_to([{"name": "Dr. Sunita Rao"}], at(1, 0))[0]["next_available_slot"] is None
+
+    def test_filtered_queries_match_a_full_scan(self, store):
+        """Test that the grid and per-specialty searches agree with checking every slot"""
+        feed = generate_demo_feed(store, start=datetime(2026, 3, 2, tzinfo=timezone.utc))
+        index = SlotIndex.from_feed(store, feed)
+        distance = {}
+        for city, origin in list(CITY_COORDINATES.items())[:6]:
+            for radius in (10, 300, 1500, 30000):
+                for specialty in (None, "pcos_specialist", "gynecologist"):
+                    after = at(3, 12)
+                    best = None
+                    for idx in range(len(index)):
+                        row = int(index.rows[idx])
+                        if index.starts[idx] < after or (specialty and index.category[row] != specialty):
+                            continue
+                        key = (row, origin)
+                        if key not in distance:
+                            lat, lon = store.lat[[row]], store.lon[[row]]
+                            distance[key] = float(haversine_km(lat, lon, origin)[0])
+                        if not distance[key] <= radius:
+                            continue
+                        if best is None or (index.starts[idx], row) < best:
+                            best = (int(index.starts[idx]), row)
+                    result = index.earliest(after, origin=origin, radius_km=radius, specialty=specialty)
+                    found = None if result is None else (parse_time(result["slot"]["start"]), result["doctor_id"])
+                    assert found == best, (city, radius, specialty)
+
+    def test_specialty_without_radius_uses_its_own_slots(self, store):
+        """Test that a specialty-only query finds its first slot behind many others of another specialty"""
+        wanted = store.find_by_name("Sunita Rao")[0]
+        category = SlotIndex(store, []).category
+        others = [row for row in range(len(store)) if category[row] != category[wanted]][:5]
+        slots = [(row, at(2, 0) + 60 * i, at(2, 0) + 60 * i + 30) for row in others for i in range(200)]
+        index = SlotIndex(store, slots + [(wanted, at(5, 0), at(5, 1))])
+        assert index.earliest(at(2, 0), specialty=category[wanted])["doctor_id"] == wanted
+        assert index.earliest(at(2, 0))["doctor_id"] in others
+        assert index.earliest(at(2, 0), specialty="no_such_category") is None
+
+    def test_demo_feed_only_weekdays(self, store):
+        """Test that the stand-in feed produces weekday slots"""
+        feed = generate_demo_feed(store, start=datetime(2026, 3, 2, tzinfo=timezone.utc), days=7)
+        index = SlotIndex.from_feed(store, feed)
+        assert len(index) > 0
+        weekdays = {datetime.fromisoformat(s["start"]).weekday() for s in feed["slots"]}
+        assert weekdays <= {0, 1, 2, 3, 4}
+
+    def test_time_round_trip(self):
+        """Test ISO parsing and formatting"""
+        assert format_time(parse_time("2026-03-02T10:00:00Z")) == "2026-03-02T10:00:00Z"
+        assert parse_time("2026-03-02T15:30:00+05:30") == parse_time("2026-03-02T10:00:00Z")
+
+
+class TestAppointmentEndpoint:
+    """Tests for /api/appointments/earliest"""
+
+    @pytest.fixture
+    def client(self, monkeypatch, feed):
+        import app as app_module
+
+        monkeypatch.setattr(
+            app_module, "slot_index", SlotIndex.from_feed(app_module.doctor_recommender.store, feed)
+        )
+        app_module.app.config["TESTING"] = True
+        with app_module.app.test_client() as client:
+            yield client
+
+    def test_earliest_endpoint(self, client):
+        """Test a radius + specialty query"""
+        response = client.get(
+            "/api/appointments/earliest?city=hyderabad&radius_km=50"
+            "&specialty=pcos_specialist&after=2026-03-02T00:00:00Z"
+        )
+        data = json.loads(response.data)
+        assert response.status_code == 200
+        assert data["earliest"]["doctor"]["name"] == "Dr. Sunita Rao"
+
+    @pytest.mark.parametrize("after", ["1960-01-01", "-5", "99999999999999"])
+    def test_after_out_of_range(self, client, after):
+        """Test that times before 1970 or too large for the index are rejected"""
+        assert client.get(f"/api/appointments/earliest?after={after}").status_code == 400
+
+    def test_invalid_specialty(self, client):
+        """Test that unknown specialties are rejected"""
+        response = client.get("/api/appointments/earliest?specialty=dentist")
+        assert response.status_code == 400
+
+    def test_radius_needs_location(self, client):
+        """Test that a radius without a known location is rejected"""
+        response = client.get("/api/appointments/earliest?city=Atlantis&radius_km=10")
+        assert response.status_code == 400
+
+    def test_not_configured(self, client, monkeypatch):
+        """Test 503 when no feed is loaded"""
+        import app as app_module
+
+        monkeypatch.setattr(app_module, "slot_index", None)
+        assert client.get("/api/appointments/earliest").status_code == 503
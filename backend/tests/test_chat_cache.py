@@ -0,0 +1,179 @@
+"""
+PCOS Smart Assistant - Chat Cache Tests
+Tests for the chat response cache and its use in /api/ai/chat
+"""
+
+import json
+import pytest
+import sys
+import os
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SKIP_SUPABASE", "1")
+
+from ai_providers import ProviderChain, ProviderClient
+from chat_cache import ChatCache, normalize_text
+
+
+def chat(*contents, temperature=0.3, model="m", system=None):
+    messages = [{"role": "system", "content": system}] if system else []
+    roles = ["user", "assistant"]
+    messages += [{"role": roles[i % 2], "content": text} for i, text in enumerate(contents)]
+    return {"model": model, "temperature": temperature, "messages": messages}
+
+
+ANSWER = {"choices": [{"message": {"role": "assistant", "content": "PCOS is ..."}}], "usage": {"total_tokens": 500}}
+
+
+class FakeClock:
+    """Manually advanced wall clock"""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestKeys:
+    """Tests for normalization and cache eligibility"""
+
+    def test_normalization(self):
+        """Test that case, spacing and trailing punctuation are ignored"""
+        assert normalize_text("  What   is PCOS?? ") == normalize_text("what is pcos")
+
+    def test_equivalent_questions_share_a_key(self):
+        """Test that normalized questions map to one key"""
+        cache = ChatCache()
+        assert cache.key(chat("What is PCOS?")) == cache.key(chat("what is  pcos"))
+
+    def test_model_temperature_and_system_prompt_are_part_of_the_key(self):
+        """Test that generation settings separate entries"""
+        cache = ChatCache()
+        base = cache.key(chat("what is pcos"))
+        assert cache.key(chat("what is pcos", model="other")) != base
+        assert cache.key(chat("what is pcos", temperature=0.2)) != base
+        assert cache.key(chat("what is pcos", system="Be brief")) != base
+
+    def test_hot_requests_are_not_cached(self):
+        """Test that high temperatures bypass the cache"""
+        assert ChatCache(max_temperature=0.5).key(chat("what is pcos", temperature=0.9)) is None
+
+    def test_frontend_temperature_is_not_cached_by_default(self):
+        """Test that the chatbot's default temperature of 0.7 bypasses the cache unless allowed"""
+        assert ChatCache().key(chat("what is pcos", temperature=0.7)) is None
+        assert ChatCache().key(chat("what is pcos", temperature=0.3)) is not None
+        assert ChatCache(max_temperature=0.7).key(chat("what is pcos", temperature=0.7)) is not None
+
+    def test_follow_ups_are_not_cached(self):
+        """Test that conversations longer than max_turns bypass the cache"""
+        cache = ChatCache(max_turns=1)
+        assert cache.key(chat("what is pcos", "PCOS is ...", "tell me more")) is None
+        assert ChatCache(max_turns=3).key(chat("what is pcos", "PCOS is ...", "tell me more")) is not None
+
+    def test_multimodal_and_tools_are_not_cached(self):
+        """Test that non-text content, tools and n>1 bypass the cache"""
+        cache = ChatCache()
+        image = {"model": "m", "temperature": 0, "messages": [{"role": "user", "content": [{"type": "image_url"}]}]}
+        assert cache.key(image) is None
+        assert cache.key({**chat("hi"), "tools": [{"type": "function"}]}) is None
+        assert cache.key({**chat("hi"), "n": 2}) is None
+
+
+class TestCache:
+    """Tests for storage, expiry and accounting"""
+
+    def test_hit_and_savings(self):
+        """Test that hits are counted and priced"""
+        cache = ChatCache(price_per_1k_tokens=0.01)
+        key = cache.key(chat("what is pcos"))
+        assert cache.get(key) is None
+        cache.set(key, ANSWER)
+        assert cache.get(key) == ANSWER
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["hit_rate"] == 0.5
+        assert stats["tokens_saved"] == 500
+        assert stats["dollars_saved"] == 0.005
+
+    def test_ttl(self):
+        """Test that entries expire"""
+        clock = FakeClock()
+        cache = ChatCache(ttl=60, clock=clock)
+        key = cache.key(chat("what is pcos"))
+        cache.set(key, ANSWER)
+        clock.now += 61
+        assert cache.get(key) is None
+
+    def test_lru_bound(self):
+        """Test that the memory level is bounded"""
+        cache = ChatCache(maxsize=2)
+        for question in ("a", "b", "c"):
+            cache.set(cache.key(chat(question)), ANSWER)
+        assert cache.stats()["size"] == 2
+        assert cache.get(cache.key(chat("a"))) is None
+
+    def test_sqlite_persistence(self, tmp_path):
+        """Test that a new cache on the same file sees earlier answers"""
+        path = str(tmp_path / "chat.db")
+        first = ChatCache(path=path)
+        key = first.key(chat("what is pcos"))
+        first.set(key, ANSWER)
+
+        second = ChatCache(path=path)
+        assert second.get(key) == ANSWER
+        assert second.stats()["persistent"] is True
+
+    def test_hits_are_fast(self):
+        """Test that a memory hit takes well under a millisecond"""
+        cache = ChatCache()
+        payload = chat("what is pcos")
+        cache.set(cache.key(payload), ANSWER)
+        started = time.perf_counter()
+        for _ in range(1000):
+            cache.get(cache.key(payload))
+        assert (time.perf_counter() - started) / 1000 < 0.001
+
+
+class TestChatEndpoint:
+    """Tests for the cache in /api/ai/chat"""
+
+    def test_second_request_is_served_from_cache(self, fake_provider, monkeypatch):
+        """Test that a repeated question skips the provider"""
+        import app as app_module
+
+        client = ProviderClient("fake", fake_provider.url, "FAKE_PROVIDER_KEY")
+        monkeypatch.setattr(app_module, "ai_chain", ProviderChain([client]))
+        monkeypatch.setattr(app_module, "chat_cache", ChatCache())
+        monkeypatch.setenv("FAKE_PROVIDER_KEY", "secret")
+        monkeypatch.setenv("SKIP_RATE_LIMIT", "1")
+        test_client = app_module.app.test_client()
+
+        first = test_client.post("/api/ai/chat", data=json.dumps(chat("What is PCOS?")), content_type="application/json")
+        second = test_client.post("/api/ai/chat", data=json.dumps(chat("what is pcos")), content_type="application/json")
+        streamed = test_client.post(
+            "/api/ai/chat", data=json.dumps({**chat("what is pcos"), "stream": True}), content_type="application/json"
+        )
+
+        assert len(fake_provider.requests) == 1
+        assert "X-Cache" not in first.headers
+        assert second.headers["X-Cache"] == "HIT"
+        assert json.loads(second.data) == json.loads(first.data)
+        assert streamed.mimetype == "text/event-stream"
+        assert fake_provider.reply.split(" ")[0].encode() in streamed.data
+
+    def test_local_fallback_is_not_cached(self, monkeypatch):
+        """Test that only provider answers are stored"""
+        import app as app_module
+
+        cache = ChatCache()
+        monkeypatch.setattr(app_module, "ai_chain", ProviderChain([]))
+        monkeypatch.setattr(app_module, "chat_cache", cache)
+        monkeypatch.setenv("SKIP_RATE_LIMIT", "1")
+        app_module.app.test_client().post(
+            "/api/ai/chat", data=json.dumps(chat("what is pcos")), content_type="application/json"
+        )
+        assert cache.stats()["stores"] == 0
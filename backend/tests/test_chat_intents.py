@@ -0,0 +1,159 @@
+"""
+PCOS Smart Assistant - Chat Intent Tests
+Tests for answering computable chat questions with the analysis engine
+"""
+
+import importlib
+import json
+import pytest
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+os.environ.setdefault("SKIP_SUPABASE", "1")
+
+from ai_providers import ProviderChain, ProviderClient
+from analysis_engine import PCOSAnalyzer
+from chat_intents import ChatIntents, Intent, extract_intent
+
+
+def ask(text, **extra):
+    return {"model": "m", "messages": [{"role": "user", "content": text}], **extra}
+
+
+class TestExtraction:
+    """Tests for intent and slot extraction"""
+
+    @pytest.mark.parametrize(
+        "text,intent",
+        [
+            ("Is a 45-day cycle normal?", Intent("cycle", {"cycle_length": 45})),
+            ("My cycle is 40 days long, is that normal?", Intent("cycle", {"cycle_length": 40})),
+            ("I get my period every 24 days, is that ok", Intent("cycle", {"cycle_length": 24})),
+            ("my period lasts 9 days, is that too long", Intent("cycle", {"period_length": 9})),
+            ("What's my BMI at 70kg and 160cm?", Intent("bmi", {"weight": 70.0, "height": 160.0})),
+            ("bmi for 60 kg and 1.65 m", Intent("bmi", {"weight": 60.0, "height": 165.0})),
+            ("my bmi at 150 lbs and 5'4\"", Intent("bmi", {"weight": 68.0, "height": 162.6})),
+            (
+                "What's my risk with acne and irregular periods?",
+                Intent("risk", {"symptoms": ["irregular_cycles", "acne"]}),
+            ),
+            (
+                "chances of pcos with a 50 day cycle and facial hair, I'm 30",
+                Intent("risk", {"symptoms": ["hirsutism"], "age": 30, "cycle_length": 50}),
+            ),
+        ],
+    )
+    def test_recognized(self, text, intent):
+        """Test that computable questions and their slots are recognized"""
+        assert extract_intent(text) == intent
+
+    @pytest.mark.parametrize(
+        "text",
+        [
+            "What is PCOS?",
+            "what is bmi",
+            "what's my bmi?",
+            "Can I get pregnant with a 45 day cycle?",
+            "what's my risk of diabetes",
+            "is a 400 day cycle normal",
+        ],
+    )
+    def test_forwarded(self, text):
+        """Test that open questions and missing or implausible slots are left to the providers"""
+        assert extract_intent(text) is None
+
+    def test_negated_symptoms_are_ignored(self):
+        """Test that "no acne" does not count as acne"""
+        intent = extract_intent("what are my chances with no acne but hair loss")
+        assert intent.slots["symptoms"] == ["hair_loss"]
+
+
+class TestAnswers:
+    """Tests for answers computed by PCOSAnalyzer"""
+
+    @pytest.fixture
+    def intents(self):
+        return ChatIntents(PCOSAnalyzer(None))
+
+    def content(self, result):
+        return result["choices"][0]["message"]["content"]
+
+    def test_cycle(self, intents):
+        """Test that the cycle answer uses the step-2 findings"""
+        result = intents.answer(ask("Is a 45-day cycle normal?"))
+        assert self.content(result).startswith("Cycle length: 45 days (longer than typical).")
+        assert result["intent"] == {"name": "cycle", "slots": {"cycle_length": 45}}
+
+    def test_bmi(self, intents):
+        """Test that the BMI answer uses the step-1 findings"""
+        result = intents.answer(ask("what's my BMI at 70kg and 160cm?"))
+        assert self.content(result).startswith("BMI for 70 kg and 160 cm: 27.3 (Overweight).")
+
+    def test_risk_matches_full_analysis(self, intents):
+        """Test that the risk answer agrees with analyze() and states its assumptions"""
+        expected = PCOSAnalyzer(None).analyze(
+            {"symptoms": ["irregular_cycles", "acne"], "cycle_length": 28, "period_length": 5, "age": 25}
+        )
+        content = self.content(intents.answer(ask("what's my risk with acne and irregular periods?")))
+        assert f"is {expected['risk_level']} ({expected['risk_score']}/100)" in content
+        assert "assumes a 28-day cycle, 5-day periods and age 25" in content
+
+    def test_only_the_last_user_message_counts(self, intents):
+        """Test that an assistant turn or earlier question is not answered"""
+        payload = {"messages": [
+            {"role": "user", "content": "Is a 45-day cycle normal?"},
+            {"role": "assistant", "content": "..."},
+            {"role": "user", "content": "thanks, what else should I know?"},
+        ]}
+        assert intents.answer(payload) is None
+
+    def test_stats(self, intents):
+        """Test answered and forwarded counters"""
+        intents.answer(ask("Is a 45-day cycle normal?"))
+        intents.answer(ask("What is PCOS?"))
+        assert intents.stats() == {"answered": {"cycle": 1}, "forwarded": 1, "answer_rate": 0.5}
+
+
+class TestChatEndpoint:
+    """Tests for the short-circuit in /api/ai/chat"""
+
+    @pytest.fixture(params=["app", "api.index"])
+    def module(self, request, fake_provider, monkeypatch):
+        module = importlib.import_module(request.param)
+        client = ProviderClient("fake", fake_provider.url, "FAKE_PROVIDER_KEY")
+        monkeypatch.setattr(module, "ai_chain", ProviderChain([client]))
+        monkeypatch.setattr(module, "chat_intents", ChatIntents(PCOSAnalyzer(None)))
+        monkeypatch.setenv("FAKE_PROVIDER_KEY", "secret")
+        monkeypatch.setenv("SKIP_RATE_LIMIT", "1")
+        return module
+
+    def post(self, module, payload):
+        return module.app.test_client().post("/api/ai/chat", data=json.dumps(payload), content_type="application/json")
+
+    def test_computable_question_skips_the_provider(self, module, fake_provider):
+        """Test that a recognized question is answered locally"""
+        response = self.post(module, ask("Is a 45-day cycle normal?"))
+        assert response.status_code == 200
+        assert response.headers["X-Local-Intent"] == "cycle"
+        assert "longer than typical" in json.loads(response.data)["choices"][0]["message"]["content"]
+        assert fake_provider.requests == []
+
+    def test_streamed_answer(self, module, fake_provider):
+        """Test that a local answer can be streamed"""
+        response = self.post(module, ask("what's my BMI at 70kg and 160cm?", stream=True))
+        assert response.mimetype == "text/event-stream"
+        assert b"[DONE]" in response.data
+        assert fake_provider.requests == []
+
+    def test_other_questions_are_forwarded(self, module, fake_provider):
+        """Test that unrecognized questions still reach the provider"""
+        response = self.post(module, ask("What is PCOS?"))
+        assert "X-Local-Intent" not in response.headers
+        assert len(fake_provider.requests) == 1
@@ -0,0 +1,214 @@
+"""
+PCOS Smart Assistant - Conversation Memory Tests
+Tests for server-side chat history keyed by conversation id
+"""
+
+import json
+import pytest
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SKIP_SUPABASE", "1")
+
+from ai_providers import ProviderChain, ProviderClient, completion_to_sse
+from chat_memory import ConversationStore
+from chat_service import StreamedReply, plan_chat
+
+
+def user(text):
+    return {"role": "user", "content": text}
+
+
+def assistant(text):
+    return {"role": "assistant", "content": text}
+
+
+def answer(text):
+    return {"choices": [{"message": assistant(text)}]}
+
+
+class TestConversationStore:
+    """Tests for the per-conversation ring buffer"""
+
+    def test_new_conversation_gets_an_id(self):
+        """Test that a missing id starts an empty conversation under a fresh id"""
+        store = ConversationStore()
+        conversation = store.resume(None)
+        assert conversation.history == [] and not conversation.resumed
+        assert len(conversation.id) >= 16
+        assert store.stats()["started"] == 1
+
+    def test_turns_are_resumed(self):
+        """Test that appended turns come back, oldest first"""
+        store = ConversationStore()
+        conversation_id = store.resume(None).id
+        store.append(conversation_id, [user("hi"), assistant("hello")])
+        store.append(conversation_id, [user("what is PCOS?")])
+        conversation = store.resume(conversation_id)
+        assert conversation.resumed
+        assert conversation.history == [user("hi"), assistant("hello"), user("what is PCOS?")]
+
+    def test_unknown_ids_are_not_adopted(self):
+        """Test that made-up, malformed or expired ids get a fresh conversation"""
+        store = ConversationStore()
+        for conversation_id in ("x" * 20, "bad id!", 42):
+            conversation = store.resume(conversation_id)
+            assert conversation.id != conversation_id and not conversation.resumed
+        assert store.stats()["unknown"] == 3
+
+    def test_ring_buffer_keeps_the_newest_turns(self):
+        """Test that a conversation holds at most ``max_turns`` messages"""
+        store = ConversationStore(max_turns=3)
+        conversation_id = store.resume(None).id
+        kept = store.append(conversation_id, [user(str(i)) for i in range(5)])
+        assert kept == 3
+        assert store.resume(conversation_id).history == [user("2"), user("3"), user("4")]
+        assert store.stats()["turns_dropped"] == 2
+
+    def test_character_cap(self):
+        """Test that old turns are dropped to stay under ``max_chars``, keeping at least the newest"""
+        store = ConversationStore(max_chars=10)
+        conversation_id = store.resume(None).id
+        store.append(conversation_id, [user("aaaaaa"), user("bbbbbb")])
+        assert store.resume(conversation_id).history == [user("bbbbbb")]
+        store.append(conversation_id, [user("c" * 50)])
+        assert store.resume(conversation_id).history == [user("c" * 50)]
+
+    def test_ttl_and_lru_eviction(self):
+        """Test that idle conversations expire and the least recently used are evicted"""
+        now = [1000.0]
+        store = ConversationStore(max_conversations=2, ttl=60, clock=lambda: now[0])
+        ids = [store.resume(None).id for _ in range(3)]
+        for conversation_id in ids:
+            store.append(conversation_id, [user("hi")])
+        assert not store.resume(ids[0]).resumed
+        assert store.resume(ids[2]).resumed
+        now[0] += 61
+        assert not store.resume(ids[2]).resumed
+        assert store.stats()["evictions"] == 1
+
+    def test_sqlite_persistence(self, tmp_path):
+        """Test that conversations survive a new store on the same file"""
+        path = str(tmp_path / "memory.sqlite3")
+        first = ConversationStore(path=path)
+        conversation_id = first.resume(None).id
+        first.append(conversation_id, [user("hi"), assistant("hello")])
+        second = ConversationStore(path=path)
+        assert second.resume(conversation_id).history == [user("hi"), assistant("hello")]
+        assert second.stats()["persistent"]
+
+    def test_workers_share_turns_through_sqlite(self, tmp_path):
+        """Test that stores on one file (two workers) see and keep each other's turns"""
+        path = str(tmp_path / "memory.sqlite3")
+        first, second = ConversationStore(path=path), ConversationStore(path=path)
+        conversation_id = first.resume(None).id
+        first.append(conversation_id, [user("1"), assistant("r1")])
+        second.append(conversation_id, [user("2"), assistant("r2")])
+        first.append(conversation_id, [user("3"), assistant("r3")])
+        expected = [user("1"), assistant("r1"), user("2"), assistant("r2"), user("3"), assistant("r3")]
+        assert first.resume(conversation_id).history == expected
+        assert second.resume(conversation_id).history == expected
+
+
+class TestPlan:
+    """Tests for expanding and storing conversations in plan_chat"""
+
+    def test_history_is_put_before_the_new_message(self):
+        """Test that the forwarded payload holds system prompt, history and the new message"""
+        store = ConversationStore()
+        conversation_id = store.resume(None).id
+        store.append(conversation_id, [user("hi"), assistant("hello")])
+        payload = {
+            "model": "m",
+            "conversation_id": conversation_id,
+            "messages": [{"role": "system", "content": "Be brief"}, user("and PCOS?")],
+        }
+        plan = plan_chat(payload, memory=store)
+        assert "conversation_id" not in plan.payload
+        assert plan.payload["messages"] == [
+            {"role": "system", "content": "Be brief"}, user("hi"), assistant("hello"), user("and PCOS?"),
+        ]
+        assert plan.headers["X-Conversation-Id"] == conversation_id
+
+    def test_payload_without_conversation_is_untouched(self):
+        """Test that clients sending full history keep working without memory"""
+        store = ConversationStore()
+        payload = {"model": "m", "messages": [user("hi")]}
+        plan = plan_chat(payload, memory=store)
+        assert plan.payload == payload and plan.conversation is None
+        assert store.stats()["started"] == 0
+
+
+class TestStreamedReply:
+    """Tests for collecting the answer text of a relayed stream"""
+
+    def test_collects_split_events(self):
+        """Test that deltas split across chunk boundaries are joined"""
+        data = b"".join(completion_to_sse({"id": "x", "choices": [{"message": assistant("one two three four")}]}))
+        reply = StreamedReply()
+        for start in range(0, len(data), 7):
+            reply.feed(data[start:start + 7])
+        assert reply.done
+        assert reply.body()["choices"][0]["message"]["content"] == "one two three four"
+
+
+class TestChatEndpoint:
+    """Tests for conversation ids on the Flask /api/ai/chat"""
+
+    @pytest.fixture
+    def app_module(self, fake_provider, monkeypatch):
+        import app as app_module
+
+        monkeypatch.setenv("FAKE_PROVIDER_KEY", "secret")
+        monkeypatch.setenv("SKIP_RATE_LIMIT", "1")
+        client = ProviderClient("fake", fake_provider.url, "FAKE_PROVIDER_KEY")
+        monkeypatch.setattr(app_module, "ai_chain", ProviderChain([client]))
+        monkeypatch.setattr(app_module, "chat_memory", ConversationStore())
+        monkeypatch.setattr(app_module, "chat_intents", None)
+        monkeypatch.setattr(app_module, "chat_cache", None)
+        return app_module
+
+    def post(self, app_module, payload):
+        return app_module.app.test_client().post(
+            "/api/ai/chat", data=json.dumps(payload), content_type="application/json"
+        )
+
+    def test_client_sends_only_the_new_message(self, app_module, fake_provider):
+        """Test that the second turn reaches the provider with the first turn's history"""
+        first = self.post(app_module, {"model": "m", "conversation_id": None, "messages": [user("hi")]})
+        conversation = first.get_json()["conversation"]
+        assert first.headers["X-Conversation-Id"] == conversation["id"]
+        assert conversation == {"id": conversation["id"], "turns": 2, "resumed": False}
+
+        second = self.post(app_module, {"model": "m", "conversation_id": conversation["id"], "messages": [user("more")]})
+        assert second.get_json()["conversation"]["resumed"]
+        assert fake_provider.requests[1]["messages"] == [user("hi"), assistant(fake_provider.reply), user("more")]
+        assert "conversation_id" not in fake_provider.requests[1]
+
+    def test_streamed_answer_is_stored(self, app_module, fake_provider):
+        """Test that a streamed answer is stored once the stream completes"""
+        response = self.post(
+            app_module, {"model": "m", "conversation_id": None, "messages": [user("hi")], "stream": True}
+        )
+        response.get_data()
+        conversation_id = response.headers["X-Conversation-Id"]
+        history = app_module.chat_memory.resume(conversation_id).history
+        assert history == [user("hi"), assistant("".join(fake_provider.stream_tokens))]
+
+    def test_fallback_answer_is_stored(self, app_module, fake_provider):
+        """Test that the local answer given when providers fail becomes part of the conversation"""
+        fake_provider.status = 503
+        response = self.post(app_module, {"model": "m", "conversation_id": None, "messages": [user("hi")]})
+        body = response.get_json()
+        assert body["id"] == "local-ai-response"
+        assert body["conversation"]["turns"] == 2
+
+    def test_metrics(self, app_module, admin_headers):
+        """Test that conversation memory counters are reported in /api/metrics"""
+        self.post(app_module, {"model": "m", "conversation_id": None, "messages": [user("hi")]})
+        metrics = app_module.app.test_client().get("/api/metrics", headers=admin_headers).get_json()
+        assert metrics["chat_memory"]["started"] == 1
+        assert metrics["chat_memory"]["turns_appended"] == 2
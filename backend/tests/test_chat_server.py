@@ -0,0 +1,278 @@
+"""
+PCOS Smart Assistant - Async Chat Server Tests
+Tests for the asyncio provider chain and the aiohttp /api/ai/chat server
+"""
+
+import asyncio
+import json
+import pytest
+import subprocess
+import sys
+import os
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SKIP_SUPABASE", "1")
+
+pytest.importorskip("aiohttp")
+from aiohttp.test_utils import TestClient, TestServer  # noqa: E402
+
+from ai_providers import ProviderChain, ProviderClient, ProviderError  # noqa: E402
+from analysis_engine import PCOSAnalyzer  # noqa: E402
+from chat_memory import ConversationStore  # noqa: E402
+from chat_intents import ChatIntents  # noqa: E402
+from chat_server import create_app  # noqa: E402
+from single_flight import SingleFlight  # noqa: E402
+
+
+def ask(text, **extra):
+    return {"model": "m", "messages": [{"role": "user", "content": text}], **extra}
+
+
+def local_answer(payload):
+    return {"id": "local-ai-response", "choices": [{"message": {"role": "assistant", "content": "local"}}]}
+
+
+@pytest.fixture
+def chain(fake_provider, monkeypatch):
+    monkeypatch.setenv("FAKE_PROVIDER_KEY", "secret")
+    return ProviderChain([ProviderClient("fake", fake_provider.url, "FAKE_PROVIDER_KEY")])
+
+
+def run_client(app, scenario):
+    """Run ``scenario(client)`` against ``app`` on a fresh event loop"""
+
+    async def main():
+        async with TestClient(TestServer(app)) as client:
+            return await scenario(client)
+
+    return asyncio.run(main())
+
+
+class TestAsyncChain:
+    """Tests for ProviderChain.acomplete and astream"""
+
+    def test_fails_over(self, fake_provider, second_provider, monkeypatch):
+        """Test that a failing provider is skipped and counted like on the blocking path"""
+        monkeypatch.setenv("FAKE_PROVIDER_KEY", "secret")
+        fake_provider.status = 500
+        chain = ProviderChain([
+            ProviderClient("first", fake_provider.url, "FAKE_PROVIDER_KEY"),
+            ProviderClient("second", second_provider.url, "FAKE_PROVIDER_KEY"),
+        ], routing="ordered")
+
+        async def main():
+            try:
+                return await chain.acomplete(ask("hi"))
+            finally:
+                await chain.aclose()
+
+        name, body = asyncio.run(main())
+        assert name == "second"
+        assert body["choices"][0]["message"]["content"] == "second"
+        providers = chain.stats()["providers"]
+        assert providers["first"]["errors"] == 1
+        assert providers["second"]["wins"] == 1
+
+    def test_hedge_cancels_the_loser(self, fake_provider, second_provider, monkeypatch):
+        """Test that a slow provider is hedged and then cancelled rather than awaited"""
+        monkeypatch.setenv("FAKE_PROVIDER_KEY", "secret")
+        fake_provider.delay = 1.0
+        chain = ProviderChain([
+            ProviderClient("slow", fake_provider.url, "FAKE_PROVIDER_KEY"),
+            ProviderClient("fast", second_provider.url, "FAKE_PROVIDER_KEY"),
+        ], routing="ordered", hedge=True, hedge_delay=0.05)
+
+        async def main():
+            started = time.monotonic()
+            try:
+                return await chain.acomplete(ask("hi")), time.monotonic() - started
+            finally:
+                await chain.aclose()
+
+        (name, _), elapsed = asyncio.run(main())
+        assert name == "fast"
+        assert elapsed < 0.8
+        assert chain.stats()["providers"]["slow"]["cancelled"] == 1
+
+    def test_no_provider(self):
+        """Test that an unconfigured chain raises ProviderError"""
+        chain = ProviderChain([ProviderClient("none", "http://127.0.0.1:9", "UNSET_PROVIDER_KEY")])
+        with pytest.raises(ProviderError):
+            asyncio.run(chain.acomplete(ask("hi")))
+
+
+class TestChatServer:
+    """Tests for the aiohttp /api/ai/chat endpoint"""
+
+    def test_forwards_to_provider(self, chain, fake_provider):
+        """Test that a question is answered by the provider"""
+
+        async def scenario(client):
+            response = await client.post("/api/ai/chat", json=ask("What is PCOS?"))
+            return response.status, await response.json()
+
+        status, body = run_client(create_app(chain, local_answer), scenario)
+        assert status == 200
+        assert body["choices"][0]["message"]["content"] == fake_provider.reply
+        assert fake_provider.requests[0]["messages"] == ask("What is PCOS?")["messages"]
+
+    def test_shares_validation_and_intents(self, chain, fake_provider):
+        """Test that bad bodies are rejected and computable questions answered locally, as in Flask"""
+        app = create_app(chain, local_answer, intents=ChatIntents(PCOSAnalyzer(None)))
+
+        async def scenario(client):
+            missing = await client.post("/api/ai/chat", json={"messages": []})
+            not_json = await client.post("/api/ai/chat", data="hello")
+            intent = await client.post("/api/ai/chat", json=ask("Is a 45-day cycle normal?"))
+            return missing.status, not_json.status, intent.headers.get("X-Local-Intent")
+
+        assert run_client(app, scenario) == (400, 400, "cycle")
+        assert fake_provider.requests == []
+
+    def test_local_fallback(self, fake_provider, chain):
+        """Test that the fallback answers when every provider fails"""
+        fake_provider.status = 503
+
+        async def scenario(client):
+            response = await client.post("/api/ai/chat", json=ask("What is PCOS?"))
+            return await response.json()
+
+        assert run_client(create_app(chain, local_answer), scenario)["id"] == "local-ai-response"
+
+    def test_streams_chunks(self, chain, fake_provider):
+        """Test that a provider stream is relayed as server-sent events"""
+
+        async def scenario(client):
+            response = await client.post("/api/ai/chat", json=ask("What is PCOS?", stream=True))
+            return response.content_type, await response.text()
+
+        content_type, text = run_client(create_app(chain, local_answer), scenario)
+        assert content_type == "text/event-stream"
+        assert '"content": " stream"' in text
+        assert text.rstrip().endswith("data: [DONE]")
+
+    def test_concurrent_requests_overlap(self, chain, fake_provider):
+        """Test that slow upstream calls are awaited concurrently in one thread"""
+        fake_provider.delay = 0.3
+
+        async def scenario(client):
+            started = time.monotonic()
+            responses = await asyncio.gather(
+                *(client.post("/api/ai/chat", json=ask(f"question {i}")) for i in range(40))
+            )
+            return [r.status for r in responses], time.monotonic() - started
+
+        statuses, elapsed = run_client(create_app(chain, local_answer), scenario)
+        assert statuses == [200] * 40
+        assert elapsed < 3.0  # 40 x 0.3 s = 12 s if the calls were serialized
+
+    def test_identical_questions_are_coalesced(self, chain, fake_provider):
+        """Test that identical concurrent questions share one provider call and stream"""
+        fake_provider.delay = 0.2
+        app = create_app(chain, local_answer, flights=SingleFlight())
+
+        async def scenario(client):
+            buffered = await asyncio.gather(
+                *(client.post("/api/ai/chat", json=ask("What is PCOS?")) for _ in range(10))
+            )
+            streamed = await asyncio.gather(
+                *(client.post("/api/ai/chat", json=ask("What is PCOS?", stream=True)) for _ in range(5))
+            )
+            texts = [await response.text() for response in streamed]
+            return [r.headers.get("X-Coalesced") for r in buffered], texts
+
+        coalesced, texts = run_client(app, scenario)
+        assert coalesced.count("true") == 9
+        assert all(text.rstrip().endswith("data: [DONE]") for text in texts)
+        assert len(fake_provider.requests) == 2
+
+    def test_deadline_falls_back(self, chain, fake_provider):
+        """Test that the client's X-Request-Timeout bounds the provider wait"""
+        fake_provider.delay = 1.0
+
+        async def scenario(client):
+            started = time.monotonic()
+            response = await client.post(
+                "/api/ai/chat", json=ask("What is PCOS?"), headers={"X-Request-Timeout": "0.3"}
+            )
+            body = await response.json()
+            return response.headers.get("X-Deadline-Exceeded"), body["id"], time.monotonic() - started
+
+        marker, answer, elapsed = run_client(create_app(chain, local_answer), scenario)
+        assert (marker, answer) == ("true", "local-ai-response")
+        assert elapsed < 0.8
+
+    def test_conversation_memory(self, chain, fake_provider):
+        """Test that a streamed turn is stored and put before the next message"""
+        app = create_app(chain, local_answer, memory=ConversationStore())
+
+        async def scenario(client):
+            first = await client.post(
+                "/api/ai/chat", json=ask("hi", conversation_id=None, stream=True)
+            )
+            await first.text()
+            conversation_id = first.headers["X-Conversation-Id"]
+            second = await client.post("/api/ai/chat", json=ask("more", conversation_id=conversation_id))
+            return (await second.json())["conversation"]
+
+        conversation = run_client(app, scenario)
+        assert conversation["resumed"] and conversation["turns"] == 4
+        assert [m["content"] for m in fake_provider.requests[1]["messages"]] == [
+            "hi", "".join(fake_provider.stream_tokens), "more",
+        ]
+
+    def test_fallback_sees_the_remembered_conversation(self):
+        """Test that the buffered fallback gets the planned payload, as the stream path does"""
+        seen = []
+
+        def fallback(payload):
+            seen.append([m["content"] for m in payload["messages"]])
+            return local_answer(payload)
+
+        app = create_app(None, fallback, memory=ConversationStore())
+
+        async def scenario(client):
+            first = await client.post("/api/ai/chat", json=ask("hi", conversation_id=None))
+            conversation_id = first.headers["X-Conversation-Id"]
+            await client.post("/api/ai/chat", json=ask("more", conversation_id=conversation_id))
+
+        run_client(app, scenario)
+        assert seen == [["hi"], ["hi", "local", "more"]]
+
+    def test_blocking_limiter_does_not_stall_the_loop(self, chain, fake_provider, monkeypatch):
+        """Test that a slow (e.g. SQLite-backed) limiter runs off the event loop"""
+        monkeypatch.delenv("SKIP_RATE_LIMIT", raising=False)
+
+        class SlowLimiter:
+            def hit(self, budget, client, cost):
+                time.sleep(0.5)
+                return type("Result", (), {"allowed": True, "retry_after": 0})()
+
+            def charge(self, budget, client, cost):
+                pass
+
+        async def scenario(client):
+            chat = asyncio.ensure_future(client.post("/api/ai/chat", json=ask("What is PCOS?")))
+            await asyncio.sleep(0.05)
+            started = time.monotonic()
+            health = await client.get("/health")
+            elapsed = time.monotonic() - started
+            return health.status, elapsed, (await chat).status
+
+        status, elapsed, chat_status = run_client(create_app(chain, local_answer, limiter=SlowLimiter()), scenario)
+        assert (status, chat_status) == (200, 200)
+        assert elapsed < 0.3
+
+    def test_from_env_does_not_import_the_flask_app(self):
+        """Test that the server's components are built without importing app (and its background writers)"""
+        script = "import sys, chat_server; chat_server.from_env(); print('app' in sys.modules)"
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            capture_output=True, text=True, timeout=60, env={**os.environ, "SKIP_SUPABASE": "1"},
+        )
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.split()[-1] == "False"
@@ -0,0 +1,224 @@
+"""
+PCOS Smart Assistant - Request Deadline Tests
+Tests for sharing one request deadline across the AI provider fallback chain
+"""
+
+import asyncio
+import importlib
+import json
+import pytest
+import sys
+import os
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+os.environ.setdefault("SKIP_SUPABASE", "1")
+
+from ai_providers import Deadline, DeadlineExceeded, ProviderChain, ProviderClient
+from rate_limiter import BudgetedRateLimiter
+from single_flight import SingleFlight
+
+
+def ask(text, **extra):
+    return {"model": "m", "messages": [{"role": "user", "content": text}], **extra}
+
+
+@pytest.fixture
+def chain(fake_provider, second_provider, monkeypatch):
+    """Slow-capable first provider, second provider behind it"""
+    monkeypatch.setenv("FAKE_PROVIDER_KEY", "secret")
+    return ProviderChain([
+        ProviderClient("first", fake_provider.url, "FAKE_PROVIDER_KEY"),
+        ProviderClient("second", second_provider.url, "FAKE_PROVIDER_KEY"),
+    ], routing="ordered")
+
+
+class TestDeadline:
+    """Tests for the Deadline value"""
+
+    def test_remaining_counts_down(self):
+        """Test that the remaining time shrinks with the clock and never goes negative"""
+        now = [100.0]
+        deadline = Deadline(2.0, clock=lambda: now[0])
+        assert deadline.remaining() == 2.0
+        now[0] = 101.5
+        assert deadline.remaining() == 0.5
+        now[0] = 103.0
+        assert deadline.remaining() == 0.0
+        assert deadline.expired
+
+    def test_header_is_capped_by_config(self):
+        """Test that a client may shorten but not lengthen the configured deadline"""
+        assert Deadline.from_header("5", 25).seconds == 5
+        assert Deadline.from_header("60", 25).seconds == 25
+        assert Deadline.from_header("-1", 25).seconds == 0
+
+    def test_bad_header_is_ignored(self):
+        """Test that a missing or malformed header falls back to the configured deadline"""
+        for value in (None, "", "soon", "nan", "inf"):
+            assert Deadline.from_header(value, 25).seconds == 25
+
+
+class TestChain:
+    """Tests for deadlines on the blocking provider chain"""
+
+    def test_slow_provider_is_cut_at_the_deadline(self, chain, fake_provider, second_provider):
+        """Test that an attempt gets only the time left, and no provider starts after it"""
+        fake_provider.delay = 1.0
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            chain.complete(ask("hi"), Deadline(0.3))
+        assert time.monotonic() - started < 0.8
+        assert second_provider.requests == []
+        assert chain.stats()["deadlines_exceeded"] == 1
+
+    def test_failover_uses_the_time_left(self, chain, fake_provider):
+        """Test that a provider failing inside the deadline still fails over"""
+        fake_provider.status = 500
+        name, body = chain.complete(ask("hi"), Deadline(5.0))
+        assert name == "second"
+
+    def test_expired_deadline_sends_nothing(self, chain, fake_provider, second_provider):
+        """Test that no request goes out, and no breaker is charged, once the deadline passed"""
+        with pytest.raises(DeadlineExceeded):
+            chain.complete(ask("hi"), Deadline(0.0))
+        assert fake_provider.requests == [] and second_provider.requests == []
+        assert chain.stats()["providers"]["first"]["errors"] == 0
+
+    def test_hedge_waits_no_longer_than_the_deadline(self, fake_provider, second_provider, monkeypatch):
+        """Test that a hedge delay longer than the deadline does not hold the request"""
+        monkeypatch.setenv("FAKE_PROVIDER_KEY", "secret")
+        fake_provider.delay = 1.0
+        chain = ProviderChain([
+            ProviderClient("first", fake_provider.url, "FAKE_PROVIDER_KEY"),
+            ProviderClient("second", second_provider.url, "FAKE_PROVIDER_KEY"),
+        ], routing="ordered", hedge=True, hedge_delay=5.0)
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            chain.complete(ask("hi"), Deadline(0.3))
+        assert time.monotonic() - started < 0.8
+
+    def test_trickled_body_is_cut_at_the_deadline(self, chain, fake_provider, second_provider):
+        """Test that a body arriving a few bytes per read cannot hold the request past the deadline"""
+        fake_provider.body_chunk_delay = 0.05
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            chain.complete(ask("hi"), Deadline(0.3))
+        assert time.monotonic() - started < 0.6
+        assert second_provider.requests == []
+
+    def test_hedges_wait_for_the_deadline_once_all_are_launched(self, fake_provider, second_provider, monkeypatch):
+        """Test that the hedged chain stops at the deadline while every provider is still trickling"""
+        monkeypatch.setenv("FAKE_PROVIDER_KEY", "secret")
+        fake_provider.body_chunk_delay = second_provider.body_chunk_delay = 0.05
+        chain = ProviderChain([
+            ProviderClient("first", fake_provider.url, "FAKE_PROVIDER_KEY"),
+            ProviderClient("second", second_provider.url, "FAKE_PROVIDER_KEY"),
+        ], routing="ordered", hedge=True, hedge_delay=0.01)
+        deadline = Deadline(0.3)
+        assert 0.0 < chain._hedge_wait(chain.clients[1], [], deadline) <= 0.3
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            chain.complete(ask("hi"), deadline)
+        assert time.monotonic() - started < 0.6
+
+    def test_stream_open_is_bounded(self, chain, fake_provider, second_provider):
+        """Test that waiting for a stream's first byte is cut at the deadline"""
+        fake_provider.delay = 1.0
+        with pytest.raises(DeadlineExceeded):
+            chain.stream(ask("hi"), Deadline(0.3))
+        assert second_provider.requests == []
+
+    def test_async_chain(self, chain, fake_provider):
+        """Test that the asyncio chain honours the deadline too"""
+        pytest.importorskip("aiohttp")
+        fake_provider.delay = 1.0
+
+        async def main():
+            started = time.monotonic()
+            try:
+                with pytest.raises(DeadlineExceeded):
+                    await chain.acomplete(ask("hi"), Deadline(0.3))
+                return time.monotonic() - started
+            finally:
+                await chain.aclose()
+
+        assert asyncio.run(main()) < 0.8
+
+
+class TestSingleFlight:
+    """Tests for followers waiting on a flight with little time left"""
+
+    def test_follower_waits_at_most_its_time_left(self):
+        """Test that a follower stops waiting after ``wait`` even if the flight timeout is longer"""
+        flights = SingleFlight(timeout=30)
+
+        async def slow():
+            await asyncio.sleep(0.5)
+            return "leader"
+
+        async def fast():
+            return "own"
+
+        async def main():
+            leader = asyncio.ensure_future(flights.ado("k", slow))
+            await asyncio.sleep(0.01)
+            follower = await flights.ado("k", fast, 0.05)
+            await leader
+            return follower
+
+        assert asyncio.run(main()) == ("own", False)
+        assert flights.stats()["timeouts"] == 1
+
+
+class TestChatEndpoint:
+    """Tests for the X-Request-Timeout header on /api/ai/chat"""
+
+    @pytest.fixture(params=["app", "api.index"])
+    def module(self, request, chain, monkeypatch):
+        module = importlib.import_module(request.param)
+        monkeypatch.setattr(module, "ai_chain", chain)
+        monkeypatch.setattr(module, "chat_intents", None)
+        monkeypatch.setattr(module, "chat_cache", None)
+        # Slow answers are metered: keep them off the shared AI budget of later tests
+        monkeypatch.setattr(module, "rate_limiter", BudgetedRateLimiter({"default": 60, "ai": 100}))
+        monkeypatch.setenv("SKIP_RATE_LIMIT", "1")
+        return module
+
+    def post(self, module, payload, timeout):
+        return module.app.test_client().post(
+            "/api/ai/chat",
+            data=json.dumps(payload),
+            content_type="application/json",
+            headers={"X-Request-Timeout": timeout},
+        )
+
+    def test_local_answer_when_time_runs_out(self, module, fake_provider, second_provider):
+        """Test that the local fallback answers as soon as the client's deadline passes"""
+        fake_provider.delay = 1.0
+        started = time.monotonic()
+        response = self.post(module, ask("What is PCOS?"), "0.3")
+        assert time.monotonic() - started < 0.8
+        assert response.status_code == 200
+        assert response.headers.get("X-Deadline-Exceeded") == "true"
+        assert response.get_json()["id"] == "local-ai-response"
+        assert second_provider.requests == []
+
+    def test_local_stream_when_time_runs_out(self, module, fake_provider):
+        """Test that a stream that does not open in time is answered locally"""
+        fake_provider.delay = 1.0
+        response = self.post(module, ask("What is PCOS?", stream=True), "0.3")
+        assert response.headers.get("X-Deadline-Exceeded") == "true"
+        assert response.get_data().rstrip().endswith(b"data: [DONE]")
+
+    def test_provider_answers_within_the_deadline(self, module, fake_provider):
+        """Test that a provider answering in time is relayed without the marker"""
+        response = self.post(module, ask("What is PCOS?"), "5")
+        assert "X-Deadline-Exceeded" not in response.headers
+        assert fake_provider.reply in response.get_data(as_text=True)
@@ -0,0 +1,176 @@
+"""
+PCOS Smart Assistant - Doctor Ranking Tests
+Tests for weighted multi-factor doctor ranking
+"""
+
+import pytest
+import sys
+import os
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from doctor_ranking import DoctorRanker, haversine_km, parse_weights, specialty_category
+from doctor_recommendations import CITY_COORDINATES, DoctorRecommender
+from doctor_store import DoctorStore
+
+
+def make_store(doctors):
+    """Store with every doctor in Hyderabad unless it has its own coordinates"""
+    return DoctorStore.from_records(
+        [("Hyderabad", doctor) for doctor in doctors], city_coordinates=CITY_COORDINATES
+    )
+
+
+def doctor(name, rating=4.5, specialty="Gynecologist", expertise=("PCOS",), **extra):
+    return {"name": name, "specialty": specialty, "rating": rating, "expertise": list(expertise), **extra}
+
+
+class TestWeights:
+    """Tests for weight configuration"""
+
+    def test_parse_weights(self):
+        """Test that a weight spec overrides defaults"""
+        weights = parse_weights("rating=1, distance=0")
+        assert weights["rating"] == 1.0
+        assert weights["distance"] == 0.0
+        assert "expertise" in weights
+
+    def test_parse_weights_rejects_unknown_factor(self):
+        """Test that typos in factor names fail loudly"""
+        with pytest.raises(ValueError):
+            parse_weights("popularity=1")
+
+    @pytest.mark.parametrize("spec", ["rating=high", "rating=-1", "rating=0,expertise=0,specialty=0,distance=0"])
+    def test_parse_weights_rejects_bad_values(self, spec):
+        """Test that non-numeric, negative and all-zero weights fail loudly"""
+        with pytest.raises(ValueError):
+            parse_weights(spec)
+
+    def test_invalid_env_falls_back_to_defaults(self, monkeypatch, caplog):
+        """Test that a typo in DOCTOR_RANKING_WEIGHTS is logged and the defaults are used"""
+        import app as app_module
+
+        monkeypatch.setenv("DOCTOR_RANKING_WEIGHTS", "ratng=0.5")
+        with caplog.at_level("WARNING", logger="pcos-backend"):
+            assert app_module.ranking_weights_from_env() is None
+        assert "ratng" in caplog.text
+        monkeypatch.setenv("DOCTOR_RANKING_WEIGHTS", "rating=1")
+        assert app_module.ranking_weights_from_env()["rating"] == 1.0
+
+    def test_weights_are_normalized(self):
+        """Test that weights sum to one"""
+        ranker = DoctorRanker(make_store([doctor("A")]), weights={"rating": 2, "expertise": 2})
+        assert sum(ranker.weights.values()) == pytest.approx(1.0)
+
+    def test_zero_weights_rejected(self):
+        """Test that all-zero weights are invalid"""
+        zero = {"rating": 0, "expertise": 0, "specialty": 0, "distance": 0}
+        with pytest.raises(ValueError):
+            DoctorRanker(make_store([doctor("A")]), weights=zero)
+
+
+class TestScoring:
+    """Tests for individual ranking factors"""
+
+    def test_rating_only(self):
+        """Test that rating-only weights reduce to sort by rating"""
+        store = make_store([doctor("A", 4.1), doctor("B", 4.9), doctor("C", 4.5)])
+        ranker = DoctorRanker(store, weights={"rating": 1, "expertise": 0, "specialty": 0, "distance": 0})
+        top = ranker.top_k(np.arange(3), 3, "moderate")
+        assert [store.materialize(row)["name"] for row in top] == ["B", "C", "A"]
+
+    def test_expertise_match_wins_over_small_rating_gap(self):
+        """Test that symptom-relevant expertise lifts a doctor"""
+        store = make_store(
+            [doctor("Generalist", 4.8), doctor("Fertility", 4.6, expertise=("PCOS", "Infertility", "IVF"))]
+        )
+        ranker = DoctorRanker(store)
+        mask = ranker.symptom_mask(["infertility"])
+        top = ranker.top_k(np.arange(2), 1, "moderate", mask)
+        assert store.materialize(top[0])["name"] == "Fertility"
+
+    def test_specialty_fit_follows_risk(self):
+        """Test that high risk prefers specialists over general gynecologists"""
+        store = make_store(
+            [doctor("Gyn", 4.7), doctor("Specialist", 4.7, specialty="Gynecologist & PCOS Specialist")]
+        )
+        ranker = DoctorRanker(store)
+        assert store.materialize(ranker.top_k(np.arange(2), 1, "high")[0])["name"] == "Specialist"
+
+    def test_distance_prefers_nearby(self):
+        """Test that closer doctors score higher with equal other factors"""
+        store = make_store(
+            [doctor("Far", lat=28.6, lon=77.2), doctor("Near", lat=17.4, lon=78.5)]
+        )
+        ranker = DoctorRanker(store)
+        top = ranker.top_k(np.arange(2), 1, "moderate", origin=CITY_COORDINATES["Hyderabad"])
+        assert store.materialize(top[0])["name"] == "Near"
+
+    def test_unknown_location_is_neutral(self):
+        """Test that missing origin does not change ordering"""
+        store = make_store([doctor("A", 4.2, lat=28.6, lon=77.2), doctor("B", 4.8)])
+        ranker = DoctorRanker(store)
+        assert store.materialize(ranker.top_k(np.arange(2), 1, "moderate")[0])["name"] == "B"
+
+    def test_haversine(self):
+        """Test distance between Hyderabad and Bangalore"""
+        lat, lon = CITY_COORDINATES["Bangalore"]
+        distance = haversine_km(np.array([lat]), np.array([lon]), CITY_COORDINATES["Hyderabad"])
+        assert 490 < distance[0] < 510
+
+    def test_specialty_category(self):
+        """Test specialty bucketing"""
+        assert specialty_category("Gynecologist & PCOS Specialist") == "pcos_specialist"
+        assert specialty_category("Gynecologist & Fertility Expert") == "fertility"
+        assert specialty_category("Endocrinologist") == "endocrinologist"
+        assert specialty_category("Gynecologist") == "gynecologist"
+
+
+class TestTopK:
+    """Tests for top-k selection"""
+
+    def test_top_k_matches_full_sort(self):
+        """Test that argpartition selection equals a full sort"""
+        rng = np.random.default_rng(3)
+        doctors = [doctor(f"D{i}", rating=float(r)) for i, r in enumerate(rng.uniform(3, 5, 500))]
+        store = make_store(doctors)
+        ranker = DoctorRanker(store)
+        rows = np.arange(len(store))
+
+        scores = ranker.score(rows, "moderate")
+        expected = [int(r) for r in np.argsort(-scores, kind="stable")[:5]]
+        assert ranker.top_k(rows, 5, "moderate") == expected
+
+    def test_top_k_with_fewer_candidates(self):
+        """Test that k larger than the candidate set returns everything"""
+        store = make_store([doctor("A"), doctor("B")])
+        assert len(DoctorRanker(store).top_k(np.arange(2), 3, "low")) == 2
+
+    def test_top_k_empty(self):
+        """Test that no candidates returns no rows"""
+        store = make_store([doctor("A")])
+        assert DoctorRanker(store).top_k(np.array([], dtype=np.int64), 3, "low") == []
+
+
+class TestRecommenderRanking:
+    """Tests for ranking inside DoctorRecommender"""
+
+    def test_custom_weights(self):
+        """Test that rating-only weights give the best rated doctors first"""
+        recommender = DoctorRecommender(
+            ranking_weights={"rating": 1, "expertise": 0, "specialty": 0, "distance": 0}
+        )
+        result = recommender.get_recommendations(city="Hyderabad", severity="low", symptoms=[])
+        ratings = [d["rating"] for d in result["primary_doctors"]]
+        assert ratings == sorted(ratings, reverse=True)
+
+    def test_symptoms_change_ranking(self):
+        """Test that symptom-relevant expertise is used"""
+        recommender = DoctorRecommender()
+        result = recommender.get_recommendations(
+            city="Hyderabad", severity="moderate", symptoms=["weight_gain"]
+        )
+        assert result["primary_doctors"][0]["name"] == "Dr. Rajeev Kumar"
@@ -0,0 +1,109 @@
+"""
+PCOS Smart Assistant - Doctor Store Tests
+Tests for the columnar doctor store
+"""
+
+import pytest
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from doctor_recommendations import DoctorRecommender
+from doctor_store import DoctorStore, StringColumn
+
+
+@pytest.fixture
+def recommender():
+    """Create a DoctorRecommender instance"""
+    return DoctorRecommender()
+
+
+@pytest.fixture
+def store(recommender):
+    """Store built from the bundled directory"""
+    return recommender.store
+
+
+class TestStringColumn:
+    """Tests for dictionary-encoded string columns"""
+
+    def test_repeated_values_are_interned(self):
+        """Test that repeated strings share one dictionary entry"""
+        column = StringColumn.build(["Apollo", "Care", "Apollo", "Apollo"])
+        assert column.cardinality == 2
+        assert [column[i] for i in range(4)] == ["Apollo", "Care", "Apollo", "Apollo"]
+
+    def test_unicode_round_trip(self):
+        """Test that non-ASCII values decode correctly"""
+        column = StringColumn.build(["Dr. Zoë", "Women's Health"])
+        assert column[0] == "Dr. Zoë"
+        assert column[1] == "Women's Health"
+
+
+class TestDoctorStore:
+    """Tests for the struct-of-arrays doctor store"""
+
+    def test_store_holds_every_doctor(self, recommender, store):
+        """Test that every directory entry becomes a row"""
+        total = sum(len(doctors) for doctors in recommender.doctors_db.values())
+        assert len(store) == total
+
+    def test_city_ranges_are_contiguous(self, recommender, store):
+        """Test that each city maps to its own row range"""
+        for city, doctors in recommender.doctors_db.items():
+            start, stop = store.city_range(city)
+            assert stop - start == len(doctors)
+            assert all(store.city_of(row) == city for row in range(start, stop))
+
+    def test_unknown_city_is_empty(self, store):
+        """Test that an unknown city has no rows"""
+        assert store.city_range("Atlantis") == (0, 0)
+        assert len(store.rows_for_city("Atlantis")) == 0
+
+    def test_materialize_matches_directory(self, recommender, store):
+        """Test that materialized rows match the original dicts"""
+        for city, doctors in recommender.doctors_db.items():
+            rows = store.rows_for_city(city)
+            for original, materialized in zip(doctors, store.materialize_many(rows)):
+                assert list(materialized) == list(original)
+                assert {k: v for k, v in materialized.items() if k != "expertise"} == {
+                    k: v for k, v in original.items() if k != "expertise"
+                }
+                assert sorted(materialized["expertise"]) == sorted(original["expertise"])
+
+    def test_materialize_with_id(self, store):
+        """Test that doctor ids are the store row"""
+        assert store.materialize(3, doctor_id=True)["id"] == 3
+
+    def test_column_types_are_compact(self, store):
+        """Test that numeric columns use compact dtypes"""
+        assert store.rating.dtype.name == "float32"
+        assert store.expertise_bits.dtype.name == "uint64"
+        assert store.columns["name"].codes.dtype.name == "uint32"
+
+    def test_expertise_mask(self, store):
+        """Test that expertise bitsets can be matched against tags"""
+        mask = store.expertise_mask(["IVF", "Unknown Tag"])
+        rows = [row for row in range(len(store)) if int(store.expertise_bits[row]) & mask]
+        assert sorted(store.materialize(row)["name"] for row in rows) == [
+            "Dr. Anjali Kapoor",
+            "Dr. Lakshmi Devi",
+        ]
+
+    def test_too_many_expertise_tags(self):
+        """Test that the bitset width is enforced"""
+        doctor = {"name": "Dr. X", "expertise": [f"tag-{i}" for i in range(65)]}
+        with pytest.raises(ValueError):
+            DoctorStore.from_records([("Pune", doctor)])
+
+    def test_recommender_uses_store(self, store):
+        """Test that a recommender can be built from an existing store"""
+        recommender = DoctorRecommender(store=store)
+        result = recommender.get_recommendations(city="Chennai", severity="moderate", symptoms=[])
+        assert [d["name"] for d in result["primary_doctors"]] == [
+            "Dr. Kavitha Menon",
+            "Dr. Ramesh Babu",
+        ]
+        assert recommender.search_doctor_by_name("babu")[0]["city"] == "Chennai"
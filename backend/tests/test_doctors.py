@@ -3,6 +3,8 @@ PCOS Smart Assistant - Doctor Recommendations Tests
 Tests for the doctor recommendation module
 """
 
+import json
+
 import pytest
 import sys
 import os
@@ -159,3 +161,118 @@ class TestCityMatching:
         # Both should return results
         assert isinstance(doctors_exact, dict)
         assert isinstance(doctors_similar, dict)
+
+
+class TestCompactRecommendations:
+    """Tests for compact recommendations and reference data"""
+
+    def test_compact_ids_match_full_response(self, recommender):
+        """Test that compact ids resolve to the full primary doctors"""
+        full = recommender.get_recommendations(city="Vijayawada", severity="high", symptoms=[])
+        compact = recommender.get_compact_recommendations(
+            city="Vijayawada", severity="high", symptoms=[]
+        )
+
+        by_id = {}
+        for city in compact["doctor_cities"]:
+            for doctor in recommender.get_city_doctors(city):
+                by_id[doctor.pop("id")] = doctor
+
+        assert [by_id[i] for i in compact["primary_doctor_ids"]] == full["primary_doctors"]
+        assert compact["urgent_care_message"] == full["urgent_care_message"]
+
+    def test_reference_version_is_stable(self, recommender):
+        """Test that identical directories share a version"""
+        assert recommender.reference_version == DoctorRecommender().reference_version
+
+    def test_reference_version_tracks_directory(self, recommender):
+        """Test that a directory change produces a new version"""
+        from doctor_store import DoctorStore
+
+        changed = dict(recommender.doctors_db)
+        changed["Pune"] = changed["Pune"][:1]
+        other = DoctorRecommender(store=DoctorStore.from_directory(changed))
+        assert other.reference_version != recommender.reference_version
+
+
+class TestRecommendationCache:
+    """Tests for memoized recommendation payloads"""
+
+    def test_repeat_calls_hit_cache(self, recommender):
+        """Test that identical inputs are served from memory"""
+        first = recommender.get_recommendations(city="Chennai", severity="high", symptoms=[])
+        second = recommender.get_recommendations(city=" chennai", severity="high", symptoms=[])
+
+        assert first == second
+        stats = recommender.cache_stats()
+        assert stats["misses"] == 1
+        assert stats["hits"] == 1
+
+    def test_key_separates_specialist_need(self, recommender):
+        """Test that infertility changes the cached selection"""
+        general = recommender.get_recommendations(city="Chennai", severity="moderate", symptoms=[])
+        fertility = recommender.get_recommendations(
+            city="Chennai", severity="moderate", symptoms=["infertility"]
+        )
+
+        names = [d["name"] for d in fertility["primary_doctors"]]
+        assert len(general["primary_doctors"]) == 2
+        assert names == ["Dr. Meera Sharma", "Dr. Ramesh Babu", "Dr. Sunita Rao"]
+        assert "Dr. Kavitha Menon" not in names
+        assert recommender.cache_stats()["misses"] == 2
+
+    def test_key_separates_urgency(self, recommender):
+        """Test that the urgent care message follows severity"""
+        low = recommender.get_recommendations(city="Pune", severity="low", symptoms=[])
+        moderate = recommender.get_recommendations(city="Pune", severity="moderate", symptoms=[])
+        assert low["urgent_care_message"] != moderate["urgent_care_message"]
+
+    def test_hits_return_the_cached_payload(self, recommender):
+        """Test that a hit is the cached payload itself, not a copy"""
+        first = recommender.get_recommendations(city="Pune", severity="low", symptoms=[])
+        assert recommender.get_recommendations(city="Pune", severity="low", symptoms=[]) is first
+
+    def test_cached_payloads_are_read_only(self, recommender):
+        """Test that a caller cannot change a shared payload at any level"""
+        first = recommender.get_recommendations(city="Pune", severity="low", symptoms=[])
+        with pytest.raises(TypeError):
+            first["extra"] = True
+        with pytest.raises(TypeError):
+            first["primary_doctors"][0]["name"] = "changed"
+        with pytest.raises(TypeError):
+            first["all_doctors_in_city"].clear()
+        second = recommender.get_recommendations(city="Pune", severity="low", symptoms=[])
+        assert "extra" not in second and second["all_doctors_in_city"]
+
+    def test_shallow_copies_can_be_changed(self, recommender):
+        """Test that callers change a shallow copy of the part they need, leaving the cache intact"""
+        first = recommender.get_recommendations(city="Pune", severity="low", symptoms=[])
+        doctors = dict(first)
+        doctors["primary_doctors"] = [{**doctor, "next_available_slot": 1} for doctor in first["primary_doctors"]]
+        assert json.loads(json.dumps(doctors))["primary_doctors"][0]["next_available_slot"] == 1
+        assert "next_available_slot" not in first["primary_doctors"][0]
+
+    def test_cache_is_bounded(self):
+        """Test that the cache evicts least recently used payloads"""
+        small = DoctorRecommender(cache_size=2)
+        for city in ["Pune", "Delhi", "Mumbai"]:
+            small.get_recommendations(city=city, severity="low", symptoms=[])
+        stats = small.cache_stats()
+        assert stats["size"] == 2
+        assert stats["evictions"] == 1
+
+    def test_load_store_invalidates(self, recommender):
+        """Test that a directory change clears memoized payloads"""
+        from doctor_store import DoctorStore
+
+        recommender.get_recommendations(city="Pune", severity="low", symptoms=[])
+        old_version = recommender.reference_version
+
+        changed = dict(recommender.doctors_db)
+        changed["Pune"] = changed["Pune"][:1]
+        recommender.load_store(DoctorStore.from_directory(changed))
+
+        result = recommender.get_recommendations(city="Pune", severity="low", symptoms=[])
+        assert recommender.reference_version != old_version
+        assert len(result["all_doctors_in_city"]) == 1
+        assert recommender.cache_stats()["size"] == 1
@@ -0,0 +1,163 @@
+"""
+PCOS Smart Assistant - Entry Spool Tests
+Tests for spooling submissions locally while Supabase cannot take them
+"""
+
+import pytest
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SKIP_SUPABASE", "1")
+
+from entry_spool import EntrySpool
+from write_behind import WriteBehindQueue
+
+
+class Writer:
+    """Records written batches; fails while ``failing`` is positive"""
+
+    def __init__(self, failing=0):
+        self.batches = []
+        self.failing = failing
+
+    def __call__(self, rows):
+        if self.failing:
+            self.failing -= 1
+            raise ConnectionError("supabase down")
+        self.batches.append(list(rows))
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "spool.sqlite3")
+
+
+class TestEntrySpool:
+    """Tests for appending, replaying and bounding the spool"""
+
+    def test_append_keeps_each_id_once(self, path):
+        """Test that a row spooled twice is held once and counted as a duplicate"""
+        spool = EntrySpool(path)
+        assert spool.append([{"id": "a", "age": 25}, {"id": "b", "age": 31}]) == 2
+        assert spool.append([{"id": "a", "age": 25}]) == 1
+        stats = spool.stats()
+        assert (stats["rows"], stats["appended"], stats["duplicates"]) == (2, 2, 1)
+        assert not stats["replaying"]
+
+    def test_replay_writes_in_order_and_empties(self, path):
+        """Test that replay writes rows in spool order, in batches, and deletes them"""
+        writer = Writer()
+        spool = EntrySpool(path, write=writer, batch_size=2)
+        spool.append([{"id": str(i)} for i in range(5)])
+        assert spool.replay() == 5
+        assert [[row["id"] for row in batch] for batch in writer.batches] == [["0", "1"], ["2", "3"], ["4"]]
+        assert spool.stats()["rows"] == 0 and spool.stats()["bytes"] == 0
+        assert spool.replay() == 0
+
+    def test_rows_survive_a_restart(self, path):
+        """Test that a new spool on the same file picks up what is still spooled"""
+        EntrySpool(path).append([{"id": "a", "symptoms": ["acne"]}])
+        writer = Writer()
+        reopened = EntrySpool(path, write=writer)
+        assert reopened.stats()["rows"] == 1
+        reopened.replay()
+        assert writer.batches == [[{"id": "a", "symptoms": ["acne"]}]]
+
+    def test_failed_replay_keeps_rows(self, path):
+        """Test that a failing write leaves the rows spooled for the next replay"""
+        writer = Writer(failing=1)
+        spool = EntrySpool(path, write=writer)
+        spool.append([{"id": "a"}])
+        with pytest.raises(ConnectionError):
+            spool.replay()
+        stats = spool.stats()
+        assert stats["rows"] == 1 and stats["replay_errors"] == 1 and stats["last_error"] == "supabase down"
+        assert spool.replay() == 1
+        assert spool.stats()["last_error"] is None
+
+    def test_spool_is_bounded_and_alerts(self, path):
+        """Test that rows past ``max_bytes`` are refused and the alert is raised near the cap"""
+        spool = EntrySpool(path, max_bytes=100, alert_ratio=0.5)
+        assert spool.append([{"id": "a", "note": "x" * 40}]) == 1
+        assert spool.stats()["alert"]
+        assert spool.append([{"id": "b", "note": "x" * 60}]) == 0
+        assert spool.stats()["rejected"] == 1 and spool.stats()["rows"] == 1
+
+    def test_given_up_batches_are_spooled(self, path):
+        """Test that rows the write-behind queue gives up on land in the spool"""
+        spool = EntrySpool(path)
+        queue = WriteBehindQueue(Writer(failing=10), max_retries=0, on_give_up=spool.append)
+        queue._start = lambda: None
+        queue.put({"id": "a"})
+        queue.flush(force=True)
+        assert spool.stats()["rows"] == 1
+
+
+    @pytest.mark.skipif(os.name != "posix", reason="file modes are POSIX")
+    def test_file_is_private(self, path):
+        """Test that only the owner can read the spooled health data"""
+        EntrySpool(path)
+        assert os.stat(path).st_mode & 0o777 == 0o600
+
+
+class TestSaveEntry:
+    """Tests for /api/analyze falling back to the spool"""
+
+    @pytest.fixture
+    def app_module(self, path, monkeypatch):
+        import app as app_module
+
+        monkeypatch.setenv("SKIP_RATE_LIMIT", "1")
+        spool = EntrySpool(path)
+        monkeypatch.setattr(app_module, "entry_spool", spool)
+        monkeypatch.setattr(app_module, "entry_sink", None)
+        monkeypatch.setattr(app_module, "entry_writer", None)
+        return app_module, spool
+
+    def test_spools_without_supabase(self, app_module):
+        """Test that a submission is spooled under its id when Supabase is not available"""
+        module, spool = app_module
+        entry_id = module.save_entry({"age": 30})
+        assert len(entry_id) == 36
+        writer = Writer()
+        spool.write = writer
+        spool.replay()
+        assert writer.batches[0][0]["id"] == entry_id
+
+    def test_spools_when_the_insert_fails(self, app_module, monkeypatch):
+        """Test that a failing direct insert falls back to the spool"""
+        module, spool = app_module
+        monkeypatch.setattr(module, "entry_sink", type("Sink", (), {"write": Writer(failing=1)})())
+        assert module.save_entry({"age": 30})
+        assert spool.stats()["rows"] == 1
+
+    def test_metrics(self, app_module, admin_headers):
+        """Test that spool size and alert state are reported in /api/metrics"""
+        module, _ = app_module
+        module.save_entry({"age": 30})
+        metrics = module.app.test_client().get("/api/metrics", headers=admin_headers).get_json()
+        assert metrics["entry_spool"]["rows"] == 1
+        assert metrics["entry_spool"]["alert"] is False
+
+    def test_spool_is_only_kept_with_a_replayer_or_an_explicit_path(self, app_module, monkeypatch, tmp_path, caplog):
+        """Test that no spool is opened by default without Supabase, and an explicit one is warned about"""
+        module, _ = app_module
+        monkeypatch.delenv("ENTRY_SPOOL_DB", raising=False)
+        assert module.entry_spool_from_env(None) is None
+        path = str(tmp_path / "explicit.sqlite3")
+        monkeypatch.setenv("ENTRY_SPOOL_DB", path)
+        with caplog.at_level("WARNING", logger="pcos-backend"):
+            spool = module.entry_spool_from_env(None)
+        assert spool.path == path and "nothing to replay" in caplog.text
+        monkeypatch.setenv("ENTRY_SPOOL", "0")
+        assert module.entry_spool_from_env(None) is None
+
+    def test_default_path_is_in_the_data_directory(self, app_module):
+        """Test that the default spool file lives under backend/data, not the working directory"""
+        module, _ = app_module
+        backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        assert module.DEFAULT_ENTRY_SPOOL_DB == os.path.join(backend, "data", "pcos_entries_spool.sqlite3")
+
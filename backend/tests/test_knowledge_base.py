@@ -0,0 +1,150 @@
+"""
+PCOS Smart Assistant - Knowledge Base Tests
+Tests for BM25 retrieval over the bundled FAQ and the local chat fallback
+"""
+
+import importlib
+import json
+import pytest
+import sys
+import os
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+os.environ.setdefault("SKIP_SUPABASE", "1")
+
+from knowledge_base import DISCLAIMER, KnowledgeBase, format_answer, stem, tokenize
+
+
+ENTRIES = [
+    {"id": "a", "question": "What is PCOS?", "answer": "PCOS is a hormonal condition.", "tags": ["definition"]},
+    {"id": "b", "question": "Can I eat rice with PCOS?", "answer": "Rice is fine in moderation.", "tags": ["carbs"]},
+    {"id": "c", "question": "Why are my periods irregular?", "answer": "Ovulation is irregular in PCOS.", "tags": []},
+    {"id": "d", "question": "Does exercise help PCOS?", "answer": "Exercise improves insulin sensitivity.", "tags": []},
+]
+
+
+@pytest.fixture(scope="module")
+def bundled():
+    return KnowledgeBase.from_file()
+
+
+class TestTokenizer:
+    """Tests for tokenization and stemming"""
+
+    def test_stopwords_and_punctuation_are_dropped(self):
+        """Test that only content words remain"""
+        assert tokenize("What is the best diet for PCOS?") == ["best", "diet", "pco"]
+
+    def test_word_forms_share_a_stem(self):
+        """Test that common inflections map to one term"""
+        assert stem("periods") == stem("period")
+        assert stem("depressed") == stem("depression")
+        assert stem("ovulation") == stem("ovulating") == stem("ovulate")
+        assert stem("treatment") == stem("treated")
+
+
+class TestSearch:
+    """Tests for BM25 ranking"""
+
+    def test_best_match_first(self):
+        """Test that the entry matching the query ranks first"""
+        kb = KnowledgeBase(ENTRIES)
+        hits = kb.search("is rice ok to eat", k=2)
+        assert hits[0].entry["id"] == "b"
+        assert len(hits) <= 2
+
+    def test_common_terms_prefer_the_closest_question(self):
+        """Test that a query of only common terms finds the shortest matching question"""
+        kb = KnowledgeBase(ENTRIES)
+        assert kb.search("what is pcos")[0].entry["id"] == "a"
+
+    def test_no_match(self):
+        """Test that unrelated queries and min_score return nothing"""
+        kb = KnowledgeBase(ENTRIES)
+        assert kb.search("hello there") == []
+        assert kb.search("rice", min_score=1000) == []
+
+    def test_saved_index_loads_without_rebuilding(self, tmp_path):
+        """Test that a saved index gives the same results"""
+        kb = KnowledgeBase(ENTRIES)
+        path = str(tmp_path / "kb.json")
+        kb.save(path)
+        with open(path) as f:
+            assert "index" in json.load(f)
+        loaded = KnowledgeBase.from_file(path)
+        for query in ("what is pcos", "irregular periods", "exercise"):
+            assert loaded.search(query) == kb.search(query)
+
+    def test_format_answer(self):
+        """Test that the reply lists the best answer, related questions and the disclaimer"""
+        kb = KnowledgeBase(ENTRIES)
+        text = format_answer(kb.search("pcos rice periods", k=2))
+        assert text.startswith("Rice is fine")
+        assert "Related questions:\n- " in text
+        assert text.endswith(DISCLAIMER)
+
+
+class TestBundledFaq:
+    """Tests for the FAQ shipped in backend/data"""
+
+    def test_size_and_ids(self, bundled):
+        """Test that the FAQ has several hundred uniquely identified entries"""
+        ids = [entry["id"] for entry in bundled.entries]
+        assert len(bundled) >= 300
+        assert len(set(ids)) == len(ids)
+
+    @pytest.mark.parametrize(
+        "query,expected",
+        [
+            ("what is pcos", "What is PCOS?"),
+            ("metformin side effects", "What are the side effects of metformin?"),
+            ("how is pcos diagnosed", "How is PCOS diagnosed?"),
+            ("can I get pregnant", "Can I get pregnant with PCOS?"),
+            ("I feel depressed", "Can PCOS cause depression?"),
+        ],
+    )
+    def test_common_questions(self, bundled, query, expected):
+        """Test that common questions find their entry"""
+        assert bundled.search(query)[0].entry["question"] == expected
+
+    def test_search_takes_milliseconds(self, bundled):
+        """Test that a search over the whole FAQ averages well under 5 ms"""
+        started = time.perf_counter()
+        for _ in range(200):
+            bundled.search("how do I get pregnant with pcos and irregular periods")
+        assert (time.perf_counter() - started) / 200 < 0.005
+
+
+class TestLocalFallback:
+    """Tests for generate_local_ai_response in both apps"""
+
+    @pytest.fixture(params=["app", "api.index"])
+    def module(self, request):
+        return importlib.import_module(request.param)
+
+    def test_answer_from_knowledge_base(self, module):
+        """Test that the fallback answers from the FAQ in the OpenAI shape"""
+        result = module.generate_local_ai_response(
+            {"model": "m", "messages": [{"role": "user", "content": "Can I eat rice with PCOS?"}]}
+        )
+        assert result["object"] == "chat.completion"
+        assert result["model"] == "m"
+        content = result["choices"][0]["message"]["content"]
+        assert content.startswith("Rice can be part of a PCOS-friendly diet")
+        assert result["usage"]["completion_tokens"] == len(content.split())
+
+    def test_greeting_when_nothing_matches(self, module):
+        """Test that small talk gets the generic reply"""
+        result = module.generate_local_ai_response({"messages": [{"role": "user", "content": "hello"}]})
+        assert result["choices"][0]["message"]["content"] == module.LOCAL_GREETING
+
+    def test_no_messages(self, module):
+        """Test that an empty conversation is an error"""
+        assert module.generate_local_ai_response({"messages": []}) == {"error": "No messages provided"}
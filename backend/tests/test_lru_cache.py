@@ -0,0 +1,74 @@
+"""
+PCOS Smart Assistant - LRU Cache Tests
+Tests for the bounded in-process cache
+"""
+
+import pytest
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lru_cache import LRUCache
+
+
+class FakeClock:
+    """Manually advanced monotonic clock"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLRUCache:
+    """Tests for LRUCache"""
+
+    def test_get_and_set(self):
+        """Test basic lookups and counters"""
+        cache = LRUCache(maxsize=4)
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+        assert cache.get("b", "missing") == "missing"
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+        assert cache.stats()["hit_rate"] == 0.5
+
+    def test_evicts_least_recently_used(self):
+        """Test that reads refresh recency"""
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert "a" in cache
+        assert "b" not in cache
+        assert cache.stats()["evictions"] == 1
+
+    def test_ttl_expiry(self):
+        """Test that expired entries are misses"""
+        clock = FakeClock()
+        cache = LRUCache(maxsize=2, ttl=10, clock=clock)
+        cache.set("a", 1)
+        clock.now = 9
+        assert cache.get("a") == 1
+        clock.now = 10
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_per_entry_ttl(self):
+        """Test that set() can override the default ttl"""
+        clock = FakeClock()
+        cache = LRUCache(maxsize=2, clock=clock)
+        cache.set("a", 1, ttl=1)
+        cache.set("b", 2)
+        clock.now = 100
+        assert cache.get("a") is None
+        assert cache.get("b") == 2
+
+    def test_invalid_size(self):
+        """Test that a cache must hold at least one entry"""
+        with pytest.raises(ValueError):
+            LRUCache(maxsize=0)
@@ -0,0 +1,276 @@
+"""
+PCOS Smart Assistant - Rate Limiter Tests
+Tests for the sliding-window-counter rate limiter
+"""
+
+import json
+import multiprocessing
+import pytest
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SKIP_SUPABASE", "1")
+
+from rate_limiter import (
+    BudgetedRateLimiter,
+    SlidingWindowLimiter,
+    SQLiteRateLimiter,
+    create_rate_limiter,
+    response_tokens,
+    usage_cost,
+)
+
+
+class FakeClock:
+    """Manually advanced wall clock"""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def hammer(path, hits, results):
+    """Worker process: spend ``hits`` checks on one shared key"""
+    limiter = SQLiteRateLimiter(100, 60, path=path)
+    results.put(sum(limiter.hit("shared-ip").allowed for _ in range(hits)))
+
+
+class TestSlidingWindowLimiter:
+    """Tests for SlidingWindowLimiter"""
+
+    def test_allows_up_to_limit(self, clock):
+        """Test that the limit is enforced within one window"""
+        limiter = SlidingWindowLimiter(3, 60, clock=clock)
+        assert [limiter.hit("ip").allowed for _ in range(4)] == [True, True, True, False]
+
+    def test_keys_are_independent(self, clock):
+        """Test that one client does not consume another's budget"""
+        limiter = SlidingWindowLimiter(1, 60, clock=clock)
+        assert limiter.hit("a").allowed
+        assert limiter.hit("b").allowed
+        assert not limiter.hit("a").allowed
+
+    def test_previous_window_is_weighted(self, clock):
+        """Test that the previous window decays linearly"""
+        limiter = SlidingWindowLimiter(10, 60, clock=clock)
+        clock.now = 60 * 1000
+        for _ in range(10):
+            limiter.hit("ip")
+
+        # Half way through the next window half of the old requests still count
+        clock.now = 60 * 1001 + 30
+        results = [limiter.hit("ip").allowed for _ in range(6)]
+        assert results == [True] * 5 + [False]
+
+    def test_budget_recovers_after_two_windows(self, clock):
+        """Test that old traffic stops counting"""
+        limiter = SlidingWindowLimiter(2, 60, clock=clock)
+        limiter.hit("ip")
+        limiter.hit("ip")
+        assert not limiter.hit("ip").allowed
+        clock.now += 120
+        assert limiter.hit("ip").allowed
+
+    def test_retry_after(self, clock):
+        """Test that denials say when the next window starts"""
+        limiter = SlidingWindowLimiter(1, 60, clock=clock)
+        clock.now = 60 * 1000 + 45
+        limiter.hit("ip")
+        result = limiter.hit("ip")
+        assert not result.allowed
+        assert result.retry_after == 15
+
+    def test_cost(self, clock):
+        """Test that weighted requests consume more budget"""
+        limiter = SlidingWindowLimiter(10, 60, clock=clock)
+        assert limiter.hit("ip", cost=8).allowed
+        assert not limiter.hit("ip", cost=3).allowed
+        assert limiter.hit("ip", cost=2).remaining == 0
+
+    def test_max_keys_cap(self, clock):
+        """Test that the key table never exceeds its cap"""
+        limiter = SlidingWindowLimiter(5, 60, max_keys=100, clock=clock)
+        for i in range(10_000):
+            limiter.hit(f"10.0.{i // 256}.{i % 256}")
+        stats = limiter.stats()
+        assert stats["tracked_keys"] == 100
+        assert stats["evictions"] == 9_900
+
+    def test_idle_keys_are_dropped(self, clock):
+        """Test that keys idle for two windows are evicted lazily"""
+        limiter = SlidingWindowLimiter(5, 60, clock=clock)
+        for i in range(10):
+            limiter.hit(f"old-{i}")
+        clock.now += 180
+        for i in range(10):
+            limiter.hit(f"new-{i}")
+        assert limiter.stats()["tracked_keys"] == 10
+
+    def test_invalid_configuration(self):
+        """Test that non-positive settings are rejected"""
+        with pytest.raises(ValueError):
+            SlidingWindowLimiter(0, 60)
+
+    def test_charge_overdraws_budget(self, clock):
+        """Test that post-paid usage blocks the key until it decays"""
+        limiter = SlidingWindowLimiter(10, 60, clock=clock)
+        clock.now = 60 * 1000
+        assert limiter.hit("ip").allowed
+        limiter.charge("ip", 14)
+        assert not limiter.hit("ip").allowed
+
+        clock.now += 120
+        assert limiter.hit("ip").allowed
+
+
+class TestSQLiteRateLimiter:
+    """Tests for the cross-process SQLite limiter"""
+
+    def test_matches_in_process_limiter(self, tmp_path, clock):
+        """Test that both backends make the same decisions"""
+        shared = SQLiteRateLimiter(10, 60, path=str(tmp_path / "rl.db"), clock=clock)
+        local = SlidingWindowLimiter(10, 60, clock=clock)
+        decisions = []
+        for step in range(40):
+            clock.now += 7
+            key = f"ip-{step % 3}"
+            decisions.append((shared.hit(key).allowed, local.hit(key).allowed))
+        assert all(a == b for a, b in decisions)
+
+    def test_state_is_shared_between_instances(self, tmp_path, clock):
+        """Test that two limiters on one file enforce one budget"""
+        path = str(tmp_path / "rl.db")
+        first = SQLiteRateLimiter(3, 60, path=path, clock=clock)
+        second = SQLiteRateLimiter(3, 60, path=path, clock=clock)
+        assert first.hit("ip").allowed
+        assert second.hit("ip").allowed
+        assert first.hit("ip").allowed
+        assert not second.hit("ip").allowed
+
+    def test_concurrent_processes_never_overspend(self, tmp_path):
+        """Test that processes hammering one key admit exactly the limit"""
+        path = str(tmp_path / "rl.db")
+        SQLiteRateLimiter(100, 60, path=path)
+        ctx = multiprocessing.get_context("fork")
+        results = ctx.Queue()
+        workers = [ctx.Process(target=hammer, args=(path, 60, results)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        allowed = sum(results.get(timeout=30) for _ in workers)
+        for worker in workers:
+            worker.join(timeout=30)
+        assert allowed == 100
+
+    def test_prune_caps_keys(self, tmp_path, clock):
+        """Test that pruning bounds the table and drops idle keys"""
+        limiter = SQLiteRateLimiter(5, 60, path=str(tmp_path / "rl.db"), max_keys=50, clock=clock, prune_every=10_000)
+        for i in range(200):
+            clock.now += 0.01
+            limiter.hit(f"ip-{i}")
+        limiter.prune()
+        assert limiter.stats()["tracked_keys"] == 50
+
+        clock.now += 180
+        limiter.prune()
+        assert limiter.stats()["tracked_keys"] == 0
+
+    def test_charge(self, tmp_path, clock):
+        """Test that post-paid usage is shared through the file"""
+        path = str(tmp_path / "rl.db")
+        first = SQLiteRateLimiter(5, 60, path=path, clock=clock)
+        second = SQLiteRateLimiter(5, 60, path=path, clock=clock)
+        first.charge("ip", 5)
+        assert not second.hit("ip").allowed
+
+    def test_factory(self, tmp_path, monkeypatch):
+        """Test backend selection from RATE_LIMIT_BACKEND"""
+        monkeypatch.setenv("RATE_LIMIT_BACKEND", "sqlite")
+        monkeypatch.setenv("RATE_LIMIT_DB", str(tmp_path / "rl.db"))
+        assert isinstance(create_rate_limiter(5), SQLiteRateLimiter)
+        assert isinstance(create_rate_limiter(5, backend="memory"), SlidingWindowLimiter)
+        with pytest.raises(ValueError):
+            create_rate_limiter(5, backend="redis")
+
+
+class TestBudgets:
+    """Tests for per-endpoint budgets and usage-based costs"""
+
+    def test_budgets_are_independent(self):
+        """Test that exhausting one budget leaves the other usable"""
+        limiter = BudgetedRateLimiter({"default": 2, "ai": 1})
+        assert limiter.hit("ai", "ip").allowed
+        assert not limiter.hit("ai", "ip").allowed
+        assert limiter.hit("default", "ip").allowed
+        assert set(limiter.stats()) == {"default", "ai"}
+
+    def test_negative_charge_is_ignored(self):
+        """Test that usage below the upfront cost is not refunded"""
+        limiter = BudgetedRateLimiter({"ai": 1})
+        limiter.hit("ai", "ip")
+        limiter.charge("ai", "ip", -1)
+        assert not limiter.hit("ai", "ip").allowed
+
+    def test_usage_cost(self):
+        """Test that the larger of time and tokens sets the cost"""
+        assert usage_cost(10, 0) == 2
+        assert usage_cost(1, 3000) == 3
+        assert response_tokens({"usage": {"total_tokens": 42}}) == 42
+        assert response_tokens({"usage": None}) == 0
+        assert response_tokens(["not", "a", "dict"]) == 0
+
+
+class TestRateLimitDecorator:
+    """Tests for the rate_limit decorator in the Flask app"""
+
+    def test_returns_429_when_exceeded(self, monkeypatch):
+        """Test that the app answers 429 with retry_after"""
+        import app as app_module
+
+        monkeypatch.delenv("SKIP_RATE_LIMIT", raising=False)
+        monkeypatch.setattr(app_module, "rate_limiter", BudgetedRateLimiter({"default": 1, "ai": 1}))
+        client = app_module.app.test_client()
+        payload = json.dumps({"step": 1, "stepData": {"age": 25}})
+        headers = {"X-Forwarded-For": "198.51.100.9"}
+
+        first = client.post("/api/analyze-step", data=payload, content_type="application/json", headers=headers)
+        second = client.post("/api/analyze-step", data=payload, content_type="application/json", headers=headers)
+
+        assert first.status_code == 200
+        assert second.status_code == 429
+        assert json.loads(second.data)["retry_after"] >= 1
+
+    def test_chat_is_post_charged_for_tokens(self, monkeypatch):
+        """Test that a token-heavy chat answer uses up the AI budget only"""
+        import app as app_module
+
+        monkeypatch.delenv("SKIP_RATE_LIMIT", raising=False)
+        monkeypatch.setattr(app_module, "rate_limiter", BudgetedRateLimiter({"default": 5, "ai": 5}))
+        monkeypatch.setattr(
+            app_module,
+            "generate_local_ai_response",
+            lambda payload: {"choices": [], "usage": {"total_tokens": 5000}},
+        )
+        for key in ("OPENROUTER_API_KEY", "OPENAI_API_KEY", "PERPLEXITY_API_KEY"):
+            monkeypatch.delenv(key, raising=False)
+        client = app_module.app.test_client()
+        headers = {"X-Forwarded-For": "198.51.100.12"}
+        chat = json.dumps({"model": "m", "messages": [{"role": "user", "content": "hi"}]})
+        step = json.dumps({"step": 1, "stepData": {"age": 25}})
+
+        first = client.post("/api/ai/chat", data=chat, content_type="application/json", headers=headers)
+        second = client.post("/api/ai/chat", data=chat, content_type="application/json", headers=headers)
+        other = client.post("/api/analyze-step", data=step, content_type="application/json", headers=headers)
+
+        assert first.status_code == 200
+        assert second.status_code == 429
+        assert other.status_code == 200
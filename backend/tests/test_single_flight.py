@@ -0,0 +1,252 @@
+"""
+PCOS Smart Assistant - Single-Flight Tests
+Tests for coalescing identical concurrent chat requests into one upstream call
+"""
+
+import asyncio
+import importlib
+import json
+import pytest
+import sys
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+os.environ.setdefault("SKIP_SUPABASE", "1")
+
+from ai_providers import ProviderChain, ProviderClient
+from chat_service import flight_key
+from single_flight import SingleFlight
+
+
+def ask(text, **extra):
+    return {"model": "m", "messages": [{"role": "user", "content": text}], **extra}
+
+
+def concurrently(n, fn):
+    with ThreadPoolExecutor(n) as pool:
+        return list(pool.map(lambda i: fn(), range(n)))
+
+
+class SlowUpstream:
+    """Counts calls; each takes ``delay`` seconds"""
+
+    def __init__(self, delay=0.2, chunks=(b"a", b"b", b"c")):
+        self.delay = delay
+        self.chunks = list(chunks)
+        self.calls = 0
+        self.closed = 0
+
+    def call(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        return {"answer": 42}
+
+    def open(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        return self._chunks()
+
+    def _chunks(self):
+        try:
+            for chunk in self.chunks:
+                time.sleep(0.01)
+                yield chunk
+        except GeneratorExit:
+            self.closed += 1
+            raise
+
+
+class TestKey:
+    """Tests for the chat request key"""
+
+    def test_normalized_text_and_stream_flag(self):
+        """Test that spacing, case and the stream flag do not split a flight"""
+        assert flight_key(ask("What is PCOS?")) == flight_key(ask("  what is  pcos", stream=True))
+
+    def test_options_count(self):
+        """Test that different models or temperatures are different flights"""
+        assert flight_key(ask("What is PCOS?")) != flight_key(ask("What is PCOS?", temperature=0.2))
+        assert flight_key({"messages": []}) is None
+
+
+class TestBlocking:
+    """Tests for SingleFlight.do and SingleFlight.stream"""
+
+    def test_concurrent_calls_share_one(self):
+        """Test that concurrent callers with one key make a single upstream call"""
+        flights, upstream = SingleFlight(), SlowUpstream()
+        results = concurrently(8, lambda: flights.do("k", upstream.call))
+        assert upstream.calls == 1
+        assert [result for result, _ in results] == [{"answer": 42}] * 8
+        assert sum(shared for _, shared in results) == 7
+        assert flights.stats()["followers"] == 7
+        assert flights.stats()["in_flight"] == 0
+
+    def test_errors_are_shared(self):
+        """Test that followers get the leader's exception"""
+        flights = SingleFlight()
+
+        def fail():
+            time.sleep(0.1)
+            raise RuntimeError("upstream down")
+
+        def call():
+            with pytest.raises(RuntimeError):
+                flights.do("k", fail)
+            return True
+
+        assert concurrently(4, call) == [True] * 4
+        assert flights.stats()["leaders"] == 1
+
+    def test_followers_stop_waiting_after_timeout(self):
+        """Test that a follower makes its own call once the per-key timeout passes"""
+        flights, upstream = SingleFlight(timeout=0.05), SlowUpstream(delay=0.3)
+        leader = threading.Thread(target=flights.do, args=("k", upstream.call))
+        leader.start()
+        time.sleep(0.02)
+        result, shared = flights.do("k", upstream.call)
+        leader.join()
+        assert not shared
+        assert upstream.calls == 2
+        assert flights.stats()["timeouts"] == 1
+
+    def test_stream_is_shared(self):
+        """Test that concurrent subscribers all get every chunk from one upstream stream"""
+        flights, upstream = SingleFlight(), SlowUpstream()
+
+        def read():
+            chunks, shared = flights.stream("k", upstream.open)
+            return b"".join(chunks), shared
+
+        results = concurrently(5, read)
+        assert upstream.calls == 1
+        assert [body for body, _ in results] == [b"abc"] * 5
+        assert sum(shared for _, shared in results) == 4
+
+    def test_late_subscriber_replays_earlier_chunks(self):
+        """Test that a follower joining mid-stream still gets the whole answer"""
+        flights, upstream = SingleFlight(), SlowUpstream(delay=0)
+        first, _ = flights.stream("k", upstream.open)
+        assert next(first) == b"a"
+        second, shared = flights.stream("k", upstream.open)
+        assert shared
+        assert b"".join(second) == b"abc"
+        assert b"".join(first) == b"bc"
+
+    def test_leader_leaving_hands_over(self):
+        """Test that followers keep reading after the leader disconnects, and upstream closes after the last"""
+        flights, upstream = SingleFlight(), SlowUpstream(delay=0)
+        first, _ = flights.stream("k", upstream.open)
+        second, _ = flights.stream("k", upstream.open)
+        next(first)
+        first.close()
+        assert next(second) == b"a"
+        assert next(second) == b"b"
+        second.close()
+        assert upstream.closed == 1
+        assert flights.stats()["in_flight"] == 0
+
+
+class TestAsyncio:
+    """Tests for SingleFlight.ado and SingleFlight.astream"""
+
+    def test_concurrent_calls_share_one(self):
+        """Test that concurrent coroutines with one key make a single upstream call"""
+        flights, calls = SingleFlight(), []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return "answer"
+
+        async def main():
+            return await asyncio.gather(*(flights.ado("k", call) for _ in range(20)))
+
+        results = asyncio.run(main())
+        assert len(calls) == 1
+        assert sum(shared for _, shared in results) == 19
+
+    def test_stream_is_shared(self):
+        """Test that concurrent subscribers all get every chunk"""
+        flights, opened = SingleFlight(), []
+
+        async def chunks():
+            for chunk in (b"a", b"b", b"c"):
+                await asyncio.sleep(0.01)
+                yield chunk
+
+        async def open_stream():
+            opened.append(1)
+            await asyncio.sleep(0.05)
+            return chunks()
+
+        async def read():
+            stream, shared = await flights.astream("k", open_stream)
+            return b"".join([chunk async for chunk in stream]), shared
+
+        async def main():
+            return await asyncio.gather(*(read() for _ in range(5)))
+
+        results = asyncio.run(main())
+        assert len(opened) == 1
+        assert [body for body, _ in results] == [b"abc"] * 5
+
+
+class TestChatEndpoint:
+    """Tests for coalescing in /api/ai/chat"""
+
+    @pytest.fixture(params=["app", "api.index"])
+    def module(self, request, fake_provider, monkeypatch):
+        module = importlib.import_module(request.param)
+        client = ProviderClient("fake", fake_provider.url, "FAKE_PROVIDER_KEY")
+        monkeypatch.setattr(module, "ai_chain", ProviderChain([client]))
+        monkeypatch.setattr(module, "chat_flights", SingleFlight())
+        monkeypatch.setattr(module, "chat_intents", None)
+        monkeypatch.setattr(module, "chat_cache", None)
+        monkeypatch.setenv("FAKE_PROVIDER_KEY", "secret")
+        monkeypatch.setenv("SKIP_RATE_LIMIT", "1")
+        return module
+
+    def post(self, module, payload):
+        response = module.app.test_client().post(
+            "/api/ai/chat", data=json.dumps(payload), content_type="application/json"
+        )
+        return response.headers.get("X-Coalesced"), response.get_data()
+
+    def test_identical_questions_share_a_call(self, module, fake_provider):
+        """Test that one provider call answers identical concurrent questions"""
+        fake_provider.delay = 0.3
+        results = concurrently(6, lambda: self.post(module, ask("What is PCOS?")))
+        assert len(fake_provider.requests) == 1
+        assert [coalesced for coalesced, _ in results].count("true") == 5
+        assert all(fake_provider.reply.encode() in body for _, body in results)
+        assert module.chat_flights.stats()["coalesce_rate"] == round(5 / 6, 4)
+
+    def test_identical_streams_share_a_call(self, module, fake_provider):
+        """Test that one provider stream is relayed to identical concurrent streaming requests"""
+        fake_provider.delay = 0.3
+        results = concurrently(4, lambda: self.post(module, ask("What is PCOS?", stream=True)))
+        assert len(fake_provider.requests) == 1
+        assert all(b" stream" in body and b"[DONE]" in body for _, body in results)
+
+    def test_different_questions_are_not_coalesced(self, module, fake_provider):
+        """Test that different questions still get their own call"""
+        questions = iter(["What is PCOS?", "What is insulin resistance?"])
+        lock = threading.Lock()
+
+        def post():
+            with lock:
+                question = next(questions)
+            return self.post(module, ask(question))
+
+        concurrently(2, post)
+        assert len(fake_provider.requests) == 2
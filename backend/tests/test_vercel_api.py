@@ -5,6 +5,7 @@ Tests for the Vercel serverless API wrapper in api/index.py.
 import importlib
 import json
 import os
+import subprocess
 import sys
 from unittest.mock import Mock
 
@@ -140,3 +141,103 @@ def test_stats_returns_503_when_analyzer_unavailable(client, monkeypatch):
     assert response.status_code == 503
     assert response.get_json()["error"] == "Analysis service unavailable"
 
+
+
+def test_rate_limit_returns_429(client, monkeypatch):
+    from rate_limiter import BudgetedRateLimiter
+
+    monkeypatch.setattr(api_module, "rate_limiter", BudgetedRateLimiter({"default": 1, "ai": 1}))
+    monkeypatch.setattr(api_module, "ANALYZER_AVAILABLE", False)
+    headers = {"X-Forwarded-For": "198.51.100.10"}
+
+    first = client.post("/api/analyze-step", data="{}", content_type="application/json", headers=headers)
+    second = client.post("/api/analyze-step", data="{}", content_type="application/json", headers=headers)
+
+    assert first.status_code == 503
+    assert second.status_code == 429
+
+
+def test_ai_chat_is_rate_limited(client, monkeypatch):
+    from rate_limiter import BudgetedRateLimiter
+
+    monkeypatch.setattr(api_module, "rate_limiter", BudgetedRateLimiter({"default": 60, "ai": 1}))
+    for key in ("OPENROUTER_API_KEY", "OPENAI_API_KEY", "PERPLEXITY_API_KEY"):
+        monkeypatch.delenv(key, raising=False)
+    headers = {"X-Forwarded-For": "198.51.100.11"}
+    body = json.dumps({"messages": [{"role": "user", "content": "hello"}]})
+
+    first = client.post("/api/ai/chat", data=body, content_type="application/json", headers=headers)
+    second = client.post("/api/ai/chat", data=body, content_type="application/json", headers=headers)
+
+    assert first.status_code == 200
+    assert second.status_code == 429
+
+
+def test_ai_provider_status_needs_the_admin_token(client, monkeypatch):
+    monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+    assert client.get("/api/ai/providers").status_code == 403
+    monkeypatch.setenv("ADMIN_TOKEN", "admin-secret")
+    assert client.get("/api/ai/providers").status_code == 403
+    assert client.get("/api/ai/providers", headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+
+def test_ai_provider_status(client, admin_headers):
+    response = client.get("/api/ai/providers", headers=admin_headers)
+
+    assert response.status_code == 200
+    providers = response.get_json()["providers"]
+    assert providers["openrouter"]["breaker"]["state"] == "closed"
+
+
+def test_ai_chat_streams_local_fallback(client, monkeypatch):
+    for key in ("OPENROUTER_API_KEY", "OPENAI_API_KEY", "PERPLEXITY_API_KEY"):
+        monkeypatch.delenv(key, raising=False)
+    body = json.dumps({"stream": True, "messages": [{"role": "user", "content": "pcos"}]})
+
+    response = client.post(
+        "/api/ai/chat",
+        data=body,
+        content_type="application/json",
+        headers={"X-Forwarded-For": "198.51.100.13"},
+    )
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    assert b"chat.completion.chunk" in response.data
+    assert response.data.endswith(b"data: [DONE]\n\n")
+
+
+def test_vercel_bundles_backend_modules():
+    with open(os.path.join(ROOT_DIR, "vercel.json"), encoding="utf-8") as handle:
+        config = json.load(handle)
+
+    include = config["functions"]["api/index.py"]["includeFiles"]
+    assert include.startswith("backend/") and "*.py" in include and "data/" in include
+
+
+OPTIONAL_MODULES = ["ai_insights", "analysis_cache", "chat_context", "chat_intents", "chat_memory",
+                    "entry_spool", "knowledge_base", "single_flight", "write_behind"]
+
+
+@pytest.mark.parametrize("module,health,disabled", [
+    ("api.index", "/api/health", ["ai_insights", "chat_flights", "context_trimmer", "chat_intents", "knowledge_base"]),
+    ("app", "/health", ["ai_insights", "analysis_cache", "chat_flights", "context_trimmer", "chat_intents",
+                        "chat_memory", "knowledge_base"]),
+])
+def test_missing_optional_modules_switch_features_off(module, health, disabled):
+    script = (
+        "import sys\n"
+        f"sys.path[:0] = [{ROOT_DIR!r}, {os.path.join(ROOT_DIR, 'backend')!r}]\n"
+        f"for name in {OPTIONAL_MODULES!r}:\n"
+        "    sys.modules[name] = None\n"
+        f"import importlib; module = importlib.import_module({module!r})\n"
+        f"print([name for name in {disabled!r} if getattr(module, name) is not None])\n"
+        f"print(module.app.test_client().get({health!r}).status_code)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        capture_output=True, text=True, timeout=60, env={**os.environ, "SKIP_SUPABASE": "1"},
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["[]", "200"]
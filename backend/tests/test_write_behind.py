@@ -0,0 +1,161 @@
+"""
+PCOS Smart Assistant - Write-Behind Queue Tests
+Tests for batched background inserts of submitted entries
+"""
+
+import json
+import pytest
+import sys
+import os
+import threading
+import time
+from unittest.mock import Mock
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SKIP_SUPABASE", "1")
+
+from ai_usage import SupabaseSink
+from write_behind import WriteBehindQueue
+
+
+class Writer:
+    """Records written batches; fails while ``failing`` is positive"""
+
+    def __init__(self, failing=0):
+        self.batches = []
+        self.failing = failing
+        self.written = threading.Event()
+
+    def __call__(self, rows):
+        if self.failing:
+            self.failing -= 1
+            raise ConnectionError("supabase down")
+        self.batches.append(list(rows))
+        self.written.set()
+
+
+class TestWriteBehindQueue:
+    """Tests for batching, retries and draining"""
+
+    def test_rows_are_written_in_batches(self):
+        """Test that pending rows are coalesced into inserts of at most ``batch_size``"""
+        writer = Writer()
+        queue = WriteBehindQueue(writer, batch_size=3, flush_interval=3600)
+        queue._start = lambda: None
+        for i in range(7):
+            assert queue.put({"n": i})
+        assert queue.flush() == 7
+        assert [len(batch) for batch in writer.batches] == [3, 3, 1]
+        stats = queue.stats()
+        assert stats["pending"] == 0 and stats["batches"] == 3 and stats["avg_flush_ms"] is not None
+
+    def test_background_thread_flushes_on_the_time_window(self):
+        """Test that a lone row is written once the flush interval passes"""
+        writer = Writer()
+        queue = WriteBehindQueue(writer, batch_size=100, flush_interval=0.05)
+        queue.put({"n": 1})
+        assert writer.written.wait(2.0)
+        assert writer.batches == [[{"n": 1}]]
+        queue.close()
+
+    def test_full_batch_wakes_the_writer(self):
+        """Test that reaching ``batch_size`` flushes without waiting for the interval"""
+        writer = Writer()
+        queue = WriteBehindQueue(writer, batch_size=2, flush_interval=3600)
+        queue.put({"n": 1})
+        queue.put({"n": 2})
+        assert writer.written.wait(2.0)
+        queue.close()
+
+    def test_failed_batch_backs_off_and_retries(self):
+        """Test that a failed batch is kept in order and retried after its backoff"""
+        now = [0.0]
+        writer = Writer(failing=2)
+        queue = WriteBehindQueue(writer, batch_size=10, backoff=1.0, clock=lambda: now[0])
+        queue._start = lambda: None
+        queue.put({"n": 1})
+        queue.put({"n": 2})
+        assert queue.flush() == 0
+        assert queue.flush() == 0  # still backing off: not tried
+        now[0] += 1.0
+        assert queue.flush() == 0  # second failure: backoff doubles
+        now[0] += 1.5
+        assert queue.flush() == 0
+        now[0] += 0.5
+        assert queue.flush() == 2
+        assert writer.batches == [[{"n": 1}, {"n": 2}]]
+        assert queue.stats()["failed_batches"] == 2
+
+    def test_gives_up_after_max_retries(self):
+        """Test that a batch failing ``max_retries`` times is handed to ``on_give_up``"""
+        given_up = []
+        queue = WriteBehindQueue(Writer(failing=10), max_retries=2, on_give_up=given_up.extend)
+        queue._start = lambda: None
+        queue.put({"n": 1})
+        for _ in range(3):
+            queue.flush(force=True)
+        assert given_up == [{"n": 1}]
+        assert queue.stats()["given_up"] == 1 and queue.pending() == 0
+
+    def test_queue_is_bounded(self):
+        """Test that rows beyond ``max_pending`` are refused and counted"""
+        queue = WriteBehindQueue(Writer(), max_pending=2, flush_interval=3600)
+        queue._start = lambda: None
+        assert queue.put({}) and queue.put({})
+        assert not queue.put({})
+        assert queue.stats()["rejected"] == 1
+
+    def test_close_drains(self):
+        """Test that closing writes everything pending and refuses new rows"""
+        writer = Writer(failing=1)
+        queue = WriteBehindQueue(writer, batch_size=2, flush_interval=3600, backoff=0.01)
+        for i in range(5):
+            queue.put({"n": i})
+        assert queue.close(timeout=2.0) == 0
+        assert sum(len(batch) for batch in writer.batches) == 5
+        assert not queue.put({"n": 6})
+
+
+class TestSaveEntry:
+    """Tests for /api/analyze queueing its insert"""
+
+    @pytest.fixture
+    def app_module(self, monkeypatch):
+        import app as app_module
+
+        monkeypatch.setenv("SKIP_RATE_LIMIT", "1")
+        supabase = Mock()
+        writer = Writer()
+        queue = WriteBehindQueue(writer, flush_interval=3600)
+        queue._start = lambda: None
+        monkeypatch.setattr(app_module, "supabase", supabase)
+        monkeypatch.setattr(app_module, "entry_writer", queue)
+        monkeypatch.setattr(app_module, "entry_sink", SupabaseSink(supabase, "pcos_entries"))
+        return app_module, supabase, queue, writer
+
+    def test_analyze_returns_before_the_insert(self, app_module):
+        """Test that the response carries the generated id while the row is still queued"""
+        module, supabase, queue, writer = app_module
+        response = module.app.test_client().post(
+            "/api/analyze",
+            data=json.dumps({"age": 25, "cycle_length": 40, "period_length": 5, "symptoms": ["acne"]}),
+            content_type="application/json",
+        )
+        entry_id = response.get_json()["entry_id"]
+        assert len(entry_id) == 36
+        assert not supabase.table.called
+        assert queue.pending() == 1
+
+        queue.flush()
+        assert writer.batches[0][0]["id"] == entry_id
+        assert writer.batches[0][0]["symptoms"] == ["acne"]
+
+    def test_metrics(self, app_module, admin_headers):
+        """Test that queue depth and flush latency are reported in /api/metrics"""
+        module, _, queue, _ = app_module
+        module.save_entry({"age": 30})
+        metrics = module.app.test_client().get("/api/metrics", headers=admin_headers).get_json()
+        assert metrics["entry_writes"]["pending"] == 1
+        assert "avg_flush_ms" in metrics["entry_writes"]
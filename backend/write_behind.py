@@ -0,0 +1,199 @@
+"""
+Write-Behind Queue
+Takes rows off the request path and inserts them in bulk from a background
+thread, retrying failed batches with exponential backoff
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+
+logger = logging.getLogger("pcos-write-behind")
+
+
+class WriteBehindQueue:
+    """Bounded queue of rows written by ``write(rows)`` in batches.
+
+    ``put`` only appends under a lock. A daemon thread writes up to
+    ``batch_size`` rows at a time, as soon as that many are waiting or every
+    ``flush_interval`` seconds otherwise. A failed batch goes back to the
+    front of the queue and is retried after ``backoff`` seconds, doubling up
+    to ``max_backoff``. After ``max_retries`` failures in a row it is handed
+    to ``on_give_up(rows)`` (logged and dropped by default). When full
+    (``max_pending``) ``put`` refuses new rows.
+
+    ``close`` drains the queue (up to ``timeout`` seconds) and is registered
+    with ``atexit``, so a graceful shutdown writes what is pending.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[List[Dict[str, Any]]], Any],
+        batch_size: int = 50,
+        flush_interval: float = 1.0,
+        max_pending: int = 10000,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        on_give_up: Optional[Callable[[List[Dict[str, Any]]], Any]] = None,
+        name: str = "write-behind",
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.write = write
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.on_give_up = on_give_up
+        self.name = name
+        self._clock = clock
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+        self._closed = False
+        self._failures = 0
+        self._retry_at = 0.0
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.given_up = 0
+        self.rejected = 0
+        self.last_flush_ms: Optional[float] = None
+        self.max_flush_ms = 0.0
+        self._flush_ms_total = 0.0
+
+    def put(self, row: Dict[str, Any]) -> bool:
+        """Queue ``row``; False when the queue is full or closed."""
+        with self._lock:
+            if self._closed or len(self._pending) >= self.max_pending:
+                self.rejected += 1
+                return False
+            self._pending.append(row)
+            self.enqueued += 1
+            full = len(self._pending) >= self.batch_size
+        self._start()
+        if full:
+            self._wake.set()
+        return True
+
+    def flush(self, force: bool = False) -> int:
+        """Write pending batches now; returns how many rows were written.
+
+        Stops at the first failed batch. Unless ``force``, nothing is tried
+        while a failed batch is backing off.
+        """
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    if not self._pending or (not force and self._clock() < self._retry_at):
+                        return written
+                    batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                started = time.monotonic()
+                try:
+                    self.write(batch)
+                except Exception as e:
+                    if not self._failed(batch, e):
+                        return written
+                    continue
+                elapsed_ms = (time.monotonic() - started) * 1000
+                with self._lock:
+                    self._failures = 0
+                    self._retry_at = 0.0
+                    self.written += len(batch)
+                    self.batches += 1
+                    self.last_flush_ms = round(elapsed_ms, 1)
+                    self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+                    self._flush_ms_total += elapsed_ms
+                written += len(batch)
+
+    def close(self, timeout: float = 10.0) -> int:
+        """Stop taking rows and write what is pending; returns how many rows are left unwritten."""
+        with self._lock:
+            self._closed = True
+        deadline = time.monotonic() + timeout
+        while self.pending() and time.monotonic() < deadline:
+            if not self.flush(force=True):
+                time.sleep(min(self.backoff, max(0.0, deadline - time.monotonic())))
+        self._wake.set()
+        left = self.pending()
+        if left:
+            logger.warning(f"{self.name}: {left} rows left unwritten at shutdown")
+        return left
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "max_pending": self.max_pending,
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "batches": self.batches,
+                "failed_batches": self.failed_batches,
+                "given_up": self.given_up,
+                "rejected": self.rejected,
+                "last_flush_ms": self.last_flush_ms,
+                "avg_flush_ms": round(self._flush_ms_total / self.batches, 1) if self.batches else None,
+                "max_flush_ms": round(self.max_flush_ms, 1),
+            }
+
+    def _failed(self, batch: List[Dict[str, Any]], error: Exception) -> bool:
+        """Requeue a failed batch with backoff, or give it up; True if it was given up."""
+        with self._lock:
+            self.failed_batches += 1
+            self._failures += 1
+            give_up = self._failures > self.max_retries
+            if give_up:
+                self._failures = 0
+                self._retry_at = 0.0
+                self.given_up += len(batch)
+            else:
+                self._pending.extendleft(reversed(batch))
+                delay = min(self.max_backoff, self.backoff * 2 ** (self._failures - 1))
+                self._retry_at = self._clock() + delay
+        if not give_up:
+            logger.warning(f"{self.name}: write of {len(batch)} rows failed, retrying: {error}")
+            return False
+        logger.error(f"{self.name}: giving up on {len(batch)} rows after {self.max_retries} retries: {error}")
+        if self.on_give_up is not None:
+            try:
+                self.on_give_up(batch)
+            except Exception as e:
+                logger.error(f"{self.name}: give-up handler failed: {e}")
+        return True
+
+    def _start(self) -> None:
+        """Start the writer thread (again after a fork: threads do not survive one)."""
+        if self._thread is not None and self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread_pid == os.getpid():
+                return
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            with self._lock:
+                if self._closed:
+                    return
+            self.flush()
@@ -8,6 +8,8 @@
 
 const API_BASE_URL = window.location.origin || '';
 const API_TIMEOUT = 30000; // 30 seconds
+// Seconds the server may spend on AI providers: it answers locally before we abort
+const AI_REQUEST_TIMEOUT = (API_TIMEOUT - 2000) / 1000;
 
 class ApiError extends Error {
   constructor(message, status, data) {
@@ -26,12 +28,12 @@ const api = {
     const url = `${API_BASE_URL}${endpoint}`;
     
     const config = {
+      timeout: API_TIMEOUT,
+      ...options,
       headers: {
         'Content-Type': 'application/json',
         ...options.headers,
       },
-      timeout: API_TIMEOUT,
-      ...options,
     };
 
     // Add auth token if available
@@ -217,7 +219,9 @@ export const aiApi = {
    * Send message to AI assistant
    */
   async sendMessage(message, context = {}) {
-    return api.post('/api/ai/chat', { message, context });
+    return api.post('/api/ai/chat', { message, context }, {
+      headers: { 'X-Request-Timeout': String(AI_REQUEST_TIMEOUT) },
+    });
   },
 
   /**